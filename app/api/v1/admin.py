@@ -15,9 +15,16 @@ from typing import Optional, List
 from pydantic import BaseModel, ValidationError
 from app.core.auth import verify_api_key, verify_app_key, get_admin_api_key
 from app.core.config import config, get_config
-from app.core.batch_tasks import create_task, get_task, expire_task
+from app.core.batch_tasks import (
+    BatchTask,
+    get_task,
+    load_task_state,
+    register_runner,
+    request_cancel,
+    start_task,
+)
 from app.core.storage import get_storage, LocalStorage, RedisStorage, SQLStorage
-from app.core.exceptions import AppException, ValidationException, ErrorType
+from app.core.exceptions import AppException, ValidationException, ErrorType, error_status
 from app.services.token.manager import get_token_manager
 from app.services.grok.utils.batch import run_in_batches
 import os
@@ -149,6 +156,36 @@ def _mask_token(token: str) -> str:
     return f"{token[:8]}...{token[-8:]}" if len(token) > 20 else token
 
 
+def _truncate_warning(truncated: bool, max_tokens: int, original_count: int) -> Optional[str]:
+    if not truncated:
+        return None
+    return f"数量超出限制，仅处理前 {max_tokens} 个（共 {original_count} 个）"
+
+
+async def _run_task_items(
+    task: BatchTask, worker, is_ok, max_concurrent, batch_size
+) -> dict:
+    """
+    执行批量任务中尚未完成的项（断点恢复时跳过已记录的项）
+
+    Returns:
+        全部已完成项的结果（含恢复前记录的），格式同 run_in_batches
+    """
+
+    async def _on_item(item: str, res: dict):
+        task.record(is_ok(res), key=item, result=res)
+
+    await run_in_batches(
+        task.pending_items(),
+        worker,
+        max_concurrent=max_concurrent,
+        batch_size=batch_size,
+        on_item=_on_item,
+        should_cancel=lambda: task.cancelled,
+    )
+    return task.results()
+
+
 async def render_template(filename: str):
     """渲染指定模板"""
     template_path = TEMPLATE_DIR / filename
@@ -197,12 +234,75 @@ def _verify_stream_api_key(request: Request) -> None:
         raise HTTPException(status_code=401, detail="Invalid authentication token")
 
 
+# 跨 worker 查看任务进度时轮询存储的间隔（秒）
+BATCH_POLL_INTERVAL = 1.0
+
+
+def _batch_snapshot(state: dict) -> dict:
+    return {
+        key: state.get(key)
+        for key in ("task_id", "status", "total", "processed", "ok", "fail", "warning")
+    }
+
+
+def _remote_batch_stream(state: dict):
+    """任务在其他 worker 上执行：轮询存储中的检查点，转换为进度事件"""
+
+    async def event_stream():
+        nonlocal state
+        task_id = state["id"]
+        yield _sse_event({"type": "snapshot", **_batch_snapshot(state)})
+        last_processed = state.get("processed")
+        idle = 0.0
+        while True:
+            final = state.get("final")
+            if final:
+                yield _sse_event(final)
+                return
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            local = get_task(task_id)
+            if local and local.final_event():
+                # 已由本 worker 接管恢复并完成
+                yield _sse_event(local.final_event())
+                return
+            latest = await load_task_state(task_id)
+            if latest is None:
+                yield _sse_event(
+                    {"type": "error", "task_id": task_id, "error": "Task not found"}
+                )
+                return
+            state = latest
+            if state.get("processed") != last_processed:
+                last_processed = state.get("processed")
+                idle = 0.0
+                yield _sse_event(
+                    {
+                        "type": "progress",
+                        "task_id": task_id,
+                        "total": state.get("total"),
+                        "processed": state.get("processed"),
+                        "ok": state.get("ok"),
+                        "fail": state.get("fail"),
+                    }
+                )
+            else:
+                idle += BATCH_POLL_INTERVAL
+                if idle >= 15:
+                    idle = 0.0
+                    yield ": ping\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("/api/v1/admin/batch/{task_id}/stream")
 async def stream_batch(task_id: str, request: Request):
     _verify_stream_api_key(request)
     task = get_task(task_id)
     if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+        state = await load_task_state(task_id)
+        if not state:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return _remote_batch_stream(state)
 
     async def event_stream():
         queue = task.attach()
@@ -238,10 +338,8 @@ async def stream_batch(task_id: str, request: Request):
     "/api/v1/admin/batch/{task_id}/cancel", dependencies=[Depends(verify_api_key)]
 )
 async def cancel_batch(task_id: str):
-    task = get_task(task_id)
-    if not task:
+    if not await request_cancel(task_id):
         raise HTTPException(status_code=404, detail="Task not found")
-    task.cancel()
     return {"status": "success"}
 
 
@@ -900,6 +998,18 @@ async def update_tokens_api(data: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/api/v1/admin/tokens/stats", dependencies=[Depends(verify_api_key)])
+async def get_token_stats_api():
+    """获取 Token 池统计与选择策略命中/429 统计"""
+    from app.services.token.manager import get_token_manager
+
+    mgr = await get_token_manager()
+    return {
+        "pools": mgr.get_stats(),
+        "strategies": mgr.get_strategy_stats(),
+    }
+
+
 @router.post("/api/v1/admin/tokens/refresh", dependencies=[Depends(verify_api_key)])
 async def refresh_tokens_api(data: dict):
     """刷新 Token 状态"""
@@ -954,7 +1064,6 @@ async def refresh_tokens_api(data: dict):
 )
 async def refresh_tokens_api_async(data: dict):
     """刷新 Token 状态（异步批量 + SSE 进度）"""
-    mgr = await get_token_manager()
     tokens = _collect_tokens(data)
 
     if not tokens:
@@ -966,75 +1075,64 @@ async def refresh_tokens_api_async(data: dict):
         tokens, max_tokens, "Usage refresh"
     )
 
-    max_concurrent = get_config("performance.usage_max_concurrent")
-    batch_size = get_config("performance.usage_batch_size")
-
-    task = create_task(len(unique_tokens))
-
-    async def _run():
-        try:
+    task = await start_task(
+        "usage_refresh",
+        unique_tokens,
+        {"warning": _truncate_warning(truncated, max_tokens, original_count)},
+    )
 
-            async def _refresh_one(t: str):
-                return await mgr.sync_usage(
-                    t, "grok-3", consume_on_fail=False, is_usage=False
-                )
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "total": len(unique_tokens),
+    }
 
-            async def _on_item(item: str, res: dict):
-                task.record(bool(res.get("ok")))
 
-            raw_results = await run_in_batches(
-                unique_tokens,
-                _refresh_one,
-                max_concurrent=max_concurrent,
-                batch_size=batch_size,
-                on_item=_on_item,
-                should_cancel=lambda: task.cancelled,
-            )
+async def _run_usage_refresh(task: BatchTask):
+    """批量任务 usage_refresh: 刷新 Token 状态"""
+    mgr = await get_token_manager()
 
-            if task.cancelled:
-                task.finish_cancelled()
-                return
+    async def _refresh_one(t: str):
+        return await mgr.sync_usage(t, "grok-3", consume_on_fail=False, is_usage=False)
 
-            results: dict[str, bool] = {}
-            ok_count = 0
-            fail_count = 0
-            for token, res in raw_results.items():
-                if res.get("ok") and res.get("data") is True:
-                    ok_count += 1
-                    results[token] = True
-                else:
-                    fail_count += 1
-                    results[token] = False
+    raw_results = await _run_task_items(
+        task,
+        _refresh_one,
+        lambda res: bool(res.get("ok")),
+        get_config("performance.usage_max_concurrent"),
+        get_config("performance.usage_batch_size"),
+    )
 
-            await mgr._save()
+    if task.cancelled:
+        task.finish_cancelled()
+        return
 
-            result = {
-                "status": "success",
-                "summary": {
-                    "total": len(unique_tokens),
-                    "ok": ok_count,
-                    "fail": fail_count,
-                },
-                "results": results,
-            }
-            warning = None
-            if truncated:
-                warning = (
-                    f"数量超出限制，仅处理前 {max_tokens} 个（共 {original_count} 个）"
-                )
-            task.finish(result, warning=warning)
-        except Exception as e:
-            task.fail_task(str(e))
-        finally:
-            asyncio.create_task(expire_task(task.id, 300))
+    results: dict[str, bool] = {}
+    ok_count = 0
+    fail_count = 0
+    for token, res in raw_results.items():
+        if res.get("ok") and res.get("data") is True:
+            ok_count += 1
+            results[token] = True
+        else:
+            fail_count += 1
+            results[token] = False
 
-    asyncio.create_task(_run())
+    await mgr._save()
 
-    return {
+    result = {
         "status": "success",
-        "task_id": task.id,
-        "total": len(unique_tokens),
+        "summary": {
+            "total": task.total,
+            "ok": ok_count,
+            "fail": fail_count,
+        },
+        "results": results,
     }
+    task.finish(result, warning=task.params.get("warning"))
+
+
+register_runner("usage_refresh", _run_usage_refresh)
 
 
 @router.post("/api/v1/admin/tokens/nsfw/enable", dependencies=[Depends(verify_api_key)])
@@ -1137,10 +1235,7 @@ async def enable_nsfw_api(data: dict):
 )
 async def enable_nsfw_api_async(data: dict):
     """批量开启 NSFW (Unhinged) 模式（异步批量 + SSE 进度）"""
-    from app.services.grok.services.nsfw import NSFWService
-
     mgr = await get_token_manager()
-    nsfw_service = NSFWService()
 
     tokens = _collect_tokens(data)
 
@@ -1159,84 +1254,77 @@ async def enable_nsfw_api_async(data: dict):
         tokens, max_tokens, "NSFW enable"
     )
 
-    max_concurrent = get_config("performance.nsfw_max_concurrent")
-    batch_size = get_config("performance.nsfw_batch_size")
-
-    task = create_task(len(unique_tokens))
+    task = await start_task(
+        "nsfw_enable",
+        unique_tokens,
+        {"warning": _truncate_warning(truncated, max_tokens, original_count)},
+    )
 
-    async def _run():
-        try:
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "total": len(unique_tokens),
+    }
 
-            async def _enable(token: str):
-                result = await nsfw_service.enable(token)
-                if result.success:
-                    await mgr.add_tag(token, "nsfw")
-                return {
-                    "success": result.success,
-                    "http_status": result.http_status,
-                    "grpc_status": result.grpc_status,
-                    "grpc_message": result.grpc_message,
-                    "error": result.error,
-                }
 
-            async def _on_item(item: str, res: dict):
-                ok = bool(res.get("ok") and res.get("data", {}).get("success"))
-                task.record(ok)
+async def _run_nsfw_enable(task: BatchTask):
+    """批量任务 nsfw_enable: 开启 NSFW 并添加 nsfw 标签"""
+    from app.services.grok.services.nsfw import NSFWService
 
-            raw_results = await run_in_batches(
-                unique_tokens,
-                _enable,
-                max_concurrent=max_concurrent,
-                batch_size=batch_size,
-                on_item=_on_item,
-                should_cancel=lambda: task.cancelled,
-            )
+    mgr = await get_token_manager()
+    nsfw_service = NSFWService()
 
-            if task.cancelled:
-                task.finish_cancelled()
-                return
+    async def _enable(token: str):
+        result = await nsfw_service.enable(token)
+        if result.success:
+            await mgr.add_tag(token, "nsfw")
+        return {
+            "success": result.success,
+            "http_status": result.http_status,
+            "grpc_status": result.grpc_status,
+            "grpc_message": result.grpc_message,
+            "error": result.error,
+        }
 
-            results = {}
-            ok_count = 0
-            fail_count = 0
-            for token, res in raw_results.items():
-                masked = f"{token[:8]}...{token[-8:]}" if len(token) > 20 else token
-                if res.get("ok") and res.get("data", {}).get("success"):
-                    ok_count += 1
-                    results[masked] = res.get("data", {})
-                else:
-                    fail_count += 1
-                    results[masked] = res.get("data") or {"error": res.get("error")}
+    raw_results = await _run_task_items(
+        task,
+        _enable,
+        lambda res: bool(res.get("ok") and res.get("data", {}).get("success")),
+        get_config("performance.nsfw_max_concurrent"),
+        get_config("performance.nsfw_batch_size"),
+    )
 
-            await mgr._save()
+    if task.cancelled:
+        task.finish_cancelled()
+        return
 
-            result = {
-                "status": "success",
-                "summary": {
-                    "total": len(unique_tokens),
-                    "ok": ok_count,
-                    "fail": fail_count,
-                },
-                "results": results,
-            }
-            warning = None
-            if truncated:
-                warning = (
-                    f"数量超出限制，仅处理前 {max_tokens} 个（共 {original_count} 个）"
-                )
-            task.finish(result, warning=warning)
-        except Exception as e:
-            task.fail_task(str(e))
-        finally:
-            asyncio.create_task(expire_task(task.id, 300))
+    results = {}
+    ok_count = 0
+    fail_count = 0
+    for token, res in raw_results.items():
+        masked = _mask_token(token)
+        if res.get("ok") and res.get("data", {}).get("success"):
+            ok_count += 1
+            results[masked] = res.get("data", {})
+        else:
+            fail_count += 1
+            results[masked] = res.get("data") or {"error": res.get("error")}
 
-    asyncio.create_task(_run())
+    await mgr._save()
 
-    return {
+    result = {
         "status": "success",
-        "task_id": task.id,
-        "total": len(unique_tokens),
+        "summary": {
+            "total": task.total,
+            "ok": ok_count,
+            "fail": fail_count,
+        },
+        "results": results,
     }
+    task.finish(result, warning=task.params.get("warning"))
+
+
+register_runner("nsfw_enable", _run_nsfw_enable)
 
 
 @router.get("/admin/cache", response_class=HTMLResponse, include_in_schema=False)
@@ -1254,8 +1342,8 @@ async def get_cache_stats_api(request: Request):
 
     try:
         dl_service = DownloadService()
-        image_stats = dl_service.get_stats("image")
-        video_stats = dl_service.get_stats("video")
+        image_stats = await dl_service.get_stats("image")
+        video_stats = await dl_service.get_stats("video")
 
         mgr = await get_token_manager()
         pools = mgr.pools
@@ -1468,10 +1556,6 @@ async def get_cache_stats_api(request: Request):
 )
 async def load_online_cache_api_async(data: dict):
     """在线资产统计（异步批量 + SSE 进度）"""
-    from app.services.grok.services.assets import DownloadService, ListService
-    from app.services.token.manager import get_token_manager
-    from app.services.grok.utils.batch import run_in_batches
-
     mgr = await get_token_manager()
 
     # 账号列表
@@ -1494,8 +1578,6 @@ async def load_online_cache_api_async(data: dict):
                 }
             )
 
-    account_map = {a["token"]: a for a in accounts}
-
     tokens = data.get("tokens")
     scope = data.get("scope")
     selected_tokens: list[str] = []
@@ -1515,105 +1597,108 @@ async def load_online_cache_api_async(data: dict):
         selected_tokens, max_tokens, "Assets load"
     )
 
-    max_concurrent = get_config("performance.assets_max_concurrent")
-    batch_size = get_config("performance.assets_batch_size")
-
-    task = create_task(len(selected_tokens))
-
-    async def _run():
-        try:
-            dl_service = DownloadService()
-            image_stats = dl_service.get_stats("image")
-            video_stats = dl_service.get_stats("video")
-
-            async def _fetch_detail(token: str):
-                account = account_map.get(token)
-                list_service = ListService()
-                try:
-                    count = await list_service.count(token)
-                    detail = {
-                        "token": token,
-                        "token_masked": account["token_masked"] if account else token,
-                        "count": count,
-                        "status": "ok",
-                        "last_asset_clear_at": account["last_asset_clear_at"]
-                        if account
-                        else None,
-                    }
-                    return {"ok": True, "detail": detail, "count": count}
-                except Exception as e:
-                    detail = {
-                        "token": token,
-                        "token_masked": account["token_masked"] if account else token,
-                        "count": 0,
-                        "status": f"error: {str(e)}",
-                        "last_asset_clear_at": account["last_asset_clear_at"]
-                        if account
-                        else None,
-                    }
-                    return {"ok": False, "detail": detail, "count": 0}
-                finally:
-                    await list_service.close()
-
-            async def _on_item(item: str, res: dict):
-                ok = bool(res.get("data", {}).get("ok"))
-                task.record(ok)
+    task = await start_task(
+        "assets_load",
+        selected_tokens,
+        {
+            "warning": _truncate_warning(truncated, max_tokens, original_count),
+            "accounts": accounts,
+            "scope": scope,
+        },
+    )
 
-            raw_results = await run_in_batches(
-                selected_tokens,
-                _fetch_detail,
-                max_concurrent=max_concurrent,
-                batch_size=batch_size,
-                on_item=_on_item,
-                should_cancel=lambda: task.cancelled,
-            )
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "total": len(selected_tokens),
+    }
 
-            if task.cancelled:
-                task.finish_cancelled()
-                return
 
-            online_details = []
-            total = 0
-            for token, res in raw_results.items():
-                data = res.get("data", {})
-                detail = data.get("detail")
-                if detail:
-                    online_details.append(detail)
-                total += data.get("count", 0)
+async def _run_assets_load(task: BatchTask):
+    """批量任务 assets_load: 统计各账号在线资产数量"""
+    from app.services.grok.services.assets import DownloadService, ListService
 
-            online_stats = {
-                "count": total,
-                "status": "ok" if selected_tokens else "no_token",
-                "token": None,
-                "last_asset_clear_at": None,
-            }
+    accounts = task.params.get("accounts") or []
+    account_map = {a["token"]: a for a in accounts}
+    dl_service = DownloadService()
+    image_stats = await dl_service.get_stats("image")
+    video_stats = await dl_service.get_stats("video")
 
-            result = {
-                "local_image": image_stats,
-                "local_video": video_stats,
-                "online": online_stats,
-                "online_accounts": accounts,
-                "online_scope": scope or "none",
-                "online_details": online_details,
+    async def _fetch_detail(token: str):
+        account = account_map.get(token)
+        list_service = ListService()
+        try:
+            count = await list_service.count(token)
+            detail = {
+                "token": token,
+                "token_masked": account["token_masked"] if account else token,
+                "count": count,
+                "status": "ok",
+                "last_asset_clear_at": account["last_asset_clear_at"]
+                if account
+                else None,
             }
-            warning = None
-            if truncated:
-                warning = (
-                    f"数量超出限制，仅处理前 {max_tokens} 个（共 {original_count} 个）"
-                )
-            task.finish(result, warning=warning)
+            return {"ok": True, "detail": detail, "count": count}
         except Exception as e:
-            task.fail_task(str(e))
+            detail = {
+                "token": token,
+                "token_masked": account["token_masked"] if account else token,
+                "count": 0,
+                "status": f"error: {str(e)}",
+                "last_asset_clear_at": account["last_asset_clear_at"]
+                if account
+                else None,
+            }
+            # http_status 供 run_in_batches 识别限流
+            return {
+                "ok": False,
+                "detail": detail,
+                "count": 0,
+                "http_status": error_status(e),
+            }
         finally:
-            asyncio.create_task(expire_task(task.id, 300))
+            await list_service.close()
+
+    raw_results = await _run_task_items(
+        task,
+        _fetch_detail,
+        lambda res: bool(res.get("data", {}).get("ok")),
+        get_config("performance.assets_max_concurrent"),
+        get_config("performance.assets_batch_size"),
+    )
 
-    asyncio.create_task(_run())
+    if task.cancelled:
+        task.finish_cancelled()
+        return
 
-    return {
-        "status": "success",
-        "task_id": task.id,
-        "total": len(selected_tokens),
+    online_details = []
+    total = 0
+    for token, res in raw_results.items():
+        data = res.get("data", {})
+        detail = data.get("detail")
+        if detail:
+            online_details.append(detail)
+        total += data.get("count", 0)
+
+    online_stats = {
+        "count": total,
+        "status": "ok" if task.total else "no_token",
+        "token": None,
+        "last_asset_clear_at": None,
+    }
+
+    result = {
+        "local_image": image_stats,
+        "local_video": video_stats,
+        "online": online_stats,
+        "online_accounts": accounts,
+        "online_scope": task.params.get("scope") or "none",
+        "online_details": online_details,
     }
+    task.finish(result, warning=task.params.get("warning"))
+
+
+register_runner("assets_load", _run_assets_load)
 
 
 @router.post("/api/v1/admin/cache/clear", dependencies=[Depends(verify_api_key)])
@@ -1625,7 +1710,7 @@ async def clear_local_cache_api(data: dict):
 
     try:
         dl_service = DownloadService()
-        result = dl_service.clear(cache_type)
+        result = await dl_service.clear(cache_type)
         return {"status": "success", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1645,7 +1730,7 @@ async def list_local_cache_api(
         if type_:
             cache_type = type_
         dl_service = DownloadService()
-        result = dl_service.list_files(cache_type, page, page_size)
+        result = await dl_service.list_files(cache_type, page, page_size)
         return {"status": "success", **result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1662,7 +1747,7 @@ async def delete_local_cache_item_api(data: dict):
         raise HTTPException(status_code=400, detail="Missing file name")
     try:
         dl_service = DownloadService()
-        result = dl_service.delete_file(cache_type, name)
+        result = await dl_service.delete_file(cache_type, name)
         return {"status": "success", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1752,11 +1837,6 @@ async def clear_online_cache_api(data: dict):
 )
 async def clear_online_cache_api_async(data: dict):
     """清理在线缓存（异步批量 + SSE 进度）"""
-    from app.services.grok.services.assets import DeleteService
-    from app.services.token.manager import get_token_manager
-    from app.services.grok.utils.batch import run_in_batches
-
-    mgr = await get_token_manager()
     tokens = data.get("tokens")
     if not isinstance(tokens, list):
         raise HTTPException(status_code=400, detail="No tokens provided")
@@ -1770,83 +1850,77 @@ async def clear_online_cache_api_async(data: dict):
         token_list, max_tokens, "Clear online cache async"
     )
 
-    max_concurrent = get_config("performance.assets_max_concurrent")
-    batch_size = get_config("performance.assets_batch_size")
-
-    task = create_task(len(token_list))
-
-    async def _run():
-        delete_service = DeleteService()
-        try:
+    task = await start_task(
+        "online_cache_clear",
+        token_list,
+        {"warning": _truncate_warning(truncated, max_tokens, original_count)},
+    )
 
-            async def _clear_one(t: str):
-                try:
-                    result = await delete_service.delete_all(t)
-                    await mgr.mark_asset_clear(t)
-                    return {"ok": True, "result": result}
-                except Exception as e:
-                    return {"ok": False, "error": str(e)}
+    return {
+        "status": "success",
+        "task_id": task.id,
+        "total": len(token_list),
+    }
 
-            async def _on_item(item: str, res: dict):
-                ok = bool(res.get("data", {}).get("ok"))
-                task.record(ok)
 
-            raw_results = await run_in_batches(
-                token_list,
-                _clear_one,
-                max_concurrent=max_concurrent,
-                batch_size=batch_size,
-                on_item=_on_item,
-                should_cancel=lambda: task.cancelled,
-            )
+async def _run_online_cache_clear(task: BatchTask):
+    """批量任务 online_cache_clear: 清理各账号在线资产"""
+    from app.services.grok.services.assets import DeleteService
 
-            if task.cancelled:
-                task.finish_cancelled()
-                return
+    mgr = await get_token_manager()
+    delete_service = DeleteService()
+    try:
 
-            results = {}
-            ok_count = 0
-            fail_count = 0
-            for token, res in raw_results.items():
-                data = res.get("data", {})
-                if data.get("ok"):
-                    ok_count += 1
-                    results[token] = {"status": "success", "result": data.get("result")}
-                else:
-                    fail_count += 1
-                    results[token] = {"status": "error", "error": data.get("error")}
+        async def _clear_one(t: str):
+            try:
+                result = await delete_service.delete_all(t)
+                await mgr.mark_asset_clear(t)
+                return {"ok": True, "result": result}
+            except Exception as e:
+                return {"ok": False, "error": str(e), "http_status": error_status(e)}
+
+        raw_results = await _run_task_items(
+            task,
+            _clear_one,
+            lambda res: bool(res.get("data", {}).get("ok")),
+            get_config("performance.assets_max_concurrent"),
+            get_config("performance.assets_batch_size"),
+        )
+    finally:
+        await delete_service.close()
 
-            # 立即保存 token 变更
-            await mgr._save()
+    if task.cancelled:
+        task.finish_cancelled()
+        return
 
-            result = {
-                "status": "success",
-                "summary": {
-                    "total": len(token_list),
-                    "ok": ok_count,
-                    "fail": fail_count,
-                },
-                "results": results,
-            }
-            warning = None
-            if truncated:
-                warning = (
-                    f"数量超出限制，仅处理前 {max_tokens} 个（共 {original_count} 个）"
-                )
-            task.finish(result, warning=warning)
-        except Exception as e:
-            task.fail_task(str(e))
-        finally:
-            await delete_service.close()
-            asyncio.create_task(expire_task(task.id, 300))
+    results = {}
+    ok_count = 0
+    fail_count = 0
+    for token, res in raw_results.items():
+        data = res.get("data", {})
+        if data.get("ok"):
+            ok_count += 1
+            results[token] = {"status": "success", "result": data.get("result")}
+        else:
+            fail_count += 1
+            results[token] = {"status": "error", "error": data.get("error")}
 
-    asyncio.create_task(_run())
+    # 立即保存 token 变更
+    await mgr._save()
 
-    return {
+    result = {
         "status": "success",
-        "task_id": task.id,
-        "total": len(token_list),
+        "summary": {
+            "total": task.total,
+            "ok": ok_count,
+            "fail": fail_count,
+        },
+        "results": results,
     }
+    task.finish(result, warning=task.params.get("warning"))
+
+
+register_runner("online_cache_clear", _run_online_cache_clear)
 
 
 @router.post("/api/v1/admin/img2img")
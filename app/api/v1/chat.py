@@ -10,6 +10,7 @@ from pydantic import BaseModel, Field, field_validator
 
 from app.services.grok.services.chat import ChatService
 from app.services.grok.models.model import ModelService
+from app.services.grok.utils.stream import coalesce_sse
 from app.core.exceptions import ValidationException
 
 
@@ -304,7 +305,7 @@ async def chat_completions(request: ChatCompletionRequest):
         return JSONResponse(content=result)
     else:
         return StreamingResponse(
-            result,
+            coalesce_sse(result),
             media_type="text/event-stream",
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
         )
@@ -2,13 +2,18 @@
 文件服务 API 路由
 """
 
-import aiofiles.os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from typing import Optional
+
+import aiofiles.os
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
 
 from app.core.logger import logger
 from app.core.storage import DATA_DIR
+from app.services.grok.utils.media_cache import get_media_cache_index
 
 router = APIRouter(tags=["Files"])
 
@@ -17,9 +22,76 @@ BASE_DIR = DATA_DIR / "tmp"
 IMAGE_DIR = BASE_DIR / "image"
 VIDEO_DIR = BASE_DIR / "video"
 
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class MediaFileResponse(FileResponse):
+    """
+    缓存文件响应
+
+    Range / If-Range 由 FileResponse 处理；服务器支持 ASGI pathsend 扩展时
+    整文件响应由服务器零拷贝发送（sendfile），否则按较大的块读取以减少线程切换。
+    """
+
+    chunk_size = 256 * 1024
+
+
+def _etag(st) -> str:
+    """强 ETag（缓存文件写入后不再修改，大小 + 纳秒级 mtime 足以区分版本）"""
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """条件请求判断（If-None-Match 优先于 If-Modified-Since）"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # GET/HEAD 使用弱比较
+        return any(
+            tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+async def _serve(
+    request: Request, file_path: Path, media_type: str, content_type: str
+) -> Optional[Response]:
+    """返回文件响应，文件不存在时返回 None"""
+    try:
+        st = await aiofiles.os.stat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    get_media_cache_index().touch(media_type, file_path.name)
+
+    etag = _etag(st)
+    # 增加缓存头，支持高并发场景下的浏览器/CDN缓存
+    headers = {
+        "Cache-Control": CACHE_CONTROL,
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+    }
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    return MediaFileResponse(
+        file_path, media_type=content_type, headers=headers, stat_result=st
+    )
+
 
 @router.get("/image/{filename:path}")
-async def get_image(filename: str):
+async def get_image(filename: str, request: Request):
     """
     获取图片文件
     """
@@ -27,43 +99,33 @@ async def get_image(filename: str):
         filename = filename.replace("/", "-")
 
     file_path = IMAGE_DIR / filename
+    content_type = "image/jpeg"
+    if file_path.suffix.lower() == ".png":
+        content_type = "image/png"
+    elif file_path.suffix.lower() == ".webp":
+        content_type = "image/webp"
 
-    if await aiofiles.os.path.exists(file_path):
-        if await aiofiles.os.path.isfile(file_path):
-            content_type = "image/jpeg"
-            if file_path.suffix.lower() == ".png":
-                content_type = "image/png"
-            elif file_path.suffix.lower() == ".webp":
-                content_type = "image/webp"
-
-            # 增加缓存头，支持高并发场景下的浏览器/CDN缓存
-            return FileResponse(
-                file_path,
-                media_type=content_type,
-                headers={"Cache-Control": "public, max-age=31536000, immutable"},
-            )
+    response = await _serve(request, file_path, "image", content_type)
+    if response is not None:
+        return response
 
     logger.warning(f"Image not found: {filename}")
     raise HTTPException(status_code=404, detail="Image not found")
 
 
 @router.get("/video/{filename:path}")
-async def get_video(filename: str):
+async def get_video(filename: str, request: Request):
     """
-    获取视频文件
+    获取视频文件（支持 Range 拖动与条件请求）
     """
     if "/" in filename:
         filename = filename.replace("/", "-")
 
     file_path = VIDEO_DIR / filename
 
-    if await aiofiles.os.path.exists(file_path):
-        if await aiofiles.os.path.isfile(file_path):
-            return FileResponse(
-                file_path,
-                media_type="video/mp4",
-                headers={"Cache-Control": "public, max-age=31536000, immutable"},
-            )
+    response = await _serve(request, file_path, "video", "video/mp4")
+    if response is not None:
+        return response
 
     logger.warning(f"Video not found: {filename}")
     raise HTTPException(status_code=404, detail="Video not found")
@@ -67,7 +67,7 @@ async def list_images(
     end_date: Optional[int] = Query(None, description="结束日期（时间戳）"),
     nsfw: Optional[bool] = Query(None, description="是否筛选敏感内容"),
     favorite: Optional[bool] = Query(None, description="是否筛选收藏的图片"),
-    sort_by: str = Query("created_at", description="排序字段"),
+    sort_by: str = Query("created_at", description="排序字段（relevance: 按搜索相关度）"),
     sort_order: str = Query("desc", description="排序顺序（asc/desc）"),
 ):
     """
@@ -115,27 +115,16 @@ async def get_random_image(
     try:
         service = get_image_metadata_service()
 
-        # 获取所有图片
-        data = await service.storage.load_image_metadata()
-        images = data.get("images", [])
-
         # 解析排除的ID列表
-        excluded_ids = set(exclude_ids.split(",")) if exclude_ids else set()
+        excluded_ids = exclude_ids.split(",") if exclude_ids else []
 
-        # 过滤图片
+        # 从索引获取质量分数达标的候选图片
         candidates = []
         weights = []
 
-        for img in images:
-            # 跳过已查看的图片
-            if img.get("id") in excluded_ids:
-                continue
-
-            # 跳过质量分数低于阈值的图片
-            quality_score = img.get("quality_score")
-            if quality_score is None or quality_score < min_quality_score:
-                continue
-
+        for image_id, quality_score in await service.list_random_candidates(
+            min_quality_score, excluded_ids
+        ):
             # 根据质量分数设置权重
             if quality_score >= 80:
                 weight = 3
@@ -146,7 +135,7 @@ async def get_random_image(
             else:
                 weight = 0.5
 
-            candidates.append(img)
+            candidates.append(image_id)
             weights.append(weight)
 
         # 如果没有符合条件的图片
@@ -158,7 +147,15 @@ async def get_random_image(
             }
 
         # 加权随机选择
-        selected = random.choices(candidates, weights=weights, k=1)[0]
+        selected_id = random.choices(candidates, weights=weights, k=1)[0]
+        image = await service.get_image(selected_id)
+        if not image:
+            return {
+                "success": False,
+                "message": "没有符合条件的图片",
+                "data": None
+            }
+        selected = image.model_dump()
 
         # 添加文件路径信息
         selected["file_path"] = str(service.image_dir / selected["filename"])
@@ -326,6 +323,28 @@ async def get_stats():
         raise HTTPException(status_code=500, detail=f"获取统计信息失败: {str(e)}")
 
 
+@router.post("/stats/rebuild")
+async def rebuild_stats(
+    full: bool = Query(False, description="按存储内容全量重建索引"),
+):
+    """
+    重建统计信息（统计数据异常时修复）
+    """
+    try:
+        service = get_image_metadata_service()
+        result = await service.rebuild_stats(full=full)
+
+        return {
+            "success": True,
+            "message": f"统计重建完成: 图片 {result['images']}",
+            "data": result,
+        }
+
+    except Exception as e:
+        logger.error(f"重建统计信息失败: {e}")
+        raise HTTPException(status_code=500, detail=f"重建统计信息失败: {str(e)}")
+
+
 @router.get("/check-missing")
 async def check_missing_files():
     """
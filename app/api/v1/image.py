@@ -26,8 +26,8 @@ from app.services.grok.processors import (
     ImageWSStreamProcessor,
     ImageWSCollectProcessor,
 )
-from app.services.token import get_token_manager, EffortType
-from app.core.exceptions import ValidationException, AppException, ErrorType
+from app.services.token import get_token_manager, EffortType, TokenStatus
+from app.core.exceptions import ValidationException, AppException, ErrorType, error_status
 from app.core.config import get_config
 from app.core.logger import logger
 
@@ -254,44 +254,122 @@ async def _get_token(model: str):
     return token_mgr, token
 
 
-async def call_grok(
-    token_mgr,
-    token: str,
-    prompt: str,
-    model_info,
-    file_attachments: Optional[List[str]] = None,
-    response_format: str = "b64_json",
-) -> List[str]:
-    """调用 Grok 获取图片，返回 base64 列表"""
-    chat_service = GrokChatService()
-    success = False
+class ImageShardScheduler:
+    """
+    n>1 非流式生图的多 Token 分片调度
 
-    try:
-        response = await chat_service.chat(
-            token=token,
-            message=prompt,
-            model=model_info.grok_model,
-            mode=model_info.model_mode,
-            stream=True,
-            file_attachments=file_attachments,
-        )
+    每个分片（一次上游调用）分配到本次请求尚未使用的 token 上并发执行，避免同一账号
+    同时承受多路 WebSocket/对话请求而被限流；池中 token 不足时复用在途请求最少的 token。
+    成功的分片按各自 token 计费；失败（异常或无图片）的分片立即换一个该分片未尝试过的
+    token 重试，最多 retry.max_retry 次，429 标记冷却、401/403 记录失败。
+    """
 
-        processor = ImageCollectProcessor(
-            model_info.model_id, token, response_format=response_format
-        )
-        images = await processor.process(response)
-        success = True
-        return images
+    def __init__(self, token_mgr, model: str, model_info, first_token: str):
+        self.token_mgr = token_mgr
+        self.model = model
+        self.model_info = model_info
+        self._first: Optional[str] = first_token
+        self._assigned = {first_token}
+
+    def _pick(self, tried: set) -> Optional[str]:
+        """优先选择本次请求未使用的 token，其次在该分片未尝试过的已用 token 中选在途请求最少的"""
+        if self._first is not None:
+            token, self._first = self._first, None
+            return token
+        pools = ModelService.pool_candidates_for_model(self.model)
+        exclude = self._assigned | tried
+        for pool_name in pools:
+            token = self.token_mgr.get_token(pool_name, exclude=exclude)
+            if token:
+                self._assigned.add(token)
+                return token
+        return self._least_loaded(pools, tried)
+
+    def _least_loaded(self, pools: List[str], tried: set) -> Optional[str]:
+        """池中没有未使用的 token 时，在本次请求已使用的 token 中选在途请求最少的"""
+        best, best_load = None, None
+        for pool_name in pools:
+            pool = self.token_mgr.pools.get(pool_name)
+            if pool is None:
+                continue
+            for token in self._assigned - tried:
+                info = pool.get(token.removeprefix("sso="))
+                if info is None or info.status != TokenStatus.ACTIVE or info.quota <= 0:
+                    continue
+                load = pool.inflight(info.token)
+                if best_load is None or load < best_load:
+                    best, best_load = token, load
+        return best
+
+    def pick_spare(self) -> Optional[str]:
+        """选择本次请求尚未使用的 token（用于对冲请求，没有则返回 None）"""
+        exclude = set(self._assigned)
+        if self._first is not None:
+            exclude.add(self._first)
+        for pool_name in ModelService.pool_candidates_for_model(self.model):
+            token = self.token_mgr.get_token(pool_name, exclude=exclude)
+            if token:
+                self._assigned.add(token)
+                return token
+        return None
+
+    async def charge(self, token: str):
+        try:
+            await self.token_mgr.consume(token, _get_effort(self.model_info))
+        except Exception as e:
+            logger.warning(f"Failed to consume token: {e}")
 
-    except Exception as e:
-        logger.error(f"Grok image call failed: {e}")
-        return []
-    finally:
-        if success:
+    async def _run_shard(self, index: int, target: int, call) -> List[str]:
+        tried: set = set()
+        attempts = max(1, int(get_config("retry.max_retry") or 1))
+        for attempt in range(attempts):
+            # 选择 token 须在首次 await 之前完成，保证并发分片各自拿到不同 token
+            token = self._pick(tried)
+            if not token:
+                logger.warning(f"Image shard {index}: no token left to try")
+                break
+            tried.add(token)
+            # 在途请求只在此登记一次，call 内不再重复登记（WS 调用传 lease=False）
+            lease = self.token_mgr.acquire_inflight(token)
             try:
-                await token_mgr.consume(token, _get_effort(model_info))
+                images = await call(token, target)
             except Exception as e:
-                logger.warning(f"Failed to consume token: {e}")
+                status = error_status(e)
+                if status == 429:
+                    await self.token_mgr.mark_rate_limited(token)
+                elif status in (401, 403):
+                    await self.token_mgr.record_fail(token, status, "image_generation")
+                logger.warning(
+                    f"Image shard {index} failed on token {token[:10]}... "
+                    f"(attempt {attempt + 1}/{attempts}): {e}"
+                )
+                continue
+            finally:
+                lease.release()
+
+            if images:
+                await self.charge(token)
+                return images
+            logger.warning(
+                f"Image shard {index} returned no images on token {token[:10]}... "
+                f"(attempt {attempt + 1}/{attempts})"
+            )
+        return []
+
+    async def run(self, targets: List[int], call) -> List[List[str]]:
+        """
+        并发执行全部分片
+
+        Args:
+            targets: 每个分片期望的图片数
+            call: async (token, target) -> List[str]，失败时抛出异常
+
+        Returns:
+            每个分片的图片列表（重试耗尽的分片为空列表）
+        """
+        return await asyncio.gather(
+            *(self._run_shard(i, target, call) for i, target in enumerate(targets))
+        )
 
 
 @router.post("/images/generations")
@@ -377,46 +455,64 @@ async def create_image(request: ImageGenerationRequest):
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
         )
 
-    # 非流式模式
+    # 非流式模式：按分片分散到多个 token 并发生成
     n = request.n
+    scheduler = ImageShardScheduler(token_mgr, request.model, model_info, token)
 
     usage_override = None
     if use_ws:
         aspect_ratio = resolve_aspect_ratio(request.size)
         enable_nsfw = bool(get_config("image.image_ws_nsfw"))
-        all_images = []
-        seen = set()
+        hedge = bool(get_config("image.image_ws_hedge"))
         expected_per_call = 6
         calls_needed = max(1, math.ceil(n / expected_per_call))
         calls_needed = min(calls_needed, n)
 
-        async def _fetch_batch(call_target: int):
-            upstream = image_service.stream(
-                token=token,
-                prompt=request.prompt,
-                aspect_ratio=aspect_ratio,
-                n=call_target,
-                enable_nsfw=enable_nsfw,
-            )
+        async def _fetch_batch(shard_token: str, call_target: int) -> List[str]:
+            backups: List[str] = []
+            if hedge:
+                # 迟迟没有图片时在空闲 token 上发起备用请求，凑齐后关闭其余连接
+                upstream = image_service.stream_hedged(
+                    token=shard_token,
+                    prompt=request.prompt,
+                    aspect_ratio=aspect_ratio,
+                    n=call_target,
+                    enable_nsfw=enable_nsfw,
+                    pick_backup=scheduler.pick_spare,
+                    on_backup=backups.append,
+                    lease=False,
+                )
+            else:
+                upstream = image_service.stream(
+                    token=shard_token,
+                    prompt=request.prompt,
+                    aspect_ratio=aspect_ratio,
+                    n=call_target,
+                    enable_nsfw=enable_nsfw,
+                    lease=False,
+                )
             processor = ImageWSCollectProcessor(
                 model_info.model_id,
-                token,
+                shard_token,
                 n=call_target,
                 response_format=response_format,
             )
-            return await processor.process(upstream)
-
-        tasks = []
-        for i in range(calls_needed):
-            remaining = n - (i * expected_per_call)
-            call_target = min(expected_per_call, remaining)
-            tasks.append(_fetch_batch(call_target))
+            try:
+                return await processor.process(upstream)
+            finally:
+                await upstream.aclose()
+                # 备用请求同样消耗上游额度
+                for backup in backups:
+                    await scheduler.charge(backup)
+
+        targets = [
+            min(expected_per_call, n - i * expected_per_call) for i in range(calls_needed)
+        ]
+        results = await scheduler.run(targets, _fetch_batch)
 
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        all_images = []
+        seen = set()
         for batch in results:
-            if isinstance(batch, Exception):
-                logger.warning(f"WS batch failed: {batch}")
-                continue
             for img in batch:
                 if img not in seen:
                     seen.add(img)
@@ -425,10 +521,6 @@ async def create_image(request: ImageGenerationRequest):
                     break
             if len(all_images) >= n:
                 break
-        try:
-            await token_mgr.consume(token, _get_effort(model_info))
-        except Exception as e:
-            logger.warning(f"Failed to consume token: {e}")
         usage_override = {
             "total_tokens": 0,
             "input_tokens": 0,
@@ -438,36 +530,21 @@ async def create_image(request: ImageGenerationRequest):
     else:
         calls_needed = (n + 1) // 2
 
-        if calls_needed == 1:
-            # 单次调用
-            all_images = await call_grok(
-                token_mgr,
-                token,
-                f"Image Generation: {request.prompt}",
-                model_info,
-                response_format=response_format,
+        async def _call_chat(shard_token: str, _target: int) -> List[str]:
+            response = await GrokChatService().chat(
+                token=shard_token,
+                message=f"Image Generation: {request.prompt}",
+                model=model_info.grok_model,
+                mode=model_info.model_mode,
+                stream=True,
             )
-        else:
-            # 并发调用
-            tasks = [
-                call_grok(
-                    token_mgr,
-                    token,
-                    f"Image Generation: {request.prompt}",
-                    model_info,
-                    response_format=response_format,
-                )
-                for _ in range(calls_needed)
-            ]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            # 收集成功的图片
-            all_images = []
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"Concurrent call failed: {result}")
-                elif isinstance(result, list):
-                    all_images.extend(result)
+            processor = ImageCollectProcessor(
+                model_info.model_id, shard_token, response_format=response_format
+            )
+            return await processor.process(response)
+
+        results = await scheduler.run([2] * calls_needed, _call_chat)
+        all_images = [img for batch in results for img in batch]
 
     # 随机选取 n 张图片
     if len(all_images) >= n:
@@ -1,18 +1,58 @@
 """
 Batch task manager for admin batch operations (SSE progress).
+
+Task parameters (including the full item list) are persisted once when the
+task starts (BaseStorage.save_batch_task_params); after that only the small
+state document and new per-item results are checkpointed
+(save_batch_task / append_batch_task_results), so that:
+
+- any worker can stream the progress of a task running on another worker;
+- a task whose worker crashed (no heartbeat for HEARTBEAT_TIMEOUT seconds) is
+  resumed by the watchdog of another worker, skipping the items it already
+  recorded.
+
+Tasks run through a registered runner (register_runner) so they can be resumed
+by kind; the runner receives the task and reads its inputs from task.params.
 """
 
 from __future__ import annotations
 
 import asyncio
+import os
+import socket
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.logger import logger
+from app.core.storage import get_storage
+
+# Interval between checkpoints (results + state + heartbeat), seconds
+FLUSH_INTERVAL = 1.0
+# A running task without heartbeat for this long is considered orphaned
+HEARTBEAT_TIMEOUT = 30
+# Finished tasks are kept this long (seconds) for late SSE clients
+TASK_TTL = 300
+# Watchdog scan interval, seconds
+WATCHDOG_INTERVAL = 15
+
+TERMINAL_STATUSES = ("done", "error", "cancelled")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
 
 
 class BatchTask:
-    def __init__(self, total: int):
-        self.id = uuid.uuid4().hex
+    def __init__(
+        self,
+        total: int,
+        *,
+        kind: str = "",
+        params: Optional[Dict[str, Any]] = None,
+        task_id: Optional[str] = None,
+    ):
+        self.id = task_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params: Dict[str, Any] = params or {}
         self.total = int(total)
         self.processed = 0
         self.ok = 0
@@ -22,9 +62,14 @@ class BatchTask:
         self.result: Optional[Dict[str, Any]] = None
         self.error: Optional[str] = None
         self.created_at = time.time()
+        self.updated_at = self.created_at
         self._queues: List[asyncio.Queue] = []
         self._final_event: Optional[Dict[str, Any]] = None
         self.cancelled = False
+        # Checkpointed per-item results: item -> {"ok": bool, "res": ...}
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._saved_state: Optional[tuple] = None
 
     def snapshot(self) -> Dict[str, Any]:
         return {
@@ -55,13 +100,30 @@ class BatchTask:
                 pass
 
     def record(
-        self, ok: bool, *, item: Any = None, detail: Any = None, error: str = ""
+        self,
+        ok: bool,
+        *,
+        item: Any = None,
+        detail: Any = None,
+        error: str = "",
+        key: Optional[str] = None,
+        result: Any = None,
     ) -> None:
+        """
+        Record one processed item.
+
+        With ``key`` the item's ``result`` is checkpointed, and the item is
+        skipped when the task is resumed.
+        """
         self.processed += 1
         if ok:
             self.ok += 1
         else:
             self.fail += 1
+        if key is not None:
+            entry = {"ok": bool(ok), "res": result}
+            self.completed[key] = entry
+            self._pending[key] = entry
         event: Dict[str, Any] = {
             "type": "progress",
             "task_id": self.id,
@@ -78,6 +140,18 @@ class BatchTask:
             event["error"] = error
         self._publish(event)
 
+    def pending_items(self) -> List[str]:
+        """Items of ``params["items"]`` not checkpointed yet."""
+        return [i for i in self.params.get("items", []) if i not in self.completed]
+
+    def results(self) -> Dict[str, Any]:
+        """Checkpointed results in ``params["items"]`` order: item -> result."""
+        return {
+            i: self.completed[i]["res"]
+            for i in self.params.get("items", [])
+            if i in self.completed
+        }
+
     def finish(self, result: Dict[str, Any], *, warning: Optional[str] = None) -> None:
         self.status = "done"
         self.result = result
@@ -129,24 +203,256 @@ class BatchTask:
     def final_event(self) -> Optional[Dict[str, Any]]:
         return self._final_event
 
+    # ==================== Persistence ====================
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Checkpointed state: status, counters and heartbeat (params are stored once)."""
+        return {
+            **self.snapshot(),
+            "id": self.id,
+            "kind": self.kind,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "owner": WORKER_ID,
+            "final": self._final_event,
+        }
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Dict[str, Any],
+        completed: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> "BatchTask":
+        task = cls(
+            data.get("total", 0),
+            kind=data.get("kind", ""),
+            params=params,
+            task_id=data["id"],
+        )
+        task.status = data.get("status", "running")
+        task.warning = data.get("warning")
+        task.error = data.get("error")
+        task.created_at = data.get("created_at", task.created_at)
+        task._final_event = data.get("final")
+        task.cancelled = bool(data.get("cancel_requested"))
+        # Counters follow the checkpointed results (written before the state)
+        task.completed = dict(completed or {})
+        task.processed = len(task.completed)
+        task.ok = sum(1 for entry in task.completed.values() if entry.get("ok"))
+        task.fail = task.processed - task.ok
+        return task
+
+    async def flush(self) -> None:
+        """Checkpoint pending results, then state and heartbeat."""
+        storage = get_storage()
+        now = time.time()
+        state = (self.processed, self.status)
+        if (
+            not self._pending
+            and state == self._saved_state
+            and now - self.updated_at < HEARTBEAT_TIMEOUT / 3
+        ):
+            # Nothing changed: only keep the heartbeat fresh
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            if pending:
+                await storage.append_batch_task_results(self.id, pending)
+            self.updated_at = now
+            await storage.save_batch_task(self.to_dict())
+            self._saved_state = state
+        except Exception as e:
+            # Keep the results for the next checkpoint
+            self._pending = {**pending, **self._pending}
+            logger.warning(f"Batch task {self.id}: checkpoint failed: {e}")
+
+    async def poll_cancel(self) -> None:
+        """Pick up a cancel request made on another worker."""
+        if not self.cancelled and await get_storage().is_batch_task_cancel_requested(
+            self.id
+        ):
+            self.cancel()
+
+
+Runner = Callable[[BatchTask], Awaitable[None]]
 
 _TASKS: Dict[str, BatchTask] = {}
+_RUNNERS: Dict[str, Runner] = {}
+_watchdog: Optional[asyncio.Task] = None
+
+
+def register_runner(kind: str, runner: Runner) -> None:
+    """
+    Register the runner of a task kind.
+
+    The runner processes ``task.pending_items()``, records each item with
+    ``key=`` and finishes the task with finish / finish_cancelled; an uncaught
+    exception fails the task.
+    """
+    _RUNNERS[kind] = runner
 
 
-def create_task(total: int) -> BatchTask:
-    task = BatchTask(total)
+async def start_task(
+    kind: str, items: List[str], params: Optional[Dict[str, Any]] = None
+) -> BatchTask:
+    """Persist a new task of a registered kind and run it in the background."""
+    if kind not in _RUNNERS:
+        raise ValueError(f"Unknown batch task kind: {kind}")
+    task = BatchTask(len(items), kind=kind, params={**(params or {}), "items": items})
     _TASKS[task.id] = task
+    try:
+        await get_storage().save_batch_task_params(task.id, task.params)
+    except Exception as e:
+        # The task still runs here, it just cannot be resumed elsewhere
+        logger.warning(f"Batch task {task.id}: saving params failed: {e}")
+    await task.flush()
+    asyncio.create_task(_drive(task))
     return task
 
 
+async def _flush_loop(task: BatchTask) -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await task.flush()
+        try:
+            await task.poll_cancel()
+        except Exception as e:
+            logger.debug(f"Batch task {task.id}: cancel check failed: {e}")
+
+
+async def _drive(task: BatchTask) -> None:
+    flusher = asyncio.create_task(_flush_loop(task))
+    try:
+        await _RUNNERS[task.kind](task)
+        if task.final_event() is None:
+            task.fail_task("Task ended without result")
+    except Exception as e:
+        logger.error(f"Batch task {task.id} ({task.kind}) failed: {e}")
+        task.fail_task(str(e))
+    finally:
+        flusher.cancel()
+        await task.flush()
+        asyncio.create_task(expire_task(task.id, TASK_TTL))
+
+
 def get_task(task_id: str) -> Optional[BatchTask]:
     return _TASKS.get(task_id)
 
 
+async def load_task_state(task_id: str) -> Optional[Dict[str, Any]]:
+    """Persisted state of a task (for tasks running on other workers)."""
+    try:
+        return await get_storage().load_batch_task(task_id)
+    except Exception as e:
+        logger.warning(f"Batch task {task_id}: load failed: {e}")
+        return None
+
+
+async def request_cancel(task_id: str) -> bool:
+    """Cancel a task running on any worker."""
+    task = _TASKS.get(task_id)
+    if task:
+        task.cancel()
+    try:
+        requested = await get_storage().request_batch_task_cancel(task_id)
+    except Exception as e:
+        logger.warning(f"Batch task {task_id}: cancel request failed: {e}")
+        requested = False
+    return bool(task) or requested
+
+
 def delete_task(task_id: str) -> None:
     _TASKS.pop(task_id, None)
 
 
-async def expire_task(task_id: str, delay: int = 300) -> None:
+async def expire_task(task_id: str, delay: int = TASK_TTL) -> None:
     await asyncio.sleep(delay)
     delete_task(task_id)
+
+
+# ==================== Resume / cleanup ====================
+
+
+async def _resume(data: Dict[str, Any]) -> None:
+    """Claim an orphaned task and continue it on this worker."""
+    task_id = data["id"]
+    storage = get_storage()
+    async with storage.acquire_lock(f"batch_task_{task_id}", timeout=10):
+        # Re-check under the lock: another worker may have claimed it
+        data = await storage.load_batch_task(task_id)
+        if (
+            not data
+            or data.get("status") != "running"
+            or time.time() - data.get("updated_at", 0) < HEARTBEAT_TIMEOUT
+            or task_id in _TASKS
+        ):
+            return
+        completed = await storage.load_batch_task_results(task_id)
+        params = await storage.load_batch_task_params(task_id)
+        task = BatchTask.from_dict(data, completed, params)
+        _TASKS[task_id] = task
+        await task.flush()
+
+    if params is None:
+        task.fail_task("Task parameters not found")
+        await task.flush()
+        asyncio.create_task(expire_task(task_id, TASK_TTL))
+        return
+    if task.cancelled:
+        task.finish_cancelled()
+        await task.flush()
+        asyncio.create_task(expire_task(task_id, TASK_TTL))
+        return
+    if task.kind not in _RUNNERS:
+        task.fail_task(f"Unknown batch task kind: {task.kind}")
+        await task.flush()
+        asyncio.create_task(expire_task(task_id, TASK_TTL))
+        return
+
+    logger.info(
+        f"Batch task {task_id} ({task.kind}): resuming at {task.processed}/{task.total}"
+    )
+    asyncio.create_task(_drive(task))
+
+
+async def sweep_tasks() -> None:
+    """Resume orphaned running tasks and delete expired finished ones."""
+    storage = get_storage()
+    now = time.time()
+    for data in await storage.list_batch_tasks():
+        task_id = data.get("id")
+        if not task_id or task_id in _TASKS:
+            continue
+        age = now - data.get("updated_at", 0)
+        if data.get("status") in TERMINAL_STATUSES:
+            if age > TASK_TTL:
+                await storage.delete_batch_task(task_id)
+        elif age > HEARTBEAT_TIMEOUT:
+            try:
+                await _resume(data)
+            except Exception as e:
+                logger.warning(f"Batch task {task_id}: resume failed: {e}")
+
+
+async def _watchdog_loop() -> None:
+    while True:
+        try:
+            await sweep_tasks()
+        except Exception as e:
+            logger.warning(f"Batch task watchdog failed: {e}")
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+
+
+def start_watchdog() -> None:
+    global _watchdog
+    if _watchdog is None or _watchdog.done():
+        _watchdog = asyncio.create_task(_watchdog_loop())
+
+
+def stop_watchdog() -> None:
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.cancel()
+        _watchdog = None
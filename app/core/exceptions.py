@@ -2,7 +2,7 @@
 全局异常处理 - OpenAI 兼容错误格式
 """
 
-from typing import Any
+from typing import Any, Optional
 from enum import Enum
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
@@ -101,6 +101,14 @@ class UpstreamException(AppException):
         self.details = details
 
 
+def error_status(error: Exception) -> Optional[int]:
+    """异常 details 中携带的原始上游 HTTP 状态码（无法识别时为 None）"""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict) and isinstance(details.get("status"), int):
+        return details["status"]
+    return None
+
+
 # ============= 异常处理器 =============
 
 
@@ -219,6 +227,7 @@ __all__ = [
     "ValidationException",
     "AuthenticationException",
     "UpstreamException",
+    "error_status",
     "error_response",
     "register_exception_handlers",
 ]
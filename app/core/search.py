@@ -0,0 +1,115 @@
+"""
+全文检索分词（SQLite FTS5）
+
+FTS5 自带的 unicode61 分词器按空白/标点切分，连续的中日韩文字会被当成一个整体，
+无法按词检索；这里在写入前自行分词，再以空格分隔的形式交给 FTS5:
+
+- body 列: 中日韩文字按二元组（bigram）切分、保持位置连续；其他文字按单词切分
+- chars 列: 中日韩单字（unigram），用于单字检索
+
+查询时中日韩连续片段转换为 bigram 短语查询（位置连续 = 原文包含该片段），
+单字走 chars 列，其他单词按前缀匹配，各片段之间为 AND；排序使用 bm25。
+"""
+
+import re
+import sqlite3
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# 中日韩文字（CJK 统一表意文字及扩展 A、兼容表意文字、假名、谚文）
+_CJK = r"぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_CJK_RUN = re.compile(f"[{_CJK}]+")
+_WORD = re.compile(f"(?:(?![{_CJK}])[^\\W_])+")
+
+# 单字检索列权重较低（二元组命中更能说明相关性）
+BM25_WEIGHTS = (1.0, 0.3)
+
+FTS_COLUMNS = "body, chars"
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").casefold()
+
+
+def _runs(text: str) -> List[Tuple[bool, str]]:
+    """按文字类别切分为 (是否中日韩, 片段)，保持原文顺序"""
+    runs: List[Tuple[bool, str]] = []
+    pos = 0
+    for m in _CJK_RUN.finditer(text):
+        runs.extend((False, w) for w in _WORD.findall(text, pos, m.start()))
+        runs.append((True, m.group()))
+        pos = m.end()
+    runs.extend((False, w) for w in _WORD.findall(text, pos))
+    return runs
+
+
+def _bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i : i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(*texts: Optional[str]) -> Tuple[str, str]:
+    """
+    生成写入 FTS 表的 (body, chars)
+
+    多段文本（如标题、正文、标签）依次拼接。
+    """
+    body: List[str] = []
+    chars: List[str] = []
+    for text in texts:
+        for is_cjk, run in _runs(_normalize(text)):
+            if is_cjk:
+                body.extend(_bigrams(run))
+                chars.extend(run)
+            else:
+                body.append(run)
+    return " ".join(body), " ".join(chars)
+
+
+def match_expression(query: Optional[str]) -> Optional[str]:
+    """
+    将用户输入转换为 FTS5 MATCH 表达式
+
+    Returns:
+        表达式；输入中没有可检索的文字时返回 None（调用方退回子串匹配）
+    """
+    terms: List[str] = []
+    for is_cjk, run in _runs(_normalize(query or "")):
+        if not is_cjk:
+            terms.append(f'body : "{run}" *')
+        elif len(run) == 1:
+            terms.append(f'chars : "{run}"')
+        else:
+            terms.append(f'body : "{" ".join(_bigrams(run))}"')
+    return " AND ".join(terms) if terms else None
+
+
+@lru_cache(maxsize=1)
+def fts5_available() -> bool:
+    """当前 SQLite 是否编译了 FTS5"""
+    try:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def fts_rows(docs: Iterable[Tuple[object, Tuple[Optional[str], ...]]]) -> List[Tuple]:
+    """(key, 文本元组) -> (body, chars, key)，用于 executemany"""
+    return [(*tokenize(*texts), key) for key, texts in docs]
+
+
+__all__ = [
+    "BM25_WEIGHTS",
+    "FTS_COLUMNS",
+    "tokenize",
+    "match_expression",
+    "fts5_available",
+    "fts_rows",
+]
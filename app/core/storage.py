@@ -17,7 +17,7 @@ import asyncio
 import hashlib
 import time
 import tomllib
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 from enum import Enum
 
@@ -41,10 +41,26 @@ DATA_DIR = Path(os.getenv("DATA_DIR", str(DEFAULT_DATA_DIR))).expanduser()
 # 配置文件路径
 CONFIG_FILE = DATA_DIR / "config.toml"
 TOKEN_FILE = DATA_DIR / "token.json"
+TOKEN_DELTA_FILE = DATA_DIR / "token.delta.jsonl"
 IMAGE_METADATA_FILE = DATA_DIR / "image_metadata.json"
 PROMPTS_FILE = DATA_DIR / "prompts.json"
+BATCH_TASK_DIR = DATA_DIR / "batch_tasks"
 LOCK_DIR = DATA_DIR / ".locks"
 
+# Token 增量日志超过该大小（且大于快照）时合并回快照
+TOKEN_DELTA_COMPACT_BYTES = 1024 * 1024
+
+# SQL 变更查询的回看窗口（毫秒），容忍 worker 间时钟偏差与事务提交延迟
+TOKEN_CHANGE_LOOKBACK_MS = 5000
+# SQL Token 删除标记保留时长（毫秒）
+TOKEN_TOMBSTONE_TTL_MS = 24 * 3600 * 1000
+
+# Redis Token 变更流保留的最大记录数（近似裁剪）
+TOKEN_CHANGE_STREAM_MAXLEN = 10000
+
+# Token 变更：(新游标, 按池分组的变更 Token, 删除的 token 列表)
+TokenChanges = Tuple[Any, Dict[str, List[Dict[str, Any]]], List[str]]
+
 
 # Windows 文件操作辅助函数
 async def safe_atomic_write(target_path: Path, content: bytes, max_retries: int = 3):
@@ -102,6 +118,42 @@ def json_loads(obj: str | bytes) -> Any:
     return orjson.loads(obj)
 
 
+def apply_token_deltas(
+    data: Dict[str, Any],
+    updated: Dict[str, List[Dict[str, Any]]],
+    deleted: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """将 Token 增量（按池分组的 upsert + 删除列表）合并到全量数据"""
+    pools: Dict[str, Dict[str, Any]] = {}
+    owner: Dict[str, str] = {}
+    for pool_name, tokens in (data or {}).items():
+        pool = pools.setdefault(pool_name, {})
+        for t in tokens or []:
+            token_str = t.get("token") if isinstance(t, dict) else None
+            if token_str:
+                pool[token_str] = t
+                owner[token_str] = pool_name
+
+    for token_str in deleted or []:
+        pool_name = owner.pop(token_str, None)
+        if pool_name is not None:
+            pools[pool_name].pop(token_str, None)
+
+    for pool_name, tokens in (updated or {}).items():
+        pool = pools.setdefault(pool_name, {})
+        for t in tokens:
+            token_str = t.get("token")
+            if not token_str:
+                continue
+            prev = owner.get(token_str)
+            if prev is not None and prev != pool_name:
+                pools[prev].pop(token_str, None)
+            pool[token_str] = t
+            owner[token_str] = pool_name
+
+    return {name: list(pool.values()) for name, pool in pools.items()}
+
+
 class StorageError(Exception):
     """存储服务基础异常"""
 
@@ -111,6 +163,11 @@ class StorageError(Exception):
 class BaseStorage(abc.ABC):
     """存储基类"""
 
+    # 是否支持跨 worker 原子配额计数（见 RedisStorage.token_quota_consume）
+    supports_atomic_quota = False
+    # 是否支持跨 worker 共享缓存（见 RedisStorage.shared_cache_get）
+    supports_shared_cache = False
+
     @abc.abstractmethod
     async def load_config(self) -> Dict[str, Any]:
         """加载配置"""
@@ -131,6 +188,40 @@ class BaseStorage(abc.ABC):
         """保存所有 Token"""
         pass
 
+    async def save_token_deltas(
+        self,
+        updated: Dict[str, List[Dict[str, Any]]],
+        deleted: Optional[List[str]] = None,
+    ):
+        """
+        增量保存 Token
+
+        Args:
+            updated: 变更的 Token（按池分组，格式同 save_tokens）
+            deleted: 被删除的 token 字符串列表
+        """
+        # 默认实现：读取全量后合并写回，各后端可覆盖为真正的增量写入
+        data = await self.load_tokens() or {}
+        await self.save_tokens(apply_token_deltas(data, updated, deleted))
+
+    async def get_token_cursor(self) -> Any:
+        """
+        获取 Token 变更游标（在 load_tokens 之前调用）
+
+        Returns:
+            游标；None 表示后端不支持变更订阅
+        """
+        return None
+
+    async def load_token_changes(self, cursor: Any) -> Optional[TokenChanges]:
+        """
+        读取游标之后的 Token 变更
+
+        Returns:
+            (新游标, 变更 Token, 删除列表)；None 表示需要全量重新加载
+        """
+        return None
+
     @abc.abstractmethod
     async def load_image_metadata(self) -> Dict[str, Any]:
         """加载图片元数据"""
@@ -141,6 +232,66 @@ class BaseStorage(abc.ABC):
         """保存图片元数据"""
         pass
 
+    async def upsert_images(self, images: List[Dict[str, Any]]):
+        """
+        新增或覆盖图片元数据（按 id）
+
+        默认实现：读取全量后合并写回，各后端可覆盖为逐行写入
+        """
+        by_id = {img["id"]: img for img in images if img.get("id")}
+        if not by_id:
+            return
+        data = await self.load_image_metadata()
+        merged = []
+        for img in data.get("images", []):
+            merged.append(by_id.pop(img.get("id"), img))
+        merged.extend(by_id.values())
+        data["images"] = merged
+        await self.save_image_metadata(data)
+
+    async def upsert_image(self, image: Dict[str, Any]):
+        """新增或覆盖单张图片元数据"""
+        await self.upsert_images([image])
+
+    async def delete_images(self, image_ids: List[str]) -> int:
+        """删除图片元数据，返回删除条数"""
+        ids = set(image_ids)
+        if not ids:
+            return 0
+        data = await self.load_image_metadata()
+        images = data.get("images", [])
+        remaining = [img for img in images if img.get("id") not in ids]
+        if len(remaining) != len(images):
+            data["images"] = remaining
+            await self.save_image_metadata(data)
+        return len(images) - len(remaining)
+
+    async def patch_image(
+        self, image_id: str, changes: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        更新单张图片的部分字段
+
+        Returns:
+            更新后的元数据；图片不存在返回 None
+        """
+        data = await self.load_image_metadata()
+        for img in data.get("images", []):
+            if img.get("id") == image_id:
+                img.update(changes)
+                await self.save_image_metadata(data)
+                return img
+        return None
+
+    async def get_image_metadata_revision(self) -> Optional[str]:
+        """
+        获取图片元数据修订号（每次写入图片元数据后变化）
+
+        Returns:
+            修订号；None 表示后端无法提供
+        """
+        return None
+
     @abc.abstractmethod
     async def load_prompts(self) -> Dict[str, Any]:
         """加载提示词"""
@@ -151,6 +302,107 @@ class BaseStorage(abc.ABC):
         """保存提示词"""
         pass
 
+    async def get_prompts_revision(self) -> Optional[str]:
+        """
+        获取提示词修订号（每次保存提示词后变化）
+
+        Returns:
+            修订号；None 表示后端无法提供
+        """
+        return None
+
+    async def shared_cache_get(self, namespace: str, field: str) -> Optional[str]:
+        """
+        读取共享缓存
+
+        Args:
+            namespace: 缓存分组（整组共享过期时间，可整组删除）
+            field: 组内键
+        """
+        return None
+
+    async def shared_cache_set(
+        self, namespace: str, field: str, value: str, ttl: int
+    ):
+        """写入共享缓存，分组过期时间刷新为 ttl 秒"""
+        return None
+
+    async def shared_cache_delete(self, namespace: str):
+        """删除整个缓存分组"""
+        return None
+
+    async def rate_limit_reserve(
+        self,
+        specs: List[Tuple[str, float, float]],
+        cost: float,
+        max_wait: float,
+        force: bool = False,
+    ) -> Optional[Tuple[bool, List[float]]]:
+        """
+        原子预留多个令牌桶（跨 worker 共享的限流）
+
+        Args:
+            specs: [(桶名, 每秒补充数, 容量), ...]
+            cost: 每个桶扣除的令牌数
+            max_wait: 任一桶需等待超过该秒数时不预留
+            force: 忽略 max_wait 强制扣除
+
+        Returns:
+            (是否已预留, 各桶需等待秒数)；None 表示后端不支持（使用进程内令牌桶）
+        """
+        return None
+
+    # ==================== 批量任务 ====================
+
+    async def save_batch_task(self, task: Dict[str, Any]):
+        """
+        保存批量任务状态（按 task["id"] 覆盖，每个检查点调用）
+
+        不会清除已请求的取消标记，也不影响 save_batch_task_params 保存的参数。
+        """
+        return None
+
+    async def save_batch_task_params(self, task_id: str, params: Dict[str, Any]):
+        """保存批量任务参数（含全部待处理项，创建任务时写入一次）"""
+        return None
+
+    async def load_batch_task_params(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """读取批量任务参数，None 表示不存在或后端不支持"""
+        return None
+
+    async def load_batch_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        读取批量任务状态
+
+        Returns:
+            任务状态（附带 cancel_requested）；None 表示不存在或后端不支持
+        """
+        return None
+
+    async def list_batch_tasks(self) -> List[Dict[str, Any]]:
+        """列出全部批量任务状态（附带 cancel_requested）"""
+        return []
+
+    async def request_batch_task_cancel(self, task_id: str) -> bool:
+        """设置取消标记（执行任务的 worker 在下次检查点读取），任务不存在时返回 False"""
+        return False
+
+    async def is_batch_task_cancel_requested(self, task_id: str) -> bool:
+        """是否已请求取消（执行任务的 worker 定期轮询）"""
+        return False
+
+    async def append_batch_task_results(self, task_id: str, results: Dict[str, Any]):
+        """追加单项结果检查点: item -> 结果（同一 item 以最后一次为准）"""
+        return None
+
+    async def load_batch_task_results(self, task_id: str) -> Dict[str, Any]:
+        """读取全部单项结果检查点"""
+        return {}
+
+    async def delete_batch_task(self, task_id: str):
+        """删除批量任务状态、参数与结果"""
+        return None
+
     @abc.abstractmethod
     async def close(self):
         """关闭资源"""
@@ -274,25 +526,148 @@ class LocalStorage(BaseStorage):
             raise StorageError(f"保存配置失败: {e}")
 
     async def load_tokens(self) -> Dict[str, Any]:
-        if not TOKEN_FILE.exists():
+        if not TOKEN_FILE.exists() and not TOKEN_DELTA_FILE.exists():
             return {}
         try:
-            async with aiofiles.open(TOKEN_FILE, "rb") as f:
-                content = await f.read()
-                return json_loads(content)
+            data = {}
+            if TOKEN_FILE.exists():
+                async with aiofiles.open(TOKEN_FILE, "rb") as f:
+                    content = await f.read()
+                    data = json_loads(content)
+            return await self._replay_token_deltas(data)
         except Exception as e:
             logger.error(f"LocalStorage: 加载 Token 失败: {e}")
             return {}
 
+    async def _replay_token_deltas(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """在快照之上重放增量日志"""
+        if not TOKEN_DELTA_FILE.exists():
+            return data
+        async with aiofiles.open(TOKEN_DELTA_FILE, "rb") as f:
+            content = await f.read()
+        updated, deleted = self._collapse_token_log(content)
+        return apply_token_deltas(data, updated, deleted)
+
+    @staticmethod
+    def _collapse_token_log(
+        content: bytes,
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], List[str]]:
+        """解析增量日志，合并为 (按池分组的变更 Token, 删除列表)"""
+        # 每条记录都是完整状态，只需保留每个 token 的最后一条
+        latest: Dict[str, Dict[str, Any]] = {}
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json_loads(line)
+            except Exception:
+                # 末行可能因进程中断而不完整
+                logger.warning("LocalStorage: 跳过损坏的 Token 增量记录")
+                continue
+            if entry.get("op") == "delete" and entry.get("token"):
+                latest.pop(entry["token"], None)
+                latest[entry["token"]] = entry
+            elif entry.get("op") == "upsert" and isinstance(entry.get("data"), dict):
+                token_str = entry["data"].get("token")
+                if token_str:
+                    latest.pop(token_str, None)
+                    latest[token_str] = entry
+
+        updated: Dict[str, List[Dict[str, Any]]] = {}
+        deleted: List[str] = []
+        for token_str, entry in latest.items():
+            if entry["op"] == "delete":
+                deleted.append(token_str)
+            else:
+                updated.setdefault(entry.get("pool"), []).append(entry["data"])
+        return updated, deleted
+
+    @staticmethod
+    def _snapshot_version() -> int:
+        try:
+            return TOKEN_FILE.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    async def get_token_cursor(self) -> Any:
+        """游标: (快照 mtime, 增量日志偏移)"""
+        try:
+            offset = TOKEN_DELTA_FILE.stat().st_size
+        except FileNotFoundError:
+            offset = 0
+        return (self._snapshot_version(), offset)
+
+    async def load_token_changes(self, cursor: Any) -> Optional[TokenChanges]:
+        """读取增量日志中游标之后追加的记录；快照被重写时返回 None"""
+        try:
+            version, offset = cursor
+            if self._snapshot_version() != version:
+                return None
+            try:
+                size = TOKEN_DELTA_FILE.stat().st_size
+            except FileNotFoundError:
+                size = 0
+            if size < offset:
+                return None
+            if size == offset:
+                return cursor, {}, []
+
+            async with aiofiles.open(TOKEN_DELTA_FILE, "rb") as f:
+                await f.seek(offset)
+                content = await f.read(size - offset)
+            # 只消费完整的行，未写完的部分留到下次
+            end = content.rfind(b"\n") + 1
+            if end == 0:
+                return cursor, {}, []
+            updated, deleted = self._collapse_token_log(content[:end])
+            return (version, offset + end), updated, deleted
+        except Exception as e:
+            logger.warning(f"LocalStorage: 读取 Token 变更失败: {e}")
+            return None
+
     async def save_tokens(self, data: Dict[str, Any]):
         try:
             TOKEN_FILE.parent.mkdir(parents=True, exist_ok=True)
             content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
             await safe_atomic_write(TOKEN_FILE, content)
+            # 快照已包含全部变更，清空增量日志
+            if TOKEN_DELTA_FILE.exists():
+                TOKEN_DELTA_FILE.unlink()
         except Exception as e:
             logger.error(f"LocalStorage: 保存 Token 失败: {e}")
             raise StorageError(f"保存 Token 失败: {e}")
 
+    async def save_token_deltas(
+        self,
+        updated: Dict[str, List[Dict[str, Any]]],
+        deleted: Optional[List[str]] = None,
+    ):
+        """追加写入增量日志，日志过大时合并回快照"""
+        try:
+            lines = []
+            for token_str in deleted or []:
+                lines.append(orjson.dumps({"op": "delete", "token": token_str}))
+            for pool_name, tokens in (updated or {}).items():
+                for t in tokens:
+                    lines.append(
+                        orjson.dumps({"op": "upsert", "pool": pool_name, "data": t})
+                    )
+            if not lines:
+                return
+
+            TOKEN_DELTA_FILE.parent.mkdir(parents=True, exist_ok=True)
+            async with aiofiles.open(TOKEN_DELTA_FILE, "ab") as f:
+                await f.write(b"\n".join(lines) + b"\n")
+
+            log_size = TOKEN_DELTA_FILE.stat().st_size
+            snapshot_size = TOKEN_FILE.stat().st_size if TOKEN_FILE.exists() else 0
+            if log_size > max(TOKEN_DELTA_COMPACT_BYTES, snapshot_size):
+                await self.save_tokens(await self.load_tokens())
+                logger.debug(f"LocalStorage: Token 增量日志已合并 ({log_size} bytes)")
+        except Exception as e:
+            logger.error(f"LocalStorage: 增量保存 Token 失败: {e}")
+            raise StorageError(f"增量保存 Token 失败: {e}")
+
     async def load_image_metadata(self) -> Dict[str, Any]:
         if not IMAGE_METADATA_FILE.exists():
             return {"images": [], "version": "1.0"}
@@ -313,6 +688,26 @@ class LocalStorage(BaseStorage):
             logger.error(f"LocalStorage: 保存图片元数据失败: {e}")
             raise StorageError(f"保存图片元数据失败: {e}")
 
+    async def get_image_metadata_revision(self) -> Optional[str]:
+        """修订号: 元数据文件 mtime + 大小（原子替换写入后必然变化）"""
+        try:
+            st = IMAGE_METADATA_FILE.stat()
+        except FileNotFoundError:
+            return "0"
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+    async def get_prompts_revision(self) -> Optional[str]:
+        """修订号: 提示词文件 mtime + 大小（原子替换写入后必然变化）"""
+        try:
+            st = PROMPTS_FILE.stat()
+        except FileNotFoundError:
+            return "0"
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
     async def load_prompts(self) -> Dict[str, Any]:
         if not PROMPTS_FILE.exists():
             return {"prompts": [], "version": "1.0"}
@@ -333,18 +728,268 @@ class LocalStorage(BaseStorage):
             logger.error(f"LocalStorage: 保存提示词失败: {e}")
             raise StorageError(f"保存提示词失败: {e}")
 
+    # ==================== 批量任务 ====================
+    # 每个任务: {id}.json 状态（原子替换）、{id}.params 参数（创建时写入一次）、
+    # {id}.results.jsonl 单项结果（追加）、{id}.cancel 取消标记；同一数据目录下的多个 worker 共享
+
+    @staticmethod
+    def _batch_task_file(task_id: str, suffix: str) -> Optional[Path]:
+        # task_id 来自请求路径，仅接受字母数字，避免路径穿越
+        if not task_id or not task_id.isalnum():
+            return None
+        return BATCH_TASK_DIR / f"{task_id}{suffix}"
+
+    async def _read_batch_task(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = json_loads(await f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"LocalStorage: 读取批量任务失败 {path.name}: {e}")
+            return None
+        data["cancel_requested"] = path.with_suffix(".cancel").exists()
+        return data
+
+    async def save_batch_task(self, task: Dict[str, Any]):
+        path = self._batch_task_file(task.get("id", ""), ".json")
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            await safe_atomic_write(path, orjson.dumps(task))
+        except Exception as e:
+            logger.error(f"LocalStorage: 保存批量任务失败: {e}")
+            raise StorageError(f"保存批量任务失败: {e}")
+
+    async def load_batch_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        path = self._batch_task_file(task_id, ".json")
+        return await self._read_batch_task(path) if path else None
+
+    async def save_batch_task_params(self, task_id: str, params: Dict[str, Any]):
+        path = self._batch_task_file(task_id, ".params")
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            await safe_atomic_write(path, orjson.dumps(params))
+        except Exception as e:
+            logger.error(f"LocalStorage: 保存批量任务参数失败: {e}")
+            raise StorageError(f"保存批量任务参数失败: {e}")
+
+    async def load_batch_task_params(self, task_id: str) -> Optional[Dict[str, Any]]:
+        path = self._batch_task_file(task_id, ".params")
+        if path is None:
+            return None
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                return json_loads(await f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"LocalStorage: 读取批量任务参数失败 {path.name}: {e}")
+            return None
+
+    async def list_batch_tasks(self) -> List[Dict[str, Any]]:
+        if not BATCH_TASK_DIR.exists():
+            return []
+        tasks = []
+        for path in BATCH_TASK_DIR.glob("*.json"):
+            data = await self._read_batch_task(path)
+            if data:
+                tasks.append(data)
+        return tasks
+
+    async def request_batch_task_cancel(self, task_id: str) -> bool:
+        path = self._batch_task_file(task_id, ".json")
+        if path is None or not path.exists():
+            return False
+        path.with_suffix(".cancel").touch()
+        return True
+
+    async def is_batch_task_cancel_requested(self, task_id: str) -> bool:
+        path = self._batch_task_file(task_id, ".cancel")
+        return bool(path and path.exists())
+
+    async def append_batch_task_results(self, task_id: str, results: Dict[str, Any]):
+        path = self._batch_task_file(task_id, ".results.jsonl")
+        if path is None or not results:
+            return
+        content = b"".join(
+            orjson.dumps({"item": item, "result": result}) + b"\n"
+            for item, result in results.items()
+        )
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            async with aiofiles.open(path, "ab") as f:
+                await f.write(content)
+        except Exception as e:
+            logger.error(f"LocalStorage: 保存批量任务结果失败: {e}")
+            raise StorageError(f"保存批量任务结果失败: {e}")
+
+    async def load_batch_task_results(self, task_id: str) -> Dict[str, Any]:
+        path = self._batch_task_file(task_id, ".results.jsonl")
+        results: Dict[str, Any] = {}
+        if path is None or not path.exists():
+            return results
+        async with aiofiles.open(path, "rb") as f:
+            content = await f.read()
+        for line in content.splitlines():
+            try:
+                entry = json_loads(line)
+            except Exception:
+                # 崩溃时可能残留未写完的最后一行
+                continue
+            results[entry["item"]] = entry.get("result")
+        return results
+
+    async def delete_batch_task(self, task_id: str):
+        for suffix in (".json", ".params", ".results.jsonl", ".cancel"):
+            path = self._batch_task_file(task_id, suffix)
+            if path is not None:
+                path.unlink(missing_ok=True)
+
     async def close(self):
         pass
 
 
+# Redis Lua: Token 配额原子操作
+# 公共参数: KEYS[1]=token hash, KEYS[2]=变更流; ARGV[1]=pool, ARGV[2]=token, ARGV[3]=流长度上限
+_LUA_TOKEN_CHANGED = """
+local function token_changed()
+    local updated = {}
+    updated[ARGV[1]] = {ARGV[2]}
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*',
+        'op', 'delta', 'updated', cjson.encode(updated), 'deleted', '[]')
+end
+"""
+
+# 归还旧租约并申请新租约/扣费
+# ARGV[4]=归还额度 ARGV[5]=租约内已用额度 ARGV[6]=租约纪元 ARGV[7]=申请额度 ARGV[8]=本次扣费 ARGV[9]=now
+_LUA_TOKEN_CONSUME = _LUA_TOKEN_CHANGED + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local epoch = tonumber(redis.call('HGET', KEYS[1], 'lease_epoch') or '0')
+local returned = tonumber(ARGV[4])
+-- 纪元变化（429/配额同步）后旧租约作废，不再归还
+if tonumber(ARGV[6]) ~= epoch then returned = 0 end
+local quota = tonumber(redis.call('HGET', KEYS[1], 'quota') or '0') + returned
+local cost = tonumber(ARGV[8])
+local take = math.min(quota, tonumber(ARGV[7]))
+local actual = math.min(cost, take)
+local leftover = take - actual
+quota = quota - take
+local used = tonumber(ARGV[5]) + actual
+local use_count = tonumber(redis.call('HINCRBY', KEYS[1], 'use_count', used))
+redis.call('HSET', KEYS[1], 'quota', quota)
+if used > 0 then redis.call('HSET', KEYS[1], 'last_used_at', ARGV[9]) end
+local status = redis.call('HGET', KEYS[1], 'status') or 'active'
+local old_status = status
+if cost > 0 or used > 0 then
+    if quota + leftover == 0 then
+        status = 'cooling'
+    elseif status == 'cooling' then
+        status = 'active'
+    end
+elseif returned > 0 and quota > 0 and status == 'cooling' then
+    status = 'active'
+end
+if status ~= old_status then redis.call('HSET', KEYS[1], 'status', status) end
+if take > 0 or status ~= old_status then token_changed() end
+return {actual, leftover, quota, status, use_count, epoch}
+"""
+
+# ARGV[4]=now ARGV[5]=原因 ARGV[6]=失败阈值
+_LUA_TOKEN_RECORD_FAIL = _LUA_TOKEN_CHANGED + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local fail_count = tonumber(redis.call('HINCRBY', KEYS[1], 'fail_count', 1))
+redis.call('HSET', KEYS[1], 'last_fail_at', ARGV[4], 'last_fail_reason', ARGV[5])
+local status = redis.call('HGET', KEYS[1], 'status') or 'active'
+if fail_count >= tonumber(ARGV[6]) then
+    status = 'expired'
+    redis.call('HSET', KEYS[1], 'status', status)
+end
+token_changed()
+return {fail_count, status}
+"""
+
+_LUA_TOKEN_RATE_LIMITED = _LUA_TOKEN_CHANGED + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+redis.call('HSET', KEYS[1], 'quota', 0, 'status', 'cooling')
+redis.call('HINCRBY', KEYS[1], 'lease_epoch', 1)
+token_changed()
+return 1
+"""
+
+# Redis Lua: 多令牌桶原子预留（使用 Redis 服务器时间，各 worker 时钟不一致也不影响）
+# KEYS[i]=桶 hash; ARGV[1]=cost, ARGV[2]=max_wait, ARGV[3]=force,
+# ARGV[2+2i]=第 i 个桶每秒补充数, ARGV[3+2i]=第 i 个桶容量
+_LUA_RATE_LIMIT_RESERVE = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local max_wait = tonumber(ARGV[2])
+local levels, waits = {}, {}
+local worst = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 + 2 * i])
+    local burst = tonumber(ARGV[3 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    waits[i] = math.max(0, (cost - tokens) / rate)
+    if waits[i] > worst then worst = waits[i] end
+end
+local ok = 1
+if worst > max_wait and ARGV[3] ~= '1' then
+    ok = 0
+else
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 + 2 * i])
+        local burst = tonumber(ARGV[3 + 2 * i])
+        local tokens = levels[i] - cost
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('EXPIRE', key, math.ceil((burst - tokens) / rate) + 60)
+    end
+end
+local out = {ok}
+for i = 1, #waits do out[i + 1] = tostring(waits[i]) end
+return out
+"""
+
+# ARGV[4]=新配额 ARGV[5]=是否计为一次使用 ARGV[6]=now
+_LUA_TOKEN_SYNC_QUOTA = _LUA_TOKEN_CHANGED + """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local quota = math.max(0, tonumber(ARGV[4]))
+local status = 'active'
+if quota == 0 then status = 'cooling' end
+redis.call('HSET', KEYS[1], 'quota', quota, 'status', status, 'fail_count', 0)
+redis.call('HDEL', KEYS[1], 'last_fail_at', 'last_fail_reason')
+local use_count = tonumber(redis.call('HGET', KEYS[1], 'use_count') or '0')
+if ARGV[5] == '1' then
+    use_count = tonumber(redis.call('HINCRBY', KEYS[1], 'use_count', 1))
+    redis.call('HSET', KEYS[1], 'last_used_at', ARGV[6])
+end
+redis.call('HINCRBY', KEYS[1], 'lease_epoch', 1)
+token_changed()
+return {status, use_count}
+"""
+
+
 class RedisStorage(BaseStorage):
     """
     Redis 存储
     - 使用 redis-py 异步客户端 (自带连接池)
     - 支持分布式锁 (redis.lock)
     - 扁平化数据结构优化性能
+    - 支持 Lua 原子配额计数（多 worker 共享）
     """
 
+    supports_atomic_quota = True
+    supports_shared_cache = True
+
     def __init__(self, url: str):
         try:
             from redis import asyncio as aioredis
@@ -360,9 +1005,22 @@ class RedisStorage(BaseStorage):
         self.key_pools = "grok2api:pools"  # Set: pool_names
         self.prefix_pool_set = "grok2api:pool:"  # Set: pool -> token_ids
         self.prefix_token_hash = "grok2api:token:"  # Hash: token_id -> token_data
-        self.image_metadata_key = "grok2api:image_metadata"  # String: JSON data
+        self.image_metadata_key = "grok2api:image_metadata"  # String: 旧版整体 JSON（迁移来源）
+        self.image_metadata_rev_key = "grok2api:image_metadata:rev"  # String: 修订号
+        self.gallery_images_key = "grok2api:gallery:images"  # Hash: image_id -> JSON
+        self.gallery_tags_key = "grok2api:gallery:tags"  # Set: 标签名
+        self.prefix_gallery_tag = "grok2api:gallery:tag:"  # Set: tag -> image_ids
         self.prompts_key = "grok2api:prompts"  # String: JSON data
+        self.prompts_rev_key = "grok2api:prompts:rev"  # String: 修订号
+        self.token_changes_key = "grok2api:token_changes"  # Stream: token 变更
+        self.prefix_shared_cache = "grok2api:cache:"  # Hash: namespace -> field -> value
+        self.batch_tasks_key = "grok2api:batch_tasks"  # Set: 批量任务 ID
+        # Hash: task_id -> data/params/cancel；{task_id}:results -> item -> 结果 JSON
+        self.prefix_batch_task = "grok2api:batch:"
+        self.prefix_rate_limit = "grok2api:ratelimit:"  # Hash: 令牌桶 -> tokens/ts
         self.lock_prefix = "grok2api:lock:"
+        self._scripts: Dict[str, Any] = {}
+        self._images_migrated = False
 
     @asynccontextmanager
     async def acquire_lock(self, name: str, timeout: int = 10):
@@ -472,31 +1130,7 @@ class RedisStorage(BaseStorage):
                 t_data = token_data_list[i]
                 if not t_data:
                     continue
-
-                # 恢复 tags (JSON -> List)
-                if "tags" in t_data:
-                    try:
-                        t_data["tags"] = json_loads(t_data["tags"])
-                    except Exception:
-                        t_data["tags"] = []
-
-                # 类型转换 (Redis 返回全 string)
-                for int_field in [
-                    "quota",
-                    "created_at",
-                    "use_count",
-                    "fail_count",
-                    "last_used_at",
-                    "last_fail_at",
-                    "last_sync_at",
-                ]:
-                    if t_data.get(int_field) and t_data[int_field] != "None":
-                        try:
-                            t_data[int_field] = int(t_data[int_field])
-                        except Exception:
-                            pass
-
-                token_lookup[tid] = t_data
+                token_lookup[tid] = self._unflatten_token(t_data)
 
             # 按 Pool 分组返回
             for pool_name in pool_names:
@@ -568,46 +1202,410 @@ class RedisStorage(BaseStorage):
                         token_str = t.get("token")
                         if not token_str:
                             continue
-                        t_flat = t.copy()
-                        if "tags" in t_flat:
-                            t_flat["tags"] = json_dumps(t_flat["tags"])
-                        status = t_flat.get("status")
-                        if isinstance(status, str) and status.startswith(
-                            "TokenStatus."
-                        ):
-                            t_flat["status"] = status.split(".", 1)[1].lower()
-                        elif isinstance(status, Enum):
-                            t_flat["status"] = status.value
-                        t_flat = {k: str(v) for k, v in t_flat.items() if v is not None}
                         pipe.hset(
-                            f"{self.prefix_token_hash}{token_str}", mapping=t_flat
+                            f"{self.prefix_token_hash}{token_str}",
+                            mapping=self._flatten_token(t),
                         )
 
+                # 全量重写：通知其他 worker 全量重新加载
+                self._add_token_change(pipe, {"op": "reset"})
+
                 await pipe.execute()
 
         except Exception as e:
             logger.error(f"RedisStorage: 保存 Token 失败: {e}")
             raise
 
+    @staticmethod
+    def _unflatten_token(t_data: Dict[str, str]) -> Dict[str, Any]:
+        """Redis Hash 字段转 Token 字典"""
+        # 恢复 tags (JSON -> List)
+        if "tags" in t_data:
+            try:
+                t_data["tags"] = json_loads(t_data["tags"])
+            except Exception:
+                t_data["tags"] = []
+
+        # 类型转换 (Redis 返回全 string)
+        for int_field in [
+            "quota",
+            "created_at",
+            "use_count",
+            "fail_count",
+            "last_used_at",
+            "last_fail_at",
+            "last_sync_at",
+        ]:
+            if t_data.get(int_field) and t_data[int_field] != "None":
+                try:
+                    t_data[int_field] = int(t_data[int_field])
+                except Exception:
+                    pass
+        return t_data
+
+    @staticmethod
+    def _flatten_token(t: Dict[str, Any]) -> Dict[str, str]:
+        """Token 字典转 Redis Hash 字段（值均为字符串）"""
+        t_flat = t.copy()
+        if "tags" in t_flat:
+            t_flat["tags"] = json_dumps(t_flat["tags"])
+        status = t_flat.get("status")
+        if isinstance(status, str) and status.startswith("TokenStatus."):
+            t_flat["status"] = status.split(".", 1)[1].lower()
+        elif isinstance(status, Enum):
+            t_flat["status"] = status.value
+        return {k: str(v) for k, v in t_flat.items() if v is not None}
+
+    async def save_token_deltas(
+        self,
+        updated: Dict[str, List[Dict[str, Any]]],
+        deleted: Optional[List[str]] = None,
+    ):
+        """增量保存 Token（逐个 Hash HSET，不重建池集合）"""
+        try:
+            pool_names = set()
+            if deleted:
+                pool_names = set(await self.redis.smembers(self.key_pools) or [])
+
+            async with self.redis.pipeline() as pipe:
+                for token_str in deleted or []:
+                    for pool_name in pool_names:
+                        pipe.srem(f"{self.prefix_pool_set}{pool_name}", token_str)
+                    pipe.delete(f"{self.prefix_token_hash}{token_str}")
+
+                for pool_name, tokens in (updated or {}).items():
+                    tids = [t.get("token") for t in tokens if t.get("token")]
+                    if not tids:
+                        continue
+                    pipe.sadd(self.key_pools, pool_name)
+                    pipe.sadd(f"{self.prefix_pool_set}{pool_name}", *tids)
+                    for t in tokens:
+                        token_str = t.get("token")
+                        if not token_str:
+                            continue
+                        key = f"{self.prefix_token_hash}{token_str}"
+                        # 置空的字段需删除，否则会残留旧值
+                        cleared = [k for k, v in t.items() if v is None]
+                        if cleared:
+                            pipe.hdel(key, *cleared)
+                        pipe.hset(key, mapping=self._flatten_token(t))
+
+                changed = {
+                    pool_name: [t.get("token") for t in tokens if t.get("token")]
+                    for pool_name, tokens in (updated or {}).items()
+                }
+                self._add_token_change(
+                    pipe,
+                    {
+                        "op": "delta",
+                        "updated": json_dumps(changed),
+                        "deleted": json_dumps(list(deleted or [])),
+                    },
+                )
+
+                await pipe.execute()
+
+        except Exception as e:
+            logger.error(f"RedisStorage: 增量保存 Token 失败: {e}")
+            raise
+
+    # ==================== 原子配额计数 ====================
+
+    async def _run_token_script(
+        self, source: str, pool_name: str, token: str, *args: Any
+    ) -> Any:
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.redis.register_script(source)
+        return await script(
+            keys=[f"{self.prefix_token_hash}{token}", self.token_changes_key],
+            args=[pool_name, token, TOKEN_CHANGE_STREAM_MAXLEN, *args],
+        )
+
+    async def token_quota_consume(
+        self,
+        pool_name: str,
+        token: str,
+        *,
+        cost: int = 0,
+        want: int = 0,
+        returned: int = 0,
+        used: int = 0,
+        epoch: int = 0,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        原子扣费（可同时归还旧租约并申请新租约）
+
+        Returns:
+            {"consumed", "leased", "quota", "status", "use_count", "epoch"}；Token 不存在时返回 None
+        """
+        now = int(time.time() * 1000)
+        res = await self._run_token_script(
+            _LUA_TOKEN_CONSUME, pool_name, token,
+            returned, used, epoch, want, cost, now,
+        )
+        if not res:
+            return None
+        consumed, leased, quota, status, use_count, epoch = res
+        return {
+            "consumed": int(consumed),
+            "leased": int(leased),
+            "quota": int(quota),
+            "status": status,
+            "use_count": int(use_count),
+            "epoch": int(epoch),
+        }
+
+    async def token_record_fail(
+        self, pool_name: str, token: str, reason: str, threshold: int
+    ) -> Optional[Dict[str, Any]]:
+        """原子记录失败，返回 {"fail_count", "status"}"""
+        now = int(time.time() * 1000)
+        res = await self._run_token_script(
+            _LUA_TOKEN_RECORD_FAIL, pool_name, token, now, reason or "", threshold
+        )
+        if not res:
+            return None
+        return {"fail_count": int(res[0]), "status": res[1]}
+
+    async def token_mark_rate_limited(self, pool_name: str, token: str) -> bool:
+        """原子标记 429（配额清零并作废所有未归还租约）"""
+        res = await self._run_token_script(_LUA_TOKEN_RATE_LIMITED, pool_name, token)
+        return bool(res)
+
+    async def token_sync_quota(
+        self, pool_name: str, token: str, quota: int, is_usage: bool
+    ) -> Optional[Dict[str, Any]]:
+        """原子写入 API 同步的配额，返回 {"status", "use_count"}"""
+        now = int(time.time() * 1000)
+        res = await self._run_token_script(
+            _LUA_TOKEN_SYNC_QUOTA, pool_name, token, quota, 1 if is_usage else 0, now
+        )
+        if not res:
+            return None
+        return {"status": res[0], "use_count": int(res[1])}
+
+    def _add_token_change(self, pipe, fields: Dict[str, str]):
+        pipe.xadd(
+            self.token_changes_key,
+            fields,
+            maxlen=TOKEN_CHANGE_STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    @staticmethod
+    def _stream_id(entry_id: str) -> Tuple[int, int]:
+        ms, _, seq = str(entry_id).partition("-")
+        return int(ms), int(seq or 0)
+
+    async def get_token_cursor(self) -> Any:
+        """游标: 变更流最后一条记录 ID"""
+        try:
+            last = await self.redis.xrevrange(self.token_changes_key, count=1)
+            return last[0][0] if last else "0-0"
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取 Token 变更游标失败: {e}")
+            return None
+
+    async def load_token_changes(self, cursor: Any) -> Optional[TokenChanges]:
+        """读取变更流中游标之后的记录，并批量取回变更的 Token"""
+        try:
+            if cursor != "0-0":
+                first = await self.redis.xrange(self.token_changes_key, count=1)
+                # 游标记录已被裁剪，中间的变更可能丢失
+                if first and self._stream_id(first[0][0]) > self._stream_id(cursor):
+                    return None
+
+            owner: Dict[str, str] = {}
+            deleted = set()
+            while True:
+                entries = await self.redis.xrange(
+                    self.token_changes_key, min=f"({cursor}", count=500
+                )
+                for entry_id, fields in entries:
+                    cursor = entry_id
+                    if fields.get("op") == "reset":
+                        return None
+                    for token_str in json_loads(fields.get("deleted") or "[]"):
+                        owner.pop(token_str, None)
+                        deleted.add(token_str)
+                    for pool_name, tids in json_loads(
+                        fields.get("updated") or "{}"
+                    ).items():
+                        for token_str in tids:
+                            deleted.discard(token_str)
+                            owner[token_str] = pool_name
+                if len(entries) < 500:
+                    break
+
+            updated: Dict[str, List[Dict[str, Any]]] = {}
+            if owner:
+                tids = list(owner)
+                async with self.redis.pipeline() as pipe:
+                    for tid in tids:
+                        pipe.hgetall(f"{self.prefix_token_hash}{tid}")
+                    token_data_list = await pipe.execute()
+                for tid, t_data in zip(tids, token_data_list):
+                    if not t_data:
+                        deleted.add(tid)
+                        continue
+                    updated.setdefault(owner[tid], []).append(
+                        self._unflatten_token(t_data)
+                    )
+
+            return cursor, updated, list(deleted)
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取 Token 变更失败: {e}")
+            return None
+
+    # ==================== 图片元数据（逐图片存储） ====================
+
+    async def _ensure_image_rows(self):
+        """旧版整体 JSON 迁移为逐图片 Hash 字段（每个进程检查一次）"""
+        if self._images_migrated:
+            return
+        from redis.exceptions import WatchError
+
+        while True:
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    # WATCH 旧键：其他 worker 并发迁移时重试，避免覆盖其后续写入
+                    await pipe.watch(self.image_metadata_key)
+                    raw = await pipe.get(self.image_metadata_key)
+                    if raw:
+                        images = json_loads(raw).get("images", [])
+                        pipe.multi()
+                        self._queue_image_upserts(pipe, images, {})
+                        pipe.delete(self.image_metadata_key)
+                        pipe.incr(self.image_metadata_rev_key)
+                        await pipe.execute()
+                        logger.info(f"RedisStorage: 图片元数据已迁移为逐图片存储 ({len(images)} 条)")
+                break
+            except WatchError:
+                continue
+        self._images_migrated = True
+
+    def _queue_image_upserts(
+        self, pipe, images: List[Dict[str, Any]], old_tags: Dict[str, List[str]]
+    ):
+        """在事务中写入图片及标签成员关系（old_tags: 覆盖前的标签）"""
+        mapping = {}
+        for img in images:
+            image_id = img.get("id")
+            if not image_id:
+                continue
+            mapping[image_id] = json_dumps(img)
+            tags = set(img.get("tags") or [])
+            for tag in set(old_tags.get(image_id) or []) - tags:
+                pipe.srem(f"{self.prefix_gallery_tag}{tag}", image_id)
+            for tag in tags:
+                pipe.sadd(f"{self.prefix_gallery_tag}{tag}", image_id)
+            if tags:
+                pipe.sadd(self.gallery_tags_key, *tags)
+        if mapping:
+            pipe.hset(self.gallery_images_key, mapping=mapping)
+
+    async def _load_images_by_id(self, image_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not image_ids:
+            return {}
+        raws = await self.redis.hmget(self.gallery_images_key, image_ids)
+        return {
+            image_id: json_loads(raw)
+            for image_id, raw in zip(image_ids, raws)
+            if raw
+        }
+
     async def load_image_metadata(self) -> Dict[str, Any]:
-        """从 Redis 加载图片元数据"""
+        """从 Redis 加载全部图片元数据"""
         try:
-            data = await self.redis.get(self.image_metadata_key)
-            if not data:
-                return {"images": [], "version": "1.0"}
-            return json_loads(data)
+            await self._ensure_image_rows()
+            raws = await self.redis.hvals(self.gallery_images_key)
+            images = [json_loads(raw) for raw in raws]
+            images.sort(key=lambda img: (img.get("created_at") or 0, img.get("id", "")))
+            return {"images": images, "version": "1.0"}
         except Exception as e:
             logger.error(f"RedisStorage: 加载图片元数据失败: {e}")
             return {"images": [], "version": "1.0"}
 
     async def save_image_metadata(self, data: Dict[str, Any]):
-        """保存图片元数据到 Redis"""
+        """整体替换图片元数据（清空、恢复等场景）"""
         try:
-            await self.redis.set(self.image_metadata_key, json_dumps(data))
+            await self._ensure_image_rows()
+            tags = await self.redis.smembers(self.gallery_tags_key)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(
+                    self.gallery_images_key,
+                    self.gallery_tags_key,
+                    *[f"{self.prefix_gallery_tag}{tag}" for tag in tags],
+                )
+                self._queue_image_upserts(pipe, data.get("images", []), {})
+                pipe.incr(self.image_metadata_rev_key)
+                await pipe.execute()
         except Exception as e:
             logger.error(f"RedisStorage: 保存图片元数据失败: {e}")
             raise
 
+    async def upsert_images(self, images: List[Dict[str, Any]]):
+        """逐图片写入（HSET + 标签集合）"""
+        try:
+            await self._ensure_image_rows()
+            old = await self._load_images_by_id([img["id"] for img in images if img.get("id")])
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_image_upserts(
+                    pipe, images, {k: v.get("tags") for k, v in old.items()}
+                )
+                pipe.incr(self.image_metadata_rev_key)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"RedisStorage: 写入图片元数据失败: {e}")
+            raise
+
+    async def delete_images(self, image_ids: List[str]) -> int:
+        try:
+            await self._ensure_image_rows()
+            old = await self._load_images_by_id(list(image_ids))
+            if not old:
+                return 0
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hdel(self.gallery_images_key, *old.keys())
+                for image_id, img in old.items():
+                    for tag in set(img.get("tags") or []):
+                        pipe.srem(f"{self.prefix_gallery_tag}{tag}", image_id)
+                pipe.incr(self.image_metadata_rev_key)
+                await pipe.execute()
+            return len(old)
+        except Exception as e:
+            logger.error(f"RedisStorage: 删除图片元数据失败: {e}")
+            raise
+
+    async def patch_image(
+        self, image_id: str, changes: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            await self._ensure_image_rows()
+            img = (await self._load_images_by_id([image_id])).get(image_id)
+            if img is None:
+                return None
+            old_tags = img.get("tags")
+            img.update(changes)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                self._queue_image_upserts(pipe, [img], {image_id: old_tags})
+                pipe.incr(self.image_metadata_rev_key)
+                await pipe.execute()
+            return img
+        except Exception as e:
+            logger.error(f"RedisStorage: 更新图片元数据失败: {e}")
+            raise
+
+    async def get_image_metadata_revision(self) -> Optional[str]:
+        """修订号: 每次写入时递增的计数器"""
+        try:
+            await self._ensure_image_rows()
+            return await self.redis.get(self.image_metadata_rev_key) or "0"
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取图片元数据修订号失败: {e}")
+            return None
+
     async def load_prompts(self) -> Dict[str, Any]:
         """从 Redis 加载提示词"""
         try:
@@ -622,18 +1620,199 @@ class RedisStorage(BaseStorage):
     async def save_prompts(self, data: Dict[str, Any]):
         """保存提示词到 Redis"""
         try:
-            await self.redis.set(self.prompts_key, json_dumps(data))
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.set(self.prompts_key, json_dumps(data))
+                pipe.incr(self.prompts_rev_key)
+                await pipe.execute()
         except Exception as e:
             logger.error(f"RedisStorage: 保存提示词失败: {e}")
             raise
 
-    async def close(self):
+    async def get_prompts_revision(self) -> Optional[str]:
+        """修订号: 每次保存时递增的计数器"""
         try:
-            await self.redis.close()
-        except (RuntimeError, asyncio.CancelledError, Exception):
-            # 忽略关闭时的 Event loop is closed 错误
-            pass
-
+            return await self.redis.get(self.prompts_rev_key) or "0"
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取提示词修订号失败: {e}")
+            return None
+
+    # ==================== 共享缓存 ====================
+
+    async def shared_cache_get(self, namespace: str, field: str) -> Optional[str]:
+        try:
+            return await self.redis.hget(f"{self.prefix_shared_cache}{namespace}", field)
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取共享缓存失败: {e}")
+            return None
+
+    async def shared_cache_set(
+        self, namespace: str, field: str, value: str, ttl: int
+    ):
+        key = f"{self.prefix_shared_cache}{namespace}"
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, value)
+                pipe.expire(key, max(1, int(ttl)))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"RedisStorage: 写入共享缓存失败: {e}")
+
+    async def shared_cache_delete(self, namespace: str):
+        try:
+            await self.redis.delete(f"{self.prefix_shared_cache}{namespace}")
+        except Exception as e:
+            logger.warning(f"RedisStorage: 删除共享缓存失败: {e}")
+
+    # ==================== 限流令牌桶 ====================
+
+    async def rate_limit_reserve(
+        self,
+        specs: List[Tuple[str, float, float]],
+        cost: float,
+        max_wait: float,
+        force: bool = False,
+    ) -> Optional[Tuple[bool, List[float]]]:
+        if not specs:
+            return True, []
+        script = self._scripts.get(_LUA_RATE_LIMIT_RESERVE)
+        if script is None:
+            script = self._scripts[_LUA_RATE_LIMIT_RESERVE] = self.redis.register_script(
+                _LUA_RATE_LIMIT_RESERVE
+            )
+        args: List[Any] = [cost, max_wait, 1 if force else 0]
+        for _, rate, burst in specs:
+            args.extend([rate, burst])
+        res = await script(
+            keys=[f"{self.prefix_rate_limit}{name}" for name, _, _ in specs],
+            args=args,
+        )
+        return bool(int(res[0])), [float(w) for w in res[1:]]
+
+    # ==================== 批量任务 ====================
+
+    @staticmethod
+    def _batch_task_data(raw: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if not raw or not raw.get("data"):
+            return None
+        data = json_loads(raw["data"])
+        data["cancel_requested"] = raw.get("cancel") == "1"
+        return data
+
+    async def save_batch_task(self, task: Dict[str, Any]):
+        task_id = task["id"]
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(f"{self.prefix_batch_task}{task_id}", "data", json_dumps(task))
+                pipe.sadd(self.batch_tasks_key, task_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"RedisStorage: 保存批量任务失败: {e}")
+            raise
+
+    async def load_batch_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis.hmget(
+                f"{self.prefix_batch_task}{task_id}", "data", "cancel"
+            )
+            return self._batch_task_data({"data": raw[0], "cancel": raw[1]})
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取批量任务失败: {e}")
+            return None
+
+    async def save_batch_task_params(self, task_id: str, params: Dict[str, Any]):
+        try:
+            await self.redis.hset(
+                f"{self.prefix_batch_task}{task_id}", "params", json_dumps(params)
+            )
+        except Exception as e:
+            logger.error(f"RedisStorage: 保存批量任务参数失败: {e}")
+            raise
+
+    async def load_batch_task_params(self, task_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis.hget(f"{self.prefix_batch_task}{task_id}", "params")
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取批量任务参数失败: {e}")
+            return None
+        return json_loads(raw) if raw else None
+
+    async def list_batch_tasks(self) -> List[Dict[str, Any]]:
+        try:
+            task_ids = list(await self.redis.smembers(self.batch_tasks_key))
+            if not task_ids:
+                return []
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for task_id in task_ids:
+                    pipe.hmget(f"{self.prefix_batch_task}{task_id}", "data", "cancel")
+                raws = [
+                    {"data": data, "cancel": cancel}
+                    for data, cancel in await pipe.execute()
+                ]
+        except Exception as e:
+            logger.warning(f"RedisStorage: 列出批量任务失败: {e}")
+            return []
+        tasks = []
+        for task_id, raw in zip(task_ids, raws):
+            data = self._batch_task_data(raw)
+            if data:
+                tasks.append(data)
+            else:
+                await self.redis.srem(self.batch_tasks_key, task_id)
+        return tasks
+
+    async def request_batch_task_cancel(self, task_id: str) -> bool:
+        key = f"{self.prefix_batch_task}{task_id}"
+        try:
+            if not await self.redis.hexists(key, "data"):
+                return False
+            await self.redis.hset(key, "cancel", "1")
+            return True
+        except Exception as e:
+            logger.warning(f"RedisStorage: 取消批量任务失败: {e}")
+            return False
+
+    async def is_batch_task_cancel_requested(self, task_id: str) -> bool:
+        try:
+            return await self.redis.hget(f"{self.prefix_batch_task}{task_id}", "cancel") == "1"
+        except Exception as e:
+            logger.warning(f"RedisStorage: 读取批量任务取消标记失败: {e}")
+            return False
+
+    async def append_batch_task_results(self, task_id: str, results: Dict[str, Any]):
+        if not results:
+            return
+        try:
+            await self.redis.hset(
+                f"{self.prefix_batch_task}{task_id}:results",
+                mapping={item: json_dumps(result) for item, result in results.items()},
+            )
+        except Exception as e:
+            logger.error(f"RedisStorage: 保存批量任务结果失败: {e}")
+            raise
+
+    async def load_batch_task_results(self, task_id: str) -> Dict[str, Any]:
+        raw = await self.redis.hgetall(f"{self.prefix_batch_task}{task_id}:results")
+        return {item: json_loads(value) for item, value in raw.items()}
+
+    async def delete_batch_task(self, task_id: str):
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(
+                    f"{self.prefix_batch_task}{task_id}",
+                    f"{self.prefix_batch_task}{task_id}:results",
+                )
+                pipe.srem(self.batch_tasks_key, task_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"RedisStorage: 删除批量任务失败: {e}")
+
+    async def close(self):
+        try:
+            await self.redis.close()
+        except (RuntimeError, asyncio.CancelledError, Exception):
+            # 忽略关闭时的 Event loop is closed 错误
+            pass
+
 
 class SQLStorage(BaseStorage):
     """
@@ -730,6 +1909,8 @@ class SQLStorage(BaseStorage):
         )
         self.async_session = async_sessionmaker(self.engine, expire_on_commit=False)
         self._initialized = False
+        # 回看窗口内已返回的变更版本，避免重复下发: token -> updated_at/-deleted_at
+        self._seen_token_changes: Dict[str, int] = {}
 
     async def _ensure_schema(self):
         """确保数据库表存在"""
@@ -752,6 +1933,16 @@ class SQLStorage(BaseStorage):
                 """)
                 )
 
+                # Token 删除标记表（供其他 worker 增量同步删除）
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS token_tombstones (
+                        token VARCHAR(512) PRIMARY KEY,
+                        deleted_at BIGINT
+                    )
+                """)
+                )
+
                 # 配置表
                 await conn.execute(
                     text("""
@@ -776,6 +1967,28 @@ class SQLStorage(BaseStorage):
                 """)
                 )
 
+                # 图片元数据（规范化：每张图片一行 + 标签成员关系）
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS gallery_images (
+                        id VARCHAR(64) PRIMARY KEY,
+                        filename VARCHAR(255),
+                        data TEXT,
+                        created_at BIGINT,
+                        updated_at BIGINT
+                    )
+                """)
+                )
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS gallery_image_tags (
+                        image_id VARCHAR(64) NOT NULL,
+                        tag VARCHAR(191) NOT NULL,
+                        PRIMARY KEY (image_id, tag)
+                    )
+                """)
+                )
+
                 # 提示词表（规范化：每条提示词一行）
                 await conn.execute(
                     text("""
@@ -793,11 +2006,45 @@ class SQLStorage(BaseStorage):
                 """)
                 )
 
+                # 批量任务（状态 + 单项结果检查点）
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS batch_tasks (
+                        id VARCHAR(64) PRIMARY KEY,
+                        data TEXT,
+                        cancel_requested INTEGER DEFAULT 0,
+                        updated_at BIGINT
+                    )
+                """)
+                )
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS batch_task_params (
+                        task_id VARCHAR(64) PRIMARY KEY,
+                        data TEXT
+                    )
+                """)
+                )
+                await conn.execute(
+                    text("""
+                    CREATE TABLE IF NOT EXISTS batch_task_results (
+                        task_id VARCHAR(64) NOT NULL,
+                        item_hash VARCHAR(64) NOT NULL,
+                        data TEXT,
+                        PRIMARY KEY (task_id, item_hash)
+                    )
+                """)
+                )
+
             # 第二步：创建索引（每个索引独立事务，失败不影响其他步骤）
             for idx_sql in [
                 "CREATE INDEX idx_tokens_pool ON tokens (pool_name)",
+                "CREATE INDEX idx_tokens_updated ON tokens (updated_at)",
+                "CREATE INDEX idx_token_tombstones_deleted ON token_tombstones (deleted_at)",
                 "CREATE INDEX idx_image_metadata_created ON image_metadata (created_at)",
                 "CREATE INDEX idx_prompts_created ON prompts (created_at)",
+                "CREATE INDEX idx_gallery_images_created ON gallery_images (created_at)",
+                "CREATE INDEX idx_gallery_image_tags_tag ON gallery_image_tags (tag)",
             ]:
                 try:
                     async with self.engine.begin() as conn:
@@ -831,6 +2078,9 @@ class SQLStorage(BaseStorage):
             # 第五步：补齐 prompts 表缺失的列（独立事务）
             await self._ensure_prompts_columns()
 
+            # 第六步：图片元数据迁移（单行 JSON blob → 逐图片存储，独立事务）
+            await self._migrate_image_metadata()
+
             self._initialized = True
         except Exception as e:
             logger.error(f"SQLStorage: Schema 初始化失败: {e}")
@@ -1111,7 +2361,10 @@ class SQLStorage(BaseStorage):
         from sqlalchemy import text
 
         try:
+            now = int(time.time() * 1000)
             async with self.async_session() as session:
+                res = await session.execute(text("SELECT token FROM tokens"))
+                existing = {row[0] for row in res.fetchall()}
                 await session.execute(text("DELETE FROM tokens"))
 
                 params = []
@@ -1122,10 +2375,14 @@ class SQLStorage(BaseStorage):
                                 "token": t.get("token"),
                                 "pool_name": pool_name,
                                 "data": json_dumps(t),
-                                "updated_at": 0,
+                                "updated_at": now,
                             }
                         )
 
+                removed = existing - {p["token"] for p in params}
+                if removed:
+                    await self._write_token_tombstones(session, removed, now)
+
                 if params:
                     # 批量插入
                     await session.execute(
@@ -1139,51 +2396,388 @@ class SQLStorage(BaseStorage):
             logger.error(f"SQLStorage: 保存 Token 失败: {e}")
             raise
 
-    async def load_image_metadata(self) -> Dict[str, Any]:
+    async def save_token_deltas(
+        self,
+        updated: Dict[str, List[Dict[str, Any]]],
+        deleted: Optional[List[str]] = None,
+    ):
+        """增量保存 Token（逐行 upsert / delete）"""
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        insert_sql = (
+            "INSERT INTO tokens (token, pool_name, data, updated_at) "
+            "VALUES (:token, :pool_name, :data, :updated_at)"
+        )
+        if self.dialect in ("mysql", "mariadb"):
+            upsert_sql = (
+                f"{insert_sql} ON DUPLICATE KEY UPDATE pool_name=VALUES(pool_name), "
+                "data=VALUES(data), updated_at=VALUES(updated_at)"
+            )
+        else:
+            upsert_sql = (
+                f"{insert_sql} ON CONFLICT (token) DO UPDATE SET "
+                "pool_name=EXCLUDED.pool_name, data=EXCLUDED.data, "
+                "updated_at=EXCLUDED.updated_at"
+            )
+
+        now = int(time.time() * 1000)
+        params = []
+        for pool_name, tokens in (updated or {}).items():
+            for t in tokens:
+                if not t.get("token"):
+                    continue
+                params.append(
+                    {
+                        "token": t.get("token"),
+                        "pool_name": pool_name,
+                        "data": json_dumps(t),
+                        "updated_at": now,
+                    }
+                )
+
+        try:
+            async with self.async_session() as session:
+                if deleted:
+                    await session.execute(
+                        text("DELETE FROM tokens WHERE token = :token"),
+                        [{"token": t} for t in deleted],
+                    )
+                    await self._write_token_tombstones(session, deleted, now)
+                if params:
+                    await session.execute(text(upsert_sql), params)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 增量保存 Token 失败: {e}")
+            raise
+
+    async def _write_token_tombstones(self, session, tokens, now: int):
+        """记录删除标记，并清理过期标记"""
+        from sqlalchemy import text
+
+        await session.execute(
+            text("DELETE FROM token_tombstones WHERE token = :token OR deleted_at < :cutoff"),
+            [{"token": t, "cutoff": now - TOKEN_TOMBSTONE_TTL_MS} for t in tokens],
+        )
+        await session.execute(
+            text(
+                "INSERT INTO token_tombstones (token, deleted_at) VALUES (:token, :deleted_at)"
+            ),
+            [{"token": t, "deleted_at": now} for t in tokens],
+        )
+
+    async def get_token_cursor(self) -> Any:
+        """游标: updated_at / deleted_at 高水位（毫秒）"""
         await self._ensure_schema()
         from sqlalchemy import text
 
         try:
             async with self.async_session() as session:
                 res = await session.execute(
-                    text("SELECT data FROM image_metadata WHERE id = 'metadata'")
+                    text(
+                        "SELECT (SELECT MAX(updated_at) FROM tokens), "
+                        "(SELECT MAX(deleted_at) FROM token_tombstones)"
+                    )
                 )
                 row = res.fetchone()
-                if not row:
-                    return {"images": [], "version": "1.0"}
+            return max(int(v or 0) for v in (row or (0, 0)))
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取 Token 变更游标失败: {e}")
+            return None
+
+    async def load_token_changes(self, cursor: Any) -> Optional[TokenChanges]:
+        """读取高水位之后（含回看窗口）的变更行与删除标记"""
+        await self._ensure_schema()
+        from sqlalchemy import text
 
+        try:
+            since = int(cursor) - TOKEN_CHANGE_LOOKBACK_MS
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text(
+                        "SELECT pool_name, data, updated_at FROM tokens WHERE updated_at > :since"
+                    ),
+                    {"since": since},
+                )
+                rows = res.fetchall()
+                res = await session.execute(
+                    text(
+                        "SELECT token, deleted_at FROM token_tombstones WHERE deleted_at > :since"
+                    ),
+                    {"since": since},
+                )
+                tombstones = res.fetchall()
+
+            seen = self._seen_token_changes
+            for token_str in [t for t, v in seen.items() if abs(v) <= since]:
+                del seen[token_str]
+
+            high = int(cursor)
+            updated: Dict[str, List[Dict[str, Any]]] = {}
+            present = set()
+            for pool_name, data_json, updated_at in rows:
+                version = int(updated_at or 0)
+                high = max(high, version)
                 try:
-                    return json_loads(row[0])
+                    t_data = (
+                        json_loads(data_json) if isinstance(data_json, str) else data_json
+                    )
                 except Exception:
-                    return {"images": [], "version": "1.0"}
+                    continue
+                token_str = t_data.get("token")
+                present.add(token_str)
+                if seen.get(token_str) == version:
+                    continue
+                seen[token_str] = version
+                updated.setdefault(pool_name, []).append(t_data)
+
+            deleted = []
+            for token_str, deleted_at in tombstones:
+                version = int(deleted_at or 0)
+                high = max(high, version)
+                # 删除后又被重新添加的 Token 以现存行为准
+                if token_str in present or seen.get(token_str) == -version:
+                    continue
+                seen[token_str] = -version
+                deleted.append(token_str)
+
+            return high, updated, deleted
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取 Token 变更失败: {e}")
+            return None
+
+    # ==================== 图片元数据（逐图片存储） ====================
+
+    def _image_upsert_sql(self) -> str:
+        insert_sql = (
+            "INSERT INTO gallery_images (id, filename, data, created_at, updated_at) "
+            "VALUES (:id, :filename, :data, :created_at, :updated_at)"
+        )
+        if self.dialect in ("mysql", "mariadb"):
+            return (
+                f"{insert_sql} ON DUPLICATE KEY UPDATE filename=VALUES(filename), "
+                "data=VALUES(data), created_at=VALUES(created_at), "
+                "updated_at=VALUES(updated_at)"
+            )
+        return (
+            f"{insert_sql} ON CONFLICT (id) DO UPDATE SET "
+            "filename=EXCLUDED.filename, data=EXCLUDED.data, "
+            "created_at=EXCLUDED.created_at, updated_at=EXCLUDED.updated_at"
+        )
+
+    async def _write_image_rows(self, session, images: List[Dict[str, Any]], now: int):
+        """逐行 upsert 图片并重写其标签成员关系"""
+        from sqlalchemy import text
+
+        rows = []
+        tag_rows = []
+        for img in images:
+            image_id = img.get("id")
+            if not image_id:
+                continue
+            rows.append(
+                {
+                    "id": image_id,
+                    "filename": img.get("filename"),
+                    "data": json_dumps(img),
+                    "created_at": int(img.get("created_at") or 0),
+                    "updated_at": now,
+                }
+            )
+            tag_rows.extend(
+                {"image_id": image_id, "tag": tag}
+                for tag in dict.fromkeys(img.get("tags") or [])
+            )
+        if not rows:
+            return
+        await session.execute(
+            text("DELETE FROM gallery_image_tags WHERE image_id = :id"),
+            [{"id": r["id"]} for r in rows],
+        )
+        await session.execute(text(self._image_upsert_sql()), rows)
+        if tag_rows:
+            await session.execute(
+                text(
+                    "INSERT INTO gallery_image_tags (image_id, tag) VALUES (:image_id, :tag)"
+                ),
+                tag_rows,
+            )
+
+    async def _bump_image_revision(self, session, now: int, row_id: str = "revision"):
+        """
+        修订号（image_metadata 表 row_id 行的 updated_at）严格递增
+
+        图片元数据使用 'revision' 行，提示词使用 'prompts_revision' 行。
+        """
+        from sqlalchemy import text
+
+        res = await session.execute(
+            text(
+                "UPDATE image_metadata SET updated_at = CASE "
+                "WHEN updated_at >= :now THEN updated_at + 1 ELSE :now END "
+                "WHERE id = :id"
+            ),
+            {"now": now, "id": row_id},
+        )
+        if not res.rowcount:
+            await session.execute(
+                text(
+                    "INSERT INTO image_metadata (id, data, created_at, updated_at) "
+                    "VALUES (:id, NULL, :now, :now)"
+                ),
+                {"now": now, "id": row_id},
+            )
+
+    async def _migrate_image_metadata(self):
+        """
+        迁移图片元数据：旧架构（单行 JSON blob）→ 逐图片存储
+
+        写入逐图片行与删除旧 blob 在同一事务中完成；失败时抛出，Schema 初始化随之失败。
+        """
+        from sqlalchemy import text
+
+        lock = " FOR UPDATE" if self.dialect in (
+            "mysql", "mariadb", "postgres", "postgresql", "pgsql"
+        ) else ""
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text(f"SELECT data FROM image_metadata WHERE id = 'metadata'{lock}")
+                )
+                row = res.fetchone()
+                if not row:
+                    return
+
+                images = []
+                if row[0]:
+                    try:
+                        images = json_loads(row[0]).get("images", [])
+                    except Exception:
+                        logger.warning("SQLStorage: 旧图片元数据解析失败，跳过迁移内容")
+
+                now = int(time.time() * 1000)
+                await self._write_image_rows(session, images, now)
+                await session.execute(
+                    text("DELETE FROM image_metadata WHERE id = 'metadata'")
+                )
+                await self._bump_image_revision(session, now)
+                await session.commit()
+            logger.info(f"SQLStorage: 图片元数据已迁移为逐图片存储 ({len(images)} 条)")
+        except Exception as e:
+            # 迁移失败时旧 blob 仍在：必须中止初始化，否则新写入落到 gallery_images 后，
+            # 下次初始化重放旧 blob 会覆盖新修改并恢复已删除的图片
+            logger.error(f"SQLStorage: 图片元数据迁移失败: {e}")
+            raise
+
+    async def load_image_metadata(self) -> Dict[str, Any]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT data FROM gallery_images ORDER BY created_at, id")
+                )
+                images = [json_loads(row[0]) for row in res.fetchall() if row[0]]
+            return {"images": images, "version": "1.0"}
         except Exception as e:
             logger.error(f"SQLStorage: 加载图片元数据失败: {e}")
             return {"images": [], "version": "1.0"}
 
     async def save_image_metadata(self, data: Dict[str, Any]):
+        """整体替换图片元数据（清空、恢复等场景）"""
         await self._ensure_schema()
         from sqlalchemy import text
 
         try:
             async with self.async_session() as session:
-                data_json = json_dumps(data)
                 now = int(time.time() * 1000)
+                await session.execute(text("DELETE FROM gallery_image_tags"))
+                await session.execute(text("DELETE FROM gallery_images"))
+                await self._write_image_rows(session, data.get("images", []), now)
+                await self._bump_image_revision(session, now)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 保存图片元数据失败: {e}")
+            raise
+
+    async def upsert_images(self, images: List[Dict[str, Any]]):
+        await self._ensure_schema()
+
+        try:
+            async with self.async_session() as session:
+                now = int(time.time() * 1000)
+                await self._write_image_rows(session, images, now)
+                await self._bump_image_revision(session, now)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 写入图片元数据失败: {e}")
+            raise
+
+    async def delete_images(self, image_ids: List[str]) -> int:
+        await self._ensure_schema()
+        from sqlalchemy import text
 
-                # Upsert 逻辑
+        if not image_ids:
+            return 0
+        params = [{"id": image_id} for image_id in image_ids]
+        try:
+            async with self.async_session() as session:
                 await session.execute(
-                    text("DELETE FROM image_metadata WHERE id = 'metadata'")
+                    text("DELETE FROM gallery_image_tags WHERE image_id = :id"), params
                 )
-                await session.execute(
-                    text(
-                        "INSERT INTO image_metadata (id, data, created_at, updated_at) VALUES (:id, :data, :created_at, :updated_at)"
-                    ),
-                    {"id": "metadata", "data": data_json, "created_at": now, "updated_at": now},
+                res = await session.execute(
+                    text("DELETE FROM gallery_images WHERE id = :id"), params
                 )
+                await self._bump_image_revision(session, int(time.time() * 1000))
                 await session.commit()
+            return max(0, res.rowcount or 0)
         except Exception as e:
-            logger.error(f"SQLStorage: 保存图片元数据失败: {e}")
+            logger.error(f"SQLStorage: 删除图片元数据失败: {e}")
+            raise
+
+    async def patch_image(
+        self, image_id: str, changes: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT data FROM gallery_images WHERE id = :id"),
+                    {"id": image_id},
+                )
+                row = res.fetchone()
+                if not row:
+                    return None
+                img = json_loads(row[0])
+                img.update(changes)
+                now = int(time.time() * 1000)
+                await self._write_image_rows(session, [img], now)
+                await self._bump_image_revision(session, now)
+                await session.commit()
+            return img
+        except Exception as e:
+            logger.error(f"SQLStorage: 更新图片元数据失败: {e}")
             raise
 
+    async def get_image_metadata_revision(self) -> Optional[str]:
+        """修订号: image_metadata 表 'revision' 行的 updated_at（毫秒，严格递增）"""
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT updated_at FROM image_metadata WHERE id = 'revision'")
+                )
+                row = res.fetchone()
+            return str(row[0]) if row else "0"
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取图片元数据修订号失败: {e}")
+            return None
+
     async def load_prompts(self) -> Dict[str, Any]:
         await self._ensure_schema()
         import json as _json
@@ -1249,11 +2843,231 @@ class SQLStorage(BaseStorage):
                         "updated_at": p.get("updated_at"),
                     })
 
+                await self._bump_image_revision(
+                    session, int(time.time() * 1000), "prompts_revision"
+                )
                 await session.commit()
         except Exception as e:
             logger.error(f"SQLStorage: 保存提示词失败: {e}")
             raise
 
+    async def get_prompts_revision(self) -> Optional[str]:
+        """修订号: image_metadata 表 'prompts_revision' 行的 updated_at（毫秒，严格递增）"""
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT updated_at FROM image_metadata WHERE id = 'prompts_revision'")
+                )
+                row = res.fetchone()
+            return str(row[0]) if row else "0"
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取提示词修订号失败: {e}")
+            return None
+
+    # ==================== 批量任务 ====================
+
+    def _upsert_sql(self, table: str, keys: List[str], columns: List[str]) -> str:
+        names = keys + columns
+        insert_sql = (
+            f"INSERT INTO {table} ({', '.join(names)}) "
+            f"VALUES ({', '.join(':' + n for n in names)})"
+        )
+        if self.dialect in ("mysql", "mariadb"):
+            updates = ", ".join(f"{c}=VALUES({c})" for c in columns)
+            return f"{insert_sql} ON DUPLICATE KEY UPDATE {updates}"
+        updates = ", ".join(f"{c}=EXCLUDED.{c}" for c in columns)
+        return f"{insert_sql} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+
+    @staticmethod
+    def _batch_task_data(row) -> Optional[Dict[str, Any]]:
+        if not row or not row[0]:
+            return None
+        data = json_loads(row[0])
+        data["cancel_requested"] = bool(row[1])
+        return data
+
+    async def save_batch_task(self, task: Dict[str, Any]):
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    text(self._upsert_sql("batch_tasks", ["id"], ["data", "updated_at"])),
+                    {
+                        "id": task["id"],
+                        "data": json_dumps(task),
+                        "updated_at": int(time.time() * 1000),
+                    },
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 保存批量任务失败: {e}")
+            raise
+
+    async def load_batch_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT data, cancel_requested FROM batch_tasks WHERE id = :id"),
+                    {"id": task_id},
+                )
+                return self._batch_task_data(res.fetchone())
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取批量任务失败: {e}")
+            return None
+
+    async def save_batch_task_params(self, task_id: str, params: Dict[str, Any]):
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    text(self._upsert_sql("batch_task_params", ["task_id"], ["data"])),
+                    {"task_id": task_id, "data": json_dumps(params)},
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 保存批量任务参数失败: {e}")
+            raise
+
+    async def load_batch_task_params(self, task_id: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT data FROM batch_task_params WHERE task_id = :id"),
+                    {"id": task_id},
+                )
+                row = res.fetchone()
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取批量任务参数失败: {e}")
+            return None
+        return json_loads(row[0]) if row and row[0] else None
+
+    async def list_batch_tasks(self) -> List[Dict[str, Any]]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT data, cancel_requested FROM batch_tasks")
+                )
+                rows = res.fetchall()
+        except Exception as e:
+            logger.warning(f"SQLStorage: 列出批量任务失败: {e}")
+            return []
+        return [data for data in map(self._batch_task_data, rows) if data]
+
+    async def request_batch_task_cancel(self, task_id: str) -> bool:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("UPDATE batch_tasks SET cancel_requested = 1 WHERE id = :id"),
+                    {"id": task_id},
+                )
+                await session.commit()
+                return bool(res.rowcount)
+        except Exception as e:
+            logger.warning(f"SQLStorage: 取消批量任务失败: {e}")
+            return False
+
+    async def is_batch_task_cancel_requested(self, task_id: str) -> bool:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                res = await session.execute(
+                    text("SELECT cancel_requested FROM batch_tasks WHERE id = :id"),
+                    {"id": task_id},
+                )
+                row = res.fetchone()
+            return bool(row and row[0])
+        except Exception as e:
+            logger.warning(f"SQLStorage: 读取批量任务取消标记失败: {e}")
+            return False
+
+    async def append_batch_task_results(self, task_id: str, results: Dict[str, Any]):
+        if not results:
+            return
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        # item（如 token）可能超过主键长度，按哈希定位
+        rows = [
+            {
+                "task_id": task_id,
+                "item_hash": hashlib.sha1(item.encode("utf-8")).hexdigest(),
+                "data": json_dumps({"item": item, "result": result}),
+            }
+            for item, result in results.items()
+        ]
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    text(
+                        self._upsert_sql(
+                            "batch_task_results", ["task_id", "item_hash"], ["data"]
+                        )
+                    ),
+                    rows,
+                )
+                await session.commit()
+        except Exception as e:
+            logger.error(f"SQLStorage: 保存批量任务结果失败: {e}")
+            raise
+
+    async def load_batch_task_results(self, task_id: str) -> Dict[str, Any]:
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        async with self.async_session() as session:
+            res = await session.execute(
+                text("SELECT data FROM batch_task_results WHERE task_id = :id"),
+                {"id": task_id},
+            )
+            rows = res.fetchall()
+        results: Dict[str, Any] = {}
+        for (raw,) in rows:
+            entry = json_loads(raw)
+            results[entry["item"]] = entry.get("result")
+        return results
+
+    async def delete_batch_task(self, task_id: str):
+        await self._ensure_schema()
+        from sqlalchemy import text
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    text("DELETE FROM batch_task_results WHERE task_id = :id"),
+                    {"id": task_id},
+                )
+                await session.execute(
+                    text("DELETE FROM batch_task_params WHERE task_id = :id"),
+                    {"id": task_id},
+                )
+                await session.execute(
+                    text("DELETE FROM batch_tasks WHERE id = :id"), {"id": task_id}
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"SQLStorage: 删除批量任务失败: {e}")
+
     async def close(self):
         await self.engine.dispose()
 
@@ -0,0 +1,566 @@
+"""
+图片元数据索引
+
+存储后端中的图片元数据是整体读写的 JSON，列表/筛选/统计若每次全量加载再在 Python 中过滤，
+图库达到十万级时单次翻页就要数百毫秒。这里在本地 SQLite 中维护逐图片一行的索引副本:
+
+- images 表: 常用筛选/排序字段单独成列并建索引（created_at、model、aspect_ratio、
+  favorite、nsfw、content_hash、filename），完整元数据以 JSON 保存在 data 列
+- image_tags 表: 标签成员关系（tag, image_id），标签筛选与计数走索引
+- images_fts 表: 提示词全文索引（FTS5，中日韩文字按 n-gram 分词，见 app.core.search），
+  搜索按 bm25 相关度排序；SQLite 未编译 FTS5 时退回子串匹配
+- stats 表: 预聚合统计（总数/总大小、模型与宽高比分布、标签计数、按月新增），
+  由触发器随 images / image_tags 的增删增量维护，统计接口只读这张小表
+- meta 表: 索引对应的存储修订号（revision），与存储后端不一致时全量重建
+
+写入由 ImageMetadataService 在持有 image_metadata 锁时同步调用 apply，
+数据变更与修订号在同一事务中提交；其他进程/实例修改存储后修订号变化，读取时自动重建。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.core.logger import logger
+from app.core.search import BM25_WEIGHTS, FTS_COLUMNS, fts5_available, fts_rows, match_expression
+from app.core.storage import DATA_DIR
+
+
+INDEX_VERSION = "3"
+
+# 按相关度排序（仅在有搜索词时生效，否则按 created_at）
+SORT_RELEVANCE = "relevance"
+
+# 允许排序的字段（其余字段按 created_at 排序）
+SORT_COLUMNS = (
+    "created_at",
+    "file_size",
+    "quality_score",
+    "width",
+    "height",
+    "filename",
+    "model",
+    "aspect_ratio",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id TEXT PRIMARY KEY,
+    filename TEXT,
+    created_at INTEGER NOT NULL DEFAULT 0,
+    model TEXT,
+    aspect_ratio TEXT,
+    favorite INTEGER NOT NULL DEFAULT 0,
+    nsfw INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    file_size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    quality_score REAL,
+    prompt_lc TEXT NOT NULL DEFAULT '',
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS image_tags (
+    tag TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    PRIMARY KEY (tag, image_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# 全文索引（rowid 与 images.rowid 对应）
+_FTS_SCHEMA = f"CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5({FTS_COLUMNS})"
+_FTS_INSERT = (
+    f"INSERT INTO images_fts (rowid, {FTS_COLUMNS}) "
+    "SELECT rowid, ?, ? FROM images WHERE id = ?"
+)
+_FTS_DELETE = "DELETE FROM images_fts WHERE rowid IN (SELECT rowid FROM images WHERE id = ?)"
+
+# 统计维度: kind -> 分组表达式（images 行，NEW/OLD 由触发器替换）
+_STAT_KEYS = {
+    "total": "''",
+    "model": "COALESCE({row}.model, 'unknown')",
+    "aspect_ratio": "COALESCE({row}.aspect_ratio, 'unknown')",
+    "month": "strftime('%Y-%m', {row}.created_at / 1000, 'unixepoch', 'localtime')",
+}
+
+
+def _stat_trigger_sql() -> Dict[str, str]:
+    """统计表维护触发器（全量重建时与二级索引一起删除，写入后按 GROUP BY 重算）"""
+    inc = "\n".join(
+        f"INSERT INTO stats (kind, key, count, size) "
+        f"VALUES ('{kind}', {expr.format(row='new')}, 1, COALESCE(new.file_size, 0)) "
+        f"ON CONFLICT (kind, key) DO UPDATE SET "
+        f"count = count + 1, size = size + excluded.size;"
+        for kind, expr in _STAT_KEYS.items()
+    )
+    dec = "\n".join(
+        f"UPDATE stats SET count = count - 1, size = size - COALESCE(old.file_size, 0) "
+        f"WHERE kind = '{kind}' AND key = {expr.format(row='old')};"
+        for kind, expr in _STAT_KEYS.items()
+    )
+    return {
+        "trg_images_insert": f"AFTER INSERT ON images BEGIN\n{inc}\nEND",
+        "trg_images_delete": (
+            f"AFTER DELETE ON images BEGIN\n{dec}\n"
+            "DELETE FROM stats WHERE count <= 0 AND kind != 'total';\nEND"
+        ),
+        "trg_tags_insert": (
+            "AFTER INSERT ON image_tags BEGIN\n"
+            "INSERT INTO stats (kind, key, count) VALUES ('tag', new.tag, 1) "
+            "ON CONFLICT (kind, key) DO UPDATE SET count = count + 1;\nEND"
+        ),
+        "trg_tags_delete": (
+            "AFTER DELETE ON image_tags BEGIN\n"
+            "UPDATE stats SET count = count - 1 WHERE kind = 'tag' AND key = old.tag;\n"
+            "DELETE FROM stats WHERE kind = 'tag' AND key = old.tag AND count <= 0;\nEND"
+        ),
+    }
+
+
+_TRIGGERS = _stat_trigger_sql()
+
+# 二级索引（全量重建时先删除、写入后再创建，比逐行维护快约一倍）
+_INDEXES = {
+    "idx_images_created": "images (created_at)",
+    "idx_images_model": "images (model, created_at)",
+    "idx_images_ratio": "images (aspect_ratio, created_at)",
+    "idx_images_favorite": "images (favorite, created_at)",
+    "idx_images_nsfw": "images (nsfw, created_at)",
+    "idx_images_hash": "images (content_hash)",
+    "idx_images_filename": "images (filename)",
+    "idx_image_tags_image": "image_tags (image_id)",
+}
+
+_COLUMNS = (
+    "id, filename, created_at, model, aspect_ratio, favorite, nsfw, content_hash, "
+    "file_size, width, height, quality_score, prompt_lc, data"
+)
+
+
+def _row(img: Dict[str, Any]) -> Tuple:
+    meta = img.get("metadata") or {}
+    return (
+        img["id"],
+        img.get("filename"),
+        int(img.get("created_at") or 0),
+        img.get("model"),
+        img.get("aspect_ratio"),
+        1 if img.get("favorite") else 0,
+        1 if img.get("nsfw") else 0,
+        meta.get("content_hash") if isinstance(meta, dict) else None,
+        img.get("file_size"),
+        img.get("width"),
+        img.get("height"),
+        img.get("quality_score"),
+        (img.get("prompt") or "").lower(),
+        orjson.dumps(img),
+    )
+
+
+def _tag_rows(img: Dict[str, Any]) -> List[Tuple[str, str]]:
+    return [(tag, img["id"]) for tag in dict.fromkeys(img.get("tags") or [])]
+
+
+def _fts_rows(images: Iterable[Dict[str, Any]]) -> List[Tuple]:
+    return fts_rows((img["id"], (img.get("prompt"),)) for img in images)
+
+
+class GalleryIndex:
+    """图片元数据索引（线程安全；点查询直接调用，全表扫描与聚合查询由调用方放入线程池）"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._fts = fts5_available()
+
+    # ==================== 连接与同步 ====================
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-32768")
+        conn.executescript(_SCHEMA)
+        if self._fts:
+            conn.execute(_FTS_SCHEMA)
+        self._create_indexes(conn)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != INDEX_VERSION:
+            # 结构变化：清空并等待重建
+            if self._fts:
+                conn.execute("DELETE FROM images_fts")
+            conn.execute("DELETE FROM images")
+            conn.execute("DELETE FROM image_tags")
+            conn.execute("DELETE FROM stats")
+            conn.execute("DELETE FROM meta")
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('version', ?)", (INDEX_VERSION,)
+            )
+        self._conn = conn
+        return conn
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def revision(self) -> Optional[str]:
+        """索引对应的存储修订号（未构建时为 None）"""
+        rows = self._query("SELECT value FROM meta WHERE key = 'revision'")
+        return rows[0][0] if rows else None
+
+    def rebuild(self, images: Iterable[Dict[str, Any]], revision: Optional[str]) -> int:
+        """按完整元数据重建索引，返回图片数"""
+        rows = []
+        tag_rows = []
+        valid = []
+        for img in images:
+            if not img.get("id"):
+                continue
+            valid.append(img)
+            rows.append(_row(img))
+            tag_rows.extend(_tag_rows(img))
+        fts_docs = _fts_rows(valid) if self._fts else []
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name in _INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+                for name in _TRIGGERS:
+                    conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute("DELETE FROM images")
+                conn.execute("DELETE FROM image_tags")
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO images ({_COLUMNS}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO image_tags (tag, image_id) VALUES (?, ?)",
+                    tag_rows,
+                )
+                if self._fts:
+                    conn.execute("DELETE FROM images_fts")
+                    conn.executemany(_FTS_INSERT, fts_docs)
+                self._create_indexes(conn)
+                self._recompute_stats(conn)
+                self._set_revision(conn, revision)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        logger.info(f"GalleryIndex: indexed {len(rows)} image(s)")
+        return len(rows)
+
+    def apply(
+        self,
+        upserts: Iterable[Dict[str, Any]] = (),
+        deletes: Iterable[str] = (),
+        revision: Optional[str] = None,
+    ) -> bool:
+        """
+        增量更新索引（与修订号同一事务提交）
+
+        失败时修订号保持不变，下次读取会按存储内容重建。
+        """
+        upserts = list({img["id"]: img for img in upserts if img.get("id")}.values())
+        delete_ids = [(image_id,) for image_id in deletes]
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # 先删后插（REPLACE 隐式删除不会触发统计触发器）
+                    ids = [(img["id"],) for img in upserts] + delete_ids
+                    conn.executemany("DELETE FROM image_tags WHERE image_id = ?", ids)
+                    if self._fts:
+                        conn.executemany(_FTS_DELETE, ids)
+                    conn.executemany("DELETE FROM images WHERE id = ?", ids)
+                    conn.executemany(
+                        f"INSERT INTO images ({_COLUMNS}) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [_row(img) for img in upserts],
+                    )
+                    if self._fts:
+                        conn.executemany(_FTS_INSERT, _fts_rows(upserts))
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO image_tags (tag, image_id) VALUES (?, ?)",
+                        [t for img in upserts for t in _tag_rows(img)],
+                    )
+                    self._set_revision(conn, revision)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"GalleryIndex: apply failed: {e}")
+            return False
+
+    @staticmethod
+    def _create_indexes(conn: sqlite3.Connection):
+        for name, target in _INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        for name, body in _TRIGGERS.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    @staticmethod
+    def _recompute_stats(conn: sqlite3.Connection):
+        """按 images / image_tags 全量重算统计表"""
+        conn.execute("DELETE FROM stats")
+        for kind, expr in _STAT_KEYS.items():
+            conn.execute(
+                f"INSERT INTO stats (kind, key, count, size) "
+                f"SELECT '{kind}', {expr.format(row='images')}, COUNT(*), "
+                f"COALESCE(SUM(file_size), 0) FROM images GROUP BY 2"
+            )
+        conn.execute(
+            "INSERT INTO stats (kind, key, count) "
+            "SELECT 'tag', tag, COUNT(*) FROM image_tags GROUP BY tag"
+        )
+
+    def rebuild_stats(self) -> Dict[str, int]:
+        """
+        修复统计表（按当前索引内容重算）
+
+        Returns:
+            重算前后与实际不一致的统计项数 {"fixed": n}
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = set(conn.execute("SELECT kind, key, count, size FROM stats"))
+                self._recompute_stats(conn)
+                after = set(conn.execute("SELECT kind, key, count, size FROM stats"))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        fixed = len(before ^ after)
+        logger.info(f"GalleryIndex: stats rebuilt, {fixed} entr(ies) corrected")
+        return {"fixed": fixed}
+
+    @staticmethod
+    def _set_revision(conn: sqlite3.Connection, revision: Optional[str]):
+        if revision is None:
+            conn.execute("DELETE FROM meta WHERE key = 'revision'")
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)",
+                (str(revision),),
+            )
+
+    # ==================== 查询 ====================
+
+    def get(self, image_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM images WHERE id = ?", (image_id,))
+        return orjson.loads(rows[0][0]) if rows else None
+
+    def find_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT data FROM images WHERE content_hash = ? LIMIT 1", (content_hash,)
+        )
+        return orjson.loads(rows[0][0]) if rows else None
+
+    def ids_by_filename(self, filename: str) -> List[str]:
+        rows = self._query("SELECT id FROM images WHERE filename = ?", (filename,))
+        return [r[0] for r in rows]
+
+    def files(self) -> List[Tuple[str, str]]:
+        """全部 (id, filename)"""
+        return self._query("SELECT id, filename FROM images")
+
+    def conflicts(
+        self, image_id: str, filename: Optional[str], content_hash: Optional[str]
+    ) -> Optional[str]:
+        """返回与已有图片冲突的字段（id/filename/content_hash），无冲突返回 None"""
+        if self._query("SELECT 1 FROM images WHERE id = ?", (image_id,)):
+            return "id"
+        if filename and self._query(
+            "SELECT 1 FROM images WHERE filename = ? LIMIT 1", (filename,)
+        ):
+            return "filename"
+        if content_hash and self._query(
+            "SELECT 1 FROM images WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ):
+            return "content_hash"
+        return None
+
+    def _match(self, filters: Any) -> Optional[str]:
+        """搜索词对应的 FTS 表达式（无搜索词、无可检索文字或不支持 FTS5 时为 None）"""
+        if filters is None or not filters.search or not self._fts:
+            return None
+        return match_expression(filters.search)
+
+    @staticmethod
+    def _where(
+        filters: Any, match: Optional[str] = None, ranked: bool = False
+    ) -> Tuple[str, List[Any]]:
+        """
+        筛选条件
+
+        match 为 FTS 表达式（None 时搜索退回子串匹配）；ranked 时全文匹配由调用方
+        JOIN 相关度子查询完成，这里不再重复过滤。
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        if filters is None:
+            return "", params
+        if filters.search and match is None:
+            clauses.append("instr(prompt_lc, ?) > 0")
+            params.append(filters.search.lower())
+        elif match is not None and not ranked:
+            clauses.append(
+                "images.rowid IN (SELECT rowid FROM images_fts WHERE images_fts MATCH ?)"
+            )
+            params.append(match)
+        if filters.model:
+            clauses.append("model = ?")
+            params.append(filters.model)
+        if filters.aspect_ratio:
+            clauses.append("aspect_ratio = ?")
+            params.append(filters.aspect_ratio)
+        if filters.tags:
+            marks = ", ".join("?" for _ in filters.tags)
+            clauses.append(
+                f"id IN (SELECT image_id FROM image_tags WHERE tag IN ({marks}))"
+            )
+            params.extend(filters.tags)
+        if filters.start_date:
+            clauses.append("created_at >= ?")
+            params.append(filters.start_date)
+        if filters.end_date:
+            clauses.append("created_at <= ?")
+            params.append(filters.end_date)
+        if filters.nsfw is not None:
+            clauses.append("nsfw = ?")
+            params.append(1 if filters.nsfw else 0)
+        if filters.favorite is not None:
+            clauses.append("favorite = ?")
+            params.append(1 if filters.favorite else 0)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(
+        self,
+        filters: Any = None,
+        offset: int = 0,
+        limit: int = 50,
+        sort_by: str = "created_at",
+        sort_order: str = "desc",
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        筛选 + 排序 + 分页，返回 (总数, 当前页图片)
+
+        有搜索词时 sort_by="relevance" 按 bm25 相关度排序（相同时按 created_at 降序）。
+        """
+        match = self._match(filters)
+        ranked = match is not None and sort_by == SORT_RELEVANCE
+        where, params = self._where(filters, match, ranked)
+        column = sort_by if sort_by in SORT_COLUMNS else "created_at"
+        direction = "ASC" if sort_order.lower() == "asc" else "DESC"
+        source = "images"
+        order = f"images.{column} {direction}, images.id {direction}"
+        if ranked:
+            weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+            source = (
+                "images JOIN (SELECT rowid AS fts_rowid, "
+                f"bm25(images_fts, {weights}) AS score "
+                "FROM images_fts WHERE images_fts MATCH ?) AS f "
+                "ON images.rowid = f.fts_rowid"
+            )
+            params = [match] + params
+            order = "f.score, images.created_at DESC, images.id DESC"
+        with self._lock:
+            conn = self._connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM {source}{where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT images.data FROM {source}{where} "
+                f"ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [int(limit), int(offset)],
+            ).fetchall()
+        return int(total), [orjson.loads(r[0]) for r in rows]
+
+    def random_candidates(
+        self, min_quality_score: float, exclude_ids: Iterable[str] = ()
+    ) -> List[Tuple[str, float]]:
+        """质量分数不低于阈值的 (id, quality_score)"""
+        exclude = set(exclude_ids)
+        rows = self._query(
+            "SELECT id, quality_score FROM images WHERE quality_score >= ?",
+            (min_quality_score,),
+        )
+        return [(image_id, score) for image_id, score in rows if image_id not in exclude]
+
+    def tag_counts(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """标签及使用次数（按次数降序，读取预聚合统计）"""
+        sql = (
+            "SELECT key, count FROM stats WHERE kind = 'tag' AND count > 0 "
+            "ORDER BY count DESC, key"
+        )
+        params: Tuple = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (int(limit),)
+        return [{"name": tag, "count": count} for tag, count in self._query(sql, params)]
+
+    def stats(self, month: str) -> Dict[str, Any]:
+        """
+        总数、总大小、本月新增、常用标签、模型/宽高比分布（读取预聚合统计）
+
+        Args:
+            month: 本月（YYYY-MM，本地时区）
+        """
+        groups: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        for kind, key, count, size in self._query(
+            "SELECT kind, key, count, size FROM stats WHERE kind != 'tag'"
+        ):
+            groups.setdefault(kind, {})[key] = (count, size)
+        total_count, total_size = groups.get("total", {}).get("", (0, 0))
+        return {
+            "total_count": int(total_count),
+            "total_size": int(total_size),
+            "month_count": int(groups.get("month", {}).get(month, (0, 0))[0]),
+            "top_tags": self.tag_counts(limit=10),
+            "models": {k: c for k, (c, _) in groups.get("model", {}).items() if c > 0},
+            "aspect_ratios": {
+                k: c for k, (c, _) in groups.get("aspect_ratio", {}).items() if c > 0
+            },
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_INDEX: Optional[GalleryIndex] = None
+
+
+def get_gallery_index() -> GalleryIndex:
+    """获取全局图片元数据索引（data/gallery_index.db）"""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = GalleryIndex(DATA_DIR / "gallery_index.db")
+    return _INDEX
+
+
+__all__ = ["GalleryIndex", "get_gallery_index", "SORT_COLUMNS", "SORT_RELEVANCE"]
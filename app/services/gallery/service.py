@@ -2,23 +2,76 @@
 图片元数据管理服务
 """
 
+import asyncio
 import os
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
 from datetime import datetime
 
 from app.core.storage import get_storage
 from app.core.logger import logger
+from app.services.grok.utils.media_cache import get_media_cache_index
 from .models import ImageMetadata, ImageListResponse, ImageFilter, ImageStats
 from .backup import get_backup_service
+from .index import get_gallery_index
 
 
 class ImageMetadataService:
-    """图片元数据管理服务"""
+    """图片元数据管理服务（读取走本地索引，写入存储后同步索引）"""
 
     def __init__(self):
         self.storage = get_storage()
         self.image_dir = Path(__file__).parent.parent.parent.parent / "data" / "tmp" / "image"
+        self.index = get_gallery_index()
+        self._index_lock = asyncio.Lock()
+        self._index_synced = False
+
+    # ==================== 索引同步 ====================
+
+    def _index_current(self, revision: Optional[str]) -> bool:
+        if revision is None:
+            # 后端无法提供修订号时，进程内构建过一次即视为最新
+            return self._index_synced
+        return self.index.revision() == revision
+
+    async def _ensure_index(self):
+        """确保索引与存储一致（修订号变化时按存储内容全量重建）"""
+        revision = await self.storage.get_image_metadata_revision()
+        if self._index_current(revision):
+            return
+        async with self._index_lock:
+            if self._index_current(revision):
+                return
+            data = await self.storage.load_image_metadata()
+            await asyncio.to_thread(self.index.rebuild, data.get("images", []), revision)
+            self._index_synced = True
+
+    async def _sync_index(
+        self,
+        upserts: List[Dict[str, Any]] = (),
+        deletes: List[str] = (),
+    ):
+        """将已写入存储的变更同步到索引（与最新修订号一起提交）"""
+        revision = await self.storage.get_image_metadata_revision()
+        await asyncio.to_thread(self.index.apply, upserts, deletes, revision)
+
+    async def _apply(
+        self,
+        upserts: List[Dict[str, Any]] = (),
+        deletes: List[str] = (),
+    ):
+        """
+        逐图片写入存储并增量同步索引
+
+        调用方需持有 image_metadata 锁，且在修改前调用过 _ensure_index。
+        """
+        if deletes:
+            await self.storage.delete_images(list(deletes))
+        if upserts:
+            await self.storage.upsert_images(list(upserts))
+        await self._sync_index(upserts, deletes)
+
+    # ==================== 写入 ====================
 
     async def add_image(self, metadata: ImageMetadata) -> bool:
         """
@@ -32,37 +85,23 @@ class ImageMetadataService:
         """
         try:
             async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
+                await self._ensure_index()
 
-                # 检查是否已存在（基于ID）
-                existing_ids = {img["id"] for img in data.get("images", [])}
-                if metadata.id in existing_ids:
+                # 检查是否已存在（ID / 文件名 / 内容哈希）
+                content_hash = metadata.metadata.get("content_hash") if metadata.metadata else None
+                conflict = self.index.conflicts(metadata.id, metadata.filename, content_hash)
+                if conflict == "id":
                     logger.warning(f"图片元数据已存在: {metadata.id}")
                     return False
-
-                # 检查是否已存在（基于文件名）
-                existing_filenames = {img.get("filename") for img in data.get("images", [])}
-                if metadata.filename in existing_filenames:
+                if conflict == "filename":
                     logger.warning(f"图片文件名已存在: {metadata.filename}")
                     return False
-
-                # 检查是否已存在（基于内容哈希）
-                content_hash = metadata.metadata.get("content_hash") if metadata.metadata else None
-                if content_hash:
-                    existing_hashes = {
-                        img.get("metadata", {}).get("content_hash")
-                        for img in data.get("images", [])
-                        if img.get("metadata", {}).get("content_hash")
-                    }
-                    if content_hash in existing_hashes:
-                        logger.warning(f"图片内容已存在（哈希: {content_hash[:16]}...）")
-                        return False
+                if conflict == "content_hash":
+                    logger.warning(f"图片内容已存在（哈希: {content_hash[:16]}...）")
+                    return False
 
                 # 添加新元数据
-                data.setdefault("images", []).append(metadata.model_dump())
-
-                # 保存
-                await self.storage.save_image_metadata(data)
+                await self._apply(upserts=[metadata.model_dump()])
                 logger.info(f"添加图片元数据成功: {metadata.id}")
 
             return True
@@ -71,6 +110,8 @@ class ImageMetadataService:
             logger.error(f"添加图片元数据失败: {e}")
             return False
 
+    # ==================== 查询 ====================
+
     async def get_image(self, image_id: str) -> Optional[ImageMetadata]:
         """
         获取图片详情
@@ -82,13 +123,9 @@ class ImageMetadataService:
             图片元数据，不存在返回 None
         """
         try:
-            data = await self.storage.load_image_metadata()
-
-            for img in data.get("images", []):
-                if img.get("id") == image_id:
-                    return ImageMetadata(**img)
-
-            return None
+            await self._ensure_index()
+            img = self.index.get(image_id)
+            return ImageMetadata(**img) if img else None
 
         except Exception as e:
             logger.error(f"获取图片详情失败: {e}")
@@ -105,19 +142,32 @@ class ImageMetadataService:
             图片元数据，不存在返回 None
         """
         try:
-            data = await self.storage.load_image_metadata()
-
-            for img in data.get("images", []):
-                img_hash = img.get("metadata", {}).get("content_hash")
-                if img_hash == content_hash:
-                    return ImageMetadata(**img)
-
-            return None
+            await self._ensure_index()
+            img = self.index.find_by_hash(content_hash)
+            return ImageMetadata(**img) if img else None
 
         except Exception as e:
             logger.error(f"根据哈希查找图片失败: {e}")
             return None
 
+    async def find_image_ids_by_filename(self, filename: str) -> List[str]:
+        """根据文件名查找图片ID"""
+        try:
+            await self._ensure_index()
+            return self.index.ids_by_filename(filename)
+        except Exception as e:
+            logger.error(f"根据文件名查找图片失败: {e}")
+            return []
+
+    async def list_random_candidates(
+        self, min_quality_score: float, exclude_ids: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """质量分数不低于阈值的候选图片 (id, quality_score)"""
+        await self._ensure_index()
+        return await asyncio.to_thread(
+            self.index.random_candidates, min_quality_score, exclude_ids or ()
+        )
+
     async def list_images(
         self,
         filters: Optional[ImageFilter] = None,
@@ -133,34 +183,27 @@ class ImageMetadataService:
             filters: 筛选条件
             page: 页码（从1开始）
             page_size: 每页数量
-            sort_by: 排序字段
+            sort_by: 排序字段（relevance: 有搜索词时按相关度排序）
             sort_order: 排序顺序（asc/desc）
 
         Returns:
             图片列表响应
         """
         try:
-            data = await self.storage.load_image_metadata()
-            images = data.get("images", [])
+            await self._ensure_index()
 
-            logger.info(f"加载图片总数: {len(images)}")
             logger.info(f"筛选条件: {filters}")
 
-            # 应用筛选
-            if filters:
-                images = self._apply_filters(images, filters)
-                logger.info(f"筛选后图片数量: {len(images)}")
-
-            # 排序
-            reverse = sort_order.lower() == "desc"
-            images.sort(key=lambda x: x.get(sort_by, 0), reverse=reverse)
-
-            # 分页
-            total = len(images)
+            # 筛选、排序、分页均在索引中完成
+            total, page_images = await asyncio.to_thread(
+                self.index.query,
+                filters,
+                (page - 1) * page_size,
+                page_size,
+                sort_by,
+                sort_order,
+            )
             total_pages = (total + page_size - 1) // page_size if total > 0 else 0
-            start = (page - 1) * page_size
-            end = start + page_size
-            page_images = images[start:end]
 
             logger.info(f"分页后: total={total}, page_images={len(page_images)}")
 
@@ -192,67 +235,7 @@ class ImageMetadataService:
                 total_pages=0
             )
 
-    def _apply_filters(self, images: List[Dict], filters: ImageFilter) -> List[Dict]:
-        """应用筛选条件"""
-        filtered = images
-
-        # 搜索关键词
-        if filters.search:
-            search_lower = filters.search.lower()
-            filtered = [
-                img for img in filtered
-                if search_lower in img.get("prompt", "").lower()
-            ]
-
-        # 模型筛选
-        if filters.model:
-            filtered = [
-                img for img in filtered
-                if img.get("model") == filters.model
-            ]
-
-        # 宽高比筛选
-        if filters.aspect_ratio:
-            filtered = [
-                img for img in filtered
-                if img.get("aspect_ratio") == filters.aspect_ratio
-            ]
-
-        # 标签筛选
-        if filters.tags:
-            filtered = [
-                img for img in filtered
-                if any(tag in img.get("tags", []) for tag in filters.tags)
-            ]
-
-        # 日期范围筛选
-        if filters.start_date:
-            filtered = [
-                img for img in filtered
-                if img.get("created_at", 0) >= filters.start_date
-            ]
-
-        if filters.end_date:
-            filtered = [
-                img for img in filtered
-                if img.get("created_at", 0) <= filters.end_date
-            ]
-
-        # NSFW 筛选
-        if filters.nsfw is not None:
-            filtered = [
-                img for img in filtered
-                if img.get("nsfw", False) == filters.nsfw
-            ]
-
-        # 收藏筛选
-        if filters.favorite is not None:
-            filtered = [
-                img for img in filtered
-                if img.get("favorite", False) == filters.favorite
-            ]
-
-        return filtered
+    # ==================== 修改 ====================
 
     async def delete_images(self, image_ids: List[str]) -> Dict[str, Any]:
         """
@@ -269,18 +252,14 @@ class ImageMetadataService:
 
         try:
             async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
-                images = data.get("images", [])
+                await self._ensure_index()
 
                 # 找到要删除的图片
                 to_delete = []
-                remaining = []
-
-                for img in images:
-                    if img.get("id") in image_ids:
+                for image_id in dict.fromkeys(image_ids):
+                    img = self.index.get(image_id)
+                    if img:
                         to_delete.append(img)
-                    else:
-                        remaining.append(img)
 
                 # 删除文件
                 for img in to_delete:
@@ -288,14 +267,16 @@ class ImageMetadataService:
                         file_path = self.image_dir / img.get("filename", "")
                         if file_path.exists():
                             file_path.unlink()
+                            await asyncio.to_thread(
+                                get_media_cache_index().remove, "image", file_path.name
+                            )
                         deleted_count += 1
                     except Exception as e:
                         logger.error(f"删除图片文件失败 {img.get('id')}: {e}")
                         failed_count += 1
 
                 # 更新元数据
-                data["images"] = remaining
-                await self.storage.save_image_metadata(data)
+                await self._apply(deletes=[img["id"] for img in to_delete])
 
                 logger.info(f"批量删除图片: 成功 {deleted_count}, 失败 {failed_count}")
 
@@ -308,6 +289,25 @@ class ImageMetadataService:
             "total": len(image_ids)
         }
 
+    async def clear_images(self):
+        """清空全部图片元数据（图片文件由调用方处理）"""
+        async with self.storage.acquire_lock("image_metadata", timeout=10):
+            await self.storage.save_image_metadata({"images": [], "version": "1.0"})
+            revision = await self.storage.get_image_metadata_revision()
+            await asyncio.to_thread(self.index.rebuild, [], revision)
+            self._index_synced = True
+
+    async def _update_image(self, image_id: str, changes: Dict[str, Any]) -> bool:
+        """更新单张图片的字段，图片不存在返回 False"""
+        async with self.storage.acquire_lock("image_metadata", timeout=10):
+            await self._ensure_index()
+            img = await self.storage.patch_image(image_id, changes)
+            if img is None:
+                logger.warning(f"图片不存在: {image_id}")
+                return False
+            await self._sync_index(upserts=[img])
+            return True
+
     async def update_tags(self, image_id: str, tags: List[str]) -> bool:
         """
         更新图片标签
@@ -320,26 +320,10 @@ class ImageMetadataService:
             是否更新成功
         """
         try:
-            async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
-                images = data.get("images", [])
-
-                # 查找并更新
-                found = False
-                for img in images:
-                    if img.get("id") == image_id:
-                        img["tags"] = tags
-                        found = True
-                        break
-
-                if not found:
-                    logger.warning(f"图片不存在: {image_id}")
-                    return False
-
-                # 保存
-                await self.storage.save_image_metadata(data)
-                logger.info(f"更新图片标签成功: {image_id}")
-                return True
+            if not await self._update_image(image_id, {"tags": tags}):
+                return False
+            logger.info(f"更新图片标签成功: {image_id}")
+            return True
 
         except Exception as e:
             logger.error(f"更新图片标签失败: {e}")
@@ -357,56 +341,27 @@ class ImageMetadataService:
             是否更新成功
         """
         try:
-            async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
-                images = data.get("images", [])
-
-                # 查找并更新
-                found = False
-                for img in images:
-                    if img.get("id") == image_id:
-                        img["favorite"] = favorite
-                        found = True
-                        break
-
-                if not found:
-                    logger.warning(f"图片不存在: {image_id}")
-                    return False
-
-                # 保存
-                await self.storage.save_image_metadata(data)
-                logger.info(f"更新图片收藏状态成功: {image_id}, favorite={favorite}")
-                return True
+            if not await self._update_image(image_id, {"favorite": favorite}):
+                return False
+            logger.info(f"更新图片收藏状态成功: {image_id}, favorite={favorite}")
+            return True
 
         except Exception as e:
             logger.error(f"更新图片收藏状态失败: {e}")
             return False
 
+    # ==================== 统计 ====================
+
     async def get_all_tags(self) -> List[Dict[str, Any]]:
         """
-        获取所有标签及其使用次数
+        获取所有标签及其使用次数（读取预聚合统计）
 
         Returns:
             标签列表，按使用次数降序排序
         """
         try:
-            data = await self.storage.load_image_metadata()
-            images = data.get("images", [])
-
-            # 统计标签
-            tag_counts = {}
-            for img in images:
-                for tag in img.get("tags", []):
-                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-            # 转换为列表并排序
-            tags = [
-                {"name": tag, "count": count}
-                for tag, count in tag_counts.items()
-            ]
-            tags.sort(key=lambda x: x["count"], reverse=True)
-
-            return tags
+            await self._ensure_index()
+            return await asyncio.to_thread(self.index.tag_counts)
 
         except Exception as e:
             logger.error(f"获取标签列表失败: {e}")
@@ -414,68 +369,47 @@ class ImageMetadataService:
 
     async def get_stats(self) -> ImageStats:
         """
-        获取统计信息
+        获取统计信息（读取预聚合统计）
 
         Returns:
             统计信息
         """
         try:
-            data = await self.storage.load_image_metadata()
-            images = data.get("images", [])
-
-            # 总数和总大小
-            total_count = len(images)
-            total_size = sum(img.get("file_size", 0) for img in images)
-
-            # 本月新增
-            now = datetime.now()
-            month_start = datetime(now.year, now.month, 1)
-            month_start_ts = int(month_start.timestamp() * 1000)
-            month_count = sum(
-                1 for img in images
-                if img.get("created_at", 0) >= month_start_ts
-            )
-
-            # 常用标签（前10）
-            tag_counts = {}
-            for img in images:
-                for tag in img.get("tags", []):
-                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
-
-            top_tags = [
-                {"name": tag, "count": count}
-                for tag, count in sorted(
-                    tag_counts.items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )[:10]
-            ]
-
-            # 模型分布
-            models = {}
-            for img in images:
-                model = img.get("model", "unknown")
-                models[model] = models.get(model, 0) + 1
-
-            # 宽高比分布
-            aspect_ratios = {}
-            for img in images:
-                ratio = img.get("aspect_ratio", "unknown")
-                aspect_ratios[ratio] = aspect_ratios.get(ratio, 0) + 1
-
-            return ImageStats(
-                total_count=total_count,
-                total_size=total_size,
-                month_count=month_count,
-                top_tags=top_tags,
-                models=models,
-                aspect_ratios=aspect_ratios
-            )
+            await self._ensure_index()
+            month = datetime.now().strftime("%Y-%m")
+            return ImageStats(**self.index.stats(month))
 
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             return ImageStats()
 
+    async def rebuild_stats(self, full: bool = False) -> Dict[str, Any]:
+        """
+        重建预聚合统计
+
+        Args:
+            full: 为 True 时按存储内容全量重建索引（统计随之重算），否则仅按索引重算统计
+
+        Returns:
+            {"images": 图片数}，仅重算统计时另含 {"fixed": 修正的统计项数}
+        """
+        if full:
+            async with self.storage.acquire_lock("image_metadata", timeout=30):
+                data = await self.storage.load_image_metadata()
+                revision = await self.storage.get_image_metadata_revision()
+                count = await asyncio.to_thread(
+                    self.index.rebuild, data.get("images", []), revision
+                )
+                self._index_synced = True
+            return {"images": count}
+
+        await self._ensure_index()
+        result = await asyncio.to_thread(self.index.rebuild_stats)
+        result["images"] = (await self.get_stats()).total_count
+        return result
+
+    # ==================== 维护 ====================
+
     async def cleanup_orphaned_metadata(self) -> int:
         """
         清理孤立的元数据（文件不存在但元数据存在）
@@ -485,25 +419,22 @@ class ImageMetadataService:
         """
         try:
             async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
-                images = data.get("images", [])
+                await self._ensure_index()
 
                 # 检查文件是否存在
-                valid_images = []
-                removed_count = 0
+                removed_ids = []
 
-                for img in images:
-                    file_path = self.image_dir / img.get("filename", "")
-                    if file_path.exists():
-                        valid_images.append(img)
-                    else:
-                        removed_count += 1
-                        logger.info(f"清理孤立元数据: {img.get('id')}")
+                files = await asyncio.to_thread(self.index.files)
+                for image_id, filename in files:
+                    file_path = self.image_dir / (filename or "")
+                    if not file_path.exists():
+                        removed_ids.append(image_id)
+                        logger.info(f"清理孤立元数据: {image_id}")
+                removed_count = len(removed_ids)
 
                 # 更新元数据
                 if removed_count > 0:
-                    data["images"] = valid_images
-                    await self.storage.save_image_metadata(data)
+                    await self._apply(deletes=removed_ids)
                     logger.info(f"清理孤立元数据完成: {removed_count} 条")
 
                 return removed_count
@@ -520,37 +451,8 @@ class ImageMetadataService:
             包含失效图片列表的字典
         """
         try:
-            data = await self.storage.load_image_metadata()
-            images = data.get("images", [])
-
-            missing_images = []
-            valid_count = 0
-
-            for img in images:
-                filename = img.get("filename")
-                if not filename:
-                    continue
-
-                file_path = self.image_dir / filename
-                if not file_path.exists():
-                    # 文件不存在，添加到失效列表
-                    missing_images.append({
-                        "id": img.get("id"),
-                        "filename": filename,
-                        "prompt": img.get("prompt", ""),
-                        "quality_score": img.get("quality_score"),
-                        "created_at": img.get("created_at"),
-                        "file_size": img.get("file_size", 0),
-                    })
-                else:
-                    valid_count += 1
-
-            return {
-                "total": len(images),
-                "valid": valid_count,
-                "missing": len(missing_images),
-                "missing_images": missing_images
-            }
+            await self._ensure_index()
+            return await asyncio.to_thread(self._scan_missing_files)
 
         except Exception as e:
             logger.error(f"检查失效图片失败: {e}")
@@ -561,6 +463,39 @@ class ImageMetadataService:
                 "missing_images": []
             }
 
+    def _scan_missing_files(self) -> Dict[str, Any]:
+        """按索引中的 (id, filename) 检查文件是否存在（在线程池中执行）"""
+        files = self.index.files()
+        missing_images = []
+        valid_count = 0
+
+        for image_id, filename in files:
+            if not filename:
+                continue
+
+            file_path = self.image_dir / filename
+            if file_path.exists():
+                valid_count += 1
+                continue
+
+            # 文件不存在，添加到失效列表
+            img = self.index.get(image_id) or {}
+            missing_images.append({
+                "id": image_id,
+                "filename": filename,
+                "prompt": img.get("prompt", ""),
+                "quality_score": img.get("quality_score"),
+                "created_at": img.get("created_at"),
+                "file_size": img.get("file_size", 0),
+            })
+
+        return {
+            "total": len(files),
+            "valid": valid_count,
+            "missing": len(missing_images),
+            "missing_images": missing_images
+        }
+
     async def scan_local_images(self) -> Dict[str, Any]:
         """
         扫描本地图片文件夹，为没有元数据的图片创建元数据
@@ -582,11 +517,12 @@ class ImageMetadataService:
             exif_manager = get_exif_manager()
 
             async with self.storage.acquire_lock("image_metadata", timeout=10):
-                data = await self.storage.load_image_metadata()
-                images = data.get("images", [])
+                await self._ensure_index()
+                added = []
 
                 # 获取已有的文件名集合
-                existing_filenames = {img.get("filename") for img in images}
+                files = await asyncio.to_thread(self.index.files)
+                existing_filenames = {filename for _, filename in files}
 
                 # 确保图片目录存在
                 self.image_dir.mkdir(parents=True, exist_ok=True)
@@ -662,7 +598,7 @@ class ImageMetadataService:
                             )
 
                             # 添加到列表
-                            images.append(metadata.model_dump())
+                            added.append(metadata.model_dump())
                             added_count += 1
                             logger.info(f"扫描到新图片: {file_path.name}")
 
@@ -672,8 +608,7 @@ class ImageMetadataService:
 
                 # 保存元数据
                 if added_count > 0:
-                    data["images"] = images
-                    await self.storage.save_image_metadata(data)
+                    await self._apply(upserts=added)
                     logger.info(f"扫描完成: 新增 {added_count}, 跳过 {skipped_count}, 失败 {failed_count}, 从EXIF恢复 {restored_from_exif}")
 
                 return {
@@ -748,6 +683,7 @@ class ImageMetadataService:
 
             # 复制文件
             shutil.copy2(source, dest_path)
+            await asyncio.to_thread(get_media_cache_index().add, "image", new_filename)
 
             # 读取图片信息
             with Image.open(dest_path) as img:
@@ -785,6 +721,9 @@ class ImageMetadataService:
                 else:
                     # 如果添加元数据失败，删除已复制的文件
                     dest_path.unlink()
+                    await asyncio.to_thread(
+                        get_media_cache_index().remove, "image", new_filename
+                    )
                     logger.error(f"添加元数据失败，已删除文件: {new_filename}")
                     return None
 
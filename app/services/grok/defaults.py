@@ -19,6 +19,9 @@ GROK_DEFAULTS = {
         "asset_proxy_url": "",
         "grok_base_url": "",
         "grok_proxy_token": "",
+        "session_pool_size": 4,
+        "session_max_clients": 32,
+        "session_max_age_sec": 300,
     },
     "security": {
         "cf_clearance": "",
@@ -34,6 +37,8 @@ GROK_DEFAULTS = {
         "filter_tags": ["grok:render", "xaiartifact", "xai:tool_usage_card"],
         "max_message_length": 32000,
         "auto_truncate_message": True,
+        "stream_coalesce_ms": 0,
+        "stream_coalesce_bytes": 4096,
     },
     "retry": {
         "max_retry": 3,
@@ -53,6 +58,9 @@ GROK_DEFAULTS = {
         "image_ws_blocked_seconds": 15,
         "image_ws_final_min_bytes": 100000,
         "image_ws_medium_min_bytes": 30000,
+        "image_ws_hedge": True,
+        "image_ws_hedge_percentile": 90,
+        "image_ws_hedge_delay": 10,
     },
     "token": {
         "auto_refresh": True,
@@ -61,10 +69,21 @@ GROK_DEFAULTS = {
         "fail_threshold": 5,
         "save_delay_ms": 500,
         "reload_interval_sec": 30,
+        "sync_interval_ms": 500,
+        "atomic_quota": False,
+        "quota_lease_units": 4,
+        "quota_lease_ms": 2000,
+        "selection_strategy": "max_quota",
+        "pool_strategies": [],
+        "max_inflight_per_token": 0,
     },
     "cache": {
         "enable_auto_clean": True,
         "limit_mb": 1024,
+        "eviction_policy": "lru",
+        "upload_cache_ttl_sec": 3600,
+        "upload_cache_max_entries": 2048,
+        "shared_download_lock": False,
     },
     "performance": {
         "assets_max_concurrent": 25,
@@ -72,12 +91,23 @@ GROK_DEFAULTS = {
         "assets_batch_size": 10,
         "assets_max_tokens": 1000,
         "media_max_concurrent": 50,
+        "upload_max_concurrent": 4,
         "usage_max_concurrent": 25,
         "usage_batch_size": 50,
         "usage_max_tokens": 1000,
         "nsfw_max_concurrent": 10,
         "nsfw_batch_size": 50,
         "nsfw_max_tokens": 1000,
+        "batch_adaptive": True,
+        "batch_adaptive_max_scale": 4,
+        "batch_latency_tolerance": 2.0,
+    },
+    "rate_limit": {
+        "enabled": True,
+        "families": [],
+        "token_rate": 0,
+        "token_burst": 10,
+        "max_wait": 30,
     },
     "video": {
         "auto_upscale": True,
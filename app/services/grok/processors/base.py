@@ -95,19 +95,60 @@ async def _with_idle_timeout(
             yield item
         return
 
+    # 单个定时器看门狗：仅在超时点检查等待时长，避免每个元素创建 wait_for 定时器
+    loop = asyncio.get_running_loop()
     iterator = iterable.__aiter__()
-    while True:
-        try:
-            item = await asyncio.wait_for(iterator.__anext__(), timeout=idle_timeout)
+    waiting_since: Optional[float] = None
+    waiter: Optional[asyncio.Task] = None
+    handle: Optional[asyncio.TimerHandle] = None
+    timed_out = False
+
+    def _check():
+        nonlocal handle, timed_out
+        handle = None
+        # 未在等待上游（下游消费中）时不计时，下次等待时重新调度
+        if waiting_since is None or waiter is None:
+            return
+        deadline = waiting_since + idle_timeout
+        if loop.time() >= deadline:
+            timed_out = True
+            waiter.cancel()
+        else:
+            handle = loop.call_at(deadline, _check)
+
+    def _timeout_error() -> StreamIdleTimeoutError:
+        logger.warning(
+            f"Stream idle timeout after {idle_timeout}s",
+            extra={"model": model, "idle_timeout": idle_timeout},
+        )
+        return StreamIdleTimeoutError(idle_timeout)
+
+    try:
+        while True:
+            waiter = asyncio.current_task()
+            waiting_since = loop.time()
+            if handle is None:
+                handle = loop.call_at(waiting_since + idle_timeout, _check)
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            except asyncio.CancelledError:
+                if timed_out and waiter is not None:
+                    waiter.uncancel()
+                    raise _timeout_error()
+                raise
+            finally:
+                waiting_since = None
+            if timed_out:
+                # 上游吞掉了取消信号，仍按超时处理
+                if waiter is not None:
+                    waiter.uncancel()
+                raise _timeout_error()
             yield item
-        except asyncio.TimeoutError:
-            logger.warning(
-                f"Stream idle timeout after {idle_timeout}s",
-                extra={"model": model, "idle_timeout": idle_timeout},
-            )
-            raise StreamIdleTimeoutError(idle_timeout)
-        except StopAsyncIteration:
-            break
+    finally:
+        if handle is not None:
+            handle.cancel()
 
 
 class BaseProcessor:
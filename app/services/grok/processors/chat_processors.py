@@ -5,7 +5,7 @@
 import asyncio
 import uuid
 import re
-from typing import Any, AsyncGenerator, AsyncIterable
+from typing import Any, AsyncGenerator, AsyncIterable, Optional
 
 import orjson
 from curl_cffi.requests.errors import RequestsError
@@ -23,6 +23,16 @@ from .base import (
 )
 
 
+# 快速路径: 仅含 token 的行（绝大多数流式行）跳过通用解析
+_TOKEN_MARKER = b'"token":'
+_SLOW_MARKERS = (
+    b'"modelResponse"',
+    b'"streamingImageGenerationResponse"',
+    b'"llmInfo"',
+)
+_CONTENT_PLACEHOLDER = "\x00content\x00"
+
+
 class StreamProcessor(BaseProcessor):
     """流式响应处理器"""
 
@@ -36,6 +46,11 @@ class StreamProcessor(BaseProcessor):
         self.image_format = get_config("app.image_format")
         self._tag_buffer: str = ""
         self._in_filter_tag: bool = False
+        self._fallback_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        # 内容 chunk 模板（id/model/created/fingerprint 固定部分），id 或指纹变化时重建
+        self._content_prefix: str = ""
+        self._content_suffix: str = ""
+        self._template_key: tuple = ()
 
         if think is None:
             self.show_think = get_config("chat.thinking")
@@ -46,6 +61,8 @@ class StreamProcessor(BaseProcessor):
         """过滤 token 中的特殊标签（如 <grok:render>...</grok:render>），支持跨 token 的标签过滤"""
         if not self.filter_tags:
             return token
+        if not self._in_filter_tag and "<" not in token:
+            return token
 
         result = []
         i = 0
@@ -91,8 +108,68 @@ class StreamProcessor(BaseProcessor):
 
         return "".join(result)
 
+    def _content_sse(self, content: str) -> str:
+        """构建内容 SSE（基于预构建模板，仅序列化内容字符串）"""
+        key = (self.response_id, self.fingerprint)
+        if key != self._template_key:
+            chunk = {
+                "id": self.response_id or self._fallback_id,
+                "object": "chat.completion.chunk",
+                "created": self.created,
+                "model": self.model,
+                "system_fingerprint": self.fingerprint,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": _CONTENT_PLACEHOLDER},
+                        "logprobs": None,
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            prefix, suffix = orjson.dumps(chunk).decode().split(
+                orjson.dumps(_CONTENT_PLACEHOLDER).decode(), 1
+            )
+            self._content_prefix = f"data: {prefix}"
+            self._content_suffix = f"{suffix}\n\n"
+            self._template_key = key
+        return (
+            self._content_prefix
+            + orjson.dumps(content).decode()
+            + self._content_suffix
+        )
+
+    def _fast_token(self, line: Any) -> Optional[str]:
+        """
+        快速解析仅含 token 的行
+
+        Returns:
+            过滤后的 token（可能为空串）；非快速路径行返回 None
+        """
+        if (
+            not self.role_sent
+            or not isinstance(line, bytes)
+            or _TOKEN_MARKER not in line
+        ):
+            return None
+        for marker in _SLOW_MARKERS:
+            if marker in line:
+                return None
+        try:
+            resp = orjson.loads(line)["result"]["response"]
+            token = resp["token"]
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return None
+        if not isinstance(token, str):
+            return None
+        if rid := resp.get("responseId"):
+            self.response_id = rid
+        return self._filter_token(token) if token else ""
+
     def _sse(self, content: str = "", role: str = None, finish: str = None) -> str:
         """构建 SSE 响应"""
+        if content and not role and not finish:
+            return self._content_sse(content)
         delta = {}
         if role:
             delta["role"] = role
@@ -101,7 +178,7 @@ class StreamProcessor(BaseProcessor):
             delta["content"] = content
 
         chunk = {
-            "id": self.response_id or f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "id": self.response_id or self._fallback_id,
             "object": "chat.completion.chunk",
             "created": self.created,
             "model": self.model,
@@ -112,94 +189,119 @@ class StreamProcessor(BaseProcessor):
         }
         return f"data: {orjson.dumps(chunk).decode()}\n\n"
 
-    async def process(
-        self, response: AsyncIterable[bytes]
-    ) -> AsyncGenerator[str, None]:
-        """处理流式响应"""
-        idle_timeout = get_config("timeout.stream_idle_timeout")
-
+    async def _process_line(self, line: Any) -> AsyncGenerator[str, None]:
+        """通用单行处理"""
+        line = _normalize_stream_line(line)
+        if not line:
+            return
         try:
-            async for line in _with_idle_timeout(response, idle_timeout, self.model):
-                line = _normalize_stream_line(line)
-                if not line:
-                    continue
-                try:
-                    data = orjson.loads(line)
-                except orjson.JSONDecodeError:
-                    continue
-
-                resp = data.get("result", {}).get("response", {})
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return
+
+        resp = data.get("result", {}).get("response", {})
+
+        if (llm := resp.get("llmInfo")) and not self.fingerprint:
+            self.fingerprint = llm.get("modelHash", "")
+        if rid := resp.get("responseId"):
+            self.response_id = rid
+
+        if not self.role_sent:
+            yield self._sse(role="assistant")
+            self.role_sent = True
+
+        # 图像生成进度
+        if img := resp.get("streamingImageGenerationResponse"):
+            if self.show_think:
+                if not self.think_opened:
+                    yield self._sse("<think>\n")
+                    self.think_opened = True
+                idx = img.get("imageIndex", 0) + 1
+                progress = img.get("progress", 0)
+                yield self._sse(
+                    f"正在生成第{idx}张图片中，当前进度{progress}%\n"
+                )
+            return
 
-                if (llm := resp.get("llmInfo")) and not self.fingerprint:
-                    self.fingerprint = llm.get("modelHash", "")
-                if rid := resp.get("responseId"):
-                    self.response_id = rid
-
-                if not self.role_sent:
-                    yield self._sse(role="assistant")
-                    self.role_sent = True
-
-                # 图像生成进度
-                if img := resp.get("streamingImageGenerationResponse"):
-                    if self.show_think:
-                        if not self.think_opened:
-                            yield self._sse("<think>\n")
-                            self.think_opened = True
-                        idx = img.get("imageIndex", 0) + 1
-                        progress = img.get("progress", 0)
-                        yield self._sse(
-                            f"正在生成第{idx}张图片中，当前进度{progress}%\n"
+        # modelResponse
+        if mr := resp.get("modelResponse"):
+            if self.think_opened and self.show_think:
+                if msg := mr.get("message"):
+                    yield self._sse(msg + "\n")
+                yield self._sse("</think>\n")
+                self.think_opened = False
+
+            # 处理生成的图片
+            for url in _collect_image_urls(mr):
+                parts = url.split("/")
+                img_id = parts[-2] if len(parts) >= 2 else "image"
+
+                if self.image_format == "base64":
+                    try:
+                        dl_service = self._get_dl()
+                        base64_data = await dl_service.to_base64(
+                            url, self.token, "image"
                         )
-                    continue
-
-                # modelResponse
-                if mr := resp.get("modelResponse"):
-                    if self.think_opened and self.show_think:
-                        if msg := mr.get("message"):
-                            yield self._sse(msg + "\n")
-                        yield self._sse("</think>\n")
-                        self.think_opened = False
-
-                    # 处理生成的图片
-                    for url in _collect_image_urls(mr):
-                        parts = url.split("/")
-                        img_id = parts[-2] if len(parts) >= 2 else "image"
-
-                        if self.image_format == "base64":
-                            try:
-                                dl_service = self._get_dl()
-                                base64_data = await dl_service.to_base64(
-                                    url, self.token, "image"
-                                )
-                                if base64_data:
-                                    yield self._sse(f"![{img_id}]({base64_data})\n")
-                                else:
-                                    final_url = await self.process_url(url, "image")
-                                    yield self._sse(f"![{img_id}]({final_url})\n")
-                            except Exception as e:
-                                logger.warning(
-                                    f"Failed to convert image to base64, falling back to URL: {e}"
-                                )
-                                final_url = await self.process_url(url, "image")
-                                yield self._sse(f"![{img_id}]({final_url})\n")
+                        if base64_data:
+                            yield self._sse(f"![{img_id}]({base64_data})\n")
                         else:
                             final_url = await self.process_url(url, "image")
                             yield self._sse(f"![{img_id}]({final_url})\n")
+                    except Exception as e:
+                        logger.warning(
+                            f"Failed to convert image to base64, falling back to URL: {e}"
+                        )
+                        final_url = await self.process_url(url, "image")
+                        yield self._sse(f"![{img_id}]({final_url})\n")
+                else:
+                    final_url = await self.process_url(url, "image")
+                    yield self._sse(f"![{img_id}]({final_url})\n")
+
+            if (
+                (meta := mr.get("metadata", {}))
+                .get("llm_info", {})
+                .get("modelHash")
+            ):
+                self.fingerprint = meta["llm_info"]["modelHash"]
+            return
+
+        # 普通 token
+        if (token := resp.get("token")) is not None:
+            if token:
+                filtered = self._filter_token(token)
+                if filtered:
+                    yield self._sse(filtered)
 
-                    if (
-                        (meta := mr.get("metadata", {}))
-                        .get("llm_info", {})
-                        .get("modelHash")
-                    ):
-                        self.fingerprint = meta["llm_info"]["modelHash"]
-                    continue
+    async def process(
+        self, response: AsyncIterable[bytes]
+    ) -> AsyncGenerator[str, None]:
+        """
+        处理流式响应
 
-                # 普通 token
-                if (token := resp.get("token")) is not None:
-                    if token:
-                        filtered = self._filter_token(token)
-                        if filtered:
-                            yield self._sse(filtered)
+        上游提供 aiter_batches 时按网络分块处理: 同一分块内连续的 token 行
+        合并为一个 SSE chunk 输出。
+        """
+        idle_timeout = get_config("timeout.stream_idle_timeout")
+        batched = hasattr(response, "aiter_batches")
+        source = response.aiter_batches() if batched else response
+
+        try:
+            async for item in _with_idle_timeout(source, idle_timeout, self.model):
+                batch = item if batched else (item,)
+                pending = []
+                for line in batch:
+                    token = self._fast_token(line)
+                    if token is not None:
+                        if token:
+                            pending.append(token)
+                        continue
+                    if pending:
+                        yield self._content_sse("".join(pending))
+                        pending = []
+                    async for chunk in self._process_line(line):
+                        yield chunk
+                if pending:
+                    yield self._content_sse("".join(pending))
 
             if self.think_opened:
                 yield self._sse("</think>\n")
@@ -238,6 +340,8 @@ class StreamProcessor(BaseProcessor):
             )
             raise
         finally:
+            if batched:
+                await source.aclose()
             await self.close()
 
 
@@ -2,6 +2,7 @@
 图片生成响应处理器（WebSocket）
 """
 
+import asyncio
 import base64
 import time
 from pathlib import Path
@@ -13,6 +14,7 @@ from app.core.config import get_config
 from app.core.logger import logger
 from app.core.storage import DATA_DIR
 from app.core.exceptions import UpstreamException
+from app.services.grok.utils.media_cache import get_media_cache_index
 from .base import BaseProcessor
 
 
@@ -61,8 +63,10 @@ class ImageWSBaseProcessor(BaseProcessor):
         image_dir = self._ensure_image_dir()
         filename = self._filename(image_id, is_final)
         filepath = image_dir / filename
+        raw = base64.b64decode(data)
         with open(filepath, "wb") as f:
-            f.write(base64.b64decode(data))
+            f.write(raw)
+        get_media_cache_index().add("image", filename, len(raw))
         return self._build_file_url(filename)
 
     def _pick_best(self, existing: Optional[Dict], incoming: Dict) -> Dict:
@@ -258,7 +262,10 @@ class ImageWSCollectProcessor(ImageWSBaseProcessor):
 
         results: List[str] = []
         for item in selected:
-            output = self._to_output(item.get("image_id", ""), item)
+            # 解码落盘与缓存索引写入放到线程池，避免阻塞事件循环
+            output = await asyncio.to_thread(
+                self._to_output, item.get("image_id", ""), item
+            )
             if output:
                 results.append(output)
 
@@ -4,11 +4,12 @@ Grok 文件资产服务
 
 import asyncio
 import base64
+import binascii
 import hashlib
 import os
 import re
 import time
-from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack, asynccontextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
@@ -27,7 +28,12 @@ from app.core.exceptions import AppException, UpstreamException, ValidationExcep
 from app.core.logger import logger
 from app.core.storage import DATA_DIR
 from app.services.grok.utils.headers import apply_statsig, build_sso_cookie, build_grok_headers
+from app.services.grok.utils.media_cache import get_media_cache_index
+from app.services.grok.utils.rate_limit import get_rate_limiter
 from app.services.grok.utils.retry import retry_on_status
+from app.services.grok.utils.session_pool import abort_response
+from app.services.grok.utils.singleflight import SingleFlight
+from app.services.grok.utils.upload_cache import content_digest, get_upload_cache
 from app.services.grok.utils.urls import grok_url
 from app.services.token.service import TokenService
 
@@ -38,11 +44,16 @@ LIST_API = "/rest/assets"
 DELETE_API = "/rest/assets-metadata"
 DOWNLOAD_API = "https://assets.grok.com"
 LOCK_DIR = DATA_DIR / ".locks"
+# 本地文件 base64 编码的读取块大小（3 的倍数）
+B64_CHUNK_SIZE = 3 * 64 * 1024
 
 # 全局信号量（运行时动态初始化）
 _ASSETS_SEMAPHORE = None
 _ASSETS_SEM_VALUE = None
 
+# 同一缓存文件的进程内下载合并
+_DOWNLOAD_FLIGHTS = SingleFlight()
+
 # 常用 MIME 类型（业务数据，非配置）
 MIME_TYPES = {
     ".jpg": "image/jpeg",
@@ -289,106 +300,124 @@ class UploadService(BaseService):
         Returns:
             (file_id, file_uri)
         """
-        async with _get_assets_semaphore():
-            # 处理输入
-            if self.is_url(file_input):
+        # 处理输入
+        if self.is_url(file_input):
+            async with _get_assets_semaphore():
                 filename, b64, mime = await self.fetch(file_input)
-            else:
-                filename, b64, mime = self.parse_b64(file_input)
+        else:
+            filename, b64, mime = self.parse_b64(file_input)
 
-            logger.debug(
-                f"Upload prepare: filename={filename}, type={mime}, size={len(b64)}"
-            )
+        logger.debug(
+            f"Upload prepare: filename={filename}, type={mime}, size={len(b64)}"
+        )
 
-            if not b64:
-                raise ValidationException("Invalid file input: empty content")
+        if not b64:
+            raise ValidationException("Invalid file input: empty content")
 
-            # 定义上传函数（用于重试）
-            async def _do_upload():
-                session = await self._get_session(reuse=reuse_session)
-                session_owned = not reuse_session  # 如果不复用，则需要关闭
+        # 同一 Token 已上传过相同内容时直接复用
+        upload_cache = get_upload_cache()
+        digest = content_digest(b64, mime)
+        cached = await upload_cache.get(digest, token)
+        if cached:
+            logger.debug(f"Upload cache hit: {filename} -> {cached[0]}")
+            return cached
 
-                try:
-                    response = await session.post(
-                        grok_url(UPLOAD_API),
-                        headers=self._build_headers(token),
-                        json={"fileName": filename, "fileMimeType": mime, "content": b64},
-                        impersonate=self.config.browser,
-                        timeout=self.config.timeout,
-                        proxies=self.config.get_proxies(),
-                    )
+        # 定义上传函数（用于重试）
+        async def _do_upload():
+            session = await self._get_session(reuse=reuse_session)
+            session_owned = not reuse_session  # 如果不复用，则需要关闭
 
-                    # 处理响应
-                    if response.status_code == 200:
-                        result = response.json()
-                        file_id = result.get("fileMetadataId", "")
-                        file_uri = result.get("fileUri", "")
-                        logger.info(f"Upload success: {filename} -> {file_id}")
-                        return file_id, file_uri
-
-                    # 认证失败
-                    if response.status_code in (401, 403):
-                        # 记录响应体，帮助诊断是 Cloudflare WAF 拦截还是 token 认证失败
-                        try:
-                            resp_body = response.text[:500].replace("<", "\\<").replace(">", "\\>")
-                        except Exception:
-                            resp_body = "(unreadable)"
-                        logger.warning(
-                            f"Upload auth failed: {response.status_code} | body={resp_body}"
-                        )
-                        try:
-                            await TokenService.record_fail(
-                                token, response.status_code, "upload_auth_failed"
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to record token failure: {e}")
-
-                        raise UpstreamException(
-                            message=f"Upload authentication failed: {response.status_code}",
-                            # token_invalidated=False 使上层不再重试（403 对上传是永久性拦截）
-                            details={"status": response.status_code, "token_invalidated": False},
+            try:
+                response = await session.post(
+                    grok_url(UPLOAD_API),
+                    headers=self._build_headers(token),
+                    json={"fileName": filename, "fileMimeType": mime, "content": b64},
+                    impersonate=self.config.browser,
+                    timeout=self.config.timeout,
+                    proxies=self.config.get_proxies(),
+                )
+
+                # 处理响应
+                if response.status_code == 200:
+                    result = response.json()
+                    file_id = result.get("fileMetadataId", "")
+                    file_uri = result.get("fileUri", "")
+                    logger.info(f"Upload success: {filename} -> {file_id}")
+                    return file_id, file_uri
+
+                # 认证失败
+                if response.status_code in (401, 403):
+                    # 记录响应体，帮助诊断是 Cloudflare WAF 拦截还是 token 认证失败
+                    try:
+                        resp_body = response.text[:500].replace("<", "\\<").replace(">", "\\>")
+                    except Exception:
+                        resp_body = "(unreadable)"
+                    logger.warning(
+                        f"Upload auth failed: {response.status_code} | body={resp_body}"
+                    )
+                    try:
+                        await TokenService.record_fail(
+                            token, response.status_code, "upload_auth_failed"
                         )
+                    except Exception as e:
+                        logger.error(f"Failed to record token failure: {e}")
 
-                    # 其他错误
-                    logger.error(f"Upload failed: {filename} - {response.status_code}")
                     raise UpstreamException(
-                        message=f"Upload failed: {response.status_code}",
-                        details={"status": response.status_code},
+                        message=f"Upload authentication failed: {response.status_code}",
+                        # token_invalidated=False 使上层不再重试（403 对上传是永久性拦截）
+                        details={"status": response.status_code, "token_invalidated": False},
                     )
-                except Exception as e:
-                    # 检查是否为 HTTP/2 错误
-                    err_str = str(e).lower()
-                    is_http2_error = "http/2" in err_str or "curl: (92)" in err_str or "protocol_error" in err_str
-
-                    if is_http2_error:
-                        logger.warning(f"HTTP/2 error during upload: {e}")
-                        # 将 HTTP/2 错误包装为可重试的 UpstreamException
-                        raise UpstreamException(
-                            message=f"HTTP/2 connection error: {str(e)}",
-                            details={"status": 502, "error": str(e), "type": "http2_error"},
-                        )
-                    raise
-                finally:
-                    # 如果是独立 session，需要关闭
-                    if session_owned:
-                        await session.close()
-
-            # 使用重试机制执行上传
-            def extract_status(e: Exception) -> Optional[int]:
-                if isinstance(e, UpstreamException) and e.details:
-                    status = e.details.get("status")
-                    # 403 上传拦截为永久性（Cloudflare WAF / token 权限不足），不重试
-                    if status == 403:
-                        return None
-                    return status
-                return None
 
-            try:
-                return await retry_on_status(_do_upload, extract_status=extract_status)
+                # 其他错误
+                logger.error(f"Upload failed: {filename} - {response.status_code}")
+                raise UpstreamException(
+                    message=f"Upload failed: {response.status_code}",
+                    details={"status": response.status_code},
+                )
             except Exception as e:
-                # 如果重试失败，记录详细错误
-                logger.error(f"Upload failed after retries: {filename} - {e}")
+                # 检查是否为 HTTP/2 错误
+                err_str = str(e).lower()
+                is_http2_error = "http/2" in err_str or "curl: (92)" in err_str or "protocol_error" in err_str
+
+                if is_http2_error:
+                    logger.warning(f"HTTP/2 error during upload: {e}")
+                    # 将 HTTP/2 错误包装为可重试的 UpstreamException
+                    raise UpstreamException(
+                        message=f"HTTP/2 connection error: {str(e)}",
+                        details={"status": 502, "error": str(e), "type": "http2_error"},
+                    )
                 raise
+            finally:
+                # 如果是独立 session，需要关闭
+                if session_owned:
+                    await session.close()
+
+        # 并发槽位只在实际上传时占用，限流排队与重试退避不占名额
+        async def _do_upload_in_slot():
+            async with _get_assets_semaphore():
+                return await _do_upload()
+
+        # 使用重试机制执行上传
+        def extract_status(e: Exception) -> Optional[int]:
+            if isinstance(e, UpstreamException) and e.details:
+                status = e.details.get("status")
+                # 403 上传拦截为永久性（Cloudflare WAF / token 权限不足），不重试
+                if status == 403:
+                    return None
+                return status
+            return None
+
+        try:
+            file_id, file_uri = await retry_on_status(
+                _do_upload_in_slot, extract_status=extract_status, limit_family="assets"
+            )
+        except Exception as e:
+            # 如果重试失败，记录详细错误
+            logger.error(f"Upload failed after retries: {filename} - {e}")
+            raise
+
+        await upload_cache.put(digest, token, file_id, file_uri)
+        return file_id, file_uri
 
 
 # ==================== 列表服务 ====================
@@ -420,6 +449,7 @@ class ListService(BaseService):
                 else:
                     params.pop("pageToken", None)
 
+                await get_rate_limiter().acquire("assets")
                 response = await session.get(
                     grok_url(LIST_API),
                     headers=headers,
@@ -468,6 +498,7 @@ class DeleteService(BaseService):
 
     async def delete(self, token: str, asset_id: str) -> bool:
         """删除单个文件"""
+        await get_rate_limiter().acquire("assets")
         async with _get_assets_semaphore():
             session = await self._get_session()
             response = await session.delete(
@@ -480,6 +511,8 @@ class DeleteService(BaseService):
 
             if response.status_code == 200:
                 logger.debug(f"Deleted: {asset_id}")
+                # 已删除的文件可能被上传缓存引用，丢弃该 Token 的缓存
+                await get_upload_cache().invalidate_token(token)
                 return True
 
             logger.error(f"Delete failed: {asset_id} - {response.status_code}")
@@ -546,6 +579,35 @@ class DeleteService(BaseService):
 # ==================== 下载服务 ====================
 
 
+class _B64Encoder:
+    """
+    增量 base64 编码器
+
+    输入按 3 字节对齐后编码（不足 3 字节的尾部留到下一块），
+    输出直接追加到以 data URI 前缀开头的缓冲区，最后只做一次解码。
+    """
+
+    __slots__ = ("_buf", "_tail")
+
+    def __init__(self, mime: str):
+        self._buf = bytearray(f"data:{mime};base64,".encode())
+        self._tail = b""
+
+    def update(self, chunk: bytes):
+        if self._tail:
+            chunk = self._tail + chunk
+        cut = len(chunk) - len(chunk) % 3
+        if cut:
+            self._buf += binascii.b2a_base64(memoryview(chunk)[:cut], newline=False)
+        self._tail = bytes(chunk[cut:])
+
+    def finish(self) -> str:
+        if self._tail:
+            self._buf += binascii.b2a_base64(self._tail, newline=False)
+            self._tail = b""
+        return self._buf.decode("ascii")
+
+
 class DownloadService(BaseService):
     """文件下载服务"""
 
@@ -556,6 +618,7 @@ class DownloadService(BaseService):
         self.video_dir = self.base_dir / "video"
         self.image_dir.mkdir(parents=True, exist_ok=True)
         self.video_dir.mkdir(parents=True, exist_ok=True)
+        self.index = get_media_cache_index()
         self._cleanup_running = False
 
     def _cache_path(self, file_path: str, media_type: str) -> Path:
@@ -575,33 +638,75 @@ class DownloadService(BaseService):
     async def download(
         self, file_path: str, token: str, media_type: str = "image"
     ) -> Tuple[Optional[Path], str]:
-        """下载文件到本地"""
-        async with _get_assets_semaphore():
-            cache_path = self._cache_path(file_path, media_type)
+        """
+        下载文件到本地
+
+        同一文件的并发下载在进程内合并为一次（所有调用等待同一结果），
+        跨进程通过文件锁（或 cache.shared_download_lock 开启时的 Redis 锁）互斥；
+        并发信号量仅在实际传输时占用。
+        """
+        cache_path = self._cache_path(file_path, media_type)
+
+        # 检查缓存
+        if cache_path.exists():
+            logger.debug(f"Cache hit: {cache_path}")
+            self.index.touch(media_type, cache_path.name)
+            return cache_path, self._get_mime(cache_path)
+
+        return await _DOWNLOAD_FLIGHTS.do(
+            str(cache_path),
+            lambda: self._download_once(file_path, token, media_type, cache_path),
+        )
 
-            # 检查缓存
+    async def _download_once(
+        self, file_path: str, token: str, media_type: str, cache_path: Path
+    ) -> Tuple[Path, str]:
+        """跨进程互斥下载（每个进程内同一文件只有一个调用进入）"""
+        lock_name = f"dl_{media_type}_{hashlib.sha1(str(cache_path).encode()).hexdigest()[:16]}"
+        async with self._download_lock(lock_name):
+            # 双重检查（其他进程可能已完成下载）
             if cache_path.exists():
-                logger.debug(f"Cache hit: {cache_path}")
                 return cache_path, self._get_mime(cache_path)
 
-            # 文件锁防止并发下载
-            lock_name = f"dl_{media_type}_{hashlib.sha1(str(cache_path).encode()).hexdigest()[:16]}"
-            async with _file_lock(lock_name, timeout=10):
-                # 双重检查
-                if cache_path.exists():
-                    return cache_path, self._get_mime(cache_path)
-
-                # 执行下载
+            # 执行下载（先排队令牌桶再占用并发槽位）
+            await get_rate_limiter().acquire("assets")
+            async with _get_assets_semaphore():
                 mime = await self._download_file(file_path, token, cache_path)
-                logger.info(f"Downloaded: {file_path}")
+            await asyncio.to_thread(self.index.add, media_type, cache_path.name)
+            logger.info(f"Downloaded: {file_path}")
 
-                # 异步检查缓存限制
-                asyncio.create_task(self.check_limit())
+        # 异步检查缓存限制
+        asyncio.create_task(self.check_limit())
 
-                return cache_path, mime
+        return cache_path, mime
 
-    async def _download_file(self, file_path: str, token: str, cache_path: Path) -> str:
-        """执行下载"""
+    @asynccontextmanager
+    async def _download_lock(self, name: str):
+        """跨进程下载锁: 默认文件锁，可选 Redis 分布式锁（多实例共享 DATA_DIR）"""
+        storage = None
+        if get_config("cache.shared_download_lock", False):
+            from app.core.storage import get_storage
+
+            storage = get_storage()
+            if not getattr(storage, "supports_shared_cache", False):
+                storage = None
+
+        async with AsyncExitStack() as stack:
+            if storage is None:
+                await stack.enter_async_context(_file_lock(name, timeout=10))
+            else:
+                # 锁过期时间覆盖整个下载，获取失败时不阻塞下载
+                timeout = max(10, int(self.config.timeout or 0))
+                try:
+                    await stack.enter_async_context(
+                        storage.acquire_lock(name, timeout=timeout)
+                    )
+                except Exception as e:
+                    logger.debug(f"Download lock unavailable, downloading without it: {e}")
+            yield
+
+    async def _open_download(self, file_path: str, token: str):
+        """发起流式下载请求，返回状态码为 200 的响应"""
         if not file_path.startswith("/"):
             file_path = f"/{file_path}"
 
@@ -620,10 +725,16 @@ class DownloadService(BaseService):
         )
 
         if response.status_code != 200:
+            await abort_response(response)
             raise UpstreamException(
                 message=f"Download failed: {response.status_code}",
                 details={"path": file_path, "status": response.status_code},
             )
+        return response
+
+    async def _download_file(self, file_path: str, token: str, cache_path: Path) -> str:
+        """执行下载"""
+        response = await self._open_download(file_path, token)
 
         # 保存文件
         tmp_path = cache_path.with_suffix(cache_path.suffix + ".tmp")
@@ -649,80 +760,68 @@ class DownloadService(BaseService):
     async def to_base64(
         self, file_path: str, token: str, media_type: str = "image"
     ) -> str:
-        """下载并转 base64"""
-        try:
-            cache_path, mime = await self.download(file_path, token, media_type)
-            if not cache_path or not cache_path.exists():
-                logger.warning(f"Download failed for {file_path}: invalid path")
-                raise AppException(
-                    "Download failed: invalid path", code="download_failed"
-                )
-
-            data_uri = self.to_b64(cache_path, mime)
+        """
+        下载并转 base64 data URI
 
-            # 删除临时文件
-            if data_uri:
+        边下载边编码（按 3 字节对齐分块，直接追加到结果缓冲区），不落盘，
+        内存中仅保留编码结果；本地已有缓存文件时按块读取编码后删除。
+        """
+        try:
+            cache_path = self._cache_path(file_path, media_type)
+            if cache_path.exists():
+                data_uri = await self._encode_file(cache_path, self._get_mime(cache_path))
+                # 删除临时文件
                 try:
                     cache_path.unlink()
+                    await asyncio.to_thread(self.index.remove, media_type, cache_path.name)
                 except Exception as e:
                     logger.debug(f"Failed to cleanup temp file {cache_path}: {e}")
+                return data_uri
 
-            return data_uri
+            await get_rate_limiter().acquire("assets")
+            async with _get_assets_semaphore():
+                response = await self._open_download(file_path, token)
+                try:
+                    mime = self._get_mime(cache_path, response)
+                    encoder = _B64Encoder(mime)
+                    if hasattr(response, "aiter_content"):
+                        async for chunk in response.aiter_content():
+                            if chunk:
+                                encoder.update(chunk)
+                    else:
+                        encoder.update(response.content)
+                except BaseException:
+                    await abort_response(response)
+                    raise
+            logger.debug(f"Downloaded as base64: {file_path}")
+            return encoder.finish()
         except Exception as e:
             logger.error(f"Failed to convert {file_path} to base64: {e}")
             raise
 
-    def get_stats(self, media_type: str = "image") -> Dict[str, Any]:
+    @staticmethod
+    async def _encode_file(file_path: Path, mime: str) -> str:
+        """按块读取本地文件并编码为 data URI"""
+        encoder = _B64Encoder(mime)
+        async with aiofiles.open(file_path, "rb") as f:
+            while chunk := await f.read(B64_CHUNK_SIZE):
+                encoder.update(chunk)
+        return encoder.finish()
+
+    async def get_stats(self, media_type: str = "image") -> Dict[str, Any]:
         """获取缓存统计"""
-        cache_dir = self.image_dir if media_type == "image" else self.video_dir
-        if not cache_dir.exists():
-            return {"count": 0, "size_mb": 0.0}
-
-        allowed = IMAGE_EXTS if media_type == "image" else VIDEO_EXTS
-        files = [
-            f
-            for f in cache_dir.glob("*")
-            if f.is_file() and f.suffix.lower() in allowed
-        ]
-        total_size = sum(f.stat().st_size for f in files)
-        return {"count": len(files), "size_mb": round(total_size / 1024 / 1024, 2)}
+        count, total_size = await asyncio.to_thread(self.index.stats, media_type)
+        return {"count": count, "size_mb": round(total_size / 1024 / 1024, 2)}
 
-    def list_files(
+    async def list_files(
         self, media_type: str = "image", page: int = 1, page_size: int = 1000
     ) -> Dict[str, Any]:
         """列出缓存文件"""
-        cache_dir = self.image_dir if media_type == "image" else self.video_dir
-        if not cache_dir.exists():
-            return {"total": 0, "page": page, "page_size": page_size, "items": []}
-
-        allowed = IMAGE_EXTS if media_type == "image" else VIDEO_EXTS
-        files = [
-            f
-            for f in cache_dir.glob("*")
-            if f.is_file() and f.suffix.lower() in allowed
-        ]
-
-        # 构建文件列表
-        items = []
-        for f in files:
-            try:
-                stat = f.stat()
-                items.append(
-                    {
-                        "name": f.name,
-                        "size_bytes": stat.st_size,
-                        "mtime_ms": int(stat.st_mtime * 1000),
-                    }
-                )
-            except Exception:
-                continue
-
-        items.sort(key=lambda x: x["mtime_ms"], reverse=True)
-
-        # 分页
-        total = len(items)
+        total, _ = await asyncio.to_thread(self.index.stats, media_type)
         start = max(0, (page - 1) * page_size)
-        paged = items[start : start + page_size]
+        paged = await asyncio.to_thread(
+            self.index.list, media_type, offset=start, limit=page_size
+        )
 
         # 添加 URL
         for item in paged:
@@ -730,7 +829,7 @@ class DownloadService(BaseService):
 
         return {"total": total, "page": page, "page_size": page_size, "items": paged}
 
-    def delete_file(self, media_type: str, name: str) -> Dict[str, Any]:
+    async def delete_file(self, media_type: str, name: str) -> Dict[str, Any]:
         """删除缓存文件"""
         cache_dir = self.image_dir if media_type == "image" else self.video_dir
         file_path = cache_dir / name.replace("/", "-")
@@ -738,6 +837,7 @@ class DownloadService(BaseService):
         if file_path.exists():
             try:
                 file_path.unlink()
+                await asyncio.to_thread(self.index.remove, media_type, file_path.name)
 
                 # 同步删除图片元数据
                 if media_type == "image":
@@ -755,13 +855,7 @@ class DownloadService(BaseService):
             service = get_image_metadata_service()
 
             # 根据文件名查找并删除元数据
-            data = await service.storage.load_image_metadata()
-            images = data.get("images", [])
-
-            image_ids = [
-                img["id"] for img in images
-                if img.get("filename") == filename
-            ]
+            image_ids = await service.find_image_ids_by_filename(filename)
 
             if image_ids:
                 await service.delete_images(image_ids)
@@ -769,7 +863,7 @@ class DownloadService(BaseService):
         except Exception as e:
             logger.error(f"删除图片元数据失败: {e}")
 
-    def clear(self, media_type: str = "image") -> Dict[str, Any]:
+    async def clear(self, media_type: str = "image") -> Dict[str, Any]:
         """清空缓存"""
         cache_dir = self.image_dir if media_type == "image" else self.video_dir
         if not cache_dir.exists():
@@ -786,6 +880,7 @@ class DownloadService(BaseService):
                     count += 1
                 except Exception:
                     pass
+        await asyncio.to_thread(self.index.clear, media_type)
 
         # 同步清空图片元数据
         if media_type == "image":
@@ -800,72 +895,39 @@ class DownloadService(BaseService):
             service = get_image_metadata_service()
 
             # 清空所有元数据
-            data = {"images": [], "version": "1.0"}
-            await service.storage.save_image_metadata(data)
+            await service.clear_images()
             logger.info("清空图片元数据")
         except Exception as e:
             logger.error(f"清空图片元数据失败: {e}")
 
     async def check_limit(self):
-        """检查并清理缓存"""
+        """检查并清理缓存（总大小取自缓存索引，超限时按 LRU/LFU 淘汰到 80%）"""
         if self._cleanup_running or not get_config("cache.enable_auto_clean"):
             return
 
+        limit_mb = get_config("cache.limit_mb")
+        total_size = await asyncio.to_thread(self.index.total_size)
+        current_mb = total_size / 1024 / 1024
+        if current_mb <= limit_mb:
+            return
+
         self._cleanup_running = True
         try:
             async with _file_lock("cache_cleanup", timeout=5):
-                limit_mb = get_config("cache.limit_mb")
-                all_files, total_size = self._collect_files()
-                current_mb = total_size / 1024 / 1024
-
-                if current_mb <= limit_mb:
-                    return
-
-                # 清理到 80%
                 logger.info(
                     f"Cache limit exceeded ({current_mb:.2f}MB > {limit_mb}MB), cleaning..."
                 )
-                all_files.sort(key=lambda x: x[1])  # 按时间排序
-
-                deleted_count = 0
-                deleted_size = 0
-                target_mb = limit_mb * 0.8
-
-                for f, _, size in all_files:
-                    try:
-                        f.unlink()
-                        deleted_count += 1
-                        deleted_size += size
-                        total_size -= size
-                        if (total_size / 1024 / 1024) <= target_mb:
-                            break
-                    except Exception:
-                        pass
-
+                policy = get_config("cache.eviction_policy", "lru")
+                target = int(limit_mb * 0.8 * 1024 * 1024)
+                deleted_count, deleted_size = await asyncio.to_thread(
+                    self.index.evict, target, policy
+                )
                 logger.info(
                     f"Cache cleanup: {deleted_count} files ({deleted_size / 1024 / 1024:.2f}MB)"
                 )
         finally:
             self._cleanup_running = False
 
-    def _collect_files(self) -> Tuple[List[Tuple[Path, float, int]], int]:
-        """收集所有缓存文件"""
-        total_size = 0
-        all_files = []
-
-        for d in [self.image_dir, self.video_dir]:
-            if d.exists():
-                for f in d.glob("*"):
-                    if f.is_file():
-                        try:
-                            stat = f.stat()
-                            total_size += stat.st_size
-                            all_files.append((f, stat.st_mtime, stat.st_size))
-                        except Exception:
-                            pass
-
-        return all_files, total_size
-
 
 __all__ = [
     "BaseService",
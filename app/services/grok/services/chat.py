@@ -2,12 +2,12 @@
 Grok Chat 服务
 """
 
+import asyncio
+import time
 import orjson
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 from dataclasses import dataclass
 
-from curl_cffi.requests import AsyncSession
-
 from app.core.logger import logger
 from app.core.config import get_config
 from app.core.exceptions import (
@@ -19,9 +19,11 @@ from app.core.exceptions import (
 from app.services.grok.models.model import ModelService
 from app.services.grok.services.assets import UploadService
 from app.services.grok.processors import StreamProcessor, CollectProcessor
+from app.services.grok.utils.rate_limit import RateLimitExceeded
 from app.services.grok.utils.retry import retry_on_status
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.headers import build_grok_headers
-from app.services.grok.utils.stream import wrap_stream_with_usage
+from app.services.grok.utils.stream import wrap_stream_with_usage, UpstreamLineStream
 from app.services.grok.utils.urls import grok_url
 from app.services.token import get_token_manager, EffortType
 
@@ -255,7 +257,8 @@ class GrokChatService:
         # 建立连接
         async def establish_connection():
             browser = get_config("security.browser")
-            session = AsyncSession(impersonate=browser)
+            lease = get_session_pool().acquire(browser, self.proxy)
+            session = lease.session
             try:
                 response = await session.post(
                     grok_url(CHAT_API),
@@ -277,20 +280,20 @@ class GrokChatService:
                         f"Chat failed: status={response.status_code}, token={token[:10]}..."
                     )
 
-                    await session.close()
+                    await lease.release(response=response)
                     raise UpstreamException(
                         message=f"Grok API request failed: {response.status_code}",
                         details={"status": response.status_code, "body": content},
                     )
 
                 logger.info(f"Chat connected: model={model}, stream={stream}")
-                return session, response
+                return lease, response
 
             except UpstreamException:
                 raise
             except Exception as e:
                 logger.error(f"Chat request error: {e}")
-                await session.close()
+                await lease.release(e)
                 raise UpstreamException(
                     message=f"Chat connection failed: {str(e)}",
                     details={"error": str(e)},
@@ -306,11 +309,14 @@ class GrokChatService:
                 return status
             return None
 
-        session = None
+        lease = None
         response = None
         try:
-            session, response = await retry_on_status(
-                establish_connection, extract_status=extract_status
+            lease, response = await retry_on_status(
+                establish_connection,
+                extract_status=extract_status,
+                limit_family="chat",
+                limit_token=token,
             )
         except Exception as e:
             status_code = extract_status(e)
@@ -325,15 +331,117 @@ class GrokChatService:
             raise
 
         # 流式传输
-        async def stream_response():
+        async def on_close(error):
+            await lease.release(error, response=response)
+
+        return UpstreamLineStream(response, on_close)
+
+    async def _upload_attachments(
+        self, token: str, attachments: List[Any], model: str
+    ) -> Tuple[List[str], str]:
+        """
+        并发上传附件（performance.upload_max_concurrent 限制单次请求并发）
+
+        每个附件遇到 403 时轮换 token 重试；上传的文件归属于 token，
+        轮换后仍在旧 token 下的附件会用最终 token 补传，保证全部可被对话引用。
+
+        Returns:
+            (按附件顺序的 file_ids, 最终使用的 token)
+        """
+        max_token_retries = 3  # 最多尝试3个不同的token
+        concurrency = max(1, int(get_config("performance.upload_max_concurrent", 4)))
+        semaphore = asyncio.Semaphore(concurrency)
+        rotate_lock = asyncio.Lock()
+        state = {"token": token}
+        upload_service = UploadService()
+        start = time.perf_counter()
+
+        async def _rotate(failed_token: str):
+            """轮换 token（并发上传只轮换一次，其余任务沿用新 token）"""
+            async with rotate_lock:
+                if state["token"] != failed_token:
+                    return
+                token_mgr = await get_token_manager()
+                await token_mgr.reload_if_stale()
+                new_token = None
+                for pool_name in ModelService.pool_candidates_for_model(model):
+                    new_token = token_mgr.get_token(pool_name)
+                    if new_token and new_token != failed_token:
+                        break
+                if new_token and new_token != failed_token:
+                    state["token"] = new_token
+                    logger.info(f"已切换到新token: {new_token[:10]}...")
+                else:
+                    logger.warning("没有可用的其他token，使用相同token重试")
+
+        async def _upload_one(attach_idx: int, attach_type: str, attach_data: str):
+            async with semaphore:
+                last_error = None
+                # 对每个附件尝试上传，如果遇到403则轮换token重试
+                for retry_idx in range(max_token_retries):
+                    current_token = state["token"]
+                    try:
+                        file_id, _ = await upload_service.upload(attach_data, current_token)
+                        logger.debug(
+                            f"Attachment uploaded: type={attach_type}, file_id={file_id} "
+                            f"(token尝试次数: {retry_idx + 1})"
+                        )
+                        return file_id, current_token
+                    except Exception as e:
+                        last_error = e
+                        # 检查是否为403认证错误
+                        is_403_error = False
+                        if hasattr(e, 'details') and isinstance(e.details, dict):
+                            if e.details.get('status') == 403:
+                                is_403_error = True
+                        elif '403' in str(e):
+                            is_403_error = True
+
+                        if is_403_error and retry_idx < max_token_retries - 1:
+                            logger.warning(
+                                f"附件 {attach_idx + 1} 上传遇到403错误 (尝试 {retry_idx + 1}/{max_token_retries})，"
+                                f"尝试轮换token重试..."
+                            )
+                            try:
+                                await _rotate(current_token)
+                            except Exception as token_err:
+                                logger.error(f"获取新token失败: {token_err}")
+                                raise last_error
+                        else:
+                            # 非403错误或已达到最大重试次数
+                            raise
+
+                logger.error(f"附件 {attach_idx + 1} 上传失败，已尝试 {max_token_retries} 个token")
+                raise last_error
+
+        tasks = [
+            asyncio.create_task(_upload_one(idx, attach_type, attach_data))
+            for idx, (attach_type, attach_data) in enumerate(attachments)
+        ]
+        try:
             try:
-                async for line in response.aiter_lines():
-                    yield line
-            finally:
-                if session:
-                    await session.close()
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
 
-        return stream_response()
+            # 轮换前已在旧 token 下完成的附件，用最终 token 补传（内容相同命中上传缓存时不重复上传）
+            final_token = state["token"]
+            file_ids = []
+            for (attach_type, attach_data), (file_id, used_token) in zip(attachments, results):
+                if used_token != final_token:
+                    file_id, _ = await upload_service.upload(attach_data, final_token)
+                file_ids.append(file_id)
+        finally:
+            await upload_service.close()
+
+        logger.info(
+            f"Attachments uploaded: count={len(file_ids)}, concurrency={concurrency}, "
+            f"elapsed={(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return file_ids, final_token
 
     async def chat_openai(self, token: str, request: ChatRequest):
         """OpenAI 兼容接口"""
@@ -359,71 +467,9 @@ class GrokChatService:
         # 上传附件 - 支持token轮换重试
         file_ids = []
         if attachments:
-            upload_service = UploadService()
-            max_token_retries = 3  # 最多尝试3个不同的token
-            current_token = token
-
-            try:
-                for attach_idx, (attach_type, attach_data) in enumerate(attachments):
-                    uploaded = False
-                    last_error = None
-
-                    # 对每个附件尝试上传，如果遇到403则轮换token重试
-                    for retry_idx in range(max_token_retries):
-                        try:
-                            file_id, _ = await upload_service.upload(attach_data, current_token)
-                            file_ids.append(file_id)
-                            uploaded = True
-                            logger.debug(
-                                f"Attachment uploaded: type={attach_type}, file_id={file_id} "
-                                f"(token尝试次数: {retry_idx + 1})"
-                            )
-                            break
-                        except Exception as e:
-                            last_error = e
-                            # 检查是否为403认证错误
-                            is_403_error = False
-                            if hasattr(e, 'details') and isinstance(e.details, dict):
-                                if e.details.get('status') == 403:
-                                    is_403_error = True
-                            elif '403' in str(e):
-                                is_403_error = True
-
-                            if is_403_error and retry_idx < max_token_retries - 1:
-                                logger.warning(
-                                    f"附件 {attach_idx + 1} 上传遇到403错误 (尝试 {retry_idx + 1}/{max_token_retries})，"
-                                    f"尝试轮换token重试..."
-                                )
-                                # 获取新的token
-                                try:
-                                    token_mgr = await get_token_manager()
-                                    await token_mgr.reload_if_stale()
-                                    new_token = None
-                                    for pool_name in ModelService.pool_candidates_for_model(request.model):
-                                        new_token = token_mgr.get_token(pool_name)
-                                        if new_token and new_token != current_token:
-                                            break
-                                    if new_token and new_token != current_token:
-                                        current_token = new_token
-                                        logger.info(f"已切换到新token: {current_token[:10]}...")
-                                    else:
-                                        logger.warning("没有可用的其他token，使用相同token重试")
-                                except Exception as token_err:
-                                    logger.error(f"获取新token失败: {token_err}")
-                                    raise last_error
-                            else:
-                                # 非403错误或已达到最大重试次数
-                                raise
-
-                    if not uploaded:
-                        logger.error(f"附件 {attach_idx + 1} 上传失败，已尝试 {max_token_retries} 个token")
-                        if last_error:
-                            raise last_error
-            finally:
-                await upload_service.close()
-
-            # 更新token以便后续chat调用使用最新的有效token
-            token = current_token
+            file_ids, token = await self._upload_attachments(
+                token, attachments, request.model
+            )
 
         stream = (
             request.stream if request.stream is not None else get_config("chat.stream")
@@ -500,6 +546,7 @@ class ChatService:
                 )
 
             tried_tokens.add(token)
+            lease = token_mgr.acquire_inflight(token)
 
             try:
                 # 请求 Grok
@@ -510,8 +557,14 @@ class ChatService:
                 if is_stream:
                     logger.debug(f"Processing stream response: model={model}")
                     processor = StreamProcessor(model_name, token, think)
+                    # 租约交由流包装器在流关闭时释放
+                    stream_lease, lease = lease, None
                     return wrap_stream_with_usage(
-                        processor.process(response), token_mgr, token, model
+                        processor.process(response),
+                        token_mgr,
+                        token,
+                        model,
+                        lease=stream_lease,
                     )
 
                 # 非流式
@@ -530,6 +583,17 @@ class ChatService:
                     logger.warning(f"Failed to record usage: {e}")
                 return result
 
+            except RateLimitExceeded as e:
+                # 本地限流未请求上游：token 桶不足时换 token，接口族桶不足时换 token 无用
+                if e.scope != "token":
+                    raise
+                last_error = e
+                logger.warning(
+                    f"Token {token[:10]}... locally rate limited, "
+                    f"trying next token (attempt {attempt + 1}/{max_token_retries})"
+                )
+                continue
+
             except UpstreamException as e:
                 status_code = e.details.get("status") if e.details else None
                 last_error = e
@@ -546,6 +610,10 @@ class ChatService:
                 # 非 429 错误，不换 token，直接抛出
                 raise
 
+            finally:
+                if lease is not None:
+                    lease.release()
+
         # 所有 token 都 429，抛出最后的错误
         if last_error:
             raise last_error
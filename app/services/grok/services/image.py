@@ -9,7 +9,8 @@ import re
 import ssl
 import time
 import uuid
-from typing import AsyncGenerator, Dict, Optional
+from collections import deque
+from typing import AsyncGenerator, Callable, Dict, Optional
 from urllib.parse import urlparse
 
 import aiohttp
@@ -18,10 +19,16 @@ from aiohttp_socks import ProxyConnector
 from app.core.config import get_config
 from app.core.logger import logger
 from app.services.grok.utils.headers import build_sso_cookie
+from app.services.grok.utils.rate_limit import RateLimitExceeded, get_rate_limiter
 from app.services.grok.utils.urls import grok_ws_url, apply_proxy_token
+from app.services.token import get_token_manager
 
 WS_URL = "/ws/imagine/listen"
 
+# 首张中等图延迟样本数（滑动窗口）与计算分位数所需的最少样本
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
 
 class _BlockedError(Exception):
     pass
@@ -34,6 +41,26 @@ class ImageService:
         self._ssl_context = ssl.create_default_context()
         self._ssl_context.load_verify_locations(certifi.where())
         self._url_pattern = re.compile(r"/images/([a-f0-9-]+)\.(png|jpg|jpeg)")
+        # 请求发出到首张中等（或最终）图的耗时（秒）
+        self._first_image_latency: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def record_first_image_latency(self, seconds: float):
+        self._first_image_latency.append(seconds)
+
+    def hedge_delay(self) -> float:
+        """
+        对冲等待时间（秒）
+
+        样本足够时取首张中等图延迟的 image_ws_hedge_percentile 分位，
+        否则使用 image_ws_hedge_delay；结果不低于 1 秒。
+        """
+        fallback = float(get_config("image.image_ws_hedge_delay") or 10)
+        samples = sorted(self._first_image_latency)
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return max(1.0, fallback)
+        percentile = min(100.0, max(0.0, float(get_config("image.image_ws_hedge_percentile") or 90)))
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return max(1.0, samples[index])
 
     def _resolve_proxy(self) -> tuple[aiohttp.BaseConnector, Optional[str]]:
         proxy_url = get_config("network.base_proxy_url")
@@ -107,34 +134,132 @@ class ImageService:
         n: int = 1,
         enable_nsfw: bool = True,
         max_retries: int = None,
+        lease: bool = True,
     ) -> AsyncGenerator[Dict[str, object], None]:
+        """lease=False 时不登记在途请求（调用方已自行登记）"""
         retries = max(1, max_retries if max_retries is not None else 1)
         logger.info(
             f"Image generation: prompt='{prompt[:50]}...', n={n}, ratio={aspect_ratio}, nsfw={enable_nsfw}"
         )
 
-        for attempt in range(retries):
-            try:
-                yielded_any = False
-                async for item in self._stream_once(
-                    token, prompt, aspect_ratio, n, enable_nsfw
-                ):
-                    yielded_any = True
-                    yield item
-                return
-            except _BlockedError:
-                if yielded_any or attempt + 1 >= retries:
-                    if not yielded_any:
-                        yield {
-                            "type": "error",
-                            "error_code": "blocked",
-                            "error": "blocked_no_final_image",
-                        }
+        token_mgr = await get_token_manager()
+        inflight = token_mgr.acquire_inflight(token) if lease else None
+        try:
+            for attempt in range(retries):
+                try:
+                    yielded_any = False
+                    async for item in self._stream_once(
+                        token, prompt, aspect_ratio, n, enable_nsfw
+                    ):
+                        yielded_any = True
+                        yield item
+                    return
+                except _BlockedError:
+                    if yielded_any or attempt + 1 >= retries:
+                        if not yielded_any:
+                            yield {
+                                "type": "error",
+                                "error_code": "blocked",
+                                "error": "blocked_no_final_image",
+                            }
+                        return
+                    logger.warning(f"WebSocket blocked, retry {attempt + 1}/{retries}")
+                except Exception as e:
+                    logger.error(f"WebSocket stream failed: {e}")
                     return
-                logger.warning(f"WebSocket blocked, retry {attempt + 1}/{retries}")
-            except Exception as e:
-                logger.error(f"WebSocket stream failed: {e}")
-                return
+        finally:
+            if inflight is not None:
+                inflight.release()
+
+    async def stream_hedged(
+        self,
+        token: str,
+        prompt: str,
+        aspect_ratio: str = "2:3",
+        n: int = 1,
+        enable_nsfw: bool = True,
+        pick_backup: Optional[Callable[[], Optional[str]]] = None,
+        on_backup: Optional[Callable[[str], None]] = None,
+        lease: bool = True,
+    ) -> AsyncGenerator[Dict[str, object], None]:
+        """
+        对冲请求：主 WebSocket 在 hedge_delay() 内没有收到中等图时，用 pick_backup
+        提供的另一个 token 发起备用 WebSocket，两路结果合并输出；累计收到 n 张最终图
+        后立即结束并关闭所有未完成的连接。
+
+        仅当所有连接都失败且没有输出任何图片时才输出最后一个错误。
+
+        Args:
+            pick_backup: 返回备用 token（无可用时返回 None，不再对冲）
+            on_backup: 发起备用请求时回调（用于计费）
+            lease: 是否为主连接登记在途请求（备用连接总是登记）
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = []
+
+        def launch(racer_token: str, racer_lease: bool = True):
+            async def pump():
+                try:
+                    async for item in self.stream(
+                        racer_token, prompt, aspect_ratio, n, enable_nsfw,
+                        lease=racer_lease,
+                    ):
+                        await queue.put(item)
+                finally:
+                    await queue.put(None)
+
+            tasks.append(asyncio.create_task(pump()))
+
+        launch(token, lease)
+        active = 1
+        deadline = time.monotonic() + self.hedge_delay() if pick_backup else None
+        finals = set()
+        last_error = None
+        yielded_any = False
+        try:
+            while active:
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    deadline = None
+                    backup = pick_backup()
+                    if backup:
+                        logger.info(
+                            f"WebSocket hedge: no image yet, backup request on token {backup[:10]}..."
+                        )
+                        if on_backup:
+                            on_backup(backup)
+                        launch(backup)
+                        active += 1
+                    continue
+
+                if item is None:
+                    active -= 1
+                    continue
+                if item.get("type") == "error":
+                    last_error = item
+                    continue
+                if item.get("type") == "image" and item.get("stage") in ("medium", "final"):
+                    # 已有进展，不再对冲
+                    deadline = None
+
+                yield item
+                yielded_any = True
+                if item.get("is_final"):
+                    finals.add(item.get("image_id"))
+                    if len(finals) >= n:
+                        logger.info(f"WebSocket hedge: collected {len(finals)} final images")
+                        break
+
+            if not yielded_any and last_error:
+                yield last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def _stream_once(
         self,
@@ -149,6 +274,12 @@ class ImageService:
         timeout = float(get_config("network.timeout"))
         blocked_seconds = float(get_config("image.image_ws_blocked_seconds"))
 
+        try:
+            await get_rate_limiter().acquire("imagine", token)
+        except RateLimitExceeded as e:
+            yield {"type": "error", "error_code": "rate_limit_exceeded", "error": e.message}
+            return
+
         try:
             connector, proxy = self._resolve_proxy()
         except Exception as e:
@@ -229,10 +360,13 @@ class ImageService:
                                 existing = images.get(image_id, {})
 
                                 if (
-                                    info["stage"] == "medium"
+                                    info["stage"] in ("medium", "final")
                                     and medium_received_time is None
                                 ):
                                     medium_received_time = time.time()
+                                    self.record_first_image_latency(
+                                        medium_received_time - start_time
+                                    )
 
                                 if info["is_final"] and not existing.get("is_final"):
                                     completed += 1
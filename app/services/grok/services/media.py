@@ -16,7 +16,6 @@ import re
 from typing import AsyncGenerator, Optional
 
 import orjson
-from curl_cffi.requests import AsyncSession
 
 from app.core.logger import logger
 from app.core.config import get_config
@@ -30,6 +29,8 @@ from app.services.grok.models.model import ModelService
 from app.services.token import get_token_manager, EffortType
 from app.services.grok.processors import VideoStreamProcessor, VideoCollectProcessor
 from app.services.grok.utils.headers import build_grok_headers, build_sso_cookie
+from app.services.grok.utils.rate_limit import RateLimitExceeded, get_rate_limiter
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.stream import wrap_stream_with_usage
 from app.services.grok.utils.urls import grok_url
 from app.services.grok.processors.base import _normalize_stream_line
@@ -284,7 +285,7 @@ class VideoService:
             else:
                 payload = {"mediaType": media_type, "prompt": prompt}
 
-            async with AsyncSession() as session:
+            async with get_session_pool().acquire(proxy=self.proxy) as session:
                 response = await session.post(
                     grok_url(CREATE_POST_API),
                     headers=headers,
@@ -347,7 +348,10 @@ class VideoService:
 
         async def _stream():
             for attempt in range(1, moderated_max_retry + 1):
-                session = AsyncSession(impersonate=get_config("security.browser"))
+                lease = get_session_pool().acquire(proxy=self.proxy)
+                session = lease.session
+                response = None
+                error = None
                 moderated_hit = False
                 try:
                     headers = self._build_headers(token)
@@ -411,6 +415,7 @@ class VideoService:
                         details={"moderated": True, "attempts": moderated_max_retry},
                     )
                 except Exception as e:
+                    error = e
                     if isinstance(e, AppException):
                         raise
                     msg, code, status = _classify_video_error(e)
@@ -421,10 +426,7 @@ class VideoService:
                         status_code=status,
                     )
                 finally:
-                    try:
-                        await session.close()
-                    except Exception:
-                        pass
+                    await lease.release(error, response=response)
 
         return _stream()
 
@@ -447,6 +449,8 @@ class VideoService:
             f"ratio={aspect_ratio}, length={video_length}s, mode={official_mode}"
         )
 
+        # 先排队令牌桶再占用并发槽位，避免等待中的请求占住其他 token 的名额
+        await get_rate_limiter().acquire("media", token)
         async with _get_semaphore():
             post_id = await self.create_post(token, prompt)
             message = self._build_video_message(prompt=prompt, preset=preset)
@@ -490,6 +494,7 @@ class VideoService:
             f"image={image_url[:80]}, mode={official_mode}"
         )
 
+        await get_rate_limiter().acquire("media", token)
         async with _get_semaphore():
             post_id = await self.create_image_post(token, image_url)
             # 用 imagine-public.x.ai 格式的 URL 作为消息里的图片引用
@@ -541,6 +546,7 @@ class VideoService:
         )
 
         source_image_url = self._build_imagine_public_url(parent_post_id)
+        await get_rate_limiter().acquire("media", token)
 
         # 对齐官网全链路：先创建 IMAGE 类型 media post
         try:
@@ -637,10 +643,14 @@ class VideoService:
 
         moderated_max_retry = max(1, int(get_config("video.moderated_max_retry", 5)))
         file_attachments = [effective_file_attachment]
+        await get_rate_limiter().acquire("media", token)
 
         async def _stream():
             for attempt in range(1, moderated_max_retry + 1):
-                session = AsyncSession(impersonate=get_config("security.browser"))
+                lease = get_session_pool().acquire(proxy=self.proxy)
+                session = lease.session
+                response = None
+                error = None
                 moderated_hit = False
                 try:
                     headers = self._build_headers(token)
@@ -705,6 +715,7 @@ class VideoService:
                         details={"moderated": True, "attempts": moderated_max_retry},
                     )
                 except Exception as e:
+                    error = e
                     if isinstance(e, AppException):
                         raise
                     msg, code, status = _classify_video_error(e)
@@ -715,10 +726,7 @@ class VideoService:
                         status_code=status,
                     )
                 finally:
-                    try:
-                        await session.close()
-                    except Exception:
-                        pass
+                    await lease.release(error, response=response)
 
         return _stream()
 
@@ -810,6 +818,7 @@ class VideoService:
                     token = token[4:]
 
             used_tokens.add(token)
+            lease = token_mgr.acquire_inflight(token)
 
             try:
                 # 处理图片附件
@@ -872,8 +881,14 @@ class VideoService:
                         model, token, think,
                         upscale_on_finish=should_upscale,
                     )
+                    # 租约交由流包装器在流关闭时释放
+                    stream_lease, lease = lease, None
                     return wrap_stream_with_usage(
-                        processor.process(response), token_mgr, token, model
+                        processor.process(response),
+                        token_mgr,
+                        token,
+                        model,
+                        lease=stream_lease,
                     )
 
                 result = await VideoCollectProcessor(
@@ -893,6 +908,17 @@ class VideoService:
                     logger.warning(f"Failed to record video usage: {e}")
                 return result
 
+            except RateLimitExceeded as e:
+                # 本地限流未请求上游：仅 token 桶不足时换 token
+                if e.scope != "token":
+                    raise
+                last_error = e
+                logger.warning(
+                    f"Token {_token_tag(token)} locally rate limited, "
+                    f"trying next token (attempt {attempt + 1}/{max_token_retries})"
+                )
+                continue
+
             except UpstreamException as e:
                 last_error = e
                 if _is_rate_limited(e):
@@ -910,6 +936,10 @@ class VideoService:
                     status_code=status,
                 )
 
+            finally:
+                if lease is not None:
+                    lease.release()
+
         if last_error:
             raise last_error
         raise AppException(
@@ -19,6 +19,7 @@ from app.services.grok.protocols.grpc_web import (
     get_grpc_status,
 )
 from app.services.grok.utils.headers import build_sso_cookie
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.urls import grok_url, apply_proxy_token
 
 NSFW_API = "/auth_mgmt.AuthManagement/UpdateUserFeatureControls"
@@ -134,7 +135,7 @@ class NSFWService:
 
         try:
             browser = get_config("security.browser")
-            async with AsyncSession(impersonate=browser) as session:
+            async with get_session_pool().acquire(browser, self.proxy) as session:
                 # 先设置出生日期（如果失败也继续，可能账号已经设置过）
                 logger.info(f"Setting birth date for token: {token[:10]}...")
                 ok, birth_status, birth_err = await self._set_birth_date(session, token)
@@ -8,12 +8,11 @@
 import re
 from typing import Optional
 
-from curl_cffi.requests import AsyncSession
-
 from app.core.logger import logger
 from app.core.config import get_config
 from app.core.exceptions import UpstreamException
 from app.services.grok.utils.headers import build_grok_headers
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.urls import grok_url
 
 VIDEO_UPSCALE_API = "/rest/media/video/upscale"
@@ -58,14 +57,13 @@ class VideoUpscaleService:
             payload = {"videoId": video_id}
             logger.info(f"VideoUpscale request: video_id={video_id}")
 
-            async with AsyncSession() as session:
+            async with get_session_pool().acquire(proxy=proxy) as session:
                 response = await session.post(
                     grok_url(VIDEO_UPSCALE_API),
                     headers=headers,
                     json=payload,
                     timeout=get_config("network.timeout"),
                     proxies=proxies,
-                    impersonate=get_config("security.browser"),
                 )
 
             if response.status_code != 200:
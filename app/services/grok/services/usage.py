@@ -5,13 +5,12 @@ Grok 用量服务
 import asyncio
 from typing import Dict
 
-from curl_cffi.requests import AsyncSession
-
 from app.core.logger import logger
 from app.core.config import get_config
 from app.core.exceptions import UpstreamException
 from app.services.grok.utils.headers import apply_statsig, build_sso_cookie
 from app.services.grok.utils.retry import retry_on_status
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.urls import grok_url, apply_proxy_token
 
 LIMITS_API = "/rest/rate-limits"
@@ -87,66 +86,74 @@ class UsageService:
         if value != _USAGE_SEM_VALUE:
             _USAGE_SEM_VALUE = value
             _USAGE_SEMAPHORE = asyncio.Semaphore(value)
-        async with _USAGE_SEMAPHORE:
-            # 定义状态码提取器
-            def extract_status(e: Exception) -> int | None:
-                if isinstance(e, UpstreamException) and e.details:
-                    return e.details.get("status")
-                return None
-
-            # 定义实际的请求函数
-            async def do_request():
-                try:
-                    headers = self._build_headers(token)
-                    payload = {"requestKind": "DEFAULT", "modelName": model_name}
-                    browser = get_config("security.browser")
-
-                    async with AsyncSession() as session:
-                        response = await session.post(
-                            grok_url(LIMITS_API),
-                            headers=headers,
-                            json=payload,
-                            impersonate=browser,
-                            timeout=self.timeout,
-                            proxies=self._build_proxies(),
-                        )
-
-                    if response.status_code == 200:
-                        data = response.json()
-                        remaining = data.get("remainingTokens", 0)
-                        logger.info(
-                            f"Usage sync success: remaining={remaining}, token={token[:10]}..."
-                        )
-                        return data
-
-                    logger.error(
-                        f"Usage sync failed: status={response.status_code}, token={token[:10]}..."
+        # 定义状态码提取器
+        def extract_status(e: Exception) -> int | None:
+            if isinstance(e, UpstreamException) and e.details:
+                return e.details.get("status")
+            return None
+
+        # 定义实际的请求函数
+        async def do_request():
+            try:
+                headers = self._build_headers(token)
+                payload = {"requestKind": "DEFAULT", "modelName": model_name}
+                browser = get_config("security.browser")
+
+                async with get_session_pool().acquire(
+                    browser, self.proxy
+                ) as session:
+                    response = await session.post(
+                        grok_url(LIMITS_API),
+                        headers=headers,
+                        json=payload,
+                        timeout=self.timeout,
+                        proxies=self._build_proxies(),
                     )
 
-                    raise UpstreamException(
-                        message=f"Failed to get usage stats: {response.status_code}",
-                        details={"status": response.status_code},
+                if response.status_code == 200:
+                    data = response.json()
+                    remaining = data.get("remainingTokens", 0)
+                    logger.info(
+                        f"Usage sync success: remaining={remaining}, token={token[:10]}..."
                     )
+                    return data
 
-                except Exception as e:
-                    if isinstance(e, UpstreamException):
-                        raise
-                    logger.error(f"Usage error: {e}")
-                    raise UpstreamException(
-                        message=f"Usage service error: {str(e)}",
-                        details={"error": str(e)},
-                    )
+                logger.error(
+                    f"Usage sync failed: status={response.status_code}, token={token[:10]}..."
+                )
 
-            # 带重试的执行
-            try:
-                result = await retry_on_status(
-                    do_request, extract_status=extract_status
+                raise UpstreamException(
+                    message=f"Failed to get usage stats: {response.status_code}",
+                    details={"status": response.status_code},
                 )
-                return result
 
-            except Exception:
-                # 最后一次失败已经被记录
-                raise
+            except Exception as e:
+                if isinstance(e, UpstreamException):
+                    raise
+                logger.error(f"Usage error: {e}")
+                raise UpstreamException(
+                    message=f"Usage service error: {str(e)}",
+                    details={"error": str(e)},
+                )
+
+        # 并发槽位只在实际请求时占用，限流排队与重试退避不占名额
+        async def do_request_in_slot():
+            async with _USAGE_SEMAPHORE:
+                return await do_request()
+
+        # 带重试的执行
+        try:
+            result = await retry_on_status(
+                do_request_in_slot,
+                extract_status=extract_status,
+                limit_family="usage",
+                limit_token=token,
+            )
+            return result
+
+        except Exception:
+            # 最后一次失败已经被记录
+            raise
 
 
 __all__ = ["UsageService"]
@@ -5,12 +5,11 @@ Grok Voice Mode Service
 import orjson
 from typing import Dict, Any
 
-from curl_cffi.requests import AsyncSession
-
 from app.core.logger import logger
 from app.core.config import get_config
 from app.core.exceptions import UpstreamException
 from app.services.grok.utils.headers import build_grok_headers
+from app.services.grok.utils.session_pool import get_session_pool
 from app.services.grok.utils.urls import grok_url
 
 LIVEKIT_TOKEN_API = "/rest/livekit/tokens"
@@ -48,7 +47,7 @@ class VoiceService:
         try:
             browser = get_config("security.browser")
             timeout = get_config("network.timeout")
-            async with AsyncSession(impersonate=browser) as session:
+            async with get_session_pool().acquire(browser, self.proxy) as session:
                 response = await session.post(
                     grok_url(LIVEKIT_TOKEN_API),
                     headers=headers,
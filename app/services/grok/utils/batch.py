@@ -1,16 +1,110 @@
 """
 批量执行工具
 
-提供分批并发、单项失败隔离的通用批量处理能力。
+提供持续补位的并发池、单项失败隔离的通用批量处理能力，并按上游反馈（429 / 延迟）
+以 AIMD 方式自适应调整并发上限。
 """
 
 import asyncio
+import statistics
+import time
 from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
 
+from app.core.config import get_config
+from app.core.exceptions import error_status
 from app.core.logger import logger
 
 T = TypeVar("T")
 
+# 一个往返内至少需要的成功样本数（不足时不按延迟调整）
+LATENCY_MIN_SAMPLES = 5
+# 延迟超标时的并发收缩系数（429 时减半）
+LATENCY_DECREASE = 0.9
+THROTTLE_DECREASE = 0.5
+
+
+class AdaptiveLimit:
+    """
+    AIMD 并发上限
+
+    - 加性增: 一个"往返"（完成约 limit 个请求）内没有 429、延迟正常时 limit + 1
+    - 乘性减: 出现 429 时 limit 减半；往返内成功请求的延迟中位数超过基线
+      latency_tolerance 倍时 limit x 0.9
+    - 每个往返最多收缩一次，避免同一波限流连续减半
+
+    延迟基线取各往返延迟中位数的历史最小值；用中位数而非均值，个别卡住的慢 token
+    不会拉低整体并发。
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        maximum: int,
+        minimum: int = 1,
+        latency_tolerance: float = 2.0,
+    ):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self._limit = float(min(max(int(initial), self.minimum), self.maximum))
+        self.latency_tolerance = max(1.0, float(latency_tolerance))
+        self._latencies: List[float] = []
+        self._baseline: Optional[float] = None
+        # 已完成请求数，及上次增/减时的完成数（用于"每个往返最多调整一次"）
+        self._completed = 0
+        self._last_change = 0
+        self._last_decrease: Optional[int] = None
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _decrease(self, factor: float):
+        self._limit = max(float(self.minimum), self._limit * factor)
+        self._last_change = self._last_decrease = self._completed
+        self._latencies.clear()
+
+    def record(self, latency: float, *, ok: bool, throttled: bool = False) -> None:
+        """记录一次完成的请求（latency 秒）"""
+        self._completed += 1
+        if throttled:
+            self.throttled += 1
+            if (
+                self._last_decrease is None
+                or self._completed - self._last_decrease >= self.limit
+            ):
+                self._decrease(THROTTLE_DECREASE)
+            return
+
+        if ok:
+            self._latencies.append(latency)
+        if self._completed - self._last_change < self.limit:
+            return
+
+        median = (
+            statistics.median(self._latencies)
+            if len(self._latencies) >= LATENCY_MIN_SAMPLES
+            else None
+        )
+        if median is not None:
+            if self._baseline is None or median < self._baseline:
+                self._baseline = median
+            elif median > self._baseline * self.latency_tolerance:
+                self._decrease(LATENCY_DECREASE)
+                return
+        if self._limit < self.maximum:
+            self._limit = min(float(self.maximum), self._limit + 1)
+        self._last_change = self._completed
+        self._latencies.clear()
+
+
+def _is_throttled(result: Dict[str, Any]) -> bool:
+    """单项结果是否为上游限流（异常状态码或返回数据中的 http_status 为 429）"""
+    if result.get("status") == 429:
+        return True
+    data = result.get("data")
+    return isinstance(data, dict) and data.get("http_status") == 429
+
 
 async def run_in_batches(
     items: List[str],
@@ -22,65 +116,91 @@ async def run_in_batches(
     should_cancel: Optional[Callable[[], bool]] = None,
 ) -> Dict[str, Dict[str, Any]]:
     """
-    分批并发执行，单项失败不影响整体
+    并发执行，单项失败不影响整体
+
+    并发池持续补位（任一项完成即启动下一项，慢项不会阻塞其他项）。
+    开启 performance.batch_adaptive 时并发上限从 max_concurrent 起步，按 AIMD 在
+    [1, max_concurrent * performance.batch_adaptive_max_scale] 之间调整。
 
     Args:
         items: 待处理项列表
-        worker: 异步处理函数
-        max_concurrent: 最大并发数
-        batch_size: 每批大小
+        worker: 异步处理函数（失败时可在返回数据中带 http_status 供限流判断）
+        max_concurrent: 并发数（自适应时为初始并发数）
+        batch_size: 兼容保留，不再分批等待
+        on_item: 单项完成回调
+        should_cancel: 返回 True 时停止启动新项（已在执行的项会完成）
 
     Returns:
-        {item: {"ok": bool, "data": ..., "error": ...}}
+        {item: {"ok": bool, "data": ..., "error": ...}}，按 items 顺序
     """
     try:
         max_concurrent = int(max_concurrent)
     except Exception:
         max_concurrent = 10
-    try:
-        batch_size = int(batch_size)
-    except Exception:
-        batch_size = 50
-
     max_concurrent = max(1, max_concurrent)
-    batch_size = max(1, batch_size)
 
-    sem = asyncio.Semaphore(max_concurrent)
+    limiter: Optional[AdaptiveLimit] = None
+    if get_config("performance.batch_adaptive", True):
+        scale = max(1.0, float(get_config("performance.batch_adaptive_max_scale", 4)))
+        limiter = AdaptiveLimit(
+            max_concurrent,
+            int(max_concurrent * scale),
+            latency_tolerance=get_config("performance.batch_latency_tolerance", 2.0),
+        )
 
     async def _one(item: str) -> tuple[str, dict]:
-        if should_cancel and should_cancel():
-            return item, {"ok": False, "error": "cancelled", "cancelled": True}
-        async with sem:
+        start = time.monotonic()
+        try:
+            data = await worker(item)
+            result = {"ok": True, "data": data}
+        except Exception as e:
+            logger.warning(f"Batch item failed: {item[:16]}... - {e}")
+            result = {"ok": False, "error": str(e)}
+            status = error_status(e)
+            if status is not None:
+                result["status"] = status
+        if limiter is not None:
+            limiter.record(
+                time.monotonic() - start, ok=result["ok"], throttled=_is_throttled(result)
+            )
+        if on_item:
             try:
-                data = await worker(item)
-                result = {"ok": True, "data": data}
-                if on_item:
-                    try:
-                        await on_item(item, result)
-                    except Exception:
-                        pass
-                return item, result
-            except Exception as e:
-                logger.warning(f"Batch item failed: {item[:16]}... - {e}")
-                result = {"ok": False, "error": str(e)}
-                if on_item:
-                    try:
-                        await on_item(item, result)
-                    except Exception:
-                        pass
-                return item, result
+                await on_item(item, result)
+            except Exception:
+                pass
+        return item, result
 
     results: Dict[str, dict] = {}
-
-    # 分批执行，避免一次性创建所有 task
-    for i in range(0, len(items), batch_size):
-        if should_cancel and should_cancel():
-            break
-        chunk = items[i : i + batch_size]
-        pairs = await asyncio.gather(*(_one(x) for x in chunk))
-        results.update(dict(pairs))
-
-    return results
-
-
-__all__ = ["run_in_batches"]
+    pending: set = set()
+    queue = iter(dict.fromkeys(items))
+    exhausted = False
+    try:
+        while True:
+            limit = limiter.limit if limiter is not None else max_concurrent
+            while not exhausted and len(pending) < limit:
+                if should_cancel and should_cancel():
+                    exhausted = True
+                    break
+                item = next(queue, None)
+                if item is None:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(_one(item)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                item, result = fut.result()
+                results[item] = result
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+    if limiter is not None and limiter.throttled:
+        logger.info(
+            f"Batch: {limiter.throttled} throttled item(s), concurrency settled at {limiter.limit}"
+        )
+    return {item: results[item] for item in dict.fromkeys(items) if item in results}
+
+
+__all__ = ["AdaptiveLimit", "run_in_batches"]
@@ -0,0 +1,349 @@
+"""
+媒体缓存索引
+
+data/tmp/{image,video} 下的缓存文件登记在 SQLite 索引中（大小、创建/访问时间、命中次数），
+各媒体类型的文件数与总大小由触发器维护，查询总量无需遍历目录:
+
+- 写入缓存文件后调用 add，读取命中时调用 touch，删除时调用 remove
+- touch 只在内存中合并访问记录，由后台线程按 TOUCH_FLUSH_INTERVAL 批量写入，
+  请求路径上不同步写 SQLite
+- evict 按 LRU（最久未访问）或 LFU（最少命中）分批淘汰直到低于目标大小
+- expire 按创建时间分批清理过期文件
+- 首次打开（索引不存在）时扫描一次目录导入已有文件
+
+索引使用 WAL 模式，多 worker 共享同一数据目录时可并发读写。
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.storage import DATA_DIR
+
+
+MEDIA_TYPES = ("image", "video")
+INDEX_VERSION = "1"
+# 淘汰/过期时每批处理的文件数
+EVICT_BATCH = 256
+# 访问记录批量写入间隔（秒）
+TOUCH_FLUSH_INTERVAL = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    media_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (media_type, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_files_accessed ON files (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_files_hits ON files (hits, accessed_at);
+CREATE INDEX IF NOT EXISTS idx_files_created ON files (media_type, created_at);
+CREATE TABLE IF NOT EXISTS totals (
+    media_type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    INSERT INTO totals (media_type, count, size) VALUES (new.media_type, 1, new.size)
+    ON CONFLICT (media_type) DO UPDATE SET count = count + 1, size = size + excluded.size;
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE totals SET count = count - 1, size = size - old.size
+    WHERE media_type = old.media_type;
+END;
+CREATE TRIGGER IF NOT EXISTS files_resize AFTER UPDATE OF size ON files BEGIN
+    UPDATE totals SET size = size - old.size + new.size
+    WHERE media_type = new.media_type;
+END;
+"""
+
+
+class MediaCacheIndex:
+    """媒体缓存索引（线程安全，阻塞操作由调用方决定是否放入线程池）"""
+
+    def __init__(self, base_dir: Path, db_path: Optional[Path] = None):
+        self.base_dir = base_dir
+        self.db_path = db_path or base_dir / "media_index.db"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # 待写入的访问记录: (media_type, name) -> (最近访问时间, 命中次数)
+        self._touches: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._touch_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def dir_for(self, media_type: str) -> Path:
+        return self.base_dir / ("image" if media_type == "image" else "video")
+
+    # ==================== 连接与初始化 ====================
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path, timeout=2.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != INDEX_VERSION:
+            self._rebuild(conn)
+        return conn
+
+    def ensure_ready(self):
+        """打开索引（首次打开时导入已有文件）"""
+        with self._lock:
+            self._connect()
+
+    def rebuild(self) -> int:
+        """按目录内容重建索引，返回文件数"""
+        with self._lock:
+            return self._rebuild(self._connect())
+
+    def _rebuild(self, conn: sqlite3.Connection) -> int:
+        rows = []
+        for media_type in MEDIA_TYPES:
+            cache_dir = self.dir_for(media_type)
+            if not cache_dir.exists():
+                continue
+            for f in cache_dir.iterdir():
+                if f.suffix == ".tmp":
+                    continue
+                try:
+                    stat = f.stat()
+                except OSError:
+                    continue
+                if f.is_file():
+                    rows.append(
+                        (media_type, f.name, stat.st_size, stat.st_mtime, stat.st_mtime)
+                    )
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM files")
+            conn.execute("DELETE FROM totals")
+            conn.executemany(
+                "INSERT INTO files (media_type, name, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (INDEX_VERSION,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"MediaCacheIndex: indexed {len(rows)} cached file(s)")
+        return len(rows)
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        """执行单条语句（索引不可用时记录日志并忽略，不影响主流程）"""
+        try:
+            with self._lock:
+                return self._connect().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"MediaCacheIndex: {e}")
+            return []
+
+    # ==================== 登记 ====================
+
+    def add(self, media_type: str, name: str, size: Optional[int] = None):
+        """登记新写入的缓存文件"""
+        if size is None:
+            try:
+                size = (self.dir_for(media_type) / name).stat().st_size
+            except OSError:
+                return
+        now = time.time()
+        self._query(
+            "INSERT INTO files (media_type, name, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (media_type, name) DO UPDATE SET "
+            "size = excluded.size, created_at = excluded.created_at, "
+            "accessed_at = excluded.accessed_at",
+            (media_type, name, int(size), now, now),
+        )
+
+    def touch(self, media_type: str, name: str):
+        """记录一次访问（内存中合并，稍后在线程池中批量写入）"""
+        key = (media_type, name)
+        with self._touch_lock:
+            _, hits = self._touches.get(key, (0.0, 0))
+            self._touches[key] = (time.time(), hits + 1)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（线程池 / 脚本），直接写入
+            self.flush_touches()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(TOUCH_FLUSH_INTERVAL)
+        await asyncio.to_thread(self.flush_touches)
+
+    def flush_touches(self):
+        """写入内存中合并的访问记录（阻塞）"""
+        with self._touch_lock:
+            pending, self._touches = self._touches, {}
+        if not pending:
+            return
+        self._execute_many(
+            "UPDATE files SET accessed_at = MAX(accessed_at, ?), hits = hits + ? "
+            "WHERE media_type = ? AND name = ?",
+            [(ts, hits, mt, name) for (mt, name), (ts, hits) in pending.items()],
+        )
+
+    def remove(self, media_type: str, name: str):
+        """移除登记（文件由调用方删除）"""
+        self._query(
+            "DELETE FROM files WHERE media_type = ? AND name = ?", (media_type, name)
+        )
+
+    def clear(self, media_type: str):
+        """移除某类型的全部登记"""
+        self._query("DELETE FROM files WHERE media_type = ?", (media_type,))
+
+    # ==================== 查询 ====================
+
+    def stats(self, media_type: str) -> Tuple[int, int]:
+        """(文件数, 总字节数)"""
+        rows = self._query(
+            "SELECT count, size FROM totals WHERE media_type = ?", (media_type,)
+        )
+        return (int(rows[0][0]), int(rows[0][1])) if rows else (0, 0)
+
+    def total_size(self) -> int:
+        rows = self._query("SELECT COALESCE(SUM(size), 0) FROM totals")
+        return int(rows[0][0]) if rows else 0
+
+    def list(
+        self, media_type: str, offset: int = 0, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """按创建时间倒序分页列出"""
+        rows = self._query(
+            "SELECT name, size, created_at FROM files WHERE media_type = ? "
+            "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (media_type, int(limit), int(offset)),
+        )
+        return [
+            {"name": name, "size_bytes": size, "mtime_ms": int(created_at * 1000)}
+            for name, size, created_at in rows
+        ]
+
+    # ==================== 淘汰 ====================
+
+    def evict(self, target_bytes: int, policy: str = "lru") -> Tuple[int, int]:
+        """
+        淘汰文件直到总大小不超过 target_bytes
+
+        Returns:
+            (删除文件数, 释放字节数)
+        """
+        order = "hits, accessed_at" if policy == "lfu" else "accessed_at"
+        # 先写入尚未落盘的访问记录，避免淘汰刚被访问的文件
+        self.flush_touches()
+        return self._drain(
+            f"SELECT media_type, name, size FROM files ORDER BY {order} LIMIT ?",
+            (),
+            stop_at=target_bytes,
+        )
+
+    def expire(self, cutoff: float) -> Tuple[int, int]:
+        """删除创建时间早于 cutoff 的文件"""
+        deleted = freed = 0
+        for media_type in MEDIA_TYPES:
+            d, f = self._drain(
+                "SELECT media_type, name, size FROM files "
+                "WHERE media_type = ? AND created_at < ? ORDER BY created_at LIMIT ?",
+                (media_type, cutoff),
+            )
+            deleted += d
+            freed += f
+        return deleted, freed
+
+    def _drain(
+        self, select: str, params: Tuple, stop_at: Optional[int] = None
+    ) -> Tuple[int, int]:
+        deleted = freed = 0
+        remaining = self.total_size() if stop_at is not None else 0
+        while stop_at is None or remaining > stop_at:
+            rows = self._query(select, params + (EVICT_BATCH,))
+            if not rows:
+                break
+            removed = []
+            for media_type, name, size in rows:
+                if stop_at is not None and remaining <= stop_at:
+                    break
+                try:
+                    (self.dir_for(media_type) / name).unlink()
+                    deleted += 1
+                    freed += size
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.debug(f"MediaCacheIndex: delete {name} failed: {e}")
+                # 删除失败也移除登记，保证淘汰推进
+                removed.append((media_type, name))
+                remaining -= size
+            if not self._remove_many(removed):
+                # 登记未能移除时下一轮会选中同一批文件，停止本次清理等待下次重试
+                break
+        return deleted, freed
+
+    def _remove_many(self, keys: List[Tuple[str, str]]) -> bool:
+        """批量移除登记，失败时返回 False"""
+        return self._execute_many(
+            "DELETE FROM files WHERE media_type = ? AND name = ?", keys
+        )
+
+    def _execute_many(self, sql: str, rows: List[Tuple]) -> bool:
+        """在一个事务中批量执行，失败时记录日志并返回 False"""
+        if not rows:
+            return True
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(sql, rows)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f"MediaCacheIndex: {e}")
+            return False
+        return True
+
+    def close(self):
+        self.flush_touches()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_INDEX: Optional[MediaCacheIndex] = None
+
+
+def get_media_cache_index() -> MediaCacheIndex:
+    """获取全局媒体缓存索引（data/tmp）"""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = MediaCacheIndex(DATA_DIR / "tmp")
+    return _INDEX
+
+
+__all__ = ["MediaCacheIndex", "get_media_cache_index", "MEDIA_TYPES"]
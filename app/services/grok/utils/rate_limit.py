@@ -0,0 +1,205 @@
+"""
+上游请求限流（令牌桶）
+
+请求发出前按两级令牌桶排队，而不是等上游返回 429 后再退避:
+
+- 接口族桶: chat / usage / assets / media / imagine 各一个，限制整个服务打到该类接口的速率
+- Token 桶: 每个 token 一个（各接口族合计），避免同一账号被突发请求打到 429
+
+只有在 rate_limit.families 中配置的接口族、以及 rate_limit.token_rate > 0 时才有对应的桶；
+默认均未配置（不限流），速率需按账号实际限额设置。
+
+两级桶在一次原子操作中同时预留，任一不足时按较长的等待时间排队；需要等待超过
+rate_limit.max_wait 时不预留，直接抛出 RateLimitExceeded（不请求上游，也不会把 token 标记为冷却）。
+
+存储为 Redis 时令牌桶保存在 Redis（Lua 原子操作，使用 Redis 服务器时间），多 worker 共享；
+否则为进程内令牌桶。上游仍返回 429 时 penalize 清空该 token 的桶（有 Retry-After 时再顺延相应时长）。
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import get_config
+from app.core.exceptions import AppException, ErrorType
+from app.core.logger import logger
+from app.core.storage import get_storage
+
+FAMILIES = ("chat", "usage", "assets", "media", "imagine")
+
+# 进程内令牌桶超过该数量时清理长时间未使用的桶
+LOCAL_BUCKETS_PRUNE_SIZE = 4096
+
+# (桶名, 每秒补充数, 容量)
+BucketSpec = Tuple[str, float, float]
+
+
+class RateLimitExceeded(AppException):
+    """本地限流：排队等待超过 rate_limit.max_wait"""
+
+    def __init__(self, family: str, scope: str, retry_after: float):
+        super().__init__(
+            message=(
+                f"Rate limit exceeded for {family} ({scope}), "
+                f"retry after {retry_after:.1f}s"
+            ),
+            error_type=ErrorType.RATE_LIMIT.value,
+            code="rate_limit_exceeded",
+            status_code=429,
+        )
+        self.family = family
+        # "family": 接口族桶不足（换 token 无用）；"token": 当前 token 的桶不足
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class _LocalBuckets:
+    """进程内令牌桶（余额可为负，表示已预留的排队请求）"""
+
+    def __init__(self):
+        self._state: Dict[str, Tuple[float, float]] = {}
+
+    def reserve(
+        self, specs: List[BucketSpec], cost: float, max_wait: float, force: bool
+    ) -> Tuple[bool, List[float]]:
+        now = time.monotonic()
+        levels = []
+        waits = []
+        for name, rate, burst in specs:
+            tokens, ts = self._state.get(name, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            levels.append(tokens)
+            waits.append(max(0.0, (cost - tokens) / rate))
+        if max(waits) > max_wait and not force:
+            return False, waits
+        if len(self._state) > LOCAL_BUCKETS_PRUNE_SIZE:
+            self._prune(now)
+        for (name, _, _), tokens in zip(specs, levels):
+            self._state[name] = (tokens - cost, now)
+        return True, waits
+
+    def _prune(self, now: float):
+        # 桶名不含速率，按保守的 1 小时未使用清理
+        stale = [name for name, (_, ts) in self._state.items() if now - ts > 3600]
+        for name in stale:
+            self._state.pop(name, None)
+
+
+def _parse_families(raw) -> Dict[str, Tuple[float, float]]:
+    """解析 rate_limit.families: ["接口族:每秒请求数:突发量", ...]"""
+    limits: Dict[str, Tuple[float, float]] = {}
+    for entry in raw or []:
+        parts = [p.strip() for p in str(entry).split(":")]
+        try:
+            family = parts[0]
+            rate = float(parts[1])
+            burst = float(parts[2]) if len(parts) > 2 else rate
+        except (IndexError, ValueError):
+            logger.warning(f"RateLimiter: invalid family limit '{entry}', ignored")
+            continue
+        if family not in FAMILIES:
+            logger.warning(f"RateLimiter: unknown family '{family}', ignored")
+            continue
+        if rate > 0:
+            limits[family] = (rate, max(1.0, burst))
+    return limits
+
+
+def _token_key(token: str) -> str:
+    raw = token[4:] if token.startswith("sso=") else token
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class RateLimiter:
+    """接口族 + Token 两级令牌桶"""
+
+    def __init__(self):
+        self._local = _LocalBuckets()
+        self._families_raw: Optional[Tuple] = None
+        self._families: Dict[str, Tuple[float, float]] = {}
+
+    def _family_limits(self) -> Dict[str, Tuple[float, float]]:
+        raw = tuple(get_config("rate_limit.families", []) or [])
+        if raw != self._families_raw:
+            self._families_raw = raw
+            self._families = _parse_families(raw)
+        return self._families
+
+    def _specs(self, family: str, token: Optional[str]) -> List[BucketSpec]:
+        specs: List[BucketSpec] = []
+        limit = self._family_limits().get(family)
+        if limit:
+            specs.append((f"family:{family}", *limit))
+        token_rate = float(get_config("rate_limit.token_rate", 0) or 0)
+        if token and token_rate > 0:
+            token_burst = max(1.0, float(get_config("rate_limit.token_burst", 1) or 1))
+            specs.append((f"token:{_token_key(token)}", token_rate, token_burst))
+        return specs
+
+    async def _reserve(
+        self, specs: List[BucketSpec], cost: float, max_wait: float, force: bool
+    ) -> Tuple[bool, List[float]]:
+        try:
+            shared = await get_storage().rate_limit_reserve(specs, cost, max_wait, force)
+            if shared is not None:
+                return shared
+        except Exception as e:
+            logger.debug(f"RateLimiter: shared buckets unavailable, using local ({e})")
+        return self._local.reserve(specs, cost, max_wait, force)
+
+    async def acquire(self, family: str, token: Optional[str] = None) -> float:
+        """
+        发出请求前调用：按接口族与 token 令牌桶排队
+
+        Returns:
+            实际等待秒数
+
+        Raises:
+            RateLimitExceeded: 需要等待超过 rate_limit.max_wait
+        """
+        if not get_config("rate_limit.enabled", True):
+            return 0.0
+        specs = self._specs(family, token)
+        if not specs:
+            return 0.0
+        max_wait = float(get_config("rate_limit.max_wait", 30))
+        reserved, waits = await self._reserve(specs, 1.0, max_wait, False)
+        wait = max(waits)
+        if not reserved:
+            scope = specs[waits.index(wait)][0].split(":", 1)[0]
+            logger.warning(
+                f"RateLimiter: {family} {scope} bucket exhausted, need {wait:.1f}s > {max_wait}s"
+            )
+            raise RateLimitExceeded(family, scope, wait)
+        if wait > 0:
+            logger.debug(f"RateLimiter: {family} waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+        return wait
+
+    async def penalize(
+        self, family: str, token: Optional[str], retry_after: Optional[float] = None
+    ) -> None:
+        """上游返回 429：清空该 token 的桶，有 Retry-After 时再顺延相应时长"""
+        if not get_config("rate_limit.enabled", True) or not token:
+            return
+        specs = [s for s in self._specs(family, token) if s[0].startswith("token:")]
+        if not specs:
+            return
+        _, rate, burst = specs[0]
+        cost = burst + rate * max(0.0, float(retry_after or 0))
+        await self._reserve(specs, cost, 0.0, True)
+
+
+_LIMITER: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取全局限流器"""
+    global _LIMITER
+    if _LIMITER is None:
+        _LIMITER = RateLimiter()
+    return _LIMITER
+
+
+__all__ = ["FAMILIES", "RateLimitExceeded", "RateLimiter", "get_rate_limiter"]
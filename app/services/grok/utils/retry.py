@@ -6,6 +6,7 @@ Grok API 重试工具
 - Retry-After header 支持
 - 429 专用退避策略
 - 重试预算控制
+- 每次请求前按上游限流令牌桶排队（limit_family）
 """
 
 import asyncio
@@ -15,7 +16,8 @@ from functools import wraps
 
 from app.core.logger import logger
 from app.core.config import get_config
-from app.core.exceptions import UpstreamException
+from app.core.exceptions import UpstreamException, error_status
+from app.services.grok.utils.rate_limit import get_rate_limiter
 
 
 class RetryContext:
@@ -132,6 +134,8 @@ async def retry_on_status(
     *args,
     extract_status: Callable[[Exception], Optional[int]] = None,
     on_retry: Callable[[int, int, Exception, float], None] = None,
+    limit_family: Optional[str] = None,
+    limit_token: Optional[str] = None,
     **kwargs,
 ) -> Any:
     """
@@ -142,13 +146,15 @@ async def retry_on_status(
         *args: 函数参数
         extract_status: 异常提取状态码的函数
         on_retry: 重试时的回调函数 (attempt, status_code, error, delay)
+        limit_family: 上游接口族，每次请求（含重试）前按该接口族与 limit_token 的令牌桶排队
+        limit_token: 本次请求使用的 token
         **kwargs: 函数关键字参数
 
     Returns:
         函数执行结果
 
     Raises:
-        最后一次失败的异常
+        最后一次失败的异常；排队超过 rate_limit.max_wait 时抛出 RateLimitExceeded
     """
     ctx = RetryContext()
 
@@ -163,7 +169,11 @@ async def retry_on_status(
                 return getattr(e, "status_code", None)
             return None
 
+    limiter = get_rate_limiter() if limit_family else None
+
     while ctx.attempt <= ctx.max_retry:
+        if limiter is not None:
+            await limiter.acquire(limit_family, limit_token)
         try:
             result = await func(*args, **kwargs)
 
@@ -180,6 +190,10 @@ async def retry_on_status(
             # 提取状态码
             status_code = extract_status(e)
 
+            # 上游仍返回 429：清空该 token 的令牌桶（extract_status 可能改写状态码，按原始状态判断）
+            if limiter is not None and limit_token and error_status(e) == 429:
+                await limiter.penalize(limit_family, limit_token, extract_retry_after(e))
+
             if status_code is None:
                 # 错误无法识别
                 logger.error(f"Non-retryable error: {e}")
@@ -0,0 +1,281 @@
+"""
+上游 HTTP 会话池
+
+按 (浏览器指纹, 代理) 复用 curl_cffi AsyncSession，避免每次请求重新进行 TLS 握手、
+建立 HTTP/2 连接。
+
+- 同一会话内的 curl 句柄共享连接缓存，并发流各自占用一个句柄（上限 session_max_clients）
+- 会话满载时新建会话，每个 key 最多 session_pool_size 个（满后按最小负载复用）
+- 会话存活超过 session_max_age_sec、空闲过久或连续传输错误后退役，
+  不再接收新请求，在途请求结束后关闭
+- 会话不保存响应 Cookie（Token 通过请求头传递，避免不同 Token 间串用）
+- session_pool_size = 0 时退化为每次请求新建会话
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from curl_cffi import CurlError
+from curl_cffi.requests import AsyncSession
+
+from app.core.config import get_config
+from app.core.logger import logger
+
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_MAX_CLIENTS = 32
+DEFAULT_MAX_AGE_SEC = 300
+# 空闲超过该时长的会话在下次获取时关闭
+IDLE_TIMEOUT_SEC = 60
+# 连续传输错误达到该次数后退役会话
+MAX_CONSECUTIVE_ERRORS = 3
+
+
+def _int_config(key: str, default: int, minimum: int) -> int:
+    try:
+        return max(minimum, int(get_config(key, default)))
+    except Exception:
+        return default
+
+
+async def abort_response(response) -> None:
+    """中止未读完的流式响应，使 curl 句柄归还会话（aclose 会等待传输结束）"""
+    task = getattr(response, "astream_task", None)
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+class _PooledSession:
+    __slots__ = (
+        "session",
+        "created_at",
+        "last_used_at",
+        "inflight",
+        "errors",
+        "retired",
+        "closed",
+    )
+
+    def __init__(self, session: AsyncSession):
+        now = time.monotonic()
+        self.session = session
+        self.created_at = now
+        self.last_used_at = now
+        self.inflight = 0
+        self.errors = 0
+        self.retired = False
+        self.closed = False
+
+
+class SessionLease:
+    """
+    会话租约
+
+    用法:
+        async with get_session_pool().acquire(browser, proxy) as session:
+            response = await session.post(...)
+
+    流式请求需跨越函数边界时，手动调用 release(response=...)。
+    """
+
+    __slots__ = ("_pool", "_entry", "_released")
+
+    def __init__(self, pool: "SessionPool", entry: _PooledSession):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    @property
+    def session(self) -> AsyncSession:
+        return self._entry.session
+
+    async def release(self, error: Optional[BaseException] = None, response=None):
+        """
+        归还会话（幂等）
+
+        Args:
+            error: 请求异常（传输错误计入会话健康状态）
+            response: 流式响应，未读完时中止传输
+        """
+        if self._released:
+            return
+        self._released = True
+        if response is not None:
+            await abort_response(response)
+        await self._pool._release(self._entry, error)
+
+    async def __aenter__(self) -> AsyncSession:
+        return self._entry.session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release(exc)
+
+
+class SessionPool:
+    """按 (impersonate, proxy) 分组的 AsyncSession 池"""
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[str, str], List[_PooledSession]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: set = set()
+        self.created = 0
+        self.recycled = 0
+
+    def acquire(
+        self, impersonate: Optional[str] = None, proxy: Optional[str] = None
+    ) -> SessionLease:
+        """获取会话租约（不等待，满载时由 curl 句柄队列排队）"""
+        if impersonate is None:
+            impersonate = get_config("security.browser")
+        pool_size = _int_config("network.session_pool_size", DEFAULT_POOL_SIZE, 0)
+        max_clients = _int_config(
+            "network.session_max_clients", DEFAULT_MAX_CLIENTS, 1
+        )
+
+        if pool_size == 0:
+            entry = _PooledSession(self._new_session(impersonate, max_clients))
+            entry.retired = True
+            entry.inflight = 1
+            return SessionLease(self, entry)
+
+        self._check_loop()
+        key = (impersonate or "", proxy or "")
+        entries = self._sessions.setdefault(key, [])
+        self._evict(entries)
+
+        # 优先填满较早的会话，集中复用已建立的连接
+        entry = next((e for e in entries if e.inflight < max_clients), None)
+        if entry is None:
+            if len(entries) < pool_size:
+                entry = _PooledSession(self._new_session(impersonate, max_clients))
+                entries.append(entry)
+                logger.debug(
+                    f"SessionPool: new session impersonate={key[0]}, "
+                    f"proxy={'yes' if key[1] else 'no'}, total={len(entries)}"
+                )
+            else:
+                entry = min(entries, key=lambda e: e.inflight)
+
+        entry.inflight += 1
+        entry.last_used_at = time.monotonic()
+        return SessionLease(self, entry)
+
+    async def close(self):
+        """关闭所有会话"""
+        entries = [e for group in self._sessions.values() for e in group]
+        self._sessions = {}
+        for entry in entries:
+            entry.retired = True
+            await self._close_entry(entry)
+
+    def stats(self) -> Dict[str, int]:
+        """会话池统计"""
+        entries = [e for group in self._sessions.values() for e in group]
+        return {
+            "keys": len(self._sessions),
+            "sessions": len(entries),
+            "inflight": sum(e.inflight for e in entries),
+            "created": self.created,
+            "recycled": self.recycled,
+        }
+
+    def _new_session(self, impersonate: str, max_clients: int) -> AsyncSession:
+        self.created += 1
+        return AsyncSession(
+            impersonate=impersonate,
+            max_clients=max_clients,
+            discard_cookies=True,
+        )
+
+    def _check_loop(self):
+        """会话绑定事件循环，循环变化时（如测试中多次 asyncio.run）丢弃旧会话"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._sessions = {}
+
+    def _evict(self, entries: List[_PooledSession]):
+        """退役超龄/空闲的会话"""
+        now = time.monotonic()
+        max_age = _int_config("network.session_max_age_sec", DEFAULT_MAX_AGE_SEC, 0)
+        for entry in list(entries):
+            expired = max_age > 0 and now - entry.created_at >= max_age
+            idle = entry.inflight == 0 and now - entry.last_used_at >= IDLE_TIMEOUT_SEC
+            if expired or idle:
+                self._retire(entries, entry)
+
+    def _retire(self, entries: List[_PooledSession], entry: _PooledSession):
+        if entry.retired:
+            return
+        entry.retired = True
+        self.recycled += 1
+        try:
+            entries.remove(entry)
+        except ValueError:
+            pass
+        if entry.inflight == 0:
+            task = asyncio.get_running_loop().create_task(self._close_entry(entry))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _release(self, entry: _PooledSession, error: Optional[BaseException]):
+        entry.inflight = max(0, entry.inflight - 1)
+        entry.last_used_at = time.monotonic()
+
+        if isinstance(error, CurlError):
+            entry.errors += 1
+            if entry.errors >= MAX_CONSECUTIVE_ERRORS and not entry.retired:
+                logger.warning(
+                    f"SessionPool: retiring session after {entry.errors} transport errors"
+                )
+                for entries in self._sessions.values():
+                    if entry in entries:
+                        self._retire(entries, entry)
+                        break
+        elif error is None:
+            entry.errors = 0
+
+        if entry.retired and entry.inflight == 0:
+            await self._close_entry(entry)
+
+    @staticmethod
+    async def _close_entry(entry: _PooledSession):
+        if entry.closed:
+            return
+        entry.closed = True
+        try:
+            await entry.session.close()
+        except Exception as e:
+            logger.debug(f"SessionPool: close session failed: {e}")
+
+
+_POOL: Optional[SessionPool] = None
+
+
+def get_session_pool() -> SessionPool:
+    """获取全局会话池"""
+    global _POOL
+    if _POOL is None:
+        _POOL = SessionPool()
+    return _POOL
+
+
+async def close_session_pool():
+    """关闭全局会话池（应用关闭时调用）"""
+    if _POOL is not None:
+        await _POOL.close()
+
+
+__all__ = [
+    "SessionPool",
+    "SessionLease",
+    "abort_response",
+    "get_session_pool",
+    "close_session_pool",
+]
@@ -0,0 +1,51 @@
+"""
+进程内请求合并（singleflight）
+
+同一 key 的并发调用只执行一次，其余调用等待同一个结果。
+执行体运行在独立任务中: 任一等待方取消不会中断执行，其他等待方照常获得结果。
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class SingleFlight:
+    """按 key 合并并发调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行或加入同 key 的调用
+
+        Args:
+            key: 合并键
+            fn: 无参协程函数，仅在没有同 key 调用进行中时执行
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如测试中多次 asyncio.run）时丢弃旧任务
+            self._loop = loop
+            self._flights = {}
+
+        task = self._flights.get(key)
+        if task is None:
+            task = loop.create_task(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # 所有等待方均已取消时避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def inflight(self) -> int:
+        return len(self._flights)
+
+
+__all__ = ["SingleFlight"]
@@ -2,15 +2,17 @@
 流式响应通用工具
 """
 
-from typing import AsyncGenerator
+import asyncio
+from typing import AsyncGenerator, AsyncIterable, Awaitable, Callable, List, Optional
 
+from app.core.config import get_config
 from app.core.logger import logger
 from app.services.grok.models.model import ModelService
 from app.services.token import EffortType
 
 
 async def wrap_stream_with_usage(
-    stream: AsyncGenerator, token_mgr, token: str, model: str
+    stream: AsyncGenerator, token_mgr, token: str, model: str, lease=None
 ) -> AsyncGenerator:
     """
     包装流式响应，在完成时记录使用
@@ -20,6 +22,7 @@ async def wrap_stream_with_usage(
         token_mgr: TokenManager 实例
         token: Token 字符串
         model: 模型名称
+        lease: 在途请求租约，流关闭时释放
     """
     success = False
     try:
@@ -27,6 +30,8 @@ async def wrap_stream_with_usage(
             yield chunk
         success = True
     finally:
+        if lease is not None:
+            lease.release()
         if success:
             try:
                 model_info = ModelService.get(model)
@@ -43,4 +48,155 @@ async def wrap_stream_with_usage(
                 logger.warning(f"Failed to record stream usage: {e}")
 
 
-__all__ = ["wrap_stream_with_usage"]
+async def coalesce_sse(
+    stream: AsyncIterable[str],
+    max_bytes: Optional[int] = None,
+    max_ms: Optional[float] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    合并 SSE 事件后再写出，减少小包写入与事件循环唤醒
+
+    缓冲区累计达到 max_bytes 字节或首个缓冲事件等待超过 max_ms 毫秒时
+    一次性写出。事件按原样拼接（不改写内容），think 标签与 [DONE] 保持不变；
+    首个事件立即发送，上游异常前先写出已缓冲的事件。
+
+    Args:
+        stream: SSE 字符串流
+        max_bytes: 缓冲字节上限，默认读取 chat.stream_coalesce_bytes
+        max_ms: 最长缓冲时间(毫秒)，默认读取 chat.stream_coalesce_ms，0 表示不合并
+    """
+    if max_bytes is None:
+        max_bytes = int(get_config("chat.stream_coalesce_bytes", 4096) or 0)
+    if max_ms is None:
+        max_ms = float(get_config("chat.stream_coalesce_ms", 0) or 0)
+
+    iterator = stream.__aiter__()
+    if max_ms <= 0:
+        try:
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    buffer: List[str] = []
+    size = 0
+    deadline = 0.0
+    first = True
+    # 缓冲非空时在独立任务中拉取下一个事件，以便按时间刷新
+    next_task: Optional[asyncio.Future] = None
+
+    try:
+        while True:
+            try:
+                if not buffer and next_task is None:
+                    chunk = await iterator.__anext__()
+                else:
+                    if next_task is None:
+                        next_task = asyncio.ensure_future(iterator.__anext__())
+                    if buffer:
+                        timeout = deadline - loop.time()
+                        if timeout > 0:
+                            await asyncio.wait((next_task,), timeout=timeout)
+                        if not next_task.done():
+                            yield "".join(buffer)
+                            buffer, size = [], 0
+                            continue
+                    else:
+                        await asyncio.wait((next_task,))
+                    task, next_task = next_task, None
+                    chunk = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if buffer:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                raise
+
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                deadline = loop.time() + max_ms / 1000
+            buffer.append(chunk)
+            size += len(chunk)
+            if max_bytes > 0 and size >= max_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if next_task is not None and not next_task.done():
+            next_task.cancel()
+            await asyncio.wait((next_task,))
+            if not next_task.cancelled():
+                next_task.exception()
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+class UpstreamLineStream:
+    """
+    上游 NDJSON 流
+
+    - async for: 逐行迭代（与 aiter_lines 一致）
+    - aiter_batches: 按网络分块产出该分块内的完整行，处理器可据此合并输出，
+      不引入额外等待
+    迭代结束（或被关闭）时调用 on_close(error) 释放连接。
+    """
+
+    def __init__(
+        self,
+        response,
+        on_close: Callable[[Optional[BaseException]], Awaitable[None]],
+    ):
+        self._response = response
+        self._on_close = on_close
+        self._closed = False
+
+    def __aiter__(self):
+        return self._iter_lines()
+
+    async def _iter_lines(self) -> AsyncGenerator[bytes, None]:
+        batches = self.aiter_batches()
+        try:
+            async for batch in batches:
+                for line in batch:
+                    yield line
+        finally:
+            await batches.aclose()
+
+    async def aiter_batches(self) -> AsyncGenerator[List[bytes], None]:
+        error = None
+        pending = b""
+        try:
+            async for chunk in self._response.aiter_content():
+                if not chunk:
+                    continue
+                if pending:
+                    chunk = pending + chunk
+                lines = chunk.split(b"\n")
+                pending = lines.pop()
+                if lines:
+                    yield lines
+            if pending:
+                yield [pending]
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await self.aclose(error)
+
+    async def aclose(self, error: Optional[BaseException] = None):
+        if self._closed:
+            return
+        self._closed = True
+        await self._on_close(error)
+
+
+__all__ = ["wrap_stream_with_usage", "coalesce_sse", "UpstreamLineStream"]
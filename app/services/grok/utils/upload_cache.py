@@ -0,0 +1,157 @@
+"""
+附件上传缓存
+
+多轮对话每轮都会重新发送相同的图片/文件，逐次上传浪费带宽与时间。
+按 (内容哈希, Token) 缓存 Grok 返回的 fileMetadataId / fileUri:
+
+- 本地 LRU + TTL（cache.upload_cache_ttl_sec / cache.upload_cache_max_entries）
+- 存储后端支持共享缓存（Redis）时跨 worker 共享，本地未命中再查共享缓存
+- 上传文件归属于 Token，换用其他 Token 时不会命中，按正常流程重新上传
+- 清空 Token 资产后调用 invalidate_token 丢弃该 Token 的缓存
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import orjson
+
+from app.core.config import get_config
+
+
+DEFAULT_TTL_SEC = 3600
+DEFAULT_MAX_ENTRIES = 2048
+
+
+def _int_config(key: str, default: int) -> int:
+    try:
+        return max(0, int(get_config(key, default)))
+    except Exception:
+        return default
+
+
+def content_digest(b64: str, mime: str) -> str:
+    """附件内容哈希（基于规范化后的 base64 与 MIME 类型）"""
+    h = hashlib.sha256(mime.encode())
+    h.update(b"\0")
+    h.update(b64.encode())
+    return h.hexdigest()
+
+
+def _token_key(token: str) -> str:
+    """Token 摘要（避免在缓存键中保存原始 Token）"""
+    return hashlib.sha256(token.encode()).hexdigest()[:24]
+
+
+class UploadCache:
+    """(内容哈希, Token) -> (file_id, file_uri) 缓存"""
+
+    def __init__(self):
+        # (token_key, digest) -> (expires_at, file_id, file_uri)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, str]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _ttl() -> int:
+        return _int_config("cache.upload_cache_ttl_sec", DEFAULT_TTL_SEC)
+
+    @staticmethod
+    def _shared_storage():
+        try:
+            from app.core.storage import get_storage
+
+            storage = get_storage()
+        except Exception:
+            return None
+        return storage if getattr(storage, "supports_shared_cache", False) else None
+
+    async def get(self, digest: str, token: str) -> Optional[Tuple[str, str]]:
+        """查询缓存，未命中返回 None"""
+        if self._ttl() <= 0:
+            return None
+        key = (_token_key(token), digest)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self._entries.pop(key, None)
+
+        storage = self._shared_storage()
+        if storage is not None:
+            raw = await storage.shared_cache_get(f"upload:{key[0]}", digest)
+            if raw:
+                try:
+                    expires_at, file_id, file_uri = orjson.loads(raw)
+                except Exception:
+                    expires_at = 0
+                if expires_at > now and file_id:
+                    self._store(key, expires_at, file_id, file_uri)
+                    self.hits += 1
+                    return file_id, file_uri
+
+        self.misses += 1
+        return None
+
+    async def put(self, digest: str, token: str, file_id: str, file_uri: str):
+        """写入缓存"""
+        ttl = self._ttl()
+        if ttl <= 0 or not file_id:
+            return
+        key = (_token_key(token), digest)
+        expires_at = time.time() + ttl
+        self._store(key, expires_at, file_id, file_uri)
+
+        storage = self._shared_storage()
+        if storage is not None:
+            await storage.shared_cache_set(
+                f"upload:{key[0]}",
+                digest,
+                orjson.dumps([expires_at, file_id, file_uri]).decode(),
+                ttl,
+            )
+
+    async def invalidate_token(self, token: str):
+        """丢弃指定 Token 的全部缓存（该 Token 的资产被删除时调用）"""
+        token_key = _token_key(token)
+        for key in [k for k in self._entries if k[0] == token_key]:
+            self._entries.pop(key, None)
+        storage = self._shared_storage()
+        if storage is not None:
+            await storage.shared_cache_delete(f"upload:{token_key}")
+
+    def _store(self, key: Tuple[str, str], expires_at: float, file_id: str, file_uri: str):
+        self._entries[key] = (expires_at, file_id, file_uri)
+        self._entries.move_to_end(key)
+        max_entries = max(
+            1, _int_config("cache.upload_cache_max_entries", DEFAULT_MAX_ENTRIES)
+        )
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_CACHE: Optional[UploadCache] = None
+
+
+def get_upload_cache() -> UploadCache:
+    """获取全局上传缓存"""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = UploadCache()
+    return _CACHE
+
+
+__all__ = ["UploadCache", "content_digest", "get_upload_cache"]
@@ -0,0 +1,277 @@
+"""
+提示词索引
+
+存储后端中的提示词是整体读写的 JSON，筛选/搜索若每次全量加载再逐条子串匹配，
+提示词库达到十万级时单次搜索要数百毫秒，且中文按子串匹配无法排序。
+这里在本地 SQLite 中维护逐提示词一行的索引副本:
+
+- prompts 表: 分类/收藏/更新时间单独成列并建索引，完整提示词以 JSON 保存在 data 列
+- prompt_tags 表: 标签成员关系（tag, prompt_id）
+- prompts_fts 表: 标题/正文/标签全文索引（FTS5，中日韩文字按 n-gram 分词，见 app.core.search），
+  搜索结果按 bm25 相关度排序；SQLite 未编译 FTS5 时退回子串匹配
+- meta 表: 索引对应的存储修订号（revision），与存储后端不一致时全量重建
+
+写入由 PromptService 在持有 prompts 锁时同步调用 apply，数据变更与修订号在同一事务中提交。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+from app.core.logger import logger
+from app.core.search import BM25_WEIGHTS, FTS_COLUMNS, fts5_available, fts_rows, match_expression
+from app.core.storage import DATA_DIR
+
+
+INDEX_VERSION = "1"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    category TEXT,
+    favorite INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL DEFAULT 0,
+    search_lc TEXT NOT NULL DEFAULT '',
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompt_tags (
+    tag TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    PRIMARY KEY (tag, prompt_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_prompts_updated ON prompts (updated_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_category ON prompts (category, updated_at);
+CREATE INDEX IF NOT EXISTS idx_prompt_tags_prompt ON prompt_tags (prompt_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# 全文索引（rowid 与 prompts.rowid 对应）
+_FTS_SCHEMA = f"CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5({FTS_COLUMNS})"
+_FTS_INSERT = (
+    f"INSERT INTO prompts_fts (rowid, {FTS_COLUMNS}) "
+    "SELECT rowid, ?, ? FROM prompts WHERE id = ?"
+)
+_FTS_DELETE = "DELETE FROM prompts_fts WHERE rowid IN (SELECT rowid FROM prompts WHERE id = ?)"
+
+
+def _texts(p: Dict[str, Any]) -> Tuple[str, str, str]:
+    """参与搜索的字段：标题、正文、标签"""
+    return (
+        str(p.get("title") or ""),
+        str(p.get("content") or ""),
+        " ".join(str(t) for t in p.get("tags") or []),
+    )
+
+
+def _row(p: Dict[str, Any]) -> Tuple:
+    return (
+        p["id"],
+        p.get("category", "默认"),
+        1 if p.get("favorite") else 0,
+        int(p.get("updated_at") or 0),
+        "\n".join(_texts(p)).lower(),
+        orjson.dumps(p),
+    )
+
+
+def _tag_rows(p: Dict[str, Any]) -> List[Tuple[str, str]]:
+    return [(str(tag), p["id"]) for tag in dict.fromkeys(p.get("tags") or [])]
+
+
+class PromptIndex:
+    """提示词索引（线程安全，耗时查询由调用方放入线程池）"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._fts = fts5_available()
+
+    # ==================== 连接与同步 ====================
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if self._fts:
+            conn.execute(_FTS_SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != INDEX_VERSION:
+            # 结构变化：清空并等待重建
+            self._clear(conn)
+            conn.execute("DELETE FROM meta")
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('version', ?)", (INDEX_VERSION,)
+            )
+        self._conn = conn
+        return conn
+
+    def _clear(self, conn: sqlite3.Connection):
+        if self._fts:
+            conn.execute("DELETE FROM prompts_fts")
+        conn.execute("DELETE FROM prompts")
+        conn.execute("DELETE FROM prompt_tags")
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def revision(self) -> Optional[str]:
+        """索引对应的存储修订号（未构建时为 None）"""
+        rows = self._query("SELECT value FROM meta WHERE key = 'revision'")
+        return rows[0][0] if rows else None
+
+    def _write(self, conn: sqlite3.Connection, prompts: List[Dict[str, Any]]):
+        conn.executemany(
+            "INSERT INTO prompts (id, category, favorite, updated_at, search_lc, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [_row(p) for p in prompts],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO prompt_tags (tag, prompt_id) VALUES (?, ?)",
+            [t for p in prompts for t in _tag_rows(p)],
+        )
+        if self._fts:
+            conn.executemany(_FTS_INSERT, fts_rows((p["id"], _texts(p)) for p in prompts))
+
+    def rebuild(self, prompts: Iterable[Dict[str, Any]], revision: Optional[str]) -> int:
+        """按完整提示词列表重建索引，返回提示词数"""
+        valid = list({p["id"]: p for p in prompts if p.get("id")}.values())
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._clear(conn)
+                self._write(conn, valid)
+                self._set_revision(conn, revision)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        logger.info(f"PromptIndex: indexed {len(valid)} prompt(s)")
+        return len(valid)
+
+    def apply(
+        self,
+        upserts: Iterable[Dict[str, Any]] = (),
+        deletes: Iterable[str] = (),
+        revision: Optional[str] = None,
+    ) -> bool:
+        """
+        增量更新索引（与修订号同一事务提交）
+
+        失败时修订号保持不变，下次读取会按存储内容重建。
+        """
+        upserts = list({p["id"]: p for p in upserts if p.get("id")}.values())
+        ids = [(p["id"],) for p in upserts] + [(prompt_id,) for prompt_id in deletes]
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("DELETE FROM prompt_tags WHERE prompt_id = ?", ids)
+                    if self._fts:
+                        conn.executemany(_FTS_DELETE, ids)
+                    conn.executemany("DELETE FROM prompts WHERE id = ?", ids)
+                    self._write(conn, upserts)
+                    self._set_revision(conn, revision)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"PromptIndex: apply failed: {e}")
+            return False
+
+    @staticmethod
+    def _set_revision(conn: sqlite3.Connection, revision: Optional[str]):
+        if revision is None:
+            conn.execute("DELETE FROM meta WHERE key = 'revision'")
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('revision', ?)",
+                (str(revision),),
+            )
+
+    # ==================== 查询 ====================
+
+    def get(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT data FROM prompts WHERE id = ?", (prompt_id,))
+        return orjson.loads(rows[0][0]) if rows else None
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        tag: Optional[str] = None,
+        favorite: Optional[bool] = None,
+        search: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        筛选提示词
+
+        有搜索词时按相关度排序（相同时按更新时间倒序），否则按更新时间倒序。
+        """
+        clauses: List[str] = []
+        params: List[Any] = []
+        source = "prompts"
+        order = "prompts.updated_at DESC, prompts.id"
+
+        match = match_expression(search) if search and self._fts else None
+        if match is not None:
+            weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+            source = (
+                "prompts JOIN (SELECT rowid AS fts_rowid, "
+                f"bm25(prompts_fts, {weights}) AS score "
+                "FROM prompts_fts WHERE prompts_fts MATCH ?) AS f "
+                "ON prompts.rowid = f.fts_rowid"
+            )
+            params.append(match)
+            order = "f.score, " + order
+        elif search:
+            clauses.append("instr(search_lc, ?) > 0")
+            params.append(search.lower())
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        if tag:
+            clauses.append("id IN (SELECT prompt_id FROM prompt_tags WHERE tag = ?)")
+            params.append(tag)
+        if favorite is not None:
+            clauses.append("favorite = ?")
+            params.append(1 if favorite else 0)
+
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        rows = self._query(
+            f"SELECT prompts.data FROM {source}{where} ORDER BY {order}", tuple(params)
+        )
+        return [orjson.loads(r[0]) for r in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_INDEX: Optional[PromptIndex] = None
+
+
+def get_prompt_index() -> PromptIndex:
+    """获取全局提示词索引（data/prompt_index.db）"""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = PromptIndex(DATA_DIR / "prompt_index.db")
+    return _INDEX
+
+
+__all__ = ["PromptIndex", "get_prompt_index"]
@@ -1,4 +1,5 @@
 """提示词管理服务"""
+import asyncio
 import uuid
 import time
 from typing import List, Optional, Dict, Any
@@ -6,14 +7,47 @@ from pathlib import Path
 
 from app.core.logger import logger
 from app.core.storage import StorageFactory
+from .index import get_prompt_index
 from .models import Prompt, PromptCreate, PromptUpdate, PromptList
 
 
 class PromptService:
-    """提示词管理服务"""
+    """提示词管理服务（列表/搜索走本地索引，写入后同步索引）"""
+
+    # 按请求实例化，索引同步状态在类上共享
+    _index_lock = asyncio.Lock()
+    _index_synced = False
 
     def __init__(self):
         self.storage = StorageFactory.get_storage()
+        self.index = get_prompt_index()
+
+    # ==================== 索引同步 ====================
+
+    def _index_current(self, revision: Optional[str]) -> bool:
+        if revision is None:
+            # 后端无法提供修订号：进程内首次读取时构建一次，之后依赖本进程写入同步
+            return PromptService._index_synced
+        return self.index.revision() == revision
+
+    async def _ensure_index(self):
+        """索引与存储不一致时按存储内容重建"""
+        revision = await self.storage.get_prompts_revision()
+        if self._index_current(revision):
+            return
+        async with PromptService._index_lock:
+            if self._index_current(revision):
+                return
+            data = await self.storage.load_prompts() or {}
+            await asyncio.to_thread(self.index.rebuild, data.get("prompts", []), revision)
+            PromptService._index_synced = True
+
+    async def _sync_index(
+        self, upserts: List[Dict[str, Any]] = (), deletes: List[str] = ()
+    ):
+        """保存提示词后同步索引（调用方需持有 prompts 锁）"""
+        revision = await self.storage.get_prompts_revision()
+        await asyncio.to_thread(self.index.apply, upserts, deletes, revision)
 
     async def get_all_prompts(
         self,
@@ -22,32 +56,15 @@ class PromptService:
         favorite: Optional[bool] = None,
         search: Optional[str] = None,
     ) -> PromptList:
-        """获取所有提示词"""
+        """获取所有提示词（有搜索词时按相关度排序，否则按更新时间倒序）"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                data = {"prompts": [], "version": "1.0"}
+            await self._ensure_index()
 
-            prompts = [Prompt(**p) for p in data.get("prompts", [])]
-
-            # 筛选
-            if category:
-                prompts = [p for p in prompts if p.category == category]
-            if tag:
-                prompts = [p for p in prompts if tag in p.tags]
-            if favorite is not None:
-                prompts = [p for p in prompts if p.favorite == favorite]
-            if search:
-                search_lower = search.lower()
-                prompts = [
-                    p for p in prompts
-                    if search_lower in p.title.lower()
-                    or search_lower in p.content.lower()
-                    or any(search_lower in t.lower() for t in p.tags)
-                ]
-
-            # 按更新时间倒序排序
-            prompts.sort(key=lambda x: x.updated_at, reverse=True)
+            # 筛选、全文检索与排序均在索引中完成
+            rows = await asyncio.to_thread(
+                self.index.query, category, tag, favorite, search
+            )
+            prompts = [Prompt(**p) for p in rows]
 
             # 统计分类和标签
             categories = list(set(p.category for p in prompts))
@@ -69,14 +86,9 @@ class PromptService:
     async def get_prompt(self, prompt_id: str) -> Optional[Prompt]:
         """获取单个提示词"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                return None
-
-            for p in data.get("prompts", []):
-                if p.get("id") == prompt_id:
-                    return Prompt(**p)
-            return None
+            await self._ensure_index()
+            p = await asyncio.to_thread(self.index.get, prompt_id)
+            return Prompt(**p) if p else None
         except Exception as e:
             logger.error(f"获取提示词失败: {e}")
             return None
@@ -84,25 +96,28 @@ class PromptService:
     async def create_prompt(self, prompt_data: PromptCreate) -> Prompt:
         """创建提示词"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                data = {"prompts": [], "version": "1.0"}
-
-            now = int(time.time() * 1000)
-            prompt = Prompt(
-                id=str(uuid.uuid4()),
-                title=prompt_data.title,
-                content=prompt_data.content,
-                category=prompt_data.category,
-                tags=prompt_data.tags,
-                favorite=False,
-                use_count=0,
-                created_at=now,
-                updated_at=now,
-            )
-
-            data["prompts"].append(prompt.model_dump())
-            await self.storage.save_prompts(data)
+            async with self.storage.acquire_lock("prompts", timeout=10):
+                await self._ensure_index()
+                data = await self.storage.load_prompts()
+                if not data:
+                    data = {"prompts": [], "version": "1.0"}
+
+                now = int(time.time() * 1000)
+                prompt = Prompt(
+                    id=str(uuid.uuid4()),
+                    title=prompt_data.title,
+                    content=prompt_data.content,
+                    category=prompt_data.category,
+                    tags=prompt_data.tags,
+                    favorite=False,
+                    use_count=0,
+                    created_at=now,
+                    updated_at=now,
+                )
+
+                data["prompts"].append(prompt.model_dump())
+                await self.storage.save_prompts(data)
+                await self._sync_index(upserts=[prompt.model_dump()])
 
             logger.info(f"创建提示词成功: {prompt.id}")
             return prompt
@@ -115,33 +130,36 @@ class PromptService:
     ) -> Optional[Prompt]:
         """更新提示词"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                return None
-
-            prompts = data.get("prompts", [])
-            for i, p in enumerate(prompts):
-                if p.get("id") == prompt_id:
-                    # 更新字段
-                    if prompt_data.title is not None:
-                        p["title"] = prompt_data.title
-                    if prompt_data.content is not None:
-                        p["content"] = prompt_data.content
-                    if prompt_data.category is not None:
-                        p["category"] = prompt_data.category
-                    if prompt_data.tags is not None:
-                        p["tags"] = prompt_data.tags
-                    if prompt_data.favorite is not None:
-                        p["favorite"] = prompt_data.favorite
-
-                    p["updated_at"] = int(time.time() * 1000)
-                    prompts[i] = p
-
-                    data["prompts"] = prompts
-                    await self.storage.save_prompts(data)
-
-                    logger.info(f"更新提示词成功: {prompt_id}")
-                    return Prompt(**p)
+            async with self.storage.acquire_lock("prompts", timeout=10):
+                await self._ensure_index()
+                data = await self.storage.load_prompts()
+                if not data:
+                    return None
+
+                prompts = data.get("prompts", [])
+                for i, p in enumerate(prompts):
+                    if p.get("id") == prompt_id:
+                        # 更新字段
+                        if prompt_data.title is not None:
+                            p["title"] = prompt_data.title
+                        if prompt_data.content is not None:
+                            p["content"] = prompt_data.content
+                        if prompt_data.category is not None:
+                            p["category"] = prompt_data.category
+                        if prompt_data.tags is not None:
+                            p["tags"] = prompt_data.tags
+                        if prompt_data.favorite is not None:
+                            p["favorite"] = prompt_data.favorite
+
+                        p["updated_at"] = int(time.time() * 1000)
+                        prompts[i] = p
+
+                        data["prompts"] = prompts
+                        await self.storage.save_prompts(data)
+                        await self._sync_index(upserts=[p])
+
+                        logger.info(f"更新提示词成功: {prompt_id}")
+                        return Prompt(**p)
 
             return None
         except Exception as e:
@@ -151,19 +169,22 @@ class PromptService:
     async def delete_prompts(self, prompt_ids: List[str]) -> int:
         """删除提示词"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                return 0
+            async with self.storage.acquire_lock("prompts", timeout=10):
+                await self._ensure_index()
+                data = await self.storage.load_prompts()
+                if not data:
+                    return 0
 
-            prompts = data.get("prompts", [])
-            original_count = len(prompts)
+                prompts = data.get("prompts", [])
+                original_count = len(prompts)
 
-            # 过滤掉要删除的提示词
-            prompts = [p for p in prompts if p.get("id") not in prompt_ids]
-            deleted_count = original_count - len(prompts)
+                # 过滤掉要删除的提示词
+                prompts = [p for p in prompts if p.get("id") not in prompt_ids]
+                deleted_count = original_count - len(prompts)
 
-            data["prompts"] = prompts
-            await self.storage.save_prompts(data)
+                data["prompts"] = prompts
+                await self.storage.save_prompts(data)
+                await self._sync_index(deletes=list(prompt_ids))
 
             logger.info(f"删除提示词成功: {deleted_count} 个")
             return deleted_count
@@ -174,20 +195,23 @@ class PromptService:
     async def increment_use_count(self, prompt_id: str) -> bool:
         """增加使用次数"""
         try:
-            data = await self.storage.load_prompts()
-            if not data:
-                return False
-
-            prompts = data.get("prompts", [])
-            for i, p in enumerate(prompts):
-                if p.get("id") == prompt_id:
-                    p["use_count"] = p.get("use_count", 0) + 1
-                    p["updated_at"] = int(time.time() * 1000)
-                    prompts[i] = p
-
-                    data["prompts"] = prompts
-                    await self.storage.save_prompts(data)
-                    return True
+            async with self.storage.acquire_lock("prompts", timeout=10):
+                await self._ensure_index()
+                data = await self.storage.load_prompts()
+                if not data:
+                    return False
+
+                prompts = data.get("prompts", [])
+                for i, p in enumerate(prompts):
+                    if p.get("id") == prompt_id:
+                        p["use_count"] = p.get("use_count", 0) + 1
+                        p["updated_at"] = int(time.time() * 1000)
+                        prompts[i] = p
+
+                        data["prompts"] = prompts
+                        await self.storage.save_prompts(data)
+                        await self._sync_index(upserts=[p])
+                        return True
 
             return False
         except Exception as e:
@@ -208,25 +232,32 @@ class PromptService:
     async def import_prompts(self, import_data: Dict[str, Any], merge: bool = True) -> int:
         """导入提示词"""
         try:
-            if merge:
-                # 合并模式：保留现有数据
-                existing_data = await self.storage.load_prompts()
-                if not existing_data:
-                    existing_data = {"prompts": [], "version": "1.0"}
-
-                existing_ids = {p.get("id") for p in existing_data.get("prompts", [])}
-                new_prompts = [
-                    p for p in import_data.get("prompts", [])
-                    if p.get("id") not in existing_ids
-                ]
-
-                existing_data["prompts"].extend(new_prompts)
-                await self.storage.save_prompts(existing_data)
-                return len(new_prompts)
-            else:
-                # 覆盖模式：替换所有数据
-                await self.storage.save_prompts(import_data)
-                return len(import_data.get("prompts", []))
+            async with self.storage.acquire_lock("prompts", timeout=30):
+                await self._ensure_index()
+                if merge:
+                    # 合并模式：保留现有数据
+                    existing_data = await self.storage.load_prompts()
+                    if not existing_data:
+                        existing_data = {"prompts": [], "version": "1.0"}
+
+                    existing_ids = {p.get("id") for p in existing_data.get("prompts", [])}
+                    new_prompts = [
+                        p for p in import_data.get("prompts", [])
+                        if p.get("id") not in existing_ids
+                    ]
+
+                    existing_data["prompts"].extend(new_prompts)
+                    await self.storage.save_prompts(existing_data)
+                    await self._sync_index(upserts=new_prompts)
+                    return len(new_prompts)
+                else:
+                    # 覆盖模式：替换所有数据
+                    await self.storage.save_prompts(import_data)
+                    revision = await self.storage.get_prompts_revision()
+                    await asyncio.to_thread(
+                        self.index.rebuild, import_data.get("prompts", []), revision
+                    )
+                    return len(import_data.get("prompts", []))
         except Exception as e:
             logger.error(f"导入提示词失败: {e}")
             raise
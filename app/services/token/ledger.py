@@ -0,0 +1,236 @@
+"""
+跨 worker 原子配额记账
+
+多 worker 部署时各进程各自扣减内存中的 quota，保存时互相覆盖导致配额漂移。
+启用 token.atomic_quota 且存储为 Redis 时，consume/record_fail/mark_rate_limited
+改为在 Redis 中通过 Lua 原子执行，结果回写到本地 TokenInfo。
+
+为减少往返，consume 采用短租约: 每次向 Redis 预留 quota_lease_units 额度，
+租约内的扣费只在本地进行，租约过期（quota_lease_ms）或用尽时归还剩余额度并结算使用次数。
+429 与配额同步会递增 Redis 中的租约纪元，使所有未归还的租约作废。
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+from app.core.config import get_config
+from app.core.logger import logger
+from app.services.token.models import TokenInfo, TokenStatus
+
+
+DEFAULT_LEASE_UNITS = 4
+DEFAULT_LEASE_MS = 2000
+
+# 由记账原子维护的字段，常规增量保存时不写入（避免覆盖其他 worker 的计数）
+LEDGER_FIELDS = frozenset(
+    {
+        "quota",
+        "status",
+        "use_count",
+        "fail_count",
+        "last_used_at",
+        "last_fail_at",
+        "last_fail_reason",
+    }
+)
+
+
+class _Lease:
+    """本 worker 持有的配额租约"""
+
+    __slots__ = ("pool_name", "units", "used", "epoch", "expires_at")
+
+    def __init__(self, pool_name: str, units: int, epoch: int, ttl: float):
+        self.pool_name = pool_name
+        self.units = units
+        self.used = 0
+        self.epoch = epoch
+        self.expires_at = time.monotonic() + ttl
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+def _lease_units() -> int:
+    try:
+        return max(1, int(get_config("token.quota_lease_units", DEFAULT_LEASE_UNITS)))
+    except Exception:
+        return DEFAULT_LEASE_UNITS
+
+
+def _lease_ttl() -> float:
+    try:
+        return max(0.0, float(get_config("token.quota_lease_ms", DEFAULT_LEASE_MS))) / 1000.0
+    except Exception:
+        return DEFAULT_LEASE_MS / 1000.0
+
+
+def _apply_status(token: TokenInfo, status: str):
+    try:
+        new_status = TokenStatus(status)
+    except ValueError:
+        return
+    if token.status != new_status:
+        token.status = new_status
+
+
+class QuotaLedger:
+    """基于 Redis 的原子配额记账（带本地租约缓存）"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._leases: Dict[str, _Lease] = {}
+
+    @staticmethod
+    def is_enabled(storage) -> bool:
+        """配置开启且存储后端支持时启用"""
+        return bool(get_config("token.atomic_quota", False)) and getattr(
+            storage, "supports_atomic_quota", False
+        )
+
+    async def consume(self, pool_name: str, token: TokenInfo, cost: int) -> Optional[int]:
+        """
+        扣费
+
+        Returns:
+            实际扣除的额度；Redis 中不存在该 Token 时返回 None（由调用方本地扣费）
+        """
+        lease = self._leases.get(token.token)
+        now_ms = int(time.time() * 1000)
+
+        # 租约内本地扣费，无需访问 Redis
+        if lease is not None and not lease.expired() and lease.units >= cost:
+            lease.units -= cost
+            lease.used += cost
+            token.last_used_at = now_ms
+            token.use_count += cost
+            token.quota = max(0, token.quota - cost)
+            if token.quota == 0:
+                token.status = TokenStatus.COOLING
+            return cost
+
+        # 取出旧租约随本次请求一并结算（pop 无 await，协程间不会重复结算）
+        lease = self._leases.pop(token.token, None)
+        try:
+            res = await self.storage.token_quota_consume(
+                pool_name,
+                token.token,
+                cost=cost,
+                want=max(cost, _lease_units()),
+                returned=lease.units if lease else 0,
+                used=lease.used if lease else 0,
+                epoch=lease.epoch if lease else 0,
+            )
+        except Exception:
+            # 失败时保留租约，下次再结算
+            if lease is not None:
+                self._keep(token.token, lease)
+            raise
+
+        if res is None:
+            return None
+        if res["leased"] > 0:
+            self._keep(
+                token.token,
+                _Lease(pool_name, res["leased"], res["epoch"], _lease_ttl()),
+            )
+
+        token.last_used_at = now_ms
+        token.use_count = res["use_count"]
+        token.quota = res["quota"] + res["leased"]
+        _apply_status(token, res["status"])
+        return res["consumed"]
+
+    async def record_fail(
+        self, pool_name: str, token: TokenInfo, reason: str, threshold: int
+    ) -> bool:
+        """原子记录 401/403 失败"""
+        res = await self.storage.token_record_fail(
+            pool_name, token.token, reason, threshold
+        )
+        if res is None:
+            return False
+        token.fail_count = res["fail_count"]
+        token.last_fail_at = int(time.time() * 1000)
+        token.last_fail_reason = reason
+        _apply_status(token, res["status"])
+        return True
+
+    async def mark_rate_limited(self, pool_name: str, token: TokenInfo) -> bool:
+        """原子标记 429"""
+        self._leases.pop(token.token, None)
+        if not await self.storage.token_mark_rate_limited(pool_name, token.token):
+            return False
+        token.quota = 0
+        token.status = TokenStatus.COOLING
+        return True
+
+    async def sync_quota(
+        self, pool_name: str, token: TokenInfo, quota: int, is_usage: bool
+    ) -> bool:
+        """写入 API 返回的真实配额（作废所有未归还租约）"""
+        self._leases.pop(token.token, None)
+        res = await self.storage.token_sync_quota(pool_name, token.token, quota, is_usage)
+        if res is None:
+            return False
+        token.update_quota(quota)
+        token.fail_count = 0
+        token.last_fail_at = None
+        token.last_fail_reason = None
+        token.use_count = res["use_count"]
+        if is_usage:
+            token.last_used_at = int(time.time() * 1000)
+        _apply_status(token, res["status"])
+        return True
+
+    def _keep(self, token_str: str, lease: _Lease):
+        """保存租约；并发请求各自拿到租约时合并，避免额度/次数丢失"""
+        other = self._leases.get(token_str)
+        if other is not None:
+            lease.used += other.used
+            if other.epoch == lease.epoch:
+                lease.units += other.units
+        self._leases[token_str] = lease
+
+    def drop(self, token_str: str):
+        """丢弃本地租约（Token 被删除/重置时）"""
+        self._leases.pop(token_str, None)
+
+    async def sweep(self, force: bool = False):
+        """归还已过期（force 时为全部）的租约"""
+        if not self._leases:
+            return
+        due = [
+            (token_str, lease)
+            for token_str, lease in self._leases.items()
+            if force or lease.expired()
+        ]
+        if not due:
+            return
+        for token_str, _ in due:
+            del self._leases[token_str]
+
+        results = await asyncio.gather(
+            *[
+                self.storage.token_quota_consume(
+                    lease.pool_name,
+                    token_str,
+                    returned=lease.units,
+                    used=lease.used,
+                    epoch=lease.epoch,
+                )
+                for token_str, lease in due
+            ],
+            return_exceptions=True,
+        )
+        failed = 0
+        for (token_str, lease), res in zip(due, results):
+            if isinstance(res, Exception):
+                failed += 1
+                self._keep(token_str, lease)
+        if failed:
+            logger.warning(f"QuotaLedger: failed to settle {failed}/{len(due)} leases")
+
+
+__all__ = ["QuotaLedger", "LEDGER_FIELDS"]
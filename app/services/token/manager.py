@@ -9,6 +9,7 @@ from app.core.logger import logger
 from app.services.token.models import (
     TokenInfo,
     EffortType,
+    EFFORT_COST,
     FAIL_THRESHOLD,
     TokenStatus,
     BASIC__DEFAULT_QUOTA,
@@ -16,7 +17,9 @@ from app.services.token.models import (
 )
 from app.core.storage import get_storage
 from app.core.config import get_config
+from app.services.token.ledger import QuotaLedger, LEDGER_FIELDS
 from app.services.token.pool import TokenPool
+from app.services.token.strategy import DEFAULT_STRATEGY, normalize_strategy
 
 
 DEFAULT_REFRESH_BATCH_SIZE = 10
@@ -24,7 +27,9 @@ DEFAULT_REFRESH_CONCURRENCY = 5
 DEFAULT_SUPER_REFRESH_INTERVAL_HOURS = 2
 DEFAULT_REFRESH_INTERVAL_HOURS = 8
 DEFAULT_RELOAD_INTERVAL_SEC = 30
+DEFAULT_SYNC_INTERVAL_MS = 500
 DEFAULT_SAVE_DELAY_MS = 500
+DEFAULT_MAX_INFLIGHT_PER_TOKEN = 0
 
 SUPER_POOL_NAME = "ssoSuper"
 BASIC_POOL_NAME = "ssoBasic"
@@ -36,6 +41,53 @@ def _default_quota_for_pool(pool_name: str) -> int:
     return BASIC__DEFAULT_QUOTA
 
 
+def _strategy_for_pool(pool_name: str) -> str:
+    """解析池的选择策略（token.pool_strategies 覆盖 token.selection_strategy）"""
+    overrides = get_config("token.pool_strategies", []) or []
+    if isinstance(overrides, str):
+        overrides = [overrides]
+    for item in overrides:
+        name, sep, strategy = str(item).partition(":")
+        if sep and name.strip() == pool_name:
+            return normalize_strategy(strategy)
+    return normalize_strategy(
+        get_config("token.selection_strategy", DEFAULT_STRATEGY)
+    )
+
+
+def _max_inflight_per_token() -> int:
+    """单 Token 在途请求上限（0 表示不限制）"""
+    value = get_config("token.max_inflight_per_token", DEFAULT_MAX_INFLIGHT_PER_TOKEN)
+    try:
+        return max(0, int(value or 0))
+    except Exception:
+        return DEFAULT_MAX_INFLIGHT_PER_TOKEN
+
+
+class InflightLease:
+    """
+    Token 在途请求租约
+
+    release 幂等；未显式释放（如流式生成器从未被迭代）时在对象回收时释放。
+    """
+
+    __slots__ = ("token", "_pool", "_released")
+
+    def __init__(self, token: str, pool: Optional[TokenPool]):
+        self.token = token
+        self._pool = pool
+        self._released = pool is None
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self.token)
+
+    def __del__(self):
+        self.release()
+
+
 class TokenManager:
     """管理 Token 的增删改查和配额同步"""
 
@@ -47,9 +99,20 @@ class TokenManager:
         self.initialized = False
         self._save_lock = asyncio.Lock()
         self._dirty = False
+        # 待增量保存的 Token: token -> pool_name，以及待删除的 Token
+        self._dirty_tokens: Dict[str, str] = {}
+        self._deleted_tokens: set = set()
+        # 计数字段需要一并写入的 Token（原子记账启用时其余 Token 只写非计数字段）
+        self._counter_dirty: set = set()
+        self._ledger: Optional[QuotaLedger] = None
         self._save_task: Optional[asyncio.Task] = None
         self._save_delay = DEFAULT_SAVE_DELAY_MS / 1000.0
         self._last_reload_at = 0.0
+        # 变更订阅游标（None 表示存储后端不支持，退化为周期性全量重载）
+        self._sync_cursor = None
+        self._last_sync_at = 0.0
+        self._sync_lock = asyncio.Lock()
+        self._reload_lock = asyncio.Lock()
 
     @classmethod
     async def get_instance(cls) -> "TokenManager":
@@ -66,6 +129,8 @@ class TokenManager:
         if not self.initialized:
             try:
                 storage = get_storage()
+                # 先取游标再加载，期间的变更会在下次同步时重放（幂等）
+                cursor = await storage.get_token_cursor()
                 data = await storage.load_tokens()
 
                 # 如果后端返回 None 或空数据，尝试从本地 data/token.json 初始化后端
@@ -83,6 +148,7 @@ class TokenManager:
                     else:
                         data = {}
 
+                old_pools = self.pools
                 self.pools = {}
                 for pool_name, tokens in data.items():
                     pool = TokenPool(pool_name)
@@ -107,11 +173,18 @@ class TokenManager:
                                 f"Failed to load token in pool '{pool_name}': {e}"
                             )
                             continue
+                    # 重新加载时沿用策略实例，保留命中/429 统计
+                    old_pool = old_pools.get(pool_name)
+                    if old_pool is not None:
+                        pool._strategies = old_pool._strategies
+                        # 共享在途计数，旧租约释放时仍作用于新池
+                        pool._inflight = old_pool._inflight
                     pool._rebuild_index()
                     self.pools[pool_name] = pool
 
                 self.initialized = True
-                self._last_reload_at = time.monotonic()
+                self._sync_cursor = cursor
+                self._last_reload_at = self._last_sync_at = time.monotonic()
                 total = sum(p.count() for p in self.pools.values())
                 logger.info(
                     f"TokenManager initialized: {len(self.pools)} pools with {total} tokens"
@@ -123,12 +196,26 @@ class TokenManager:
 
     async def reload(self):
         """重新加载 Token 池数据"""
-        async with self.__class__._lock:
+        # 使用实例锁，避免阻塞 get_instance
+        async with self._reload_lock:
             self.initialized = False
             await self._load()
 
     async def reload_if_stale(self):
-        """在多 worker 场景下保持短周期一致性"""
+        """
+        在多 worker 场景下保持短周期一致性
+
+        存储后端支持变更订阅时按 token.sync_interval_ms 增量同步，
+        否则按 token.reload_interval_sec 全量重载。
+        """
+        ledger = self._get_ledger()
+        if ledger is not None:
+            await ledger.sweep()
+
+        if self._sync_cursor is not None:
+            await self._sync_if_stale()
+            return
+
         interval = get_config("token.reload_interval_sec", DEFAULT_RELOAD_INTERVAL_SEC)
         try:
             interval = float(interval)
@@ -140,9 +227,119 @@ class TokenManager:
             return
         await self.reload()
 
+    async def _sync_if_stale(self):
+        """增量同步其他 worker 的 Token 变更"""
+        interval_ms = get_config("token.sync_interval_ms", DEFAULT_SYNC_INTERVAL_MS)
+        try:
+            interval = float(interval_ms) / 1000.0
+        except Exception:
+            interval = DEFAULT_SYNC_INTERVAL_MS / 1000.0
+        if interval < 0:
+            return
+        if time.monotonic() - self._last_sync_at < interval:
+            return
+        # 已有同步在进行时直接返回，不排队等待
+        if self._sync_lock.locked() or self._reload_lock.locked():
+            return
+
+        async with self._sync_lock:
+            self._last_sync_at = time.monotonic()
+            storage = get_storage()
+            changes = await storage.load_token_changes(self._sync_cursor)
+            if changes is None:
+                logger.info("Token change feed requires full reload")
+                await self.reload()
+                return
+
+            cursor, updated, deleted = changes
+            applied = self._apply_changes(updated, deleted)
+            self._sync_cursor = cursor
+            if applied:
+                logger.debug(f"Token sync: applied {applied} changes")
+
+    def _apply_changes(self, updated: Dict[str, List[dict]], deleted: List[str]) -> int:
+        """将存储中的 Token 变更原地应用到内存池（本地未保存的变更优先）"""
+        pending = self._dirty_tokens.keys() | self._deleted_tokens
+        applied = 0
+
+        for token_str in deleted:
+            if token_str in pending:
+                continue
+            for pool in self.pools.values():
+                if pool.remove(token_str):
+                    applied += 1
+
+        for pool_name, tokens in updated.items():
+            for token_data in tokens:
+                try:
+                    raw_token = str(token_data.get("token") or "").removeprefix("sso=")
+                    if not raw_token or raw_token in pending:
+                        continue
+                    incoming = TokenInfo(**{**token_data, "token": raw_token})
+                except Exception as e:
+                    logger.warning(f"Token sync: skip invalid token in pool '{pool_name}': {e}")
+                    continue
+
+                pool = self.pools.get(pool_name)
+                if pool is None:
+                    pool = self.pools[pool_name] = TokenPool(pool_name)
+                for other in self.pools.values():
+                    if other is not pool:
+                        other.remove(raw_token)
+
+                current = pool.get(raw_token)
+                if current is None:
+                    pool.add(incoming)
+                    applied += 1
+                    continue
+
+                # 原地更新，保持已持有 TokenInfo 引用的调用方可见
+                changed = False
+                for field in TokenInfo.model_fields:
+                    value = getattr(incoming, field)
+                    if getattr(current, field) != value:
+                        setattr(current, field, value)
+                        changed = True
+                applied += changed
+
+        return applied
+
+    def _get_ledger(self) -> Optional[QuotaLedger]:
+        """获取原子记账（未启用时返回 None）"""
+        storage = get_storage()
+        if not QuotaLedger.is_enabled(storage):
+            return None
+        if self._ledger is None or self._ledger.storage is not storage:
+            self._ledger = QuotaLedger(storage)
+        return self._ledger
+
+    def _mark_dirty(self, pool_name: str, token_str: str, counters: bool = True):
+        """
+        记录待增量保存的 Token
+
+        Args:
+            counters: 是否包含配额/状态/计数字段的变更
+        """
+        self._dirty_tokens[token_str] = pool_name
+        self._deleted_tokens.discard(token_str)
+        if counters:
+            self._counter_dirty.add(token_str)
+
+    def _mark_deleted(self, token_str: str):
+        """记录待删除的 Token"""
+        self._dirty_tokens.pop(token_str, None)
+        self._counter_dirty.discard(token_str)
+        self._deleted_tokens.add(token_str)
+        if self._ledger is not None:
+            self._ledger.drop(token_str)
+
     async def _save(self):
-        """保存变更"""
+        """全量保存（外部直接修改 pools 后调用）"""
         async with self._save_lock:
+            # 全量数据已包含所有增量
+            dirty, deleted = self._dirty_tokens, self._deleted_tokens
+            self._dirty_tokens, self._deleted_tokens = {}, set()
+            self._counter_dirty = set()
             try:
                 data = {}
                 for pool_name, pool in self.pools.items():
@@ -152,8 +349,56 @@ class TokenManager:
                 async with storage.acquire_lock("tokens_save", timeout=10):
                     await storage.save_tokens(data)
             except Exception as e:
+                self._restore_deltas(dirty, deleted)
                 logger.error(f"Failed to save tokens: {e}")
 
+    async def _save_deltas(self):
+        """增量保存（仅写入变更/删除的 Token）"""
+        async with self._save_lock:
+            dirty, deleted = self._dirty_tokens, self._deleted_tokens
+            if not dirty and not deleted:
+                return
+            counters = self._counter_dirty
+            self._dirty_tokens, self._deleted_tokens = {}, set()
+            self._counter_dirty = set()
+            try:
+                # 原子记账启用时计数字段以存储为准，仅在显式变更时写入
+                atomic = self._get_ledger() is not None
+                updated: Dict[str, List[dict]] = {}
+                for token_str, pool_name in dirty.items():
+                    pool = self.pools.get(pool_name)
+                    info = pool.get(token_str) if pool else None
+                    if info is None:
+                        continue
+                    if atomic and token_str not in counters:
+                        dumped = info.model_dump(exclude=LEDGER_FIELDS)
+                    else:
+                        dumped = info.model_dump()
+                    updated.setdefault(pool_name, []).append(dumped)
+
+                storage = get_storage()
+                async with storage.acquire_lock("tokens_save", timeout=10):
+                    await storage.save_token_deltas(updated, list(deleted))
+            except Exception as e:
+                self._restore_deltas(dirty, deleted)
+                self._counter_dirty |= counters & self._dirty_tokens.keys()
+                logger.error(f"Failed to save token deltas: {e}")
+
+    def _restore_deltas(self, dirty: Dict[str, str], deleted: set):
+        """保存失败时放回增量（不覆盖期间产生的新标记）"""
+        for token_str, pool_name in dirty.items():
+            if token_str not in self._deleted_tokens:
+                self._dirty_tokens.setdefault(token_str, pool_name)
+        for token_str in deleted:
+            if token_str not in self._dirty_tokens:
+                self._deleted_tokens.add(token_str)
+
+    async def flush(self):
+        """立即写入未保存的变更并归还配额租约（关闭时调用）"""
+        if self._ledger is not None:
+            await self._ledger.sweep(force=True)
+        await self._save_deltas()
+
     def _schedule_save(self):
         """合并高频保存请求，减少写入开销"""
         delay_ms = get_config("token.save_delay_ms", DEFAULT_SAVE_DELAY_MS)
@@ -166,7 +411,7 @@ class TokenManager:
         if self._save_delay == 0:
             if self._save_task and not self._save_task.done():
                 return
-            self._save_task = asyncio.create_task(self._save())
+            self._save_task = asyncio.create_task(self._save_deltas())
             return
         if self._save_task and not self._save_task.done():
             return
@@ -179,7 +424,7 @@ class TokenManager:
                 if not self._dirty:
                     break
                 self._dirty = False
-                await self._save()
+                await self._save_deltas()
         finally:
             self._save_task = None
             if self._dirty:
@@ -201,7 +446,11 @@ class TokenManager:
             logger.warning(f"Pool '{pool_name}' not found")
             return None
 
-        token_info = pool.select(exclude=exclude)
+        token_info = pool.select(
+            exclude=exclude,
+            strategy=_strategy_for_pool(pool_name),
+            max_inflight=_max_inflight_per_token(),
+        )
         if not token_info:
             logger.warning(f"No available token in pool '{pool_name}'")
             return None
@@ -226,7 +475,10 @@ class TokenManager:
             logger.warning(f"Pool '{pool_name}' not found")
             return None
 
-        token_info = pool.select()
+        token_info = pool.select(
+            strategy=_strategy_for_pool(pool_name),
+            max_inflight=_max_inflight_per_token(),
+        )
         if not token_info:
             logger.warning(f"No available token in pool '{pool_name}'")
             return None
@@ -313,14 +565,31 @@ class TokenManager:
             是否成功
         """
         raw_token = token_str.replace("sso=", "")
+        ledger = self._get_ledger()
 
         for pool in self.pools.values():
             token = pool.get(raw_token)
             if token:
+                if ledger is not None:
+                    try:
+                        consumed = await ledger.consume(
+                            pool.name, token, EFFORT_COST[effort]
+                        )
+                        if consumed is not None:
+                            logger.debug(
+                                f"Token {raw_token[:10]}...: consumed {consumed} quota (atomic), "
+                                f"use_count={token.use_count}"
+                            )
+                            return True
+                    except Exception as e:
+                        logger.warning(
+                            f"Token {raw_token[:10]}...: atomic consume failed, fallback to local ({e})"
+                        )
                 consumed = token.consume(effort)
                 logger.debug(
                     f"Token {raw_token[:10]}...: consumed {consumed} quota, use_count={token.use_count}"
                 )
+                self._mark_dirty(pool.name, raw_token)
                 self._schedule_save()
                 return True
 
@@ -354,9 +623,11 @@ class TokenManager:
 
         # 查找 Token 对象
         target_token: Optional[TokenInfo] = None
+        target_pool = ""
         for pool in self.pools.values():
             target_token = pool.get(raw_token)
             if target_token:
+                target_pool = pool.name
                 break
 
         if not target_token:
@@ -374,6 +645,15 @@ class TokenManager:
                 old_quota = target_token.quota
                 new_quota = result["remainingTokens"]
 
+                ledger = self._get_ledger()
+                if ledger is not None and await ledger.sync_quota(
+                    target_pool, target_token, new_quota, is_usage
+                ):
+                    logger.info(
+                        f"Token {raw_token[:10]}...: synced quota {old_quota} -> {new_quota} (atomic)"
+                    )
+                    return True
+
                 target_token.update_quota(new_quota)
                 target_token.record_success(is_usage=is_usage)
 
@@ -383,6 +663,7 @@ class TokenManager:
                     f"{old_quota} -> {new_quota} (consumed: {consumed}, use_count: {target_token.use_count})"
                 )
 
+                self._mark_dirty(target_pool, raw_token)
                 self._schedule_save()
                 return True
 
@@ -420,6 +701,21 @@ class TokenManager:
         for pool in self.pools.values():
             token = pool.get(raw_token)
             if token:
+                ledger = self._get_ledger() if status_code in (401, 403) else None
+                if ledger is not None:
+                    try:
+                        if await ledger.record_fail(
+                            pool.name, token, reason, FAIL_THRESHOLD
+                        ):
+                            logger.warning(
+                                f"Token {raw_token[:10]}...: recorded {status_code} failure "
+                                f"({token.fail_count}/{FAIL_THRESHOLD}, atomic) - {reason}"
+                            )
+                            return True
+                    except Exception as e:
+                        logger.warning(
+                            f"Token {raw_token[:10]}...: atomic fail record failed ({e})"
+                        )
                 if status_code in (401, 403):
                     token.record_fail(status_code, reason)
                     logger.warning(
@@ -430,12 +726,30 @@ class TokenManager:
                     logger.info(
                         f"Token {raw_token[:10]}...: non-auth error ({status_code}) - {reason} (not counted)"
                     )
+                self._mark_dirty(pool.name, raw_token, counters=status_code in (401, 403))
                 self._schedule_save()
                 return True
 
         logger.warning(f"Token {raw_token[:10]}...: not found for failure record")
         return False
 
+    def acquire_inflight(self, token_str: str) -> InflightLease:
+        """
+        登记 Token 的一个在途请求
+
+        Args:
+            token_str: Token 字符串
+
+        Returns:
+            InflightLease，请求结束（流关闭）时调用 release()
+        """
+        raw_token = token_str.removeprefix("sso=")
+        for pool in self.pools.values():
+            if pool.get(raw_token):
+                pool.acquire(raw_token)
+                return InflightLease(raw_token, pool)
+        return InflightLease(raw_token, None)
+
     async def mark_rate_limited(self, token_str: str) -> bool:
         """
         将 Token 标记为配额耗尽（COOLING）
@@ -454,13 +768,28 @@ class TokenManager:
         for pool in self.pools.values():
             token = pool.get(raw_token)
             if token:
+                pool.record_rate_limited(raw_token)
                 old_quota = token.quota
+                ledger = self._get_ledger()
+                if ledger is not None:
+                    try:
+                        if await ledger.mark_rate_limited(pool.name, token):
+                            logger.warning(
+                                f"Token {raw_token[:10]}...: marked as rate limited "
+                                f"(quota {old_quota} -> 0, status -> cooling, atomic)"
+                            )
+                            return True
+                    except Exception as e:
+                        logger.warning(
+                            f"Token {raw_token[:10]}...: atomic rate limit marking failed ({e})"
+                        )
                 token.quota = 0
                 token.status = TokenStatus.COOLING
                 logger.warning(
                     f"Token {raw_token[:10]}...: marked as rate limited "
                     f"(quota {old_quota} -> 0, status -> cooling)"
                 )
+                self._mark_dirty(pool.name, raw_token)
                 self._schedule_save()
                 return True
 
@@ -492,7 +821,8 @@ class TokenManager:
             return False
 
         pool.add(TokenInfo(token=token, quota=_default_quota_for_pool(pool_name)))
-        await self._save()
+        self._mark_dirty(pool_name, token)
+        await self._save_deltas()
         logger.info(f"Pool '{pool_name}': token added")
         return True
 
@@ -503,6 +833,7 @@ class TokenManager:
             info = pool.get(raw_token)
             if info:
                 info.last_asset_clear_at = int(datetime.now().timestamp() * 1000)
+                self._mark_dirty(pool.name, raw_token, counters=False)
                 self._schedule_save()
                 return True
         return False
@@ -524,6 +855,7 @@ class TokenManager:
             if info:
                 if tag not in info.tags:
                     info.tags.append(tag)
+                    self._mark_dirty(pool.name, raw_token, counters=False)
                     self._schedule_save()
                     logger.debug(f"Token {raw_token[:10]}...: added tag '{tag}'")
                 return True
@@ -546,6 +878,7 @@ class TokenManager:
             if info:
                 if tag in info.tags:
                     info.tags.remove(tag)
+                    self._mark_dirty(pool.name, raw_token, counters=False)
                     self._schedule_save()
                     logger.debug(f"Token {raw_token[:10]}...: removed tag '{tag}'")
                 return True
@@ -563,7 +896,8 @@ class TokenManager:
         """
         for pool_name, pool in self.pools.items():
             if pool.remove(token):
-                await self._save()
+                self._mark_deleted(token)
+                await self._save_deltas()
                 logger.info(f"Pool '{pool_name}': token removed")
                 return True
 
@@ -577,6 +911,8 @@ class TokenManager:
             default_quota = _default_quota_for_pool(pool_name)
             for token in pool:
                 token.reset(default_quota)
+                if self._ledger is not None:
+                    self._ledger.drop(token.token)
                 count += 1
 
         await self._save()
@@ -599,7 +935,10 @@ class TokenManager:
             if token:
                 default_quota = _default_quota_for_pool(pool.name)
                 token.reset(default_quota)
-                await self._save()
+                if self._ledger is not None:
+                    self._ledger.drop(raw_token)
+                self._mark_dirty(pool.name, raw_token)
+                await self._save_deltas()
                 logger.info(f"Token {raw_token[:10]}...: reset completed")
                 return True
 
@@ -614,6 +953,17 @@ class TokenManager:
             stats[name] = pool_stats.model_dump()
         return stats
 
+    def get_strategy_stats(self) -> Dict[str, dict]:
+        """获取各池选择策略的命中/429 统计与在途请求数"""
+        return {
+            name: {
+                "strategy": _strategy_for_pool(name),
+                "strategies": pool.get_strategy_stats(),
+                "inflight": pool.get_inflight_stats(),
+            }
+            for name, pool in self.pools.items()
+        }
+
     def get_pool_tokens(self, pool_name: str = "ssoBasic") -> List[TokenInfo]:
         """
         获取指定池的所有 Token
@@ -654,6 +1004,7 @@ class TokenManager:
             for token in pool:
                 if token.need_refresh(interval_hours):
                     to_refresh.append(token)
+                    self._mark_dirty(pool.name, token.token)
 
         if not to_refresh:
             logger.debug("Refresh check: no tokens need refresh")
@@ -740,7 +1091,7 @@ class TokenManager:
             if i + DEFAULT_REFRESH_BATCH_SIZE < len(to_refresh):
                 await asyncio.sleep(1)
 
-        await self._save()
+        await self._save_deltas()
 
         logger.info(
             f"Refresh completed: "
@@ -762,4 +1113,4 @@ async def get_token_manager() -> TokenManager:
     return await TokenManager.get_instance()
 
 
-__all__ = ["TokenManager", "get_token_manager"]
+__all__ = ["TokenManager", "InflightLease", "get_token_manager"]
@@ -9,8 +9,8 @@ Token 数据模型
 """
 
 from enum import Enum
-from typing import Optional, List
-from pydantic import BaseModel, Field
+from typing import Any, Callable, Optional, List
+from pydantic import BaseModel, Field, PrivateAttr
 from datetime import datetime
 
 
@@ -21,6 +21,9 @@ SUPER_DEFAULT_QUOTA = 140
 # 失败阈值
 FAIL_THRESHOLD = 5
 
+# 影响 Token 池索引的字段
+INDEXED_FIELDS = frozenset({"quota", "status"})
+
 
 class TokenStatus(str, Enum):
     """Token 状态"""
@@ -71,6 +74,16 @@ class TokenInfo(BaseModel):
     note: str = ""
     last_asset_clear_at: Optional[int] = None
 
+    # 索引回调（由 TokenPool 注入，quota/status 变化时通知池更新索引）
+    _index_hook: Optional[Callable[["TokenInfo"], None]] = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name in INDEXED_FIELDS:
+            hook = self._index_hook
+            if hook is not None:
+                hook(self)
+
     def is_available(self) -> bool:
         """检查是否可用（状态正常且配额 > 0）"""
         return self.status == TokenStatus.ACTIVE and self.quota > 0
@@ -1,65 +1,207 @@
 """Token 池管理"""
 
+import bisect
 import random
 from typing import Dict, List, Optional, Iterator
 
 from app.services.token.models import TokenInfo, TokenStatus, TokenPoolStats
+from app.services.token.strategy import (
+    DEFAULT_STRATEGY,
+    SelectionStrategy,
+    create_strategy,
+    normalize_strategy,
+)
+
+
+# 排除集合命中时随机重采样的次数上限，超过后退化为桶内过滤
+_MAX_SAMPLE_ATTEMPTS = 8
+
+
+class _TokenBucket:
+    """可用 Token 集合（支持 O(1) 增删与随机选取）"""
+
+    __slots__ = ("items", "positions")
+
+    def __init__(self):
+        self.items: List[TokenInfo] = []
+        self.positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, token: TokenInfo):
+        self.positions[token.token] = len(self.items)
+        self.items.append(token)
+
+    def discard(self, token_str: str):
+        idx = self.positions.pop(token_str, None)
+        if idx is None:
+            return
+        last = self.items.pop()
+        if idx < len(self.items):
+            self.items[idx] = last
+            self.positions[last.token] = idx
+
+    def choice(self, exclude: Optional[set] = None) -> Optional[TokenInfo]:
+        if not self.items:
+            return None
+        if not exclude:
+            return random.choice(self.items)
+
+        excluded = sum(1 for t in exclude if t in self.positions)
+        if excluded >= len(self.items):
+            return None
+
+        for _ in range(_MAX_SAMPLE_ATTEMPTS):
+            token = random.choice(self.items)
+            if token.token not in exclude:
+                return token
+
+        candidates = [t for t in self.items if t.token not in exclude]
+        return random.choice(candidates) if candidates else None
 
 
 class TokenPool:
     """Token 池（管理一组 Token）"""
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, strategy: str = DEFAULT_STRATEGY):
         self.name = name
+        self.strategy = normalize_strategy(strategy)
         self._tokens: Dict[str, TokenInfo] = {}
+        # 可用 Token 索引: quota -> bucket，_quotas 为升序的非空桶额度
+        self._buckets: Dict[int, _TokenBucket] = {}
+        self._quotas: List[int] = []
+        self._indexed: Dict[str, int] = {}
+        self._available = _TokenBucket()
+        # 每种策略独立实例（独立状态与统计），按需创建
+        self._strategies: Dict[str, SelectionStrategy] = {}
+        self._selected_by: Dict[str, str] = {}
+        # 在途请求计数（仅记录非零项）
+        self._inflight: Dict[str, int] = {}
 
     def add(self, token: TokenInfo):
         """添加 Token"""
+        old = self._tokens.get(token.token)
+        if old is not None and old is not token:
+            old._index_hook = None
+            self._unindex(old.token)
         self._tokens[token.token] = token
+        token._index_hook = self._reindex
+        self._reindex(token)
 
     def remove(self, token_str: str) -> bool:
         """删除 Token"""
-        if token_str in self._tokens:
-            del self._tokens[token_str]
-            return True
-        return False
+        token = self._tokens.pop(token_str, None)
+        if token is None:
+            return False
+        token._index_hook = None
+        self._unindex(token_str)
+        return True
 
     def get(self, token_str: str) -> Optional[TokenInfo]:
         """获取 Token"""
         return self._tokens.get(token_str)
 
-    def select(self, exclude: set = None) -> Optional[TokenInfo]:
+    def select(
+        self,
+        exclude: set = None,
+        strategy: Optional[str] = None,
+        max_inflight: int = 0,
+    ) -> Optional[TokenInfo]:
         """
         选择一个可用 Token
-        策略:
-        1. 选择 active 状态且有配额的 token
-        2. 优先选择剩余额度最多的
-        3. 如果额度相同，随机选择（避免并发冲突）
+
+        Args:
+            exclude: 需要排除的 token 字符串集合
+            strategy: 选择策略名，默认使用池配置的策略
+            max_inflight: 单 Token 在途请求上限，达到上限的 Token 不参与选择（0 不限制）
         """
-        # 选择 token
-        available = [
-            t
-            for t in self._tokens.values()
-            if t.status == TokenStatus.ACTIVE and t.quota > 0
-            and (not exclude or t.token not in exclude)
-        ]
-
-        if not available:
-            return None
+        if max_inflight > 0 and self._inflight:
+            saturated = {
+                t for t, count in self._inflight.items() if count >= max_inflight
+            }
+            if saturated:
+                exclude = saturated | exclude if exclude else saturated
 
-        # 找到最大额度
-        max_quota = max(t.quota for t in available)
+        name = normalize_strategy(strategy) if strategy else self.strategy
+        impl = self.get_strategy(name)
+        token = impl.select(self, exclude)
+        if token is not None:
+            impl.hits += 1
+            self._selected_by[token.token] = name
+        return token
 
-        # 筛选最大额度
-        candidates = [t for t in available if t.quota == max_quota]
+    def acquire(self, token_str: str) -> int:
+        """在途请求计数 +1，返回当前计数"""
+        count = self._inflight.get(token_str, 0) + 1
+        self._inflight[token_str] = count
+        return count
 
-        # 随机选择
-        return random.choice(candidates)
+    def release(self, token_str: str):
+        """在途请求计数 -1"""
+        count = self._inflight.get(token_str, 0) - 1
+        if count > 0:
+            self._inflight[token_str] = count
+        else:
+            self._inflight.pop(token_str, None)
+
+    def inflight(self, token_str: str) -> int:
+        """Token 当前在途请求数"""
+        return self._inflight.get(token_str, 0)
+
+    def get_inflight_stats(self) -> Dict[str, int]:
+        """在途请求统计"""
+        counts = self._inflight.values()
+        return {
+            "total": sum(counts),
+            "tokens": len(self._inflight),
+            "max": max(counts, default=0),
+        }
+
+    def get_strategy(self, name: str) -> SelectionStrategy:
+        """获取（或创建）本池的策略实例"""
+        impl = self._strategies.get(name)
+        if impl is None:
+            impl = self._strategies[name] = create_strategy(name)
+        return impl
+
+    def set_strategy(self, name: str):
+        """设置默认选择策略"""
+        self.strategy = normalize_strategy(name)
+
+    def record_rate_limited(self, token_str: str):
+        """将 429 计入选中该 Token 的策略"""
+        name = self._selected_by.get(token_str)
+        if name and name in self._strategies:
+            self._strategies[name].rate_limited += 1
+
+    def get_strategy_stats(self) -> Dict[str, dict]:
+        """各策略命中/429 统计"""
+        return {name: impl.stats() for name, impl in self._strategies.items()}
+
+    def _select_max_quota(self, exclude: set = None) -> Optional[TokenInfo]:
+        """
+        最大额度策略:
+        1. 选择 active 状态且有配额的 token
+        2. 优先选择剩余额度最多的
+        3. 如果额度相同，随机选择（避免并发冲突）
+
+        基于额度分桶索引，从最高额度桶开始查找，无需全量扫描
+        """
+        for i in range(len(self._quotas) - 1, -1, -1):
+            token = self._buckets[self._quotas[i]].choice(exclude)
+            if token is not None:
+                return token
+        return None
 
     def count(self) -> int:
         """Token 数量"""
         return len(self._tokens)
 
+    def available_count(self) -> int:
+        """可用 Token 数量（active 且有配额）"""
+        return len(self._indexed)
+
     def list(self) -> List[TokenInfo]:
         """获取所有 Token"""
         return list(self._tokens.values())
@@ -85,9 +227,66 @@ class TokenPool:
 
         return stats
 
+    def _reindex(self, token: TokenInfo):
+        """根据 Token 当前 quota/status 更新索引（由 TokenInfo 字段变更回调）"""
+        if self._tokens.get(token.token) is not token:
+            return
+
+        target = (
+            token.quota
+            if token.status == TokenStatus.ACTIVE and token.quota > 0
+            else None
+        )
+        current = self._indexed.get(token.token)
+        if current == target:
+            return
+
+        if current is not None:
+            self._unindex(token.token, notify=target is None)
+        if target is None:
+            return
+
+        bucket = self._buckets.get(target)
+        if bucket is None:
+            bucket = self._buckets[target] = _TokenBucket()
+            bisect.insort(self._quotas, target)
+        bucket.add(token)
+        self._indexed[token.token] = target
+        if current is None:
+            self._available.add(token)
+            for impl in self._strategies.values():
+                impl.on_available(token)
+
+    def _unindex(self, token_str: str, notify: bool = True):
+        """从索引中移除 Token（notify=False 表示仅在额度桶之间移动）"""
+        quota = self._indexed.pop(token_str, None)
+        if quota is None:
+            return
+        if notify:
+            self._available.discard(token_str)
+            self._selected_by.pop(token_str, None)
+            for impl in self._strategies.values():
+                impl.on_unavailable(token_str)
+        bucket = self._buckets[quota]
+        bucket.discard(token_str)
+        if not bucket:
+            del self._buckets[quota]
+            idx = bisect.bisect_left(self._quotas, quota)
+            if idx < len(self._quotas) and self._quotas[idx] == quota:
+                self._quotas.pop(idx)
+
     def _rebuild_index(self):
-        """重建索引（预留接口，用于加载时调用）"""
-        pass
+        """重建索引（加载时调用，或在绕过字段回调修改数据后修复）"""
+        self._buckets = {}
+        self._quotas = []
+        self._indexed = {}
+        self._available = _TokenBucket()
+        self._selected_by = {}
+        for impl in self._strategies.values():
+            impl.reset()
+        for token in self._tokens.values():
+            token._index_hook = self._reindex
+            self._reindex(token)
 
     def __iter__(self) -> Iterator[TokenInfo]:
         return iter(self._tokens.values())
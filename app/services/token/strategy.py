@@ -0,0 +1,250 @@
+"""
+Token 选择策略
+
+每个 TokenPool 为每种策略维护独立实例（各自的状态与命中/429 计数）。
+
+策略:
+- max_quota: 优先剩余额度最多的 Token，同额度随机（默认）
+- lru: 最久未被使用的 Token 优先
+- weighted_random: 按剩余额度加权随机
+- p2c: 随机抽取两个 Token，取负载（在途请求数）更低者（power-of-two-choices）
+- round_robin: 在可用 Token 之间轮询
+"""
+
+import random
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Type
+
+from app.services.token.models import TokenInfo
+
+if TYPE_CHECKING:
+    from app.services.token.pool import TokenPool
+
+
+DEFAULT_STRATEGY = "max_quota"
+
+# 排除集合命中时随机重采样的次数上限
+_MAX_SAMPLE_ATTEMPTS = 8
+
+
+class SelectionStrategy:
+    """选择策略基类"""
+
+    name = ""
+
+    def __init__(self):
+        self.hits = 0
+        self.rate_limited = 0
+
+    def select(
+        self, pool: "TokenPool", exclude: Optional[set] = None
+    ) -> Optional[TokenInfo]:
+        """从池中选择一个可用 Token"""
+        raise NotImplementedError
+
+    def on_available(self, token: TokenInfo):
+        """Token 变为可用时回调"""
+        pass
+
+    def on_unavailable(self, token_str: str):
+        """Token 变为不可用（或被删除）时回调"""
+        pass
+
+    def reset(self):
+        """池索引重建时清理内部状态（保留统计）"""
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        """命中/429 统计"""
+        rate = self.rate_limited / self.hits if self.hits else 0.0
+        return {
+            "hits": self.hits,
+            "rate_limited": self.rate_limited,
+            "rate_limited_ratio": round(rate, 4),
+        }
+
+
+class MaxQuotaStrategy(SelectionStrategy):
+    """优先最大额度，同额度随机"""
+
+    name = "max_quota"
+
+    def select(self, pool, exclude=None):
+        return pool._select_max_quota(exclude)
+
+
+class LRUStrategy(SelectionStrategy):
+    """最久未使用优先（按 last_used_at 初始化，之后按本策略的选取顺序维护）"""
+
+    name = "lru"
+
+    def __init__(self):
+        super().__init__()
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+        self._seeded = False
+
+    def _seed(self, pool: "TokenPool"):
+        tokens = sorted(pool._available.items, key=lambda t: t.last_used_at or 0)
+        self._order = OrderedDict((t.token, None) for t in tokens)
+        self._seeded = True
+
+    def select(self, pool, exclude=None):
+        if not self._seeded:
+            self._seed(pool)
+
+        chosen = None
+        for token_str in self._order:
+            if exclude and token_str in exclude:
+                continue
+            chosen = token_str
+            break
+
+        if chosen is None:
+            return None
+        self._order.move_to_end(chosen)
+        return pool.get(chosen)
+
+    def on_available(self, token):
+        if not self._seeded:
+            return
+        # 刚恢复/新加入的 Token 已空闲一段时间，放到队首
+        self._order[token.token] = None
+        self._order.move_to_end(token.token, last=False)
+
+    def on_unavailable(self, token_str):
+        self._order.pop(token_str, None)
+
+    def reset(self):
+        self._order = OrderedDict()
+        self._seeded = False
+
+
+class WeightedRandomStrategy(SelectionStrategy):
+    """按剩余额度加权随机（先按 quota*数量 选桶，再在桶内随机）"""
+
+    name = "weighted_random"
+
+    def select(self, pool, exclude=None):
+        quotas = pool._quotas
+        if not quotas:
+            return None
+
+        weights = [q * len(pool._buckets[q]) for q in quotas]
+        for _ in range(_MAX_SAMPLE_ATTEMPTS):
+            quota = random.choices(quotas, weights=weights)[0]
+            token = pool._buckets[quota].choice(exclude)
+            if token is not None:
+                return token
+
+        candidates = [
+            t for t in pool._available.items if not exclude or t.token not in exclude
+        ]
+        if not candidates:
+            return None
+        return random.choices(candidates, weights=[t.quota for t in candidates])[0]
+
+
+class PowerOfTwoStrategy(SelectionStrategy):
+    """随机抽取两个 Token，选择负载更低者（在途请求更少、额度更高、最近选取更早）"""
+
+    name = "p2c"
+
+    def __init__(self):
+        super().__init__()
+        self._picked_at: Dict[str, float] = {}
+
+    def _score(self, pool: "TokenPool", token: TokenInfo) -> tuple:
+        return (
+            -pool.inflight(token.token),
+            token.quota,
+            -self._picked_at.get(token.token, 0.0),
+        )
+
+    def select(self, pool, exclude=None):
+        first = pool._available.choice(exclude)
+        if first is None:
+            return None
+        second = pool._available.choice(exclude)
+        chosen = first
+        if second is not None and second is not first:
+            if self._score(pool, second) > self._score(pool, first):
+                chosen = second
+        self._picked_at[chosen.token] = time.monotonic()
+        return chosen
+
+    def on_unavailable(self, token_str):
+        self._picked_at.pop(token_str, None)
+
+    def reset(self):
+        self._picked_at = {}
+
+
+class RoundRobinStrategy(SelectionStrategy):
+    """在可用 Token 之间轮询"""
+
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self._cursor = 0
+
+    def select(self, pool, exclude=None):
+        items = pool._available.items
+        size = len(items)
+        for step in range(size):
+            idx = (self._cursor + step) % size
+            token = items[idx]
+            if exclude and token.token in exclude:
+                continue
+            self._cursor = idx + 1
+            return token
+        return None
+
+    def reset(self):
+        self._cursor = 0
+
+
+STRATEGIES: Dict[str, Type[SelectionStrategy]] = {
+    cls.name: cls
+    for cls in (
+        MaxQuotaStrategy,
+        LRUStrategy,
+        WeightedRandomStrategy,
+        PowerOfTwoStrategy,
+        RoundRobinStrategy,
+    )
+}
+
+
+def normalize_strategy(name: Optional[str]) -> str:
+    """规范化策略名，未知策略回退到默认"""
+    key = str(name or "").strip().lower().replace("-", "_")
+    aliases = {
+        "least_recently_used": "lru",
+        "weighted": "weighted_random",
+        "power_of_two": "p2c",
+        "power_of_two_choices": "p2c",
+        "rr": "round_robin",
+    }
+    key = aliases.get(key, key)
+    return key if key in STRATEGIES else DEFAULT_STRATEGY
+
+
+def create_strategy(name: str) -> SelectionStrategy:
+    """创建策略实例"""
+    return STRATEGIES[normalize_strategy(name)]()
+
+
+__all__ = [
+    "SelectionStrategy",
+    "MaxQuotaStrategy",
+    "LRUStrategy",
+    "WeightedRandomStrategy",
+    "PowerOfTwoStrategy",
+    "RoundRobinStrategy",
+    "STRATEGIES",
+    "DEFAULT_STRATEGY",
+    "normalize_strategy",
+    "create_strategy",
+]
@@ -3,6 +3,11 @@ let currentConfig = {};
 const byId = (id) => document.getElementById(id);
 const NUMERIC_FIELDS = new Set([
   'timeout',
+  'session_pool_size',
+  'session_max_clients',
+  'session_max_age_sec',
+  'stream_coalesce_ms',
+  'stream_coalesce_bytes',
   'max_retry',
   'retry_backoff_base',
   'retry_backoff_factor',
@@ -12,9 +17,12 @@ const NUMERIC_FIELDS = new Set([
   'super_refresh_interval_hours',
   'fail_threshold',
   'limit_mb',
+  'upload_cache_ttl_sec',
+  'upload_cache_max_entries',
   'save_delay_ms',
   'assets_max_concurrent',
   'media_max_concurrent',
+  'upload_max_concurrent',
   'usage_max_concurrent',
   'assets_delete_batch_size',
   'assets_batch_size',
@@ -22,14 +30,25 @@ const NUMERIC_FIELDS = new Set([
   'usage_batch_size',
   'usage_max_tokens',
   'reload_interval_sec',
+  'sync_interval_ms',
+  'quota_lease_units',
+  'quota_lease_ms',
+  'max_inflight_per_token',
   'stream_idle_timeout',
   'video_idle_timeout',
   'image_ws_blocked_seconds',
   'image_ws_final_min_bytes',
   'image_ws_medium_min_bytes',
+  'image_ws_hedge_percentile',
+  'image_ws_hedge_delay',
   'nsfw_max_concurrent',
   'nsfw_batch_size',
   'nsfw_max_tokens',
+  'batch_adaptive_max_scale',
+  'batch_latency_tolerance',
+  'token_rate',
+  'token_burst',
+  'max_wait',
   'max_message_length'
 ]);
 
@@ -46,7 +65,10 @@ const LOCALE_MAP = {
     "label": "网络配置",
     "timeout": { title: "请求超时", desc: "请求 Grok 服务的超时时间（秒）。" },
     "base_proxy_url": { title: "基础代理 URL", desc: "代理请求到 Grok 官网的基础服务地址。" },
-    "asset_proxy_url": { title: "资源代理 URL", desc: "代理请求到 Grok 官网的静态资源（图片/视频）地址。" }
+    "asset_proxy_url": { title: "资源代理 URL", desc: "代理请求到 Grok 官网的静态资源（图片/视频）地址。" },
+    "session_pool_size": { title: "会话池大小", desc: "每组浏览器指纹与代理最多复用的上游会话数，0 表示每次请求新建会话。" },
+    "session_max_clients": { title: "会话并发上限", desc: "单个上游会话的并发请求数上限，满载后新建会话。" },
+    "session_max_age_sec": { title: "会话最长存活", desc: "上游会话最长存活时间（秒），到期后重建，0 表示不限制。" }
   },
   "security": {
     "label": "反爬虫验证",
@@ -63,7 +85,9 @@ const LOCALE_MAP = {
     "dynamic_statsig": { title: "动态指纹", desc: "是否启用动态生成 Statsig 值。" },
     "filter_tags": { title: "过滤标签", desc: "自动过滤 Grok 响应中的特殊标签。" },
     "max_message_length": { title: "最大消息长度", desc: "单次请求的最大消息字符数，0 表示不限制。推荐 32000。" },
-    "auto_truncate_message": { title: "自动截断消息", desc: "当消息超过长度限制时是否自动截断（保留前后部分）。" }
+    "auto_truncate_message": { title: "自动截断消息", desc: "当消息超过长度限制时是否自动截断（保留前后部分）。" },
+    "stream_coalesce_ms": { title: "流式合并时长", desc: "流式响应合并发送的最长缓冲时间（毫秒），0 表示逐事件发送。" },
+    "stream_coalesce_bytes": { title: "流式合并字节", desc: "流式响应缓冲达到该字节数时立即发送。" }
   },
   "retry": {
     "label": "重试策略",
@@ -85,7 +109,10 @@ const LOCALE_MAP = {
     "image_ws_nsfw": { title: "NSFW 模式", desc: "WebSocket 请求是否启用 NSFW。" },
     "image_ws_blocked_seconds": { title: "Blocked 阈值", desc: "收到中等图后超过该秒数仍无最终图则判定 blocked。" },
     "image_ws_final_min_bytes": { title: "最终图最小字节", desc: "判定最终图的最小字节数（通常 JPG > 100KB）。" },
-    "image_ws_medium_min_bytes": { title: "中等图最小字节", desc: "判定中等质量图的最小字节数。" }
+    "image_ws_medium_min_bytes": { title: "中等图最小字节", desc: "判定中等质量图的最小字节数。" },
+    "image_ws_hedge": { title: "对冲请求", desc: "非流式生成时，迟迟没有图片则在另一个 Token 上发起备用请求，凑齐后关闭其余连接。" },
+    "image_ws_hedge_percentile": { title: "对冲分位数", desc: "对冲等待时间取首张中等图延迟的该分位数（样本足够时）。" },
+    "image_ws_hedge_delay": { title: "默认对冲等待", desc: "延迟样本不足时的对冲等待秒数。" }
   },
   "token": {
     "label": "Token 池管理",
@@ -94,19 +121,34 @@ const LOCALE_MAP = {
     "super_refresh_interval_hours": { title: "Super 刷新间隔", desc: "Super Token 刷新的时间间隔（小时）。" },
     "fail_threshold": { title: "失败阈值", desc: "单个 Token 连续失败多少次后被标记为不可用。" },
     "save_delay_ms": { title: "保存延迟", desc: "Token 变更合并写入的延迟（毫秒）。" },
-    "reload_interval_sec": { title: "同步间隔", desc: "多 worker 场景下 Token 状态刷新间隔（秒）。" }
+    "reload_interval_sec": { title: "同步间隔", desc: "多 worker 场景下 Token 状态刷新间隔（秒）。" },
+    "sync_interval_ms": { title: "增量同步间隔", desc: "基于存储变更订阅的增量同步间隔（毫秒），0 表示每次请求都检查。" },
+    "atomic_quota": { title: "原子配额记账", desc: "在 Redis 中原子扣减配额与计数，多 worker 共享准确用量（仅 Redis 存储生效）。" },
+    "quota_lease_units": { title: "配额租约额度", desc: "原子记账每次预留的额度，租约内在本地扣费以减少 Redis 往返。" },
+    "quota_lease_ms": { title: "配额租约时长", desc: "租约有效期（毫秒），到期后归还未使用的额度。" },
+    "selection_strategy": { title: "选择策略", desc: "Token 选择策略：最大额度、最久未用、按额度加权随机、二选一、轮询。" },
+    "pool_strategies": { title: "池策略覆盖", desc: "按池覆盖选择策略，格式 \"池名:策略\"，例如 [\"ssoBasic:p2c\"]。" },
+    "max_inflight_per_token": { title: "单 Token 并发上限", desc: "单个 Token 同时进行中的请求数上限，达到上限时选择其他 Token，0 表示不限制。" }
   },
   "cache": {
     "label": "缓存管理",
     "enable_auto_clean": { title: "自动清理", desc: "是否启用缓存自动清理，开启后按上限自动回收。" },
-    "limit_mb": { title: "清理阈值", desc: "缓存大小阈值（MB），超过阈值会触发清理。" }
+    "limit_mb": { title: "清理阈值", desc: "缓存大小阈值（MB），超过阈值会触发清理。" },
+    "eviction_policy": { title: "淘汰策略", desc: "超出上限时的淘汰策略：lru（最久未访问优先）、lfu（访问次数最少优先）。" },
+    "upload_cache_ttl_sec": { title: "上传缓存有效期", desc: "相同附件在同一 Token 下复用已上传文件的时长（秒），0 表示禁用。" },
+    "upload_cache_max_entries": { title: "上传缓存条目数", desc: "附件上传缓存的最大条目数，超出后按最近使用淘汰。" },
+    "shared_download_lock": { title: "共享下载锁", desc: "使用 Redis 分布式锁合并跨 worker 的同一文件下载（仅 Redis 存储生效）。" }
   },
   "performance": {
     "label": "并发性能",
     "media_max_concurrent": { title: "Media 并发上限", desc: "视频/媒体生成请求的并发上限。推荐 50。" },
+    "upload_max_concurrent": { title: "附件上传并发", desc: "单次对话中附件并发上传的数量上限。" },
     "nsfw_max_concurrent": { title: "NSFW 开启并发上限", desc: "批量开启 NSFW 模式时的并发请求上限。推荐 10。" },
     "nsfw_batch_size": { title: "NSFW 开启批量大小", desc: "批量开启 NSFW 模式的单批处理数量。推荐 50。" },
     "nsfw_max_tokens": { title: "NSFW 开启最大数量", desc: "单次批量开启 NSFW 的 Token 数量上限，防止误操作。推荐 1000。" },
+    "batch_adaptive": { title: "自适应并发", desc: "批量操作按上游反馈调整并发：遇 429 减半、延迟升高时收缩，正常时逐步增加。" },
+    "batch_adaptive_max_scale": { title: "自适应并发倍数", desc: "自适应并发的上限为各操作并发上限乘以该倍数。" },
+    "batch_latency_tolerance": { title: "延迟容忍倍数", desc: "一个往返内请求延迟中位数超过基线（历次往返中位数的最小值）该倍数时收缩并发。" },
     "usage_max_concurrent": { title: "Token 刷新并发上限", desc: "批量刷新 Token 用量时的并发请求上限。推荐 25。" },
     "usage_batch_size": { title: "Token 刷新批次大小", desc: "批量刷新 Token 用量的单批处理数量。推荐 50。" },
     "usage_max_tokens": { title: "Token 刷新最大数量", desc: "单次批量刷新 Token 用量时的处理数量上限。推荐 1000。" },
@@ -114,6 +156,14 @@ const LOCALE_MAP = {
     "assets_batch_size": { title: "Assets 处理批次大小", desc: "批量查找/删除资产时的单批处理数量。推荐 10。" },
     "assets_max_tokens": { title: "Assets 处理最大数量", desc: "单次批量查找/删除资产时的处理数量上限。推荐 1000。" },
     "assets_delete_batch_size": { title: "Assets 单账号删除批量大小", desc: "单账号批量删除资产时的单批并发数量。推荐 10。" }
+  },
+  "rate_limit": {
+    "label": "上游限流",
+    "enabled": { title: "启用限流", desc: "请求上游前按令牌桶排队，存储为 Redis 时多 worker 共享；默认未配置任何桶，不限流。" },
+    "families": { title: "接口族限流", desc: "格式 \"接口族:每秒请求数:突发量\"，接口族为 chat/usage/assets/media/imagine，例如 [\"chat:20:40\", \"media:5:10\"]。" },
+    "token_rate": { title: "单 Token 速率", desc: "单个 Token 每秒请求数（各接口族合计），0 表示不限制，例如 1。" },
+    "token_burst": { title: "单 Token 突发量", desc: "单个 Token 令牌桶容量。" },
+    "max_wait": { title: "排队等待上限", desc: "需要排队超过该秒数（秒）时直接返回 429，不请求上游。" }
   }
 };
 
@@ -340,6 +390,15 @@ function buildFieldCard(section, key, val) {
       { val: 'base64', text: 'Base64' }
     ]);
   }
+  else if (key === 'selection_strategy') {
+    built = buildSelectInput(section, key, val, [
+      { val: 'max_quota', text: '最大额度 (max_quota)' },
+      { val: 'lru', text: '最久未用 (lru)' },
+      { val: 'weighted_random', text: '加权随机 (weighted_random)' },
+      { val: 'p2c', text: '二选一 (p2c)' },
+      { val: 'round_robin', text: '轮询 (round_robin)' }
+    ]);
+  }
   else if (key === 'video_format') {
     built = buildSelectInput(section, key, val, [
       { val: 'html', text: 'HTML' },
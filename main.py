@@ -70,6 +70,16 @@ async def lifespan(app: FastAPI):
         scheduler = get_scheduler(interval)
         scheduler.start()
 
+    # 5. 打开媒体缓存索引（首次启动时导入已有缓存文件）
+    from app.services.grok.utils.media_cache import get_media_cache_index
+
+    await asyncio.to_thread(get_media_cache_index().ensure_ready)
+
+    # 6. 批量任务看门狗（接管崩溃 worker 遗留的任务、清理过期任务）
+    from app.core.batch_tasks import start_watchdog, stop_watchdog
+
+    start_watchdog()
+
     logger.info("Application startup complete.")
     asyncio.create_task(_cleanup_tmp_files())
     yield
@@ -77,7 +87,25 @@ async def lifespan(app: FastAPI):
     # 关闭
     logger.info("Shutting down Grok2API...")
 
+    stop_watchdog()
+
     from app.core.storage import StorageFactory
+    from app.services.token.manager import TokenManager
+
+    if TokenManager._instance:
+        try:
+            await TokenManager._instance.flush()
+        except Exception as e:
+            logger.warning(f"Token flush on shutdown failed: {e}")
+
+    from app.services.grok.utils.session_pool import close_session_pool
+
+    await close_session_pool()
+
+    from app.services.grok.utils.media_cache import get_media_cache_index
+
+    # 写入内存中尚未落盘的缓存访问记录
+    await asyncio.to_thread(get_media_cache_index().flush_touches)
 
     if StorageFactory._instance:
         await StorageFactory._instance.close()
@@ -89,27 +117,21 @@ async def lifespan(app: FastAPI):
 
 async def _cleanup_tmp_files():
     """定期清理 data/tmp 下超过 30 分钟的缓存图片/视频，防止 Zeabur 等容器磁盘积累"""
-    from app.core.storage import DATA_DIR
+    from app.services.grok.utils.media_cache import get_media_cache_index
 
-    dirs = [DATA_DIR / "tmp" / "image", DATA_DIR / "tmp" / "video"]
+    index = get_media_cache_index()
     interval = 900  # 每 15 分钟运行一次
     ttl = 1800  # 超过 30 分钟的文件删除
 
     while True:
         await asyncio.sleep(interval)
         cutoff = time.time() - ttl
-        deleted = 0
-        for d in dirs:
-            if not d.exists():
-                continue
-            for f in d.glob("*"):
-                if f.is_file():
-                    try:
-                        if f.stat().st_mtime < cutoff:
-                            f.unlink()
-                            deleted += 1
-                    except Exception:
-                        pass
+        try:
+            # 按索引中的创建时间查询过期文件，无需遍历目录
+            deleted, _ = await asyncio.to_thread(index.expire, cutoff)
+        except Exception as e:
+            logger.warning(f"Tmp cleanup failed: {e}")
+            continue
         if deleted:
             logger.info(f"Tmp cleanup: removed {deleted} file(s) older than {ttl}s")
 
@@ -0,0 +1,133 @@
+"""
+批量执行并发池基准（模拟上游）
+
+模拟一个并发容量有限的上游：在途请求超过容量时直接返回 429，负载越高单次延迟越长，
+少量请求会卡住很久（慢 token）。对比旧版分批 gather（每批等最慢的一项）与
+持续补位的并发池（固定并发 / AIMD 自适应并发）的总耗时、成功数与 429 数。
+
+时间按 --scale 缩放（默认 0.01，即模拟的 1 秒 = 10 毫秒）。
+
+Usage:
+    python tests/bench_batch.py --items 1000 --capacity 60 --concurrency 25
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+class SimulatedUpstream:
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.inflight = 0
+        self.throttled = 0
+
+    async def call(self, item: str):
+        from app.core.exceptions import UpstreamException
+
+        args = self.args
+        self.inflight += 1
+        try:
+            if self.inflight > args.capacity:
+                await asyncio.sleep(0.05 * args.scale)
+                self.throttled += 1
+                raise UpstreamException("Too Many Requests", details={"status": 429})
+            if self.rng.random() < args.slow_rate:
+                latency = args.slow_seconds
+            else:
+                # 负载越接近容量延迟越高
+                load = self.inflight / args.capacity
+                latency = self.rng.lognormvariate(-0.7, 0.3) * (1 + 2 * load * load)
+            await asyncio.sleep(latency * args.scale)
+            return True
+        finally:
+            self.inflight -= 1
+
+
+async def legacy_run_in_batches(items, worker, *, max_concurrent, batch_size):
+    """旧版实现：分批 gather，每批等待最慢的一项"""
+    sem = asyncio.Semaphore(max_concurrent)
+
+    async def _one(item):
+        async with sem:
+            try:
+                return item, {"ok": True, "data": await worker(item)}
+            except Exception as e:
+                return item, {"ok": False, "error": str(e)}
+
+    results = {}
+    for i in range(0, len(items), batch_size):
+        pairs = await asyncio.gather(*(_one(x) for x in items[i : i + batch_size]))
+        results.update(dict(pairs))
+    return results
+
+
+async def _measure(name: str, run, args):
+    upstream = SimulatedUpstream(args, random.Random(args.seed))
+    items = [f"token-{i}" for i in range(args.items)]
+    start = time.monotonic()
+    results = await run(items, upstream.call)
+    elapsed = (time.monotonic() - start) / args.scale
+    ok = sum(1 for r in results.values() if r["ok"])
+    print(
+        f"{name:<10}  time={elapsed:8.1f}s  ok={ok:>5}/{len(items)}  "
+        f"429={upstream.throttled:>5}  rate={ok / elapsed:6.1f}/s"
+    )
+
+
+async def main_async(args) -> int:
+    from app.core.config import config
+    from app.services.grok.utils import batch
+
+    def run_pool(adaptive: bool):
+        async def _run(items, worker):
+            config._config = {
+                "performance": {
+                    "batch_adaptive": adaptive,
+                    "batch_adaptive_max_scale": args.max_scale,
+                    "batch_latency_tolerance": args.latency_tolerance,
+                }
+            }
+            return await batch.run_in_batches(
+                items, worker, max_concurrent=args.concurrency, batch_size=args.batch_size
+            )
+
+        return _run
+
+    async def run_legacy(items, worker):
+        return await legacy_run_in_batches(
+            items, worker, max_concurrent=args.concurrency, batch_size=args.batch_size
+        )
+
+    await _measure("legacy", run_legacy, args)
+    await _measure("pool", run_pool(False), args)
+    await _measure("adaptive", run_pool(True), args)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark batch worker pool")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=25, help="configured max_concurrent")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--capacity", type=int, default=60, help="upstream concurrency before 429")
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--slow-seconds", type=float, default=15.0)
+    parser.add_argument("--max-scale", type=float, default=4)
+    parser.add_argument("--latency-tolerance", type=float, default=2.0)
+    parser.add_argument("--scale", type=float, default=0.01, help="real seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,452 @@
+"""
+端到端基准测试（本地模拟上游）
+
+启动 tests/fake_grok.py 模拟上游与一个指向它的 Grok2API 实例（均为子进程，
+使用临时 DATA_DIR），按指定并发驱动 /v1/chat/completions、/v1/images/generations
+与视频生成流程，统计:
+
+- TTFB p50/p99（首个响应字节）
+- 总耗时 p50/p99
+- 输出速率（对话按内容增量数 / 秒，图片与视频按生成数量计；单请求速率仅统计流式响应）
+- 服务进程每请求 CPU 时间（读取 /proc，仅 Linux）
+
+资产下载地址在代码中固定为 assets.grok.com，服务子进程启动前将其替换为模拟上游地址。
+
+Usage:
+    python tests/bench_e2e.py --scenarios chat image video --concurrency 16 --requests 200
+    python tests/bench_e2e.py --scenarios chat --token-rate 0 --tokens 2000 --tokens-per-pool 50
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+import orjson
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from tests.fake_grok import add_fake_grok_arguments  # noqa: E402
+
+
+CHAT_MODEL = "grok-4.1-fast"
+IMAGE_MODEL = "grok-imagine-1.0"
+VIDEO_MODEL = "grok-imagine-1.0-video"
+TOKEN_POOLS = ("ssoBasic", "ssoSuper")
+
+
+@dataclass
+class Sample:
+    ok: bool
+    ttfb: float = 0.0
+    total: float = 0.0
+    units: int = 0
+    # 是否为流式响应（非流式请求的响应体几乎瞬间读完，不计单请求速率）
+    streamed: bool = False
+    error: str = ""
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    samples: List[Sample] = field(default_factory=list)
+    wall: float = 0.0
+    cpu: Optional[float] = None
+
+
+# ==================== 子进程 ====================
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _write_data_dir(data_dir: Path, app_port: int, fake_port: int, args) -> None:
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    config = f"""
+[app]
+app_url = "http://127.0.0.1:{app_port}"
+api_key = ""
+image_format = "url"
+video_format = "url"
+
+[network]
+grok_base_url = "{fake_url}"
+timeout = 60
+
+[chat]
+stream_coalesce_ms = {args.coalesce_ms}
+stream_coalesce_bytes = {args.coalesce_bytes}
+
+[token]
+auto_refresh = false
+selection_strategy = "{args.strategy}"
+
+[video]
+auto_upscale = false
+
+[cache]
+enable_auto_clean = false
+"""
+    (data_dir / "config.toml").write_text(config.strip() + "\n", encoding="utf-8")
+
+    tokens = {
+        pool: [
+            {"token": f"bench-{pool}-{i:05d}", "quota": 10_000_000}
+            for i in range(args.tokens_per_pool)
+        ]
+        for pool in TOKEN_POOLS
+    }
+    (data_dir / "token.json").write_bytes(orjson.dumps(tokens))
+
+
+def _start_fake(port: int, args) -> subprocess.Popen:
+    cmd = [
+        sys.executable,
+        str(ROOT / "tests" / "fake_grok.py"),
+        "--port",
+        str(port),
+        "--latency-ms",
+        str(args.latency_ms),
+        "--token-rate",
+        str(args.token_rate),
+        "--tokens",
+        str(args.tokens),
+        "--video-steps",
+        str(args.video_steps),
+        "--video-step-ms",
+        str(args.video_step_ms),
+        "--ws-images",
+        str(args.ws_images),
+        "--image-kb",
+        str(args.image_kb),
+        "--image-step-ms",
+        str(args.image_step_ms),
+        "--asset-kb",
+        str(args.asset_kb),
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT)
+
+
+def _start_app(port: int, fake_port: int, data_dir: Path, args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["DATA_DIR"] = str(data_dir)
+    env["LOG_LEVEL"] = args.app_log_level
+    env["SERVER_STORAGE_TYPE"] = "local"
+    cmd = [
+        sys.executable,
+        str(Path(__file__).resolve()),
+        "--serve-app",
+        "--app-port",
+        str(port),
+        "--fake-port",
+        str(fake_port),
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+def _serve_app(port: int, fake_port: int) -> int:
+    """子进程: 将资产地址指向模拟上游后启动服务"""
+    import uvicorn
+
+    from app.services.grok.processors import base as processor_base
+    from app.services.grok.services import assets
+
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    assets.DOWNLOAD_API = fake_url
+    processor_base.ASSET_URL = f"{fake_url}/"
+
+    from main import app
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    return 0
+
+
+async def _wait_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"port {port} not ready after {timeout}s")
+
+
+def _process_cpu(pid: int) -> Optional[float]:
+    """读取进程累计 CPU 时间（秒），非 Linux 返回 None"""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    fields = stat.rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks
+
+
+# ==================== 场景 ====================
+
+
+async def _read_sse(resp: aiohttp.ClientResponse, start: float) -> Sample:
+    ttfb = 0.0
+    deltas = 0
+    async for raw in resp.content:
+        if not ttfb:
+            ttfb = time.perf_counter() - start
+        line = raw.strip()
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        try:
+            chunk = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            continue
+        if "error" in chunk:
+            return Sample(ok=False, error=str(chunk["error"])[:80])
+        for choice in chunk.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                # 按上游内容增量计数（模拟上游每个 token 以空格结尾），
+                # 开启 stream_coalesce_ms 合并多个增量为一个 chunk 时结果不变
+                deltas += len(content.split())
+    return Sample(
+        ok=True,
+        ttfb=ttfb,
+        total=time.perf_counter() - start,
+        units=deltas,
+        streamed=True,
+    )
+
+
+async def run_chat(session: aiohttp.ClientSession, base: str, args) -> Sample:
+    body = {
+        "model": CHAT_MODEL,
+        "stream": True,
+        "messages": [{"role": "user", "content": "benchmark"}],
+    }
+    start = time.perf_counter()
+    async with session.post(f"{base}/v1/chat/completions", json=body) as resp:
+        if resp.status != 200:
+            return Sample(ok=False, error=f"HTTP {resp.status}")
+        return await _read_sse(resp, start)
+
+
+async def run_video(session: aiohttp.ClientSession, base: str, args) -> Sample:
+    body = {
+        "model": VIDEO_MODEL,
+        "stream": True,
+        "messages": [{"role": "user", "content": "benchmark video"}],
+    }
+    start = time.perf_counter()
+    async with session.post(f"{base}/v1/chat/completions", json=body) as resp:
+        if resp.status != 200:
+            return Sample(ok=False, error=f"HTTP {resp.status}")
+        sample = await _read_sse(resp, start)
+        # 视频按生成数量计
+        sample.units = 1 if sample.ok else 0
+        return sample
+
+
+async def run_image(session: aiohttp.ClientSession, base: str, args) -> Sample:
+    body = {
+        "model": IMAGE_MODEL,
+        "prompt": "benchmark image",
+        "n": args.image_n,
+        "response_format": "b64_json",
+    }
+    start = time.perf_counter()
+    async with session.post(f"{base}/v1/images/generations", json=body) as resp:
+        first = await resp.content.read(1)
+        ttfb = time.perf_counter() - start
+        rest = await resp.content.read()
+        if resp.status != 200:
+            return Sample(ok=False, error=f"HTTP {resp.status}")
+        data = orjson.loads(first + rest)
+        images = [d for d in data.get("data") or [] if d.get("b64_json")]
+        return Sample(
+            ok=bool(images),
+            ttfb=ttfb,
+            total=time.perf_counter() - start,
+            units=len(images),
+            error="" if images else "no images",
+        )
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "chat": run_chat,
+    "image": run_image,
+    "video": run_video,
+}
+
+
+async def run_scenario(
+    name: str, base: str, args, app_pid: int
+) -> ScenarioResult:
+    runner = SCENARIOS[name]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    result = ScenarioResult(name=name)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        for _ in range(args.warmup):
+            await runner(session, base, args)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for _ in range(args.requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    sample = await runner(session, base, args)
+                except Exception as e:
+                    sample = Sample(ok=False, error=f"{type(e).__name__}: {e}"[:80])
+                result.samples.append(sample)
+
+        cpu_before = _process_cpu(app_pid)
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        result.wall = time.perf_counter() - start
+        cpu_after = _process_cpu(app_pid)
+        if cpu_before is not None and cpu_after is not None:
+            result.cpu = cpu_after - cpu_before
+    return result
+
+
+# ==================== 报告 ====================
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[idx]
+
+
+def report(results: List[ScenarioResult]):
+    header = (
+        f"{'scenario':<8}  {'ok':>5}  {'err':>4}  {'ttfb p50':>9}  {'ttfb p99':>9}  "
+        f"{'total p50':>9}  {'total p99':>9}  {'units/s':>9}  {'per-req/s':>9}  {'cpu ms/req':>10}"
+    )
+    print(header)
+    for res in results:
+        ok = [s for s in res.samples if s.ok]
+        errors = [s for s in res.samples if not s.ok]
+        ttfb = [s.ttfb * 1000 for s in ok]
+        total = [s.total * 1000 for s in ok]
+        units = sum(s.units for s in ok)
+        rate = units / res.wall if res.wall > 0 else 0.0
+        per_stream = [
+            s.units / (s.total - s.ttfb)
+            for s in ok
+            if s.streamed and s.total - s.ttfb > 0 and s.units
+        ]
+        per_req = (
+            f"{statistics.median(per_stream):>9.1f}" if per_stream else f"{'n/a':>9}"
+        )
+        cpu = (
+            f"{res.cpu * 1000 / len(res.samples):>10.2f}"
+            if res.cpu is not None and res.samples
+            else f"{'n/a':>10}"
+        )
+        print(
+            f"{res.name:<8}  {len(ok):>5}  {len(errors):>4}  {_percentile(ttfb, 50):>9.1f}  "
+            f"{_percentile(ttfb, 99):>9.1f}  {_percentile(total, 50):>9.1f}  "
+            f"{_percentile(total, 99):>9.1f}  {rate:>9.1f}  {per_req}  {cpu}"
+        )
+        if errors:
+            reasons: Dict[str, int] = {}
+            for s in errors:
+                reasons[s.error] = reasons.get(s.error, 0) + 1
+            for reason, count in sorted(reasons.items(), key=lambda x: -x[1])[:3]:
+                print(f"          {count} x {reason}")
+
+
+async def _bench(args) -> int:
+    fake_port = args.fake_port or _free_port()
+    app_port = args.app_port or _free_port()
+
+    with tempfile.TemporaryDirectory(prefix="grok2api-bench-") as tmp:
+        data_dir = Path(tmp)
+        _write_data_dir(data_dir, app_port, fake_port, args)
+
+        fake = _start_fake(fake_port, args)
+        app = _start_app(app_port, fake_port, data_dir, args)
+        try:
+            await _wait_port(fake_port)
+            await _wait_port(app_port)
+
+            base = f"http://127.0.0.1:{app_port}"
+            print(
+                f"upstream latency={args.latency_ms}ms token_rate={args.token_rate}/s "
+                f"tokens={args.tokens} concurrency={args.concurrency} requests={args.requests}"
+            )
+            results = []
+            for name in args.scenarios:
+                results.append(await run_scenario(name, base, args, app.pid))
+            report(results)
+        finally:
+            for proc in (app, fake):
+                proc.terminate()
+            for proc in (app, fake):
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against a fake upstream")
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=["chat", "image", "video"],
+        choices=sorted(SCENARIOS),
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="warmup requests per scenario")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument("--image-n", type=int, default=2, help="images per generation request")
+    parser.add_argument("--tokens-per-pool", type=int, default=20)
+    parser.add_argument("--strategy", default="max_quota", help="token selection strategy")
+    parser.add_argument(
+        "--coalesce-ms", type=float, default=0, help="chat.stream_coalesce_ms (0 = off)"
+    )
+    parser.add_argument("--coalesce-bytes", type=int, default=4096)
+    parser.add_argument("--app-log-level", default="WARNING")
+    parser.add_argument("--app-port", type=int, default=0)
+    parser.add_argument("--fake-port", type=int, default=0)
+    parser.add_argument("--serve-app", action="store_true", help=argparse.SUPPRESS)
+    add_fake_grok_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        return _serve_app(args.app_port, args.fake_port)
+    return asyncio.run(_bench(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
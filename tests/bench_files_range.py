@@ -0,0 +1,182 @@
+"""
+/v1/files Range 与条件请求基准
+
+在临时 DATA_DIR 中生成视频文件，启动只挂载 files 路由的 uvicorn 子进程，
+并发发送随机 Range 请求（模拟播放器拖动）与 If-None-Match 重新验证，
+统计延迟分位、吞吐与状态码分布。--baseline 同时测试未做条件请求处理的
+原始 FileResponse 路由作为对照。
+
+Usage:
+    python tests/bench_files_range.py --size-mb 64 --requests 2000 --concurrency 32
+    python tests/bench_files_range.py --range-kb 1024 --revalidate 0.5 --baseline
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+VIDEO_NAME = "bench-video.mp4"
+
+
+def _serve(port: int) -> int:
+    """子进程：运行只包含 files 路由的应用"""
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import FileResponse
+
+    from app.api.v1.files import VIDEO_DIR, router
+
+    app = FastAPI()
+    app.include_router(router, prefix="/v1/files")
+
+    @app.get("/baseline/video/{filename}")
+    async def baseline(filename: str):
+        return FileResponse(VIDEO_DIR / filename, media_type="video/mp4")
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+    return 0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(session, url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.head(url) as resp:
+                if resp.status < 500:
+                    return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def _bench(
+    session, url: str, size: int, args
+) -> Tuple[List[float], Counter, int]:
+    """返回 (延迟列表 ms, 状态码计数, 读取字节数)"""
+    async with session.get(url, headers={"Range": "bytes=0-0"}) as resp:
+        etag = resp.headers.get("ETag")
+
+    rng = random.Random(args.seed)
+    range_len = args.range_kb * 1024
+    plan = []
+    for _ in range(args.requests):
+        if etag and rng.random() < args.revalidate:
+            plan.append({"If-None-Match": etag})
+        else:
+            start = rng.randrange(0, max(1, size - range_len))
+            plan.append({"Range": f"bytes={start}-{start + range_len - 1}"})
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    total = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for headers in plan:
+        queue.put_nowait(headers)
+
+    async def worker():
+        nonlocal total
+        while True:
+            try:
+                headers = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            async with session.get(url, headers=headers) as resp:
+                body = await resp.read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[resp.status] += 1
+            total += len(body)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies, statuses, total
+
+
+def _report(name: str, latencies: List[float], statuses: Counter, total: int, elapsed: float):
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    codes = " ".join(f"{k}={v}" for k, v in sorted(statuses.items()))
+    print(
+        f"{name:<10}  p50={p50:7.2f}ms  p99={p99:7.2f}ms  "
+        f"rps={len(latencies) / elapsed:8.1f}  MB/s={total / elapsed / 1e6:8.1f}  {codes}"
+    )
+
+
+async def main_async(args, port: int, size: int) -> int:
+    import aiohttp
+
+    base = f"http://127.0.0.1:{port}"
+    targets: Dict[str, str] = {"files": f"{base}/v1/files/video/{VIDEO_NAME}"}
+    if args.baseline:
+        targets = {"baseline": f"{base}/baseline/video/{VIDEO_NAME}", **targets}
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await _wait_ready(session, targets["files"])
+        for name, url in targets.items():
+            start = time.perf_counter()
+            latencies, statuses, total = await _bench(session, url, size, args)
+            _report(name, latencies, statuses, total, time.perf_counter() - start)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark /v1/files Range requests")
+    parser.add_argument("--size-mb", type=int, default=64, help="video file size")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--range-kb", type=int, default=512, help="bytes per Range request")
+    parser.add_argument(
+        "--revalidate", type=float, default=0.3, help="fraction of If-None-Match requests"
+    )
+    parser.add_argument("--baseline", action="store_true", help="also bench plain FileResponse")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return _serve(args.serve)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        video_dir = Path(data_dir) / "tmp" / "video"
+        video_dir.mkdir(parents=True)
+        size = args.size_mb * 1024 * 1024
+        with open(video_dir / VIDEO_NAME, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        port = _free_port()
+        env = {**os.environ, "DATA_DIR": data_dir}
+        server = subprocess.Popen(
+            [sys.executable, __file__, "--serve", str(port)], cwd=ROOT, env=env
+        )
+        try:
+            return asyncio.run(main_async(args, port, size))
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+"""
+图库元数据查询基准
+
+在临时 DATA_DIR 中生成 N 条图片元数据，对比旧版（全量加载 + Python 筛选/排序/分页）
+与索引查询的翻页、详情、哈希查找、统计耗时，并校验结果一致；
+最后对比整体读写（旧版）与逐图片写入单张图片的耗时。
+
+Usage:
+    python tests/bench_gallery.py --images 100000 --rounds 20
+    python tests/bench_gallery.py --storage sqlite   # SQLStorage (sqlite+aiosqlite)
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+MODELS = ["grok-imagine-1.0", "grok-imagine-1.0-edit", "local-import", "imported"]
+RATIOS = ["1:1", "2:3", "3:2", "16:9", "9:16"]
+TAGS = ["风景", "人物", "动漫", "城市", "夜景", "猫", "狗", "赛博朋克", "水彩", "本地导入"]
+WORDS = ["a cat", "sunset", "城市夜景", "cyberpunk street", "水彩风格", "portrait", "mountain lake"]
+
+
+def _build_images(count: int, seed: int):
+    rng = random.Random(seed)
+    now = int(time.time() * 1000)
+    images = []
+    for i in range(count):
+        image_id = f"{i:08x}-{rng.getrandbits(32):08x}"
+        images.append(
+            {
+                "id": image_id,
+                "filename": f"{image_id}.jpg",
+                "prompt": f"{rng.choice(WORDS)} {rng.choice(WORDS)} #{i}",
+                "model": rng.choice(MODELS),
+                "aspect_ratio": rng.choice(RATIOS),
+                "created_at": now - rng.randrange(0, 400 * 86400 * 1000),
+                "file_size": rng.randrange(50_000, 3_000_000),
+                "width": 1024,
+                "height": 1024,
+                "tags": rng.sample(TAGS, rng.randrange(0, 3)),
+                "nsfw": rng.random() < 0.05,
+                "metadata": {"content_hash": f"{rng.getrandbits(128):032x}"},
+                "quality_score": round(rng.uniform(0, 100), 1),
+                "blur_score": None,
+                "brightness_score": None,
+                "quality_issues": [],
+                "favorite": rng.random() < 0.1,
+            }
+        )
+    return images
+
+
+def _legacy_list(images, filters, page, page_size, sort_by="created_at", sort_order="desc"):
+    """旧版实现：逐条件列表推导 + 全量排序 + 切片"""
+    filtered = images
+    if filters.search:
+        s = filters.search.lower()
+        filtered = [i for i in filtered if s in i.get("prompt", "").lower()]
+    if filters.model:
+        filtered = [i for i in filtered if i.get("model") == filters.model]
+    if filters.aspect_ratio:
+        filtered = [i for i in filtered if i.get("aspect_ratio") == filters.aspect_ratio]
+    if filters.tags:
+        filtered = [i for i in filtered if any(t in i.get("tags", []) for t in filters.tags)]
+    if filters.start_date:
+        filtered = [i for i in filtered if i.get("created_at", 0) >= filters.start_date]
+    if filters.end_date:
+        filtered = [i for i in filtered if i.get("created_at", 0) <= filters.end_date]
+    if filters.nsfw is not None:
+        filtered = [i for i in filtered if i.get("nsfw", False) == filters.nsfw]
+    if filters.favorite is not None:
+        filtered = [i for i in filtered if i.get("favorite", False) == filters.favorite]
+    filtered = sorted(filtered, key=lambda x: x.get(sort_by, 0), reverse=sort_order == "desc")
+    start = (page - 1) * page_size
+    return len(filtered), [i["id"] for i in filtered[start : start + page_size]]
+
+
+def _legacy_stats(images, month_start_ts):
+    tag_counts = {}
+    models = {}
+    ratios = {}
+    for img in images:
+        for tag in img.get("tags", []):
+            tag_counts[tag] = tag_counts.get(tag, 0) + 1
+        models[img.get("model", "unknown")] = models.get(img.get("model", "unknown"), 0) + 1
+        ratio = img.get("aspect_ratio", "unknown")
+        ratios[ratio] = ratios.get(ratio, 0) + 1
+    return {
+        "total_count": len(images),
+        "total_size": sum(i.get("file_size", 0) for i in images),
+        "month_count": sum(1 for i in images if i.get("created_at", 0) >= month_start_ts),
+        "tags": tag_counts,
+        "models": models,
+        "aspect_ratios": ratios,
+    }
+
+
+async def _timed(fn, rounds: int):
+    start = time.perf_counter()
+    result = None
+    for _ in range(rounds):
+        result = await fn()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+async def main_async(args) -> int:
+    from app.core.storage import BaseStorage, SQLStorage, StorageFactory, get_storage
+    from app.services.gallery.models import ImageFilter
+    from app.services.gallery.service import get_image_metadata_service
+
+    if args.storage == "sqlite":
+        StorageFactory._instance = SQLStorage(
+            f"sqlite+aiosqlite:///{os.environ['DATA_DIR']}/bench.db"
+        )
+    storage = get_storage()
+    images = _build_images(args.images, args.seed)
+    await storage.save_image_metadata({"images": images, "version": "1.0"})
+
+    service = get_image_metadata_service()
+    start = time.perf_counter()
+    await service._ensure_index()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.0f} ms for {len(images)} images")
+
+    cases = {
+        "page 1": ImageFilter(),
+        "page 50": ImageFilter(),
+        "model+ratio": ImageFilter(model=MODELS[0], aspect_ratio="16:9"),
+        "tags": ImageFilter(tags=["猫", "赛博朋克"]),
+        "favorite": ImageFilter(favorite=True),
+        "search": ImageFilter(search="城市"),
+    }
+    print(f"{'case':<14}  {'legacy ms':>10}  {'index ms':>9}  {'speedup':>8}")
+    for name, filters in cases.items():
+        page = 50 if name == "page 50" else 1
+
+        async def legacy():
+            data = await storage.load_image_metadata()
+            return _legacy_list(data["images"], filters, page, 50)
+
+        async def indexed():
+            res = await service.list_images(filters=filters, page=page, page_size=50)
+            return res.total, [i.id for i in res.images]
+
+        legacy_ms, expected = await _timed(legacy, args.rounds)
+        index_ms, got = await _timed(indexed, args.rounds)
+        if got != expected:
+            print(f"{name}: result mismatch")
+            return 1
+        print(f"{name:<14}  {legacy_ms:>10.1f}  {index_ms:>9.2f}  {legacy_ms / index_ms:>7.0f}x")
+
+    target = images[len(images) // 2]
+
+    async def legacy_get():
+        data = await storage.load_image_metadata()
+        return next(i for i in data["images"] if i["id"] == target["id"])
+
+    async def legacy_hash():
+        data = await storage.load_image_metadata()
+        h = target["metadata"]["content_hash"]
+        return next(i for i in data["images"] if i["metadata"].get("content_hash") == h)
+
+    for name, legacy, indexed in (
+        ("get_image", legacy_get, lambda: service.get_image(target["id"])),
+        (
+            "by_hash",
+            legacy_hash,
+            lambda: service.find_image_by_hash(target["metadata"]["content_hash"]),
+        ),
+    ):
+        legacy_ms, _ = await _timed(legacy, args.rounds)
+        index_ms, got = await _timed(indexed, args.rounds)
+        if got is None or got.id != target["id"]:
+            print(f"{name}: result mismatch")
+            return 1
+        print(f"{name:<14}  {legacy_ms:>10.1f}  {index_ms:>9.2f}  {legacy_ms / index_ms:>7.0f}x")
+
+    now = datetime.now()
+    month_start_ts = int(datetime(now.year, now.month, 1).timestamp() * 1000)
+
+    async def legacy_stats():
+        data = await storage.load_image_metadata()
+        return _legacy_stats(data["images"], month_start_ts)
+
+    legacy_ms, expected = await _timed(legacy_stats, args.rounds)
+    index_ms, stats = await _timed(service.get_stats, args.rounds)
+    tags = {t["name"]: t["count"] for t in await service.get_all_tags()}
+    if (
+        stats.total_count != expected["total_count"]
+        or stats.total_size != expected["total_size"]
+        or stats.month_count != expected["month_count"]
+        or stats.models != expected["models"]
+        or stats.aspect_ratios != expected["aspect_ratios"]
+        or tags != expected["tags"]
+    ):
+        print("get_stats: result mismatch")
+        return 1
+    print(f"{'get_stats':<14}  {legacy_ms:>10.1f}  {index_ms:>9.2f}  {legacy_ms / index_ms:>7.0f}x")
+
+    # 单张图片写入：整体读写 vs 后端逐图片写入
+    print(f"{'write':<14}  {'blob ms':>10}  {'row ms':>9}  {'speedup':>8}")
+    flip = {"value": False}
+
+    async def blob_patch():
+        flip["value"] = not flip["value"]
+        return await BaseStorage.patch_image(storage, target["id"], {"favorite": flip["value"]})
+
+    async def row_patch():
+        flip["value"] = not flip["value"]
+        return await storage.patch_image(target["id"], {"favorite": flip["value"]})
+
+    blob_ms, _ = await _timed(blob_patch, args.rounds)
+    row_ms, got = await _timed(row_patch, args.rounds)
+    if got is None or got["favorite"] != flip["value"]:
+        print("patch_image: result mismatch")
+        return 1
+    print(f"{'patch_image':<14}  {blob_ms:>10.1f}  {row_ms:>9.2f}  {blob_ms / row_ms:>7.0f}x")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark gallery metadata queries")
+    parser.add_argument("--images", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--storage", choices=["local", "sqlite"], default="local")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["DATA_DIR"] = data_dir
+        return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+"""
+WebSocket 生图对冲请求基准（模拟上游）
+
+用模拟的 WebSocket 流替换 ImageService.stream：每路连接首张中等图的耗时服从长尾分布
+（多数请求正常，少数请求卡住），之后依次推送最终图。对比单路收集与 stream_hedged
+（超过延迟分位数仍无图片时在备用 token 上再发一路）的端到端延迟分位与平均连接数。
+
+时间按 --scale 缩放（默认 0.01，即模拟的 1 秒 = 10 毫秒）。
+
+Usage:
+    python tests/bench_image_hedge.py --requests 500 --stall-rate 0.1
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def _make_service(args, rng: random.Random):
+    from app.services.grok.services.image import ImageService
+
+    class SimulatedImageService(ImageService):
+        sockets = 0
+
+        def hedge_delay(self) -> float:
+            # 延迟样本按模拟秒记录，换算回真实等待时间
+            return self.simulated_hedge_delay() * args.scale
+
+        def simulated_hedge_delay(self) -> float:
+            return super().hedge_delay()
+
+        async def stream(self, token, prompt, aspect_ratio="2:3", n=1, enable_nsfw=True, max_retries=None):
+            self.sockets += 1
+            start = time.monotonic()
+            if rng.random() < args.stall_rate:
+                first = rng.uniform(args.stall_seconds / 2, args.stall_seconds)
+            else:
+                first = rng.lognormvariate(1.3, 0.3)  # 中位数约 3.7 秒
+            await asyncio.sleep(first * args.scale)
+            self.record_first_image_latency((time.monotonic() - start) / args.scale)
+            yield {"type": "image", "image_id": f"{token}-m", "stage": "medium", "is_final": False}
+            for i in range(n):
+                await asyncio.sleep(rng.uniform(1.0, 2.0) * args.scale)
+                yield {
+                    "type": "image",
+                    "image_id": f"{token}-{i}",
+                    "stage": "final",
+                    "is_final": True,
+                }
+
+    return SimulatedImageService()
+
+
+async def _collect(upstream, n: int) -> int:
+    finals = set()
+    async for item in upstream:
+        if item.get("is_final"):
+            finals.add(item["image_id"])
+    return min(len(finals), n)
+
+
+async def _run(service, args, hedged: bool):
+    counter = {"value": 0}
+
+    def pick_backup():
+        counter["value"] += 1
+        return f"backup-{counter['value']}"
+
+    latencies = []
+    service.sockets = 0
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with sem:
+            start = time.monotonic()
+            if hedged:
+                upstream = service.stream_hedged(
+                    f"token-{i}", "bench", n=args.n, pick_backup=pick_backup
+                )
+            else:
+                upstream = service.stream(f"token-{i}", "bench", n=args.n)
+            got = await _collect(upstream, args.n)
+            if got < args.n:
+                raise RuntimeError(f"request {i}: only {got} images")
+            latencies.append((time.monotonic() - start) / args.scale)
+
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    return latencies, service.sockets / args.requests
+
+
+def _report(name: str, latencies, sockets: float):
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]  # noqa: E731
+    print(
+        f"{name:<8}  p50={statistics.median(latencies):6.2f}s  p90={p(0.90):6.2f}s  "
+        f"p99={p(0.99):6.2f}s  max={latencies[-1]:6.2f}s  sockets/req={sockets:.2f}"
+    )
+
+
+async def main_async(args) -> int:
+    rng = random.Random(args.seed)
+    service = _make_service(args, rng)
+
+    # 预热延迟样本，使对冲等待时间取分位数
+    await _run(service, argparse.Namespace(**{**vars(args), "requests": 50}), hedged=False)
+    print(f"hedge delay: {service.simulated_hedge_delay():.2f}s")
+
+    plain, plain_sockets = await _run(service, args, hedged=False)
+    _report("plain", plain, plain_sockets)
+    hedged, hedged_sockets = await _run(service, args, hedged=True)
+    _report("hedged", hedged, hedged_sockets)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark hedged WebSocket image requests")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--n", type=int, default=4, help="images per request")
+    parser.add_argument("--stall-rate", type=float, default=0.1, help="fraction of stalled sockets")
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--scale", type=float, default=0.01, help="real seconds per simulated second")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,161 @@
+"""
+上游限流令牌桶基准（模拟上游）
+
+模拟一个按 token 与按接口限速的上游（各自为令牌桶，超出时返回 429），客户端按突发方式
+经 retry_on_status 发送请求（429 时按重试配置退避）。对比不限流（只在 429 后退避）与
+请求前按令牌桶排队两种方式的上游调用次数、429 数、成功数与端到端延迟。
+
+限流器按真实时间计时，模拟上游的速率按 --speed 放大（默认 10 倍），退避参数同比缩小。
+
+Usage:
+    python tests/bench_rate_limit.py --requests 600 --tokens 20
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+class Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SimulatedUpstream:
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.endpoint = Bucket(args.endpoint_rate * args.speed, args.endpoint_burst)
+        self.tokens = {}
+        self.calls = 0
+        self.throttled = 0
+
+    async def call(self, token: str):
+        from app.core.exceptions import UpstreamException
+
+        args = self.args
+        self.calls += 1
+        bucket = self.tokens.setdefault(
+            token, Bucket(args.token_rate * args.speed, args.token_burst)
+        )
+        # 两级都有余量才放行（与上游一致：先过接口限速，再过账号限速）
+        if not self.endpoint.take() or not bucket.take():
+            self.throttled += 1
+            await asyncio.sleep(0.02 / args.speed)
+            raise UpstreamException("Too Many Requests", details={"status": 429})
+        await asyncio.sleep(self.rng.lognormvariate(-1.0, 0.3) / args.speed)
+        return True
+
+
+async def _run(args, limited: bool):
+    from app.core.config import config
+    from app.services.grok.utils import rate_limit
+    from app.services.grok.utils.retry import retry_on_status
+
+    speed = args.speed
+    config._config = {
+        "retry": {
+            "max_retry": args.max_retry,
+            "retry_status_codes": [429],
+            "retry_backoff_base": 0.5 / speed,
+            "retry_backoff_factor": 2.0,
+            "retry_backoff_max": 30.0 / speed,
+            "retry_budget": 90.0 / speed,
+        },
+        "rate_limit": {
+            "enabled": limited,
+            "families": [f"chat:{args.endpoint_rate * speed}:{args.endpoint_burst}"],
+            "token_rate": args.token_rate * speed,
+            "token_burst": args.token_burst,
+            "max_wait": args.max_wait / speed,
+        },
+    }
+    rate_limit._LIMITER = None
+
+    rng = random.Random(args.seed)
+    upstream = SimulatedUpstream(args, rng)
+    tokens = [f"token-{i}" for i in range(args.tokens)]
+    latencies = []
+    failed = 0
+
+    async def one(i: int):
+        nonlocal failed
+        # 突发到达：每 --burst-every 秒一波
+        await asyncio.sleep((i // args.wave) * args.burst_every / speed)
+        token = tokens[rng.randrange(len(tokens))]
+        start = time.monotonic()
+        try:
+            await retry_on_status(
+                upstream.call, token, limit_family="chat", limit_token=token
+            )
+            latencies.append((time.monotonic() - start) * speed)
+        except Exception:
+            failed += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = (time.monotonic() - start) * speed
+    return upstream, latencies, failed, elapsed
+
+
+def _report(name: str, upstream, latencies, failed: int, elapsed: float):
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]  # noqa: E731
+    print(
+        f"{name:<8}  calls={upstream.calls:>5}  429={upstream.throttled:>5}  "
+        f"ok={len(latencies):>5}  failed={failed:>4}  "
+        f"p50={statistics.median(latencies):6.2f}s  p99={p(0.99):6.2f}s  total={elapsed:6.1f}s"
+    )
+
+
+async def main_async(args) -> int:
+    from app.core.logger import logger
+
+    # 重试耗尽会逐条打印错误日志，基准中关闭
+    logger.remove()
+
+    _report("reactive", *await _run(args, limited=False))
+    _report("bucket", *await _run(args, limited=True))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark upstream token-bucket rate limiting")
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--wave", type=int, default=150, help="requests per burst")
+    parser.add_argument("--burst-every", type=float, default=10.0, help="seconds between bursts")
+    parser.add_argument("--endpoint-rate", type=float, default=20.0, help="upstream requests/s per endpoint")
+    parser.add_argument("--endpoint-burst", type=float, default=40.0)
+    parser.add_argument("--token-rate", type=float, default=1.0, help="upstream requests/s per token")
+    parser.add_argument("--token-burst", type=float, default=10.0)
+    parser.add_argument("--max-retry", type=int, default=3)
+    parser.add_argument("--max-wait", type=float, default=30.0)
+    parser.add_argument("--speed", type=float, default=10.0, help="simulated seconds per real second")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+"""
+提示词全文检索基准
+
+在临时 DATA_DIR 中按不同规模生成图片元数据与提示词库，对比旧版（全量加载 + 逐条子串匹配）
+与全文索引（FTS5 + n-gram）的搜索耗时，观察索引耗时是否随规模保持平稳，
+并校验中文查询的命中集合与子串匹配一致。
+
+Usage:
+    python tests/bench_search.py --sizes 10000,50000,100000 --rounds 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+SUBJECTS = ["小猫", "柴犬", "少女", "机甲", "古城", "森林", "海边", "雪山", "街道", "花园", "宇航员", "巨龙"]
+STYLES = ["赛博朋克", "水彩", "油画", "浮世绘", "像素风", "电影感", "胶片", "极简", "蒸汽波", "国风"]
+SCENES = ["夜景", "日落", "雨天", "晨雾", "星空", "霓虹灯", "逆光", "黄昏"]
+WORDS = ["portrait", "cinematic", "ultra detailed", "8k", "soft light", "wide angle", "bokeh"]
+TAGS = ["风景", "人物", "动漫", "城市", "夜景", "猫", "狗", "赛博朋克", "水彩"]
+QUERIES = ["机甲 霓虹灯", "浮世绘风格的巨龙", "宇航员", "雪山晨雾"]
+
+
+def _text(rng: random.Random, i: int) -> str:
+    return (
+        f"{rng.choice(STYLES)}风格的{rng.choice(SUBJECTS)}，{rng.choice(SCENES)}，"
+        f"{rng.choice(SUBJECTS)}与{rng.choice(SUBJECTS)}，{rng.choice(WORDS)}, "
+        f"{rng.choice(WORDS)} #{i}"
+    )
+
+
+def _build(count: int, seed: int):
+    rng = random.Random(seed)
+    now = int(time.time() * 1000)
+    images, prompts = [], []
+    for i in range(count):
+        ts = now - rng.randrange(0, 400 * 86400 * 1000)
+        images.append(
+            {
+                "id": f"img-{i:08d}",
+                "filename": f"img-{i:08d}.jpg",
+                "prompt": _text(rng, i),
+                "model": "grok-imagine-1.0",
+                "aspect_ratio": "1:1",
+                "created_at": ts,
+                "file_size": 100_000,
+                "tags": rng.sample(TAGS, rng.randrange(0, 3)),
+                "metadata": {},
+            }
+        )
+        prompts.append(
+            {
+                "id": f"prompt-{i:08d}",
+                "title": f"{rng.choice(STYLES)}{rng.choice(SUBJECTS)}",
+                "content": _text(rng, i),
+                "category": "默认",
+                "tags": rng.sample(TAGS, rng.randrange(0, 3)),
+                "favorite": False,
+                "use_count": 0,
+                "created_at": ts,
+                "updated_at": ts,
+            }
+        )
+    return images, prompts
+
+
+def _substring_hits(query: str, texts) -> set:
+    """旧版语义：整个查询作为子串（按空白拆分后逐段 AND，与索引的多词查询对齐）"""
+    parts = query.lower().split()
+    return {key for key, text in texts if all(p in text for p in parts)}
+
+
+async def _timed(fn, rounds: int):
+    start = time.perf_counter()
+    result = None
+    for _ in range(rounds):
+        result = await fn()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+async def main_async(args) -> int:
+    from app.core.storage import get_storage
+    from app.services.gallery.models import ImageFilter
+    from app.services.gallery.service import get_image_metadata_service
+    from app.services.prompts.models import Prompt
+    from app.services.prompts.service import PromptService
+
+    storage = get_storage()
+    gallery = get_image_metadata_service()
+
+    print(f"{'size':>7}  {'case':<22}  {'hits':>6}  {'legacy ms':>10}  {'index ms':>9}")
+    for size in args.sizes:
+        images, prompts = _build(size, args.seed)
+        await storage.save_image_metadata({"images": images, "version": "1.0"})
+        await storage.save_prompts({"prompts": prompts, "version": "1.0"})
+        await gallery._ensure_index()
+        await PromptService()._ensure_index()
+
+        for query in QUERIES:
+            # 图库：第一页（按时间倒序）
+            async def legacy_gallery():
+                data = await storage.load_image_metadata()
+                parts = query.lower().split()
+                hits = [
+                    i for i in data["images"]
+                    if all(p in i.get("prompt", "").lower() for p in parts)
+                ]
+                hits.sort(key=lambda x: x.get("created_at", 0), reverse=True)
+                return len(hits), [i["id"] for i in hits[:50]]
+
+            async def indexed_gallery():
+                res = await gallery.list_images(
+                    filters=ImageFilter(search=query), page=1, page_size=50
+                )
+                return res.total, [i.id for i in res.images]
+
+            legacy_ms, expected = await _timed(legacy_gallery, args.rounds)
+            index_ms, got = await _timed(indexed_gallery, args.rounds)
+            if got != expected:
+                print(f"gallery '{query}': result mismatch ({got[0]} vs {expected[0]})")
+                return 1
+            print(
+                f"{size:>7}  {'gallery ' + query:<22}  {got[0]:>6}  "
+                f"{legacy_ms:>10.1f}  {index_ms:>9.2f}"
+            )
+
+            # 提示词库：全部命中（按相关度）
+            async def legacy_prompts():
+                data = await storage.load_prompts()
+                items = [Prompt(**p) for p in data.get("prompts", [])]
+                texts = [
+                    (p.id, "\n".join([p.title, p.content, " ".join(p.tags)]).lower())
+                    for p in items
+                ]
+                return _substring_hits(query, texts)
+
+            async def indexed_prompts():
+                res = await PromptService().get_all_prompts(search=query)
+                return {p.id for p in res.prompts}
+
+            legacy_ms, expected = await _timed(legacy_prompts, args.rounds)
+            index_ms, got = await _timed(indexed_prompts, args.rounds)
+            if got != expected:
+                print(f"prompts '{query}': result mismatch ({len(got)} vs {len(expected)})")
+                return 1
+            print(
+                f"{size:>7}  {'prompts ' + query:<22}  {len(got):>6}  "
+                f"{legacy_ms:>10.1f}  {index_ms:>9.2f}"
+            )
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark full-text prompt search")
+    parser.add_argument(
+        "--sizes",
+        type=lambda v: [int(x) for x in v.split(",")],
+        default=[10000, 100000],
+        help="library sizes (comma separated)",
+    )
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["DATA_DIR"] = data_dir
+        return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
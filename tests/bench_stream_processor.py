@@ -0,0 +1,273 @@
+"""
+StreamProcessor 微基准
+
+对比旧版逐行通用解析与快速路径（token 行字节级判断 + SSE 模板 + 分块合并）
+处理 NDJSON 流的耗时，并校验输出内容一致。
+
+Usage:
+    python tests/bench_stream_processor.py --lines 20000 --batch 1 4 16
+    python tests/bench_stream_processor.py --token "<grok:render>x</grok:render>"
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncGenerator, List
+
+import orjson
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.config import get_config  # noqa: E402
+from app.services.grok.processors.base import (  # noqa: E402
+    StreamIdleTimeoutError,
+    _normalize_stream_line,
+)
+from app.services.grok.processors.chat_processors import StreamProcessor  # noqa: E402
+
+
+def _build_lines(count: int, token: str) -> List[bytes]:
+    response_id = uuid.uuid4().hex
+    lines = [
+        orjson.dumps(
+            {
+                "result": {
+                    "response": {
+                        "token": "",
+                        "responseId": response_id,
+                        "llmInfo": {"modelHash": "bench"},
+                    }
+                }
+            }
+        )
+    ]
+    for _ in range(count):
+        lines.append(
+            orjson.dumps(
+                {
+                    "result": {
+                        "response": {
+                            "token": token,
+                            "isThinking": False,
+                            "isSoftStop": False,
+                            "responseId": response_id,
+                        }
+                    }
+                }
+            )
+        )
+    lines.append(
+        orjson.dumps(
+            {"result": {"response": {"modelResponse": {"responseId": response_id}}}}
+        )
+    )
+    return lines
+
+
+async def _legacy_idle_timeout(iterable, idle_timeout: float):
+    """旧版空闲超时包装：每个元素一次 asyncio.wait_for"""
+    if idle_timeout <= 0:
+        async for item in iterable:
+            yield item
+        return
+    iterator = iterable.__aiter__()
+    while True:
+        try:
+            item = await asyncio.wait_for(iterator.__anext__(), timeout=idle_timeout)
+            yield item
+        except asyncio.TimeoutError:
+            raise StreamIdleTimeoutError(idle_timeout)
+        except StopAsyncIteration:
+            break
+
+
+class _LegacyProcessor(StreamProcessor):
+    """旧版实现：逐行 decode/strip + 完整解析 + 每个 chunk 构建 dict 序列化"""
+
+    def _legacy_filter(self, token: str) -> str:
+        if not self.filter_tags:
+            return token
+        result = []
+        i = 0
+        while i < len(token):
+            char = token[i]
+            if self._in_filter_tag:
+                self._tag_buffer += char
+                if char == ">":
+                    if "/>" in self._tag_buffer:
+                        self._in_filter_tag = False
+                        self._tag_buffer = ""
+                    else:
+                        for tag in self.filter_tags:
+                            if f"</{tag}>" in self._tag_buffer:
+                                self._in_filter_tag = False
+                                self._tag_buffer = ""
+                                break
+                i += 1
+                continue
+            if char == "<":
+                remaining = token[i:]
+                tag_started = False
+                for tag in self.filter_tags:
+                    if remaining.startswith(f"<{tag}"):
+                        tag_started = True
+                        break
+                    if len(remaining) < len(tag) + 1:
+                        for j in range(1, len(remaining) + 1):
+                            if f"<{tag}".startswith(remaining[:j]):
+                                tag_started = True
+                                break
+                if tag_started:
+                    self._in_filter_tag = True
+                    self._tag_buffer = char
+                    i += 1
+                    continue
+            result.append(char)
+            i += 1
+        return "".join(result)
+
+    def _legacy_sse(self, content: str = "", role: str = None, finish: str = None) -> str:
+        delta = {}
+        if role:
+            delta["role"] = role
+            delta["content"] = ""
+        elif content:
+            delta["content"] = content
+        chunk = {
+            "id": self.response_id or f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "system_fingerprint": self.fingerprint,
+            "choices": [
+                {"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish}
+            ],
+        }
+        return f"data: {orjson.dumps(chunk).decode()}\n\n"
+
+    async def process(self, response) -> AsyncGenerator[str, None]:
+        idle_timeout = get_config("timeout.stream_idle_timeout")
+        async for line in _legacy_idle_timeout(response, idle_timeout):
+            line = _normalize_stream_line(line)
+            if not line:
+                continue
+            try:
+                data = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            resp = data.get("result", {}).get("response", {})
+            if (llm := resp.get("llmInfo")) and not self.fingerprint:
+                self.fingerprint = llm.get("modelHash", "")
+            if rid := resp.get("responseId"):
+                self.response_id = rid
+            if not self.role_sent:
+                yield self._legacy_sse(role="assistant")
+                self.role_sent = True
+            if resp.get("modelResponse"):
+                continue
+            if (token := resp.get("token")) is not None:
+                if token:
+                    filtered = self._legacy_filter(token)
+                    if filtered:
+                        yield self._legacy_sse(filtered)
+        yield self._legacy_sse(finish="stop")
+        yield "data: [DONE]\n\n"
+
+
+class _Lines:
+    """逐行上游"""
+
+    def __init__(self, lines: List[bytes]):
+        self.lines = lines
+
+    async def __aiter__(self):
+        for line in self.lines:
+            yield line
+
+
+class _Batches(_Lines):
+    """按分块产出的上游（模拟同一网络分块内到达多行）"""
+
+    def __init__(self, lines: List[bytes], size: int):
+        super().__init__(lines)
+        self.size = size
+
+    async def aiter_batches(self):
+        for i in range(0, len(self.lines), self.size):
+            yield self.lines[i : i + self.size]
+
+
+def _content_of(chunks: List[str]) -> str:
+    text = []
+    for chunk in chunks:
+        if not chunk.startswith("data: {"):
+            continue
+        delta = orjson.loads(chunk[6:])["choices"][0]["delta"]
+        text.append(delta.get("content") or "")
+    return "".join(text)
+
+
+async def _run(processor: StreamProcessor, upstream: Any, rounds: int, lines: int):
+    """返回 (每行耗时 us, 输出 chunk 数, 输出字节数, 输出内容)"""
+    chunks: List[str] = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        chunks = []
+        processor.role_sent = False
+        async for chunk in processor.process(upstream):
+            chunks.append(chunk)
+    elapsed = time.perf_counter() - start
+    per_line = elapsed / (rounds * lines) * 1e6
+    return per_line, len(chunks), sum(len(c) for c in chunks), _content_of(chunks)
+
+
+async def main_async(args) -> int:
+    from app.core.config import config
+
+    await config.load()
+
+    lines = _build_lines(args.lines, args.token)
+    model = "grok-4"
+
+    legacy_us, legacy_chunks, legacy_bytes, legacy_text = await _run(
+        _LegacyProcessor(model), _Lines(lines), args.rounds, len(lines)
+    )
+    print(f"{'case':<16}  {'us/line':>8}  {'speedup':>8}  {'chunks':>8}  {'bytes':>10}")
+    print(
+        f"{'legacy':<16}  {legacy_us:>8.2f}  {'1.0x':>8}  {legacy_chunks:>8}  {legacy_bytes:>10}"
+    )
+
+    cases = [("fast/line", _Lines(lines))] + [
+        (f"fast/batch={size}", _Batches(lines, size)) for size in args.batch
+    ]
+    for name, upstream in cases:
+        us, chunks, size, text = await _run(
+            StreamProcessor(model), upstream, args.rounds, len(lines)
+        )
+        if text != legacy_text:
+            print(f"{name}: output mismatch")
+            return 1
+        speedup = legacy_us / us if us > 0 else float("inf")
+        print(f"{name:<16}  {us:>8.2f}  {speedup:>7.1f}x  {chunks:>8}  {size:>10}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark StreamProcessor parsing")
+    parser.add_argument("--lines", type=int, default=20000, help="token lines per stream")
+    parser.add_argument("--rounds", type=int, default=3, help="streams per case")
+    parser.add_argument(
+        "--batch", type=int, nargs="+", default=[4, 16], help="lines per upstream chunk"
+    )
+    parser.add_argument("--token", default="你好", help="token text per line")
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
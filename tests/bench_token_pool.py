@@ -0,0 +1,128 @@
+"""
+TokenPool.select 微基准
+
+对比旧版全量扫描与额度分桶索引在不同规模 Token 池下的选择耗时。
+
+Usage:
+    python tests/bench_token_pool.py --sizes 10000 100000 --rounds 2000
+    python tests/bench_token_pool.py --strategy p2c
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.services.token.models import TokenInfo, TokenStatus, EffortType  # noqa: E402
+from app.services.token.pool import TokenPool  # noqa: E402
+from app.services.token.strategy import STRATEGIES  # noqa: E402
+
+
+def _scan_select(pool: TokenPool, exclude: set = None) -> Optional[TokenInfo]:
+    """旧版实现：每次全量扫描"""
+    available = [
+        t
+        for t in pool
+        if t.status == TokenStatus.ACTIVE and t.quota > 0
+        and (not exclude or t.token not in exclude)
+    ]
+    if not available:
+        return None
+    max_quota = max(t.quota for t in available)
+    candidates = [t for t in available if t.quota == max_quota]
+    return random.choice(candidates)
+
+
+def _build_pool(size: int, seed: int) -> TokenPool:
+    rng = random.Random(seed)
+    pool = TokenPool("bench")
+    statuses = [TokenStatus.ACTIVE] * 8 + [TokenStatus.COOLING, TokenStatus.EXPIRED]
+    for i in range(size):
+        status = rng.choice(statuses)
+        quota = 0 if status == TokenStatus.COOLING else rng.randint(1, 80)
+        pool.add(TokenInfo(token=f"tok-{i:08d}", status=status, quota=quota))
+    pool._rebuild_index()
+    return pool
+
+
+def _measure(
+    pool: TokenPool,
+    select: Callable[[TokenPool, Optional[set]], Optional[TokenInfo]],
+    rounds: int,
+    exclude_size: int,
+    consume: bool,
+) -> float:
+    """返回单次选择平均耗时（微秒）"""
+    exclude: set = set()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        token = select(pool, exclude or None)
+        if token is None:
+            break
+        if exclude_size:
+            exclude.add(token.token)
+            if len(exclude) > exclude_size:
+                exclude.pop()
+        if consume:
+            token.consume(EffortType.LOW)
+    elapsed = time.perf_counter() - start
+    return elapsed / max(1, rounds) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark TokenPool.select")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000], help="pool sizes"
+    )
+    parser.add_argument("--rounds", type=int, default=2000, help="selects per case")
+    parser.add_argument(
+        "--exclude", type=int, default=3, help="size of the rolling exclude set"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument(
+        "--strategy",
+        default="max_quota",
+        choices=sorted(STRATEGIES),
+        help="selection strategy for the indexed pool",
+    )
+    args = parser.parse_args()
+
+    cases = [
+        ("select", 0, False),
+        ("select+exclude", args.exclude, False),
+        ("select+consume", 0, True),
+    ]
+
+    print(f"{'size':>8}  {'case':<16}  {'scan(us)':>10}  {'index(us)':>10}  {'speedup':>8}")
+    for size in args.sizes:
+        for name, exclude_size, consume in cases:
+            random.seed(args.seed)
+            scan_pool = _build_pool(size, args.seed)
+            # 全量扫描较慢，按规模缩减轮数
+            scan_rounds = max(10, min(args.rounds, 2_000_000 // max(1, size)))
+            scan_us = _measure(scan_pool, _scan_select, scan_rounds, exclude_size, consume)
+
+            random.seed(args.seed)
+            index_pool = _build_pool(size, args.seed)
+            index_us = _measure(
+                index_pool,
+                lambda p, ex: p.select(exclude=ex, strategy=args.strategy),
+                args.rounds,
+                exclude_size,
+                consume,
+            )
+            speedup = scan_us / index_us if index_us > 0 else float("inf")
+            print(
+                f"{size:>8}  {name:<16}  {scan_us:>10.2f}  {index_us:>10.2f}  {speedup:>7.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,293 @@
+"""
+本地 Grok 上游模拟服务（用于基准测试）
+
+模拟以下接口，延迟与输出速率可配置:
+- POST /rest/app-chat/conversations/new   NDJSON 流式对话（含视频生成进度）
+- GET  /ws/imagine/listen                 Imagine 图片 WebSocket
+- POST /rest/rate-limits                  配额查询
+- POST /rest/media/post/create            创建媒体帖子
+- POST /rest/media/video/upscale          视频超分
+- POST /rest/app-chat/upload-file         附件上传
+- GET  /users/...                         资产下载（替代 assets.grok.com）
+
+Usage:
+    python tests/fake_grok.py --port 18080 --latency-ms 200 --token-rate 80 --tokens 300
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import time
+import uuid
+from dataclasses import dataclass
+
+import orjson
+from aiohttp import web
+
+
+@dataclass
+class FakeGrokConfig:
+    """模拟上游参数"""
+
+    # 响应头之前的延迟（模拟上游排队/首包时间）
+    latency_ms: float = 200.0
+    # 单个流每秒输出的 token 数，0 表示不限速
+    token_rate: float = 80.0
+    # 每次对话输出的 token 数
+    tokens: int = 300
+    token_text: str = "测试token "
+    # 视频进度推送次数与间隔
+    video_steps: int = 10
+    video_step_ms: float = 100.0
+    # 每次 WS 请求返回的图片数量与单张 final 图 blob 大小
+    ws_images: int = 4
+    image_kb: int = 160
+    image_step_ms: float = 50.0
+    # 附件上传耗时
+    upload_ms: float = 150.0
+    # 资产下载大小
+    asset_kb: int = 256
+    remaining_tokens: int = 80
+
+
+class FakeGrok:
+    """模拟上游实现（aiohttp）"""
+
+    def __init__(self, config: FakeGrokConfig):
+        self.config = config
+        self.requests = 0
+        self.uploads = 0
+        self._asset = os.urandom(config.asset_kb * 1024)
+        # final 图需超过 image_ws_final_min_bytes，medium 需超过 image_ws_medium_min_bytes
+        self._final_blob = base64.b64encode(os.urandom(config.image_kb * 768)).decode()
+        self._medium_blob = self._final_blob[: 40 * 1024]
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/rest/app-chat/conversations/new", self.conversation)
+        app.router.add_get("/ws/imagine/listen", self.imagine_ws)
+        app.router.add_post("/rest/rate-limits", self.rate_limits)
+        app.router.add_post("/rest/media/post/create", self.create_post)
+        app.router.add_post("/rest/media/video/upscale", self.upscale)
+        app.router.add_post("/rest/app-chat/upload-file", self.upload_file)
+        app.router.add_get("/{path:.*}", self.asset)
+        return app
+
+    async def _delay(self):
+        if self.config.latency_ms > 0:
+            await asyncio.sleep(self.config.latency_ms / 1000)
+
+    @staticmethod
+    def _line(response: dict) -> bytes:
+        return orjson.dumps({"result": {"response": response}}) + b"\n"
+
+    async def conversation(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        payload = await request.json(loads=orjson.loads)
+        await self._delay()
+
+        resp = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await resp.prepare(request)
+        response_id = uuid.uuid4().hex
+
+        if (payload.get("toolOverrides") or {}).get("videoGen"):
+            await self._stream_video(resp, response_id)
+        else:
+            await self._stream_chat(resp, response_id)
+        await resp.write_eof()
+        return resp
+
+    async def _stream_chat(self, resp: web.StreamResponse, response_id: str):
+        cfg = self.config
+        interval = 1.0 / cfg.token_rate if cfg.token_rate > 0 else 0.0
+        start = time.perf_counter()
+        for i in range(cfg.tokens):
+            await resp.write(
+                self._line(
+                    {"token": cfg.token_text, "isThinking": False, "responseId": response_id}
+                )
+            )
+            if interval:
+                # 按绝对时间对齐，避免 sleep 误差累积
+                delay = start + (i + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        await resp.write(
+            self._line(
+                {
+                    "modelResponse": {
+                        "responseId": response_id,
+                        "message": cfg.token_text * cfg.tokens,
+                        "metadata": {"llm_info": {"modelHash": "fake"}},
+                    }
+                }
+            )
+        )
+
+    async def _stream_video(self, resp: web.StreamResponse, response_id: str):
+        cfg = self.config
+        video_id = str(uuid.uuid4())
+        steps = max(1, cfg.video_steps)
+        for step in range(1, steps + 1):
+            progress = step * 100 // steps
+            video = {"progress": progress, "videoId": video_id}
+            if progress == 100:
+                video.update(
+                    {
+                        "videoUrl": f"users/fake/generated/{video_id}/generated_video.mp4",
+                        "thumbnailImageUrl": f"users/fake/generated/{video_id}/preview_image.jpg",
+                        "videoPostId": video_id,
+                    }
+                )
+            await resp.write(
+                self._line(
+                    {"streamingVideoGenerationResponse": video, "responseId": response_id}
+                )
+            )
+            if progress < 100 and cfg.video_step_ms > 0:
+                await asyncio.sleep(cfg.video_step_ms / 1000)
+
+    async def imagine_ws(self, request: web.Request) -> web.WebSocketResponse:
+        self.requests += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        cfg = self.config
+
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                await self._delay()
+                await self._send_images(ws, cfg)
+        except ConnectionResetError:
+            # 客户端中途关闭（如对冲请求凑齐后取消其余连接）
+            pass
+        return ws
+
+    async def _send_images(self, ws: web.WebSocketResponse, cfg):
+        image_ids = [str(uuid.uuid4()) for _ in range(max(1, cfg.ws_images))]
+        # 先推送各图中间态，再推送最终图
+        for image_id in image_ids:
+            await ws.send_str(
+                orjson.dumps(
+                    {
+                        "type": "image",
+                        "url": f"https://assets.grok.com/images/{image_id}.png",
+                        "blob": self._medium_blob,
+                    }
+                ).decode()
+            )
+        for image_id in image_ids:
+            if cfg.image_step_ms > 0:
+                await asyncio.sleep(cfg.image_step_ms / 1000)
+            await ws.send_str(
+                orjson.dumps(
+                    {
+                        "type": "image",
+                        "url": f"https://assets.grok.com/images/{image_id}.jpg",
+                        "blob": self._final_blob,
+                    }
+                ).decode()
+            )
+
+    async def rate_limits(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"remainingTokens": self.config.remaining_tokens, "windowSizeSeconds": 7200},
+            dumps=lambda v: orjson.dumps(v).decode(),
+        )
+
+    async def create_post(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"post": {"id": str(uuid.uuid4())}})
+
+    async def upscale(self, request: web.Request) -> web.Response:
+        payload = await request.json(loads=orjson.loads)
+        video_id = payload.get("videoId", "")
+        return web.json_response(
+            {"hdMediaUrl": f"users/fake/generated/{video_id}/generated_video_hd.mp4"}
+        )
+
+    async def upload_file(self, request: web.Request) -> web.Response:
+        self.uploads += 1
+        payload = await request.json(loads=orjson.loads)
+        if self.config.upload_ms > 0:
+            await asyncio.sleep(self.config.upload_ms / 1000)
+        file_id = str(uuid.uuid4())
+        return web.json_response(
+            {
+                "fileMetadataId": file_id,
+                "fileUri": f"users/fake/{file_id}/{payload.get('fileName', 'file')}",
+            }
+        )
+
+    async def asset(self, request: web.Request) -> web.Response:
+        path = request.match_info.get("path", "")
+        if path.endswith((".jpg", ".jpeg")):
+            content_type = "image/jpeg"
+        elif path.endswith(".png"):
+            content_type = "image/png"
+        elif path.endswith(".mp4"):
+            content_type = "video/mp4"
+        else:
+            content_type = "application/octet-stream"
+        return web.Response(body=self._asset, content_type=content_type)
+
+
+async def start_fake_grok(
+    config: FakeGrokConfig, host: str = "127.0.0.1", port: int = 0
+) -> tuple[web.AppRunner, int]:
+    """在当前事件循环中启动模拟服务，返回 (runner, 实际端口)"""
+    runner = web.AppRunner(FakeGrok(config).build_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    sockets = site._server.sockets if site._server else []
+    actual_port = sockets[0].getsockname()[1] if sockets else port
+    return runner, actual_port
+
+
+def add_fake_grok_arguments(parser: argparse.ArgumentParser):
+    """注册模拟上游参数（bench_e2e 复用）"""
+    defaults = FakeGrokConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--token-rate", type=float, default=defaults.token_rate)
+    parser.add_argument("--tokens", type=int, default=defaults.tokens)
+    parser.add_argument("--video-steps", type=int, default=defaults.video_steps)
+    parser.add_argument("--video-step-ms", type=float, default=defaults.video_step_ms)
+    parser.add_argument("--ws-images", type=int, default=defaults.ws_images)
+    parser.add_argument("--image-kb", type=int, default=defaults.image_kb)
+    parser.add_argument("--image-step-ms", type=float, default=defaults.image_step_ms)
+    parser.add_argument("--upload-ms", type=float, default=defaults.upload_ms)
+    parser.add_argument("--asset-kb", type=int, default=defaults.asset_kb)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeGrokConfig:
+    return FakeGrokConfig(
+        latency_ms=args.latency_ms,
+        token_rate=args.token_rate,
+        tokens=args.tokens,
+        video_steps=args.video_steps,
+        video_step_ms=args.video_step_ms,
+        ws_images=args.ws_images,
+        image_kb=args.image_kb,
+        image_step_ms=args.image_step_ms,
+        upload_ms=args.upload_ms,
+        asset_kb=args.asset_kb,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local fake Grok upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    add_fake_grok_arguments(parser)
+    args = parser.parse_args()
+
+    app = FakeGrok(config_from_args(args)).build_app()
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())